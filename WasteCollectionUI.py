@@ -1,14 +1,28 @@
 import tkinter as tk
-import sqlite3
+import queue
 import time
 from threading import Thread
+import db
+import map_renderer
+import route_cache
+import sharding
 
 # Initializations
 GRID_SIZE = 10 # 10x10 grid for neighbourhood
 TRUCKS = {"Garbage": "red", "Recycling": "blue", "Organic": "green"} # dictionary for truck waste type and color
 BASE_LOCATION = (GRID_SIZE // 2, GRID_SIZE // 2) # base location (middle of grid)
-CELL_SIZE = 50 # pixel size of each cell
+CELL_SIZE = 50 # pixel size of each cell (the canvas is GRID_SIZE cells wide, the map zooms to fit it)
 WEEK_DAYS = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+# when the map is split into shards (python shard_scheduler.py --split), read every shard instead of the single database
+SHARDS = sharding.FederatedView() if sharding.shard_paths() else None
+# how often the schedule panel picks up schedule rows written since the last refresh
+REFRESH_INTERVAL_MS = 500
+# Animation: a simulation clock advanced by a root.after frame timer moves every truck of the day at once,
+# positions interpolated between grid cells
+FRAME_MS = 33 # ~30 frames per second
+CELLS_PER_SECOND = 2 # truck speed at 1x (one cell every 0.5 s)
+DAY_PAUSE = 3 # simulated seconds between the last truck of a day coming back and the next day
+SPEEDS = (0.25, 16) # range of the speed multiplier slider
 
 """ UI Class """
 class WasteCollectionUI:
@@ -38,6 +52,12 @@ class WasteCollectionUI:
         self.legend_frame = tk.Frame(self.right_panel)
         self.legend_frame.pack(side=tk.TOP, pady=30)
 
+        # Speed multiplier of the simulation clock
+        self.speed = tk.DoubleVar(value=1.0)
+        self.speed_scale = tk.Scale(self.right_panel, label="Speed (x)", variable=self.speed, orient=tk.HORIZONTAL,
+                                    from_=SPEEDS[0], to=SPEEDS[1], resolution=0.25, length=200)
+        self.speed_scale.pack(side=tk.TOP)
+
         # Schedule Panel
         self.schedule_text = tk.Text(self.right_panel, width=45, height=20, font=("Arial", 10))
         self.schedule_text.pack(side=tk.LEFT, padx=10)
@@ -50,33 +70,46 @@ class WasteCollectionUI:
         self.log_text.insert(tk.END, "🚛 Truck Activity Log:\n", 'center')
 
         # Load map and schedule data
+        # (the schedule is then followed through db.ScheduleFeed, one per shard when sharded)
         self.houses = self.load_houses_from_db()
+        self.feeds = SHARDS.feeds() if SHARDS is not None else [db.ScheduleFeed()]
+        self.route_cache = route_cache.RouteCache()
         self.schedule = self.load_schedule_from_db()
 
         # Draw layout
-        self.draw_grid()
-        self.draw_houses()
+        self.draw_map()
         self.draw_legend()
         self.display_schedule()
 
-        # Create separate truck icons for each waste type
+        # Create separate truck icons for each waste type (trucks of a larger fleet get theirs when first dispatched)
         self.truck_icons = {}
-        for truck_type, color in TRUCKS.items():
-
-            icon = self.canvas.create_text(BASE_LOCATION[0] * CELL_SIZE + 25,
-                                           BASE_LOCATION[1] * CELL_SIZE + 25,
-                                           text="🚛", font=("Arial", 16, "bold"),
-                                           fill=color)
-            self.truck_icons[truck_type] = icon
-
-        # Start scheduler simulation
+        for truck_type in TRUCKS:
+            self.truck_icon(truck_type, truck_type)
+
+        # Start scheduler simulation: the worker thread builds each day's routes and hands them to the
+        # UI thread through ui_events, only the UI thread touches Tk
+        self.day_requests = queue.Queue()
+        self.ui_events = queue.Queue()
+        self.trucks_on_road = {} # truck id -> route being driven
+        self.clock = 0.0 # simulated seconds
+        self.last_frame = time.monotonic()
+        self.day_index = 0
+        self.day_end = None # clock time the next day starts, None while trucks are out
+        self.map.on_redraw = self.park_trucks
         self.truck_thread = Thread(target=self.schedule_trucks, daemon=True)
         self.truck_thread.start()
+        self.day_requests.put(WEEK_DAYS[self.day_index])
+        self.root.after(FRAME_MS, self.animate)
+
+        # Keep the schedule up to date
+        self.root.after(REFRESH_INTERVAL_MS, self.refresh_schedule)
 
     """ Loads map from DB """
     def load_houses_from_db(self):
         # Loads house positions for all houses in neighbourhood
-        conn = sqlite3.connect("my_database.db")
+        if SHARDS is not None:
+            return {house_id: {"location": location} for house_id, location in SHARDS.houses().items()}
+        conn = db.connect()
         cursor = conn.cursor()
 
         # Get all house locations
@@ -91,47 +124,107 @@ class WasteCollectionUI:
 
     """ Load schedule from DB"""
     def load_schedule_from_db(self):
-        # Loads all house sched entries from schedule table
-        conn = sqlite3.connect("my_database.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM schedule")
-        rows = cursor.fetchall()
-        conn.close()
-
-        # Converting rows to dictionary format
-        schedule = {}
-        for row in rows:
-            request_id, house_id, truck_types, days = row
-            truck_list = truck_types.split(", ")
-            day_list = days.split(", ")
-            schedule.setdefault(house_id, {})
-            for t, d in zip(truck_list, day_list):
-                schedule[house_id][t] = d
-        return schedule
-
-    """ Draws 10x10 grid and highlight base """
-    def draw_grid(self):
-        for i in range(GRID_SIZE + 1):
-            self.canvas.create_line(i * CELL_SIZE, 0, i * CELL_SIZE, GRID_SIZE * CELL_SIZE, fill="gray")
-            self.canvas.create_line(0, i * CELL_SIZE, GRID_SIZE * CELL_SIZE, i * CELL_SIZE, fill="gray")
-
-        # Draw base (center of grid)
-        bx, by = BASE_LOCATION
-        self.canvas.create_rectangle(bx * CELL_SIZE, by * CELL_SIZE,
-                                     (bx + 1) * CELL_SIZE, (by + 1) * CELL_SIZE,
-                                     fill="black")
-        self.canvas.create_text(bx * CELL_SIZE + 25, by * CELL_SIZE + 25,
-                                text="Base", fill="white", font=("Arial", 10, "bold"))
-
-    """ Draws houses on map grid"""
-    def draw_houses(self):
-        for house_id, data in self.houses.items():
-            x, y = data["location"]
-            self.canvas.create_rectangle(x * CELL_SIZE, y * CELL_SIZE,
-                                         (x + 1) * CELL_SIZE, (y + 1) * CELL_SIZE,
-                                         fill="grey")
-            self.canvas.create_text(x * CELL_SIZE + 25, y * CELL_SIZE + 20,
-                                    text=f"House {house_id}", fill="white", font=("Arial", 9, "bold"))
+        # Loads scheduled house entries from schedule table (one row per house, truck type and day),
+        # from the start of every feed
+        self.schedule = {}
+        # house, waste type -> id of the truck in the fleet visiting it, and (feed, id) of the schedule row shown
+        self.truck_ids = {}
+        self.row_ids = {}
+        # day -> truck id -> its stops {house: waste type}, the routes the trucks are dispatched on
+        self.route_stops = {day: {} for day in WEEK_DAYS}
+        self.route_cache.clear()
+        # day, waste type -> houses, what the schedule panel shows
+        self.entries = {(day, waste_type): set() for day in WEEK_DAYS for waste_type in TRUCKS}
+        for number, feed in enumerate(self.feeds):
+            feed.restart()
+            for row_id, house_id, truck_type, day, truck in feed.poll()[0]:
+                self.apply_schedule_row(house_id, truck_type, day, truck, (number, row_id))
+        return self.schedule
+
+    """ Applies one schedule row, returns the (day, waste type) entries it changed"""
+    def apply_schedule_row(self, house_id, truck_type, day, truck=None, row=(0, 0)):
+        # truck type and day are stored as integers, a later row for a house and type replaces the earlier
+        # one (row: (feed number, row id)); a row changed in place only counts while no later row of its
+        # feed is shown, day None unschedules it if it is the one shown
+        waste_type = db.TRUCK_TYPES[truck_type]
+        shown = self.row_ids.get((house_id, waste_type))
+        if shown is not None and shown[0] == row[0] and row[1] < shown[1]:
+            return ()
+        if day is None and row != shown:
+            return ()
+        day = None if day is None else db.DAYS[day]
+        truck_id = truck or waste_type
+        house_schedule = self.schedule.setdefault(house_id, {})
+        old_day = house_schedule.get(waste_type)
+        old_truck = self.truck_ids.get((house_id, waste_type))
+        self.row_ids[(house_id, waste_type)] = row
+        if old_day == day and old_truck == truck_id:
+            return ()
+
+        # routes losing / getting the stop are rebuilt the next time they are dispatched
+        if old_day is not None:
+            self.route_stops[old_day][old_truck].pop(house_id, None)
+            self.route_cache.invalidate((old_day, old_truck))
+        if day is None:
+            del house_schedule[waste_type]
+            del self.truck_ids[(house_id, waste_type)]
+            del self.row_ids[(house_id, waste_type)]
+            self.entries[(old_day, waste_type)].discard(house_id)
+            return ((old_day, waste_type),)
+        self.route_stops[day].setdefault(truck_id, {})[house_id] = waste_type
+        self.route_cache.invalidate((day, truck_id))
+        self.truck_ids[(house_id, waste_type)] = truck_id
+        if old_day == day:
+            return ()
+        house_schedule[waste_type] = day
+        self.entries[(day, waste_type)].add(house_id)
+        if old_day is None:
+            return ((day, waste_type),)
+        self.entries[(old_day, waste_type)].discard(house_id)
+        return (old_day, waste_type), (day, waste_type)
+
+    """ Picks up schedule changes and redraws only the entries they touch"""
+    def refresh_schedule(self):
+        rows, restarted = [], False
+        for number, feed in enumerate(self.feeds):
+            feed_rows, feed_restarted = feed.poll()
+            rows += [(number, row) for row in feed_rows]
+            restarted = restarted or feed_restarted
+
+        if restarted:
+            # rows were deleted (re-planned week, cleared table): read it all again
+            self.load_schedule_from_db()
+            changed = self.entries.keys()
+            houses = self.schedule.keys()
+        else:
+            # new rows and rows moved in place (optimised routes, repairs), each feed's in id order
+            changed = set()
+            for number, (row_id, house_id, truck_type, day, truck) in rows:
+                changed.update(self.apply_schedule_row(house_id, truck_type, day, truck, (number, row_id)))
+            houses = {row[1] for _, row in rows}
+
+        # houses added to the map after the UI started
+        new_houses = [house_id for house_id in houses if house_id not in self.houses]
+        if new_houses:
+            all_houses = self.load_houses_from_db()
+            for house_id in new_houses:
+                if house_id in all_houses:
+                    self.houses[house_id] = all_houses[house_id]
+            self.map.add_houses({house_id: self.houses[house_id]["location"] for house_id in new_houses
+                                 if house_id in self.houses})
+
+        for day, waste_type in changed:
+            self.update_schedule_entry(day, waste_type)
+        self.root.after(REFRESH_INTERVAL_MS, self.refresh_schedule)
+
+    """ Draws grid, base and houses, zoomable with the mouse wheel and pannable by dragging"""
+    def draw_map(self):
+        # only the part in view is drawn, as a heatmap when zoomed out (see map_renderer.py)
+        self.map = map_renderer.MapRenderer(self.canvas, GRID_SIZE * CELL_SIZE, GRID_SIZE * CELL_SIZE,
+                                            {house_id: data["location"] for house_id, data in self.houses.items()},
+                                            BASE_LOCATION)
+        self.map.bind_controls()
+        self.map.redraw()
 
     """ Draws legend for truck types"""
     def draw_legend(self):
@@ -149,103 +242,129 @@ class WasteCollectionUI:
 
     """ Displays daily schedule of houses to visit by waster type"""
     def display_schedule(self):
-        # day -> waste type -> houses
-        schedule_data = {day: {t: [] for t in TRUCKS} for day in WEEK_DAYS}
-
-        for house_id, waste_schedule in self.schedule.items():
-            for waste_type, day in waste_schedule.items():
-                if day in schedule_data and waste_type in TRUCKS:
-                    schedule_data[day][waste_type].append(house_id)
-
-        # Create chart to display schedule
+        # Create chart to display schedule: every day and waste type gets its entry between two marks
+        # (start stays left of, end right of text inserted at them) so it can be redrawn on its own
         for day in WEEK_DAYS:
-            day_data = schedule_data[day]
             self.schedule_text.insert(tk.END, f"🗓 {day}\n", ("day",))
             for waste_type in TRUCKS:
-                houses = day_data[waste_type]
-                if houses:
-                    house_list = ", ".join(f"House {h}" for h in sorted(houses))
-                    text = f"   - {waste_type}: {house_list}\n"
-                    self.schedule_text.insert(tk.END, text, waste_type)
                 self.schedule_text.insert(tk.END, "\n")
+                start, end = self.entry_marks(day, waste_type)
+                self.schedule_text.mark_set(start, "end-2c")
+                self.schedule_text.mark_gravity(start, tk.LEFT)
+                self.schedule_text.mark_set(end, "end-2c")
+                self.update_schedule_entry(day, waste_type)
+
+    def entry_marks(self, day, waste_type):
+        return f"entry_{day}_{waste_type}_start", f"entry_{day}_{waste_type}_end"
+
+    """ Redraws the houses of one day and waste type in the schedule panel"""
+    def update_schedule_entry(self, day, waste_type):
+        start, end = self.entry_marks(day, waste_type)
+        self.schedule_text.delete(start, end)
+        houses = self.entries[(day, waste_type)]
+        if houses:
+            house_list = ", ".join(f"House {h}" for h in sorted(houses))
+            text = f"   - {waste_type}: {house_list}\n"
+            self.schedule_text.insert(start, text, waste_type)
+
+    """ Icon of a truck, created at the base the first time it is needed"""
+    def truck_icon(self, truck_type, truck_id):
+        icon = self.truck_icons.get(truck_id)
+        if icon is None:
+            icon = self.canvas.create_text(*self.map.to_screen(BASE_LOCATION[0] + 0.5, BASE_LOCATION[1] + 0.5),
+                                           text="🚛", font=("Arial", 16, "bold"),
+                                           fill=TRUCKS[truck_type], tags=(map_renderer.TRUCK_TAG,))
+            self.truck_icons[truck_id] = icon
+        return icon
+
+    """ Keeps the trucks at the base in place when the map is zoomed or panned (the others move every frame)"""
+    def park_trucks(self):
+        for truck_id, icon in self.truck_icons.items():
+            if truck_id not in self.trucks_on_road:
+                self.canvas.coords(icon, *self.map.to_screen(BASE_LOCATION[0] + 0.5, BASE_LOCATION[1] + 0.5))
+
+    """ Frame timer: advances the simulation clock, starts the days the worker has routed and moves the trucks"""
+    def animate(self):
+        now = time.monotonic()
+        self.clock += (now - self.last_frame) * self.speed.get()
+        self.last_frame = now
 
-    """ Animates truck movement along scheduled path"""
-    def move_truck(self, truck_icon, path):
-        for (x, y) in path:
-            self.canvas.coords(truck_icon, x * CELL_SIZE + 25, y * CELL_SIZE + 25)
-            self.root.update_idletasks()
-            time.sleep(0.5)
-        time.sleep(0.5)
-
-    """ Loops one day at a time to dispatch truck"""
+        while True:
+            try:
+                day, routes = self.ui_events.get_nowait()
+            except queue.Empty:
+                break
+            self.start_day(day, routes)
+
+        for truck_id, route in list(self.trucks_on_road.items()):
+            if self.move_truck(route):
+                del self.trucks_on_road[truck_id]
+                # Log after returning to base
+                for house_id, _, _ in route["stops"]:
+                    self.log_collection(house_id, route["truck_type"], route["day"])
+                if not self.trucks_on_road:
+                    self.day_end = self.clock + DAY_PAUSE
+
+        # Go to next day once every truck is back and the pause is over
+        if self.day_end is not None and self.clock >= self.day_end:
+            self.day_end = None
+            self.day_index = (self.day_index + 1) % len(WEEK_DAYS)
+            self.day_requests.put(WEEK_DAYS[self.day_index])
+        self.root.after(FRAME_MS, self.animate)
+
+    """ Sends out every truck with stops on the day, all at once"""
+    def start_day(self, day, routes):
+        self.log_text.tag_configure('center', justify='center')
+        self.log_text.insert(tk.END, f"\n📅 Today is {day}\n", 'center')
+        self.log_text.see(tk.END)
+        for truck_type, truck_id, stops, polyline in routes:
+            self.trucks_on_road[truck_id] = {"icon": self.truck_icon(truck_type, truck_id), "truck_type": truck_type,
+                                             "day": day, "stops": stops, "points": polyline.points.tolist(),
+                                             "lengths": polyline.lengths.tolist(), "segment": 0, "start": self.clock}
+        if not routes:
+            self.day_end = self.clock + DAY_PAUSE
+
+    """ Places a truck where it is at the current clock time along its route, returns True once it is back"""
+    def move_truck(self, route):
+        points, lengths = route["points"], route["lengths"]
+        distance = (self.clock - route["start"]) * CELLS_PER_SECOND
+        done = distance >= lengths[-1]
+        if done:
+            x, y = points[-1]
+        else:
+            # in between two corners, the segment only moves forward
+            segment = route["segment"]
+            while lengths[segment + 1] <= distance:
+                segment += 1
+            route["segment"] = segment
+            fraction = (distance - lengths[segment]) / (lengths[segment + 1] - lengths[segment])
+            (x0, y0), (x1, y1) = points[segment], points[segment + 1]
+            x, y = x0 + (x1 - x0) * fraction, y0 + (y1 - y0) * fraction
+        self.canvas.coords(route["icon"], *self.map.to_screen(x + 0.5, y + 0.5))
+        return done
+
+    """ Worker thread: hands the routes of each day the UI asks for over, one day at a time"""
     def schedule_trucks(self):
         """Send trucks strictly based on the schedule table."""
-        current_day_index = 0
         while True:
-            current_day = WEEK_DAYS[current_day_index]
-            self.log_text.tag_configure('center', justify='center')
-            self.log_text.insert(tk.END, f"\n📅 Today is {current_day}\n", 'center')
-            self.log_text.see(tk.END)
-
-            for truck_type in TRUCKS:
-                # Get all houses scheduled for the given type on the selected day
-                stops = []
-                for house_id, waste_type in self.schedule.items():
-                    if waste_type.get(truck_type) == current_day:
-                        loc = self.houses[house_id]["location"]
-                        stops.append((house_id, loc))
-
-                if stops:
-                    self.dispatch_truck(truck_type, stops, current_day)
-                # delay between trucks
-                time.sleep(1.5)
-
-            # Go to next day every 3 seconds
-            current_day_index = (current_day_index + 1) % len(WEEK_DAYS)
-            time.sleep(3)
-
-    """ Dispatches required truck after building path based on schedule, returning to base"""
-    def dispatch_truck(self, truck_type, stops, day):
-        truck_icon = self.truck_icons[truck_type]
-        current_position = BASE_LOCATION
-        path = []
-
-        # Creating the path without using log_collection
-        for _, loc in stops:
-            # move from current position to house
-            path += self.get_path(current_position, loc)
-            current_position = loc
-
-        # Return to base
-        path += self.get_path(current_position, BASE_LOCATION)
-        # Move truck
-        self.move_truck(truck_icon, path)
-
-        # Log after returning to base
-        for house_id, _ in stops:
-            self.log_collection(house_id, truck_type, day)
-
-    """ Calculates path between two points (in a straight line to mimic city streets)"""
-    def get_path(self, start, end):
-        path = []
-        sx, sy = start
-        ex, ey = end
-
-        while sx != ex:
-            if sx < ex:
-                sx += 1
-            else:
-                sx -= 1
-            path.append((sx, sy))
-
-        while sy != ey:
-            if sy < ey:
-                sy += 1
-            else:
-                sy -= 1
-            path.append((sx, sy))
-
-        return path
+            current_day = self.day_requests.get()
+            routes = []
+            for truck_id, stops in list(self.route_stops[current_day].items()):  # refresh_schedule updates it
+                route = self.route_cache.get((current_day, truck_id))
+                if route is None:
+                    version = self.route_cache.version
+                    route = self.dispatch_truck(list(stops.items()))
+                    self.route_cache.put((current_day, truck_id), route, version)
+                if route[0]:
+                    routes.append((route[0][0][2], truck_id) + route)
+            self.ui_events.put((current_day, routes))
+
+    """ Builds the route of a truck from base through its stops ((house, waste type) list), returning to base"""
+    def dispatch_truck(self, stops):
+        # (house, location, waste type) of every stop, and the polyline through them
+        stops = [(house_id, self.houses[house_id]["location"], waste_type) for house_id, waste_type in stops
+                 if house_id in self.houses]
+        return stops, route_cache.manhattan_polyline([BASE_LOCATION] + [stop[1] for stop in stops] + [BASE_LOCATION])
 
     """ Adds truck activity to log panel once truck completes route """
     def log_collection(self, house_id, waste_type, day):
@@ -0,0 +1,332 @@
+import asyncio
+import collections
+import concurrent.futures
+import threading
+import time
+
+import pika
+from pika.adapters.asyncio_connection import AsyncioConnection
+
+
+# Asyncio backend of transport.py: pika's AsyncioConnection on an asyncio event loop, behind the
+# part of the pika BlockingConnection / BlockingChannel API the stages use (as inproc_broker.py),
+# so a stage runs on it unchanged.
+# Calls made outside the loop (declaring queues, opening channels, a client's publishes) wait for
+# the broker's reply by running the loop until it comes. Calls made on the loop, from consumer
+# callbacks and call_later timers, never wait: publishes on a confirm channel are pipelined instead
+# of taking a round trip each, and a basic_ack is held back until every publish made before it on
+# the connection has been confirmed. A nacked publish turns the acks held on it into
+# basic_nack(requeue=True), so their messages are redelivered. The acks the stages send after their
+# confirmed publishes keep their meaning with many messages in flight.
+# A transaction commit (tx_select / tx_commit) made on the loop is held like a publish: acks sent
+# after it wait for its Commit-Ok, a channel closed before it came turns them into requeueing nacks.
+# A connection opened while an event loop is already running in the thread (sensor_simulator.py)
+# runs its own loop in a thread of its own, and the calls wait on that thread.
+
+# seconds close() waits for the outstanding publisher confirms
+CLOSE_TIMEOUT = 5
+
+
+class BlockingConnection:
+    """
+    Connection to RabbitMQ (parameters: pika.ConnectionParameters), see the top of the file.
+    """
+    def __init__(self, parameters=None):
+        self.loop = asyncio.new_event_loop()
+        self.thread = None
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            self.thread = threading.Thread(target=self.loop.run_forever, name="asyncio-transport", daemon=True)
+            self.thread.start()
+        self.channels = []
+        self.held_acks = collections.deque()  # (channel, delivery tag, multiple, {confirm channel: last publish})
+        self.waiting = set()  # futures waiting on the broker, failed if the connection is lost
+        self.on_closed = None
+        self.connection = None
+        self.connection = self._call(lambda done: AsyncioConnection(
+            parameters, on_open_callback=done, on_open_error_callback=self._on_open_error,
+            on_close_callback=self._on_close, custom_ioloop=self.loop))
+
+    @property
+    def is_open(self):
+        return self.connection is not None and self.connection.is_open
+
+    # True when called from the loop: a consumer callback or a timer
+    def _on_loop(self):
+        if self.thread is not None:
+            return threading.current_thread() is self.thread
+        return self.loop.is_running()
+
+    def _future(self):
+        future = concurrent.futures.Future()
+        self.waiting.add(future)
+        future.add_done_callback(self.waiting.discard)
+        return future
+
+    def _wait(self, future):
+        if self.thread is not None and not self._on_loop():
+            return future.result()
+        if future.done():
+            return future.result()
+        if self._on_loop():
+            return None  # doesn't wait on the loop
+        return self.loop.run_until_complete(asyncio.wrap_future(future, loop=self.loop))
+
+    # runs start(done) on the loop and waits (unless on the loop) until done(result) is called
+    def _call(self, start):
+        future = self._future()
+
+        def done(result=None, *args):
+            if not future.done():
+                future.set_result(result)
+
+        def run():
+            try:
+                start(done)
+            except Exception as error:
+                if not future.done():
+                    future.set_exception(error)
+
+        if self.thread is not None and not self._on_loop():
+            self.loop.call_soon_threadsafe(run)
+        else:
+            run()
+        return self._wait(future)
+
+    def _fail_waiting(self, error):
+        for future in list(self.waiting):
+            if not future.done():
+                future.set_exception(error)
+
+    def _on_open_error(self, connection, error):
+        self._fail_waiting(error if isinstance(error, BaseException) else pika.exceptions.AMQPConnectionError(error))
+
+    def _on_close(self, connection, reason):
+        if self.on_closed is not None:
+            self.on_closed()
+        self._fail_waiting(reason)
+
+    def channel(self):
+        if self._on_loop():
+            raise RuntimeError("Channels have to be opened before consuming")
+        channel = BlockingChannel(self, self._call(lambda done: self.connection.channel(on_open_callback=done)))
+        self.channels.append(channel)
+        return channel
+
+    def call_later(self, delay, callback):
+        return self._call(lambda done: done(self.loop.call_later(delay, callback)))
+
+    def remove_timeout(self, timer):
+        self._call(lambda done: done(timer.cancel()))
+
+    def process_data_events(self, time_limit=0):
+        if self._on_loop():
+            return 0
+        if self.thread is not None:
+            time.sleep(time_limit or 0)
+        else:
+            self.loop.run_until_complete(asyncio.sleep(time_limit or 0))
+        return 0
+
+    # acks once the publishes made so far on this connection are confirmed
+    def _ack(self, channel, delivery_tag, multiple):
+        waits = {publisher: publisher.published for publisher in self.channels
+                 if publisher.unconfirmed or publisher.nacked}
+        if not waits and not self.held_acks:
+            channel.channel.basic_ack(delivery_tag, multiple)
+            return
+        self.held_acks.append((channel, delivery_tag, multiple, waits))
+        self._release_acks()
+
+    def _release_acks(self):
+        while self.held_acks:
+            channel, delivery_tag, multiple, waits = self.held_acks[0]
+            if any(min(publisher.unconfirmed, default=last + 1) <= last for publisher, last in waits.items()):
+                return
+            self.held_acks.popleft()
+            nacked = any(tag <= last for publisher, last in waits.items() for tag in publisher.nacked)
+            for publisher, last in waits.items():
+                publisher.nacked = {tag for tag in publisher.nacked if tag > last}
+            if not channel.channel.is_open:
+                continue  # its deliveries are requeued by the broker
+            if nacked:
+                print(f"[Transport] A publish was nacked, requeueing delivery {delivery_tag}")
+                channel.channel.basic_nack(delivery_tag, multiple, requeue=True)
+            else:
+                channel.channel.basic_ack(delivery_tag, multiple)
+
+    def close(self):
+        if not self.is_open:
+            return
+        deadline = time.monotonic() + CLOSE_TIMEOUT
+        while (not self._on_loop() and any(channel.unconfirmed for channel in self.channels)
+               and time.monotonic() < deadline):
+            self.process_data_events(0.01)
+
+        def close(done):
+            self.on_closed = done
+            self.connection.close()
+        self._call(close)
+        if self.thread is not None and not self._on_loop():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+        elif not self._on_loop():
+            self.loop.close()
+
+
+class BlockingChannel:
+    """
+    Channel of an asyncio BlockingConnection. Consumer callbacks are given this channel, not pika's.
+    """
+    def __init__(self, connection, channel):
+        self.connection = connection
+        self.channel = channel
+        self.confirming = False
+        self.published = 0  # publishes made since confirm_delivery(), numbered as the broker's confirms
+        self.unconfirmed = set()
+        self.nacked = set()
+        self.returned = 0
+        self.waiters = {}  # publish number -> (done, returned before it), for publishes made off the loop
+        self.consumer_tags = []
+        self.stopped = None
+        channel.add_on_close_callback(self._on_close)
+        channel.add_on_return_callback(self._on_return)
+
+    @property
+    def is_open(self):
+        return self.channel.is_open
+
+    def queue_declare(self, queue, durable=False, arguments=None, **kwargs):
+        return self.connection._call(lambda done: self.channel.queue_declare(
+            queue, durable=durable, arguments=arguments, callback=done, **kwargs))
+
+    def exchange_declare(self, exchange, exchange_type='direct', durable=False, **kwargs):
+        return self.connection._call(lambda done: self.channel.exchange_declare(
+            exchange, exchange_type=exchange_type, durable=durable, callback=done, **kwargs))
+
+    def queue_bind(self, queue, exchange, routing_key=None, **kwargs):
+        return self.connection._call(lambda done: self.channel.queue_bind(
+            queue, exchange, routing_key=routing_key, callback=done, **kwargs))
+
+    def queue_purge(self, queue):
+        return self.connection._call(lambda done: self.channel.queue_purge(queue, callback=done))
+
+    def basic_qos(self, prefetch_count=0, **kwargs):
+        self.connection._call(lambda done: self.channel.basic_qos(prefetch_count=prefetch_count, callback=done,
+                                                                  **kwargs))
+
+    def confirm_delivery(self):
+        self.connection._call(lambda done: self.channel.confirm_delivery(self._on_confirm, callback=done))
+        self.confirming = True
+
+    def tx_select(self):
+        self.connection._call(lambda done: self.channel.tx_select(callback=done))
+
+    # commits the messages published since the last commit, numbered like a publish so acks made
+    # after it wait for the broker's Commit-Ok (a channel is either confirming or transactional)
+    def tx_commit(self):
+        def commit(done):
+            self.published += 1
+            number = self.published
+            self.unconfirmed.add(number)
+
+            def committed(frame):
+                self.unconfirmed.discard(number)
+                self.connection._release_acks()
+                done()
+            self.channel.tx_commit(callback=committed)
+        self.connection._call(commit)
+
+    def tx_rollback(self):
+        self.connection._call(lambda done: self.channel.tx_rollback(callback=done))
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        wait = not self.connection._on_loop()
+
+        def publish(done):
+            self.channel.basic_publish(exchange, routing_key, body, properties, mandatory)
+            if not self.confirming:
+                return done()
+            self.published += 1
+            self.unconfirmed.add(self.published)
+            if not wait:
+                return done()
+            self.waiters[self.published] = (done, self.returned)
+
+        outcome = self.connection._call(publish)
+        if outcome == "nacked":
+            raise pika.exceptions.NackError([])
+        if outcome == "returned" and mandatory:
+            raise pika.exceptions.UnroutableError([])
+
+    def _on_confirm(self, frame):
+        method = frame.method
+        if method.multiple:
+            tags = {tag for tag in self.unconfirmed if tag <= method.delivery_tag}
+        else:
+            tags = {method.delivery_tag} & self.unconfirmed
+        self.unconfirmed -= tags
+        if not isinstance(method, pika.spec.Basic.Ack):
+            self.nacked |= tags
+        for tag in sorted(tags):
+            waiter = self.waiters.pop(tag, None)
+            if waiter is not None:
+                done, returned = waiter
+                if tag in self.nacked:
+                    done("nacked")
+                else:
+                    done("returned" if self.returned > returned else None)
+        self.connection._release_acks()
+
+    def _on_return(self, channel, method, properties, body):
+        self.returned += 1
+        if not self.waiters:
+            print(f"[Transport] Message to '{method.routing_key}' was returned as unroutable")
+
+    def _on_close(self, channel, reason):
+        # publishes / commits that will never be confirmed now: the acks held on them become nacks
+        self.nacked |= self.unconfirmed
+        self.unconfirmed = set()
+        self.connection._release_acks()
+        if not isinstance(reason, pika.exceptions.ChannelClosedByClient):
+            self.connection._fail_waiting(reason)
+
+    def basic_consume(self, queue, on_message_callback, auto_ack=False, **kwargs):
+        def deliver(channel, method, properties, body):
+            on_message_callback(self, method, properties, body)
+        tag = self.connection._call(lambda done: done(self.channel.basic_consume(queue, deliver, auto_ack=auto_ack,
+                                                                                 **kwargs)))
+        self.consumer_tags.append(tag)
+        return tag
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        self.connection._call(lambda done: done(self.connection._ack(self, delivery_tag, multiple)))
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        self.connection._call(lambda done: done(self.channel.basic_nack(delivery_tag, multiple, requeue)))
+
+    def basic_reject(self, delivery_tag=0, requeue=True):
+        self.basic_nack(delivery_tag, multiple=False, requeue=requeue)
+
+    def start_consuming(self):
+        self.stopped = self.connection._future()
+        self.connection._wait(self.stopped)
+
+    def stop_consuming(self):
+        def stop(done):
+            for tag in self.consumer_tags:
+                if self.channel.is_open:
+                    self.channel.basic_cancel(tag)
+            self.consumer_tags = []
+            if self.stopped is not None and not self.stopped.done():
+                self.stopped.set_result(None)
+            done()
+        self.connection._call(stop)
+
+    def close(self):
+        if self.channel.is_open:
+            self.connection._call(lambda done: done(self.channel.close()))
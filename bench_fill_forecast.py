@@ -0,0 +1,101 @@
+import sys
+import time
+
+import numpy as np
+
+import fill_forecast
+import server
+
+
+# Replay of synthetic fill histories: reactive pickups (truck requested once a bin reports over
+# server.THRESHOLD) vs forecast pickups (fill_forecast pre-schedules bins expected to cross it).
+# Every house reports every REPORT_HOURS; bins fill linearly at a per-house rate plus sensor noise,
+# and a requested bin is emptied on the first collection day at or after its requested day.
+# Prints the time to refit every house and, for both policies, how full bins are when emptied,
+# how many pickups found the bin overflowing (it reached 100% first), and the requests per day
+# (after a first week of warm-up, while the histories fill up).
+# Usage: python bench_fill_forecast.py [houses] [days]
+
+REPORT_HOURS = 6
+SENSOR_NOISE = 2.0
+# collection is daily; a request made on a day is picked up the next day at the earliest
+PICKUP_LAG_DAYS = 1
+WARM_UP_DAYS = 7
+
+
+def replay(houses, days, use_forecast, seed=3):
+    rng = np.random.default_rng(seed)
+    rates = rng.lognormal(np.log(0.8), 0.4, size=(houses, 3))  # % per hour
+    levels = rng.uniform(0, 60, size=(houses, 3))
+    pickup_day = np.full((houses, 3), np.inf)  # day the bin will be emptied (inf: not requested)
+    history = fill_forecast.ReadingHistory(houses)
+    house_ids = np.arange(1, houses + 1)
+    requests_per_day = []
+    fill_at_pickup = []
+    overflow_count = 0
+    overflowed = np.zeros((houses, 3), dtype=bool)
+    refit_times = []
+
+    steps_per_day = 24 // REPORT_HOURS
+    for step in range(days * steps_per_day):
+        now = step * REPORT_HOURS * 3600.0
+        day = step // steps_per_day
+        if step % steps_per_day == 0:
+            # the day's collection
+            emptied = pickup_day <= day
+            if day >= WARM_UP_DAYS:
+                fill_at_pickup.append(levels[emptied])
+                overflow_count += int(overflowed[emptied].sum())
+            overflowed[emptied] = False
+            levels[emptied] = 5
+            pickup_day[emptied] = np.inf
+            requests_per_day.append(0)
+
+        levels = np.minimum(levels + rates * REPORT_HOURS, 100)
+        overflowed |= levels >= 100
+        reported = np.clip(np.rint(levels + rng.normal(0, SENSOR_NOISE, levels.shape)), 0, 100).astype(np.uint8)
+        history.record_many(house_ids, reported, now)
+
+        open_bins = np.isfinite(pickup_day)
+        reactive = (reported > server.THRESHOLD) & ~open_bins
+        pickup_day[reactive] = day + PICKUP_LAG_DAYS
+        requests_per_day[-1] += int(reactive.any(axis=1).sum())
+
+        if use_forecast and step % steps_per_day == 0:
+            start = time.perf_counter()
+            crossing, latest = fill_forecast.threshold_times(history, server.THRESHOLD, now)
+            refit_times.append(time.perf_counter() - start)
+            due = ~np.isfinite(pickup_day) & (crossing <= now + fill_forecast.FORECAST_HORIZON)
+            # booked for the collection day on which the bin is expected to be full
+            pickup_day[due] = np.maximum(np.floor(crossing[due] / 86400), day + PICKUP_LAG_DAYS)
+            requests_per_day[-1] += int(due.any(axis=1).sum())
+
+    return np.concatenate(fill_at_pickup), overflow_count, requests_per_day[WARM_UP_DAYS:], refit_times
+
+
+def main():
+    houses = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    days = max(int(sys.argv[2]) if len(sys.argv) > 2 else 28, WARM_UP_DAYS + 1)
+
+    # refit of a full history (HISTORY_LENGTH readings for every house)
+    history = fill_forecast.ReadingHistory(houses)
+    rng = np.random.default_rng(1)
+    house_ids = np.arange(1, houses + 1)
+    for step in range(fill_forecast.HISTORY_LENGTH):
+        history.record_many(house_ids, rng.integers(0, 100, size=(houses, 3), dtype=np.uint8), step * 3600.0)
+    start = time.perf_counter()
+    fill_forecast.threshold_times(history, server.THRESHOLD, fill_forecast.HISTORY_LENGTH * 3600.0)
+    refit = time.perf_counter() - start
+    print(f"refit of {houses} houses x 3 bins ({fill_forecast.HISTORY_LENGTH} readings each): {refit * 1000:.0f} ms")
+
+    print(f"\nreplay: {houses} houses, {days} days, a report every {REPORT_HOURS} h")
+    print(f"{'':<12}{'pickups':>10}{'mean fill at pickup':>22}{'overflowed':>12}{'requests/day':>14}{'busiest day':>13}")
+    for label, use_forecast in (("reactive", False), ("forecast", True)):
+        fills, overflow_count, requests_per_day, refit_times = replay(houses, days, use_forecast)
+        print(f"{label:<12}{len(fills):10d}{fills.mean():21.1f}%{overflow_count:12d}"
+              f"{np.mean(requests_per_day):14.0f}{max(requests_per_day):13d}")
+    print(f"mean refit during the replay: {np.mean(refit_times) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import contextlib
+import io
+import random
+import sys
+import time
+
+import bench_week_planner
+import db
+import fleet
+import truck_scheduler
+
+
+# Same-day pickups as the fleet grows: one city, every request wants to go out on Sunday
+# (first_day 0), scheduled first-fit with truck_scheduler.schedule_pickup on fleets of
+# 1, 2, 4, ... trucks per type with a load limit of MAX_LOAD (bins are 60-100% full).
+# Then the cost of one placement in fleet.CapacityIndex (find the tightest fit + update)
+# against a linear scan of the trucks, for growing fleets.
+# Usage: python bench_fleet.py [houses] [max trucks per type]
+
+MAX_LOAD = 1500
+
+
+def use_fleet(trucks):
+    truck_scheduler.FLEET.clear()
+    truck_scheduler.FLEET.update((truck.truck_id, truck) for truck in trucks)
+    for day in truck_scheduler.WEEKLY_SCHEDULE:
+        truck_scheduler.WEEKLY_SCHEDULE[day] = {truck.truck_id: [] for truck in trucks}
+    truck_scheduler.ROUTES.clear()
+    truck_scheduler.CAPACITY.clear()
+
+
+def run_fleet(requests, trucks_per_type):
+    use_fleet(fleet.make_fleet(trucks_per_type, max_load=MAX_LOAD))
+    same_day = scheduled = 0
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for house_id, truck, load in requests:
+            day, _ = truck_scheduler.schedule_pickup(house_id, truck, optimise=False, load=load)
+            scheduled += day != 0
+            same_day += day == db.DAYS[0]
+    return same_day, scheduled, time.perf_counter() - start
+
+
+def linear_fit(remaining, load):
+    best = None
+    for truck_id, left in remaining.items():
+        if left >= load and (best is None or left < remaining[best]):
+            best = truck_id
+    return best
+
+
+def bench_index(trucks_per_type, placements=20000):
+    # room for every placement, spread over the trucks
+    trucks = fleet.make_fleet(trucks_per_type, max_load=120 * placements // trucks_per_type + 100)[:trucks_per_type]
+    loads = [random.randint(60, 100) for _ in range(placements)]
+
+    index = fleet.CapacityIndex(trucks)
+    start = time.perf_counter()
+    for load in loads:
+        index.update(next(index.fitting(load)), load)
+    indexed = time.perf_counter() - start
+
+    remaining = {truck.truck_id: truck.max_load for truck in trucks}
+    count = min(placements, 200000 // trucks_per_type + 1)  # the scan gets slow, time a sample
+    start = time.perf_counter()
+    for load in loads[:count]:
+        remaining[linear_fit(remaining, load)] -= load
+    scanned = (time.perf_counter() - start) * placements / count
+    return indexed / placements, scanned / placements
+
+
+def main():
+    houses = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    max_trucks = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    house_grid, city_requests, max_distance = bench_week_planner.make_city(houses)
+    bench_week_planner.use_city(house_grid, max_distance * 7)  # a day can hold a full week's route
+    random.seed(5)
+    requests = [(house_id, truck, random.randint(60, 100)) for house_id, truck in city_requests]
+
+    print(f"{houses} requests, all from Sunday; route limit {truck_scheduler.MAX_DISTANCE}, "
+          f"load limit {MAX_LOAD} per truck")
+    print(f"{'trucks/type':>12}{'same day':>10}{'scheduled':>11}{'us/pickup':>11}")
+    trucks_per_type = 1
+    while trucks_per_type <= max_trucks:
+        same_day, scheduled, elapsed = run_fleet(requests, trucks_per_type)
+        print(f"{trucks_per_type:12d}{same_day:10d}{scheduled:11d}{elapsed / len(requests) * 1e6:11.0f}")
+        trucks_per_type *= 2
+
+    print(f"\n{'trucks':>12}{'index us':>10}{'scan us':>10}")
+    for trucks in (10, 100, 1000, 10000, 100000):
+        indexed, scanned = bench_index(trucks)
+        print(f"{trucks:12d}{indexed * 1e6:10.2f}{scanned * 1e6:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import random
+import sys
+import time
+
+import numpy as np
+
+import truck_scheduler
+from house_index import HouseIndex
+
+
+# Micro-benchmark: dict-based truck_scheduler.distance_between_houses vs HouseIndex batches,
+# plus the spatial queries. Usage: python bench_house_index.py [houses] [grid side]
+
+
+def timed(function, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    houses = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    side = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    random.seed(7)
+    house_grid = {house_id: (random.randrange(side), random.randrange(side)) for house_id in range(houses)}
+    truck_scheduler.HOUSE_GRID.clear()
+    truck_scheduler.HOUSE_GRID.update(house_grid)
+
+    build_time, index = timed(lambda: HouseIndex.from_grid(house_grid), repeat=1)
+    print(f"index build ({houses} houses): {build_time * 1000:.1f} ms")
+
+    # one-to-many: one house against every house
+    ids = list(house_grid)
+    dict_time, dict_result = timed(lambda: [truck_scheduler.distance_between_houses(0, h) for h in ids])
+    array_time, array_result = timed(lambda: index.distances_from(0, ids))
+    assert dict_result == array_result.tolist()
+    print(f"one-to-many  ({houses}):       dict {dict_time * 1000:8.2f} ms   numpy {array_time * 1000:8.2f} ms"
+          f"   ({dict_time / array_time:.0f}x)")
+
+    # many-to-many: pairwise matrix for a block of houses
+    block = ids[:1000]
+    dict_time, dict_result = timed(
+        lambda: [[truck_scheduler.distance_between_houses(a, b) for b in block] for a in block], repeat=1)
+    array_time, array_result = timed(lambda: index.distance_matrix(block))
+    assert np.array_equal(np.array(dict_result), array_result)
+    print(f"many-to-many ({len(block)}x{len(block)}):  dict {dict_time * 1000:8.2f} ms   numpy {array_time * 1000:8.2f} ms"
+          f"   ({dict_time / array_time:.0f}x)")
+
+    # spatial queries vs a brute-force scan of the dict
+    x, y = house_grid[0]
+    radius = side // 50
+    brute_time, brute = timed(lambda: sorted(h for h, (hx, hy) in house_grid.items()
+                                             if abs(hx - x) + abs(hy - y) <= radius))
+    query_time, found = timed(lambda: index.within_radius(x, y, radius))
+    assert brute == sorted(found.tolist())
+    print(f"within radius {radius}:           scan {brute_time * 1000:8.2f} ms   grid  {query_time * 1000:8.2f} ms"
+          f"   ({len(found)} houses)")
+
+    brute_time, brute = timed(lambda: sorted(house_grid, key=lambda h: abs(house_grid[h][0] - x) + abs(house_grid[h][1] - y))[:10])
+    query_time, found = timed(lambda: index.nearest(x, y, 10))
+    assert sorted(abs(house_grid[h][0] - x) + abs(house_grid[h][1] - y) for h in brute) == \
+        sorted(abs(house_grid[h][0] - x) + abs(house_grid[h][1] - y) for h in found.tolist())
+    print(f"nearest 10:                  scan {brute_time * 1000:8.2f} ms   grid  {query_time * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
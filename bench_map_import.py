@@ -0,0 +1,103 @@
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import coordinate_cache
+import db
+import map_import
+
+
+# Benchmark of the map at city size: the old way (one execute per house, a new connection and
+# query per coordinate lookup) against map_import (executemany in one transaction, from CSV or
+# GeoJSON) and the in-memory coordinate_cache.CoordinateCache.
+# Usage: python bench_map_import.py [houses]
+
+
+def timed(label, function):
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<52} {elapsed * 1000:10.1f} ms")
+    return elapsed, result
+
+
+def city(houses):
+    random.seed(3)
+    side = int(houses ** 0.5) * 2
+    return [(house_id, random.randrange(side), random.randrange(side)) for house_id in range(houses + 1)]
+
+
+def main():
+    houses = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    directory = tempfile.mkdtemp()
+    rows = city(houses)
+    csv_path = os.path.join(directory, "houses.csv")
+    with open(csv_path, "w") as csv_file:
+        csv_file.write("house_id,x,y\n")
+        csv_file.writelines(f"{house_id},{x},{y}\n" for house_id, x, y in rows)
+    geojson_path = os.path.join(directory, "houses.geojson")
+    with open(geojson_path, "w") as geojson_file:
+        json.dump({"type": "FeatureCollection", "features": [
+            {"type": "Feature", "id": house_id, "geometry": {"type": "Point", "coordinates": [x, y]}, "properties": {}}
+            for house_id, x, y in rows]}, geojson_file)
+
+    # old way: one execute per house (as db.create_tables did), one commit
+    legacy_path = os.path.join(directory, "legacy.db")
+    legacy = db.connect(legacy_path)
+    cursor = legacy.cursor()
+    db.create_map_table(cursor)
+
+    def execute_per_house():
+        for row in rows:
+            cursor.execute("INSERT INTO map (house_id, x_value, y_value) VALUES (?, ?, ?)", row)
+        legacy.commit()
+
+    elapsed, _ = timed(f"execute per house ({houses} houses, parsed)", execute_per_house)
+    print(f"{'':<52} {len(rows) / elapsed:10.0f} houses/s")
+    legacy.close()
+
+    parsed = db.connect(os.path.join(directory, "parsed.db"))
+    elapsed, _ = timed("map_import.import_houses (parsed, executemany)", lambda: map_import.import_houses(parsed, rows))
+    print(f"{'':<52} {len(rows) / elapsed:10.0f} houses/s")
+    parsed.close()
+
+    path = os.path.join(directory, "map.db")
+    connection = db.connect(path)
+    elapsed, written = timed("map_import CSV (parse + executemany, 1 transaction)",
+                             lambda: map_import.import_houses(connection, map_import.read_houses(csv_path)))
+    print(f"{'':<52} {written / elapsed:10.0f} houses/s")
+    elapsed, written = timed("map_import GeoJSON (parse + executemany)",
+                             lambda: map_import.import_houses(connection, map_import.read_houses(geojson_path), replace=True))
+    print(f"{'':<52} {written / elapsed:10.0f} houses/s")
+
+    # lookups: a connection + query per message (as client.get_house_coordinates did) vs the cache
+    lookups = [random.randint(1, houses) for _ in range(100000)]
+    sample = 2000
+
+    def connect_per_lookup():
+        for house_id in lookups[:sample]:
+            lookup = sqlite3.connect(path)
+            lookup.execute("SELECT x_value, y_value FROM map WHERE house_id = ?", (house_id,)).fetchone()
+            lookup.close()
+
+    elapsed, _ = timed(f"connection + query per lookup ({sample} lookups)", connect_per_lookup)
+    print(f"{'':<52} {elapsed / sample * 1e6:10.1f} us/lookup")
+    _, cache = timed("CoordinateCache load", lambda: coordinate_cache.CoordinateCache(path))
+    elapsed, found = timed(f"CoordinateCache lookups ({len(lookups)})", lambda: [cache.location(house_id) for house_id in lookups])
+    print(f"{'':<52} {elapsed / len(lookups) * 1e6:10.1f} us/lookup")
+    assert found[0] == rows[lookups[0]][1:]
+
+    connection.execute("UPDATE map SET x_value = -1 WHERE house_id = ?", (lookups[0],))
+    connection.commit()
+    timed("CoordinateCache reload after a change", cache.check)
+    assert cache.location(lookups[0])[0] == -1
+    cache.close()
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
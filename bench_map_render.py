@@ -0,0 +1,122 @@
+import math
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import map_renderer
+
+
+# Map rendering for growing cities (1k, 100k, 1M houses, one house per 4 grid cells):
+# the old drawing (a line per grid row / column, a rectangle and a text per house, all at
+# 50 px per cell) against map_renderer.MapRenderer at three zoom levels (whole city -> heatmap,
+# a district, a street at the old 50 px). Prints canvas items, redraw time (mean of 10 pans)
+# and the Python memory of the renderer's house arrays.
+# Draws on a real Tk canvas when there is a display, otherwise on CountingCanvas, which only
+# counts items (the time is then the renderer's own work without Tk's).
+# Usage: python bench_map_render.py [max houses]
+
+SIZE = 500
+PANS = 10
+
+
+class CountingCanvas:
+    def __init__(self):
+        self.items = 0
+        self.calls = 0
+
+    def _create(self, *args, **options):
+        self.items += 1
+        return self.items
+
+    create_line = create_rectangle = create_text = create_image = _create
+
+    def _call(self, *args, **options):
+        self.calls += 1
+
+    coords = itemconfigure = tag_raise = tag_lower = bind = after_idle = _call
+
+
+class HeadlessRenderer(map_renderer.MapRenderer):
+    # no Tk image without a display: the PPM is built, not shown
+    def show_heatmap(self, ppm):
+        self.heat_image = ppm
+
+
+def make_city(houses):
+    side = int(2 * math.sqrt(houses))
+    rng = random.Random(7)
+    return {house_id: (rng.randrange(side), rng.randrange(side)) for house_id in range(1, houses + 1)}, side
+
+
+def new_canvas():
+    if os.environ.get("DISPLAY"):
+        import tkinter as tk
+        root = tk.Tk()
+        canvas = tk.Canvas(root, width=SIZE, height=SIZE)
+        canvas.pack()
+        return canvas, map_renderer.MapRenderer
+    return CountingCanvas(), HeadlessRenderer
+
+
+def item_count(canvas):
+    return len(canvas.find_all()) if hasattr(canvas, "find_all") else canvas.items
+
+
+def old_draw(canvas, houses, side):
+    start = time.perf_counter()
+    for i in range(side + 1):
+        canvas.create_line(i * 50, 0, i * 50, side * 50, fill="gray")
+        canvas.create_line(0, i * 50, side * 50, i * 50, fill="gray")
+    for house_id, (x, y) in houses.items():
+        canvas.create_rectangle(x * 50, y * 50, (x + 1) * 50, (y + 1) * 50, fill="grey")
+        canvas.create_text(x * 50 + 25, y * 50 + 20, text=f"House {house_id}", fill="white", font=("Arial", 9, "bold"))
+    return time.perf_counter() - start
+
+
+def bench_view(renderer, scale):
+    renderer.fit()
+    renderer.zoom(scale / renderer.scale, SIZE / 2, SIZE / 2)
+    renderer.redraw()
+    start = time.perf_counter()
+    for _ in range(PANS):
+        renderer.pan(37, 23)
+        renderer.redraw()
+    return (time.perf_counter() - start) / PANS
+
+
+def main():
+    max_houses = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    canvas, renderer_class = new_canvas()
+    print(f"{'Tk canvas' if renderer_class is map_renderer.MapRenderer else 'CountingCanvas (no display)'}, "
+          f"{SIZE}x{SIZE} px")
+    print(f"{'houses':>9}{'old items':>11}{'old ms':>9}  {'view':<9}{'items':>7}{'redraw ms':>11}{'houses drawn':>14}"
+          f"{'arrays MB':>11}")
+    houses_count = 1000
+    while houses_count <= max_houses:
+        houses, side = make_city(houses_count)
+        old_canvas, _ = new_canvas()
+        old_ms = old_draw(old_canvas, houses, side) * 1000
+        old_items = item_count(old_canvas)
+
+        tracemalloc.start()
+        renderer = renderer_class(canvas, SIZE, SIZE, houses, (side // 2, side // 2))
+        arrays = tracemalloc.get_traced_memory()[0] / 1e6
+        tracemalloc.stop()
+        first = True
+        for view, scale in (("city", SIZE / side), ("district", 6), ("street", 50)):
+            redraw_ms = bench_view(renderer, scale) * 1000
+            print(f"{houses_count if first else '':>9}{old_items if first else '':>11}"
+                  f"{f'{old_ms:.0f}' if first else '':>9}  {view:<9}{item_count(canvas):>7}{redraw_ms:11.2f}"
+                  f"{renderer.drawn:>14}{f'{arrays:.1f}' if first else '':>11}")
+            first = False
+        if hasattr(canvas, "master"):
+            canvas.master.destroy()
+            old_canvas.master.destroy()
+        canvas, renderer_class = new_canvas()
+        houses_count *= 100 if houses_count < 100000 else 10
+
+
+if __name__ == "__main__":
+    main()
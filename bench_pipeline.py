@@ -0,0 +1,313 @@
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# End-to-end benchmark of the collection pipeline: simulated house sensors (client.publish_house_info_to_queue)
+# -> server.rabbitmq_callback -> truck_scheduler.rabbitmq_callback -> schedule rows committed to SQLite,
+# on the in-process broker (transport "inproc") and a fresh temporary database per scenario.
+# A scenario is a seeded random city (houses around the base), a fleet (trucks per type, route limit
+# scaled to the city) and a stream of reports offered at a fixed rate. The reports cover one simulated
+# week, with fill levels from sensor_simulator.FillModel (bins fill up, get emptied after reporting
+# above the threshold), computed before the run starts. Server and scheduler run their
+# real listeners (start_rabbitmq_listener), pumped from one thread, until every report is scheduled.
+# Each scenario runs in its own process (the scheduler opens its database at import, and peak RSS
+# is per process) and reports as JSON:
+# - throughput: reports/s and committed schedule rows/s
+# - latency: p50 / p99 / max of client publish -> schedule row committed (metrics "end_to_end";
+#   log2 buckets, so values are bucket bounds)
+# - schedule quality: total route distance of the week, pickups left unscheduled
+# - peak RSS of the scenario's process
+# Batching in the server and the scheduler is time based, so repeated runs can differ slightly.
+# A request that fits on no day waits in truck_scheduler.PENDING; the week is re-optimised from the
+# scheduler's timer (truck_scheduler.OPTIMISE_TIME_BUDGET, at most every OPTIMISE_INTERVAL seconds) and repaired.
+# Usage:
+#   python bench_pipeline.py [scenario ...] [--json results.json] [--save-baseline baseline.json]
+#   python bench_pipeline.py --baseline baseline.json      -> compares against a saved run, exit 1 on regressions
+#   python bench_pipeline.py --houses 5000 --reports 20000 --rate 4000 --trucks 3   -> custom scenario
+# Scenarios: 10, 1k, 100k, 1m (default: 10 1k 100k)
+
+SCENARIOS = {
+    "10": {"houses": 10, "reports": 500, "rate": 500, "trucks": 1},
+    "1k": {"houses": 1000, "reports": 10000, "rate": 2000, "trucks": 2},
+    "100k": {"houses": 100000, "reports": 50000, "rate": 4000, "trucks": 8},
+    "1m": {"houses": 1000000, "reports": 100000, "rate": 4000, "trucks": 32},
+}
+DEFAULT_SCENARIOS = ["10", "1k", "100k"]
+SEED = 11
+WEEK = 7 * 24 * 3600
+
+# a scenario that doesn't drain in this long after its last report fails
+DRAIN_TIMEOUT = 600
+
+# compared against the baseline: (higher is better, relative change tolerated in the bad direction)
+# latencies are exact percentiles of the end-to-end samples, noisier than throughput
+COMPARED = {
+    "reports_per_s": (True, 0.15),
+    "rows_per_s": (True, 0.15),
+    "latency_p50_us": (False, 0.3),
+    "latency_p99_us": (False, 0.3),
+    "total_distance": (False, 0.05),
+    "unscheduled": (False, 0.05),
+    "peak_rss_mb": (False, 0.15),
+}
+
+
+def make_city(houses, trucks, seed):
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    side = int(2 * math.sqrt(houses)) + 10
+    xs = rng.integers(0, side, houses + 1)
+    ys = rng.integers(0, side, houses + 1)
+    xs[0] = ys[0] = side // 2  # house 0 is the base
+    # one truck's week ~ a tour through its share of the houses (as bench_week_planner.py), with room
+    # for the ~3 pickups a house needs per week and first-fit routes, and at least the round trip to
+    # the farthest corner so the scenario measures the pipeline, not a full week
+    per_truck = houses / (3 * trucks)
+    max_distance = max(int(2 * 0.95 * math.sqrt(per_truck * side * side) / 7 + side), 2 * side)
+    return xs, ys, max_distance
+
+
+# writes the scenario's map and fleet into directory and points the stages at them
+# (before db / truck_scheduler are imported)
+def prepare(directory, xs, ys, trucks, max_distance):
+    import sqlite3
+    path = os.path.join(directory, "pipeline.db")
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE map (house_id INTEGER PRIMARY KEY, x_value INTEGER, y_value INTEGER)")
+    connection.executemany("INSERT INTO map VALUES (?, ?, ?)", zip(range(len(xs)), xs.tolist(), ys.tolist()))
+    connection.commit()
+    connection.close()
+    fleet_path = os.path.join(directory, "fleet.json")
+    with open(fleet_path, "w") as fleet_file:
+        json.dump([{"id": truck_type if number == 1 else f"{truck_type}-{number}", "type": truck_type,
+                    "depot": 0, "max_distance": max_distance}
+                   for truck_type in ("Garbage", "Recycling", "Organic") for number in range(1, trucks + 1)],
+                  fleet_file)
+    os.environ["WASTE_DB_PATH"] = path
+    os.environ["WASTE_SNAPSHOT_PATH"] = os.path.join(directory, "scheduler_state.snap")
+    os.environ["WASTE_FLEET"] = fleet_path
+    os.environ["WASTE_TRANSPORT"] = "inproc"
+
+
+def run_scenario(spec):
+    import random
+    import numpy as np
+
+    started = time.perf_counter()
+    directory = tempfile.mkdtemp(prefix="bench_pipeline_")
+    xs, ys, max_distance = make_city(spec["houses"], spec["trucks"], SEED)
+    prepare(directory, xs, ys, spec["trucks"], max_distance)
+
+    import client
+    import db
+    import metrics
+    import sensor_simulator
+    import server
+    import transport
+    import truck_scheduler
+
+    random.seed(SEED)  # the clients' request ids
+    report_houses = np.random.default_rng(SEED + 1).integers(1, spec["houses"] + 1, spec["reports"]).tolist()
+    rng = random.Random(SEED + 2)
+    models = {}
+    report_levels = []
+    for index, house_id in enumerate(report_houses):
+        sim_time = index * WEEK / spec["reports"]
+        model = models.get(house_id)
+        if model is None:
+            model = models[house_id] = sensor_simulator.FillModel(rng, sim_time)
+        report_levels.append(model.read(sim_time))
+    models = None
+
+    metrics.METRICS.keep_samples("end_to_end")  # exact p50 / p99, not log2 bucket bounds
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        with truck_scheduler.conn:
+            db.create_schedule_table(truck_scheduler.cursor)
+        truck_scheduler.load_state()
+        scheduler_connection, _ = truck_scheduler.start_rabbitmq_listener()
+        server_connection, _ = server.start_rabbitmq_listener()
+        client_connection, client_channel = client.setup_rabbitmq()
+        broker = transport.BROKER
+        connections = (server_connection, scheduler_connection)
+        setup_s = time.perf_counter() - started
+
+        start = time.perf_counter()
+        sent = 0
+        while sent < spec["reports"]:
+            due = min(spec["reports"], int((time.perf_counter() - start) * spec["rate"]) + 1)
+            for index in range(sent, due):
+                house_id = report_houses[index]
+                client.publish_house_info_to_queue(house_id, channel=client_channel,
+                                                   garbage_info=report_levels[index],
+                                                   location={"x": int(xs[house_id]), "y": int(ys[house_id])})
+            sent = due
+            for connection in connections:
+                connection.process_data_events()
+        published_s = time.perf_counter() - start
+
+        # drain: every report aggregated and published, every truck request committed and acked
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        while (broker.message_count('Garbage-Info-Queue') or broker.message_count('Truck-Queue')
+               or any(channel.unacked for connection in connections for channel in connection.channels)):
+            if not broker.message_count('Garbage-Info-Queue'):
+                server.close_aggregation_window()
+            for connection in connections:
+                connection.process_data_events(time_limit=0.001)
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Pipeline didn't drain within {DRAIN_TIMEOUT} s")
+        truck_scheduler.SCHEDULE_WRITER.flush()
+        elapsed = time.perf_counter() - start
+        server.stop_rabbitmq_listener(server_connection)
+        client_connection.close()
+
+    rows, unscheduled = truck_scheduler.conn.execute(
+        "SELECT COUNT(*), COUNT(*) - COUNT(day) FROM schedule").fetchone()
+    routes = [truck_scheduler.get_route(day, truck) for day, trucks in truck_scheduler.WEEKLY_SCHEDULE.items()
+              for truck in trucks]
+    snapshot = metrics.METRICS.snapshot()
+    end_to_end = snapshot["latency"].get("end_to_end", metrics.Histogram().summary())
+    return {
+        **spec,
+        "max_distance": max_distance,
+        "setup_s": round(setup_s, 3),
+        "publish_s": round(published_s, 3),
+        "elapsed_s": round(elapsed, 3),
+        "reports_per_s": round(spec["reports"] / elapsed, 1),
+        "truck_requests": snapshot["counters"].get("server.truck_requests", 0),
+        "rows": rows,
+        "rows_per_s": round(rows / elapsed, 1),
+        "latency_p50_us": end_to_end["p50_us"],
+        "latency_p99_us": end_to_end["p99_us"],
+        "latency_max_us": end_to_end["max_us"],
+        "total_distance": sum(route.length for route in routes),
+        "truck_days": sum(1 for route in routes if len(route.houses)),
+        "unscheduled": unscheduled,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+# commit the benchmarked tree is at: WASTE_BENCH_COMMIT, else git rev-parse, else read from .git
+# (no git binary, or a repository git refuses to read as another user)
+def current_commit():
+    if os.environ.get("WASTE_BENCH_COMMIT"):
+        return os.environ["WASTE_BENCH_COMMIT"]
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=directory).stdout.strip()
+    except OSError:
+        commit = ""
+    if commit:
+        return commit[:12]
+    git_dir = os.path.join(directory, ".git")
+    try:
+        with open(os.path.join(git_dir, "HEAD")) as head_file:
+            head = head_file.read().strip()
+        if not head.startswith("ref: "):
+            return head[:12]
+        ref = head[5:]
+        if os.path.exists(os.path.join(git_dir, ref)):
+            with open(os.path.join(git_dir, ref)) as ref_file:
+                return ref_file.read().strip()[:12]
+        with open(os.path.join(git_dir, "packed-refs")) as packed_file:
+            for line in packed_file:
+                if line.rstrip().endswith(" " + ref):
+                    return line.split()[0][:12]
+    except OSError:
+        pass
+    return None
+
+
+def environment():
+    commit = current_commit()
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "commit": commit}
+
+
+# runs one scenario in a child process, returns its results
+def run_in_process(name, spec):
+    print(f"[Bench] {name}: {spec['houses']} houses, {spec['reports']} reports at {spec['rate']}/s, "
+          f"{spec['trucks']} trucks per type", file=sys.stderr)
+    child = subprocess.run([sys.executable, os.path.abspath(__file__), "--run", json.dumps(spec)],
+                           capture_output=True, text=True)
+    if child.returncode != 0:
+        raise RuntimeError(f"Scenario {name} failed:\n{child.stderr}")
+    return json.loads(child.stdout.strip().splitlines()[-1])
+
+
+# prints the changes against the baseline, returns the regressions
+def compare(results, baseline):
+    regressions = []
+    print(f"{'scenario':<10}{'metric':<16}{'baseline':>12}{'now':>12}{'change':>9}")
+    for name, result in results["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            print(f"{name:<10}(not in the baseline)")
+            continue
+        for metric, (higher_is_better, tolerance) in COMPARED.items():
+            old, new = before.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else (0.0 if new == old else math.inf)
+            worse = -change if higher_is_better else change
+            flag = "  REGRESSION" if worse > tolerance else ""
+            if flag:
+                regressions.append((name, metric, old, new))
+            print(f"{name:<10}{metric:<16}{old:>12}{new:>12}{change:>+9.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of client -> server -> truck scheduler.")
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run ({', '.join(SCENARIOS)})")
+    parser.add_argument("--houses", type=int, help="custom scenario: number of houses")
+    parser.add_argument("--reports", type=int, help="custom scenario: number of reports")
+    parser.add_argument("--rate", type=float, help="custom scenario: reports offered per second")
+    parser.add_argument("--trucks", type=int, help="custom scenario: trucks per type")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare against the results saved in this file")
+    parser.add_argument("--save-baseline", help="save the results as a baseline in this file")
+    parser.add_argument("--run", help=argparse.SUPPRESS)  # child process: one scenario spec as JSON
+    arguments = parser.parse_args()
+
+    if arguments.run:
+        print(json.dumps(run_scenario(json.loads(arguments.run))))
+        return
+
+    scenarios = {}
+    if arguments.houses:
+        spec = {"houses": arguments.houses, "reports": arguments.reports or arguments.houses * 10,
+                "rate": arguments.rate or 2000, "trucks": arguments.trucks or 1}
+        scenarios[f"custom-{spec['houses']}"] = spec
+    for name in arguments.scenarios or ([] if scenarios else DEFAULT_SCENARIOS):
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name}, expected one of {', '.join(SCENARIOS)}")
+        scenarios[name] = SCENARIOS[name]
+
+    results = {"environment": environment(), "scenarios": {}}
+    for name, spec in scenarios.items():
+        results["scenarios"][name] = run_in_process(name, spec)
+    output = json.dumps(results, indent=2)
+    print(output)
+    for path in (arguments.json, arguments.save_baseline):
+        if path:
+            with open(path, "w") as results_file:
+                results_file.write(output + "\n")
+    if arguments.baseline:
+        with open(arguments.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file))
+        if regressions:
+            print(f"[Bench] {len(regressions)} regression(s) against {arguments.baseline}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
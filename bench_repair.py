@@ -0,0 +1,120 @@
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+# the scheduler writes its schedule rows to a scratch database
+directory = tempfile.mkdtemp()
+os.environ["WASTE_DB_PATH"] = os.path.join(directory, "repair.db")
+os.environ["WASTE_SNAPSHOT_PATH"] = os.path.join(directory, "repair.snap")
+
+import bench_fleet
+import bench_week_planner
+import db
+import fleet
+import map_import
+import truck_scheduler
+
+
+# Real-time rescheduling: a truck taken out of service for a day (set_availability: its pickups
+# are displaced and re-placed by insertion / ejection chains) and full bins arriving when every
+# route is full (place_by_ejection), against rebuilding the week first-fit without the truck.
+# Usage: python bench_repair.py [houses] [trucks per type]
+
+FULL_BINS = 200
+
+# load limit of a truck, in days' worth of its average load (bins are 20-100% full, 60% on average)
+LOAD_SLACK = 1.3
+
+
+def quiet(function, *arguments, **keywords):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*arguments, **keywords)
+
+
+def fill_week(requests):
+    request_id = 0
+    for house_id, truck, load in requests:
+        request_id += 1
+        day, truck_id = truck_scheduler.schedule_pickup(house_id, truck, optimise=False, load=load)
+        truck_scheduler.publish_truck_info_to_queue(request_id, house_id, [truck], [day or "N/A"], [truck_id], [load])
+        if truck_id is None:
+            truck_scheduler.PENDING.push(request_id, truck, house_id, load)
+    truck_scheduler.SCHEDULE_WRITER.flush()
+    return request_id
+
+
+def main():
+    houses = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    trucks_per_type = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    db.create_tables(db.cursor)
+    db.conn.commit()
+    house_grid, city_requests, max_distance = bench_week_planner.make_city(houses)
+    bench_week_planner.use_city(house_grid, max_distance)
+    # the scheduler reloads its map when the map table changes (truck_scheduler.refresh_map)
+    map_import.import_houses(db.conn, ((house_id, x, y) for house_id, (x, y) in house_grid.items()), replace=True)
+    truck_scheduler.get_all_house_coordinates()
+    random.seed(6)
+    requests = [(house_id, truck, random.randint(20, 100)) for house_id, truck in city_requests]
+    max_load = int(LOAD_SLACK * 60 * houses / len(db.TRUCK_TYPES) / (7 * trucks_per_type))
+    trucks = fleet.make_fleet(trucks_per_type, max_load=max_load)
+    bench_fleet.use_fleet(trucks)
+
+    start = time.perf_counter()
+    request_id = quiet(fill_week, requests)
+    print(f"{houses} requests, {len(trucks)} trucks (load limit {max_load}): week filled first-fit in "
+          f"{time.perf_counter() - start:.2f} s, {len(truck_scheduler.PENDING)} waiting; "
+          f"repair budget {truck_scheduler.REPAIR_TIME_BUDGET * 1000:.0f} ms")
+
+    # first repair pass (in the budget) + the passes continuing it at the next timer ticks
+    print(f"\n{'truck out of service':<32}{'1st pass ms':>12}{'passes':>8}{'total ms':>10}"
+          f"{'displaced':>11}{'placed':>8}{'waiting':>9}{'ms/pickup':>11}")
+    for truck in trucks[:3]:
+        for day in ("Wednesday", None):
+            start = time.perf_counter()
+            report = quiet(truck_scheduler.set_availability, truck.truck_id, day)
+            first = time.perf_counter() - start
+            passes, placed, displaced = 1, report["placed"], report["displaced"]
+            while truck_scheduler.REPAIR_DUE:
+                report = quiet(truck_scheduler.repair)
+                passes, placed = passes + 1, placed + report["placed"]
+            elapsed = time.perf_counter() - start
+            print(f"{truck.truck_id + ' on ' + (day or 'every day'):<32}{first * 1000:12.1f}{passes:8d}"
+                  f"{elapsed * 1000:10.1f}{displaced:11d}"
+                  f"{placed:8d}{len(truck_scheduler.PENDING):9d}{elapsed / max(placed, 1) * 1000:11.2f}")
+            quiet(truck_scheduler.set_availability, truck.truck_id, day, available=True)
+            while truck_scheduler.REPAIR_DUE:
+                quiet(truck_scheduler.repair)
+
+    # full bins of random houses: the emptiest bins on the routes make room for them
+    placed = 0
+    bins = [(house_id, random.choice(db.TRUCK_TYPES)) for house_id in random.sample(range(1, houses + 1), FULL_BINS)]
+    start = time.perf_counter()
+    for house_id, truck in bins:
+        day, truck_id = quiet(truck_scheduler.schedule_pickup, house_id, truck, optimise=False, load=fleet.FULL_BIN_LOAD)
+        if truck_id is None:
+            day, truck_id = quiet(truck_scheduler.place_by_ejection, house_id, truck, fleet.FULL_BIN_LOAD, time.time())
+        if truck_id is not None:
+            placed += 1
+            request_id += 1
+            quiet(truck_scheduler.publish_truck_info_to_queue, request_id, house_id, [truck], [day], [truck_id],
+                  [fleet.FULL_BIN_LOAD])
+    elapsed = time.perf_counter() - start
+    print(f"\n{FULL_BINS} full bins: {placed} placed, {elapsed / FULL_BINS * 1000:.2f} ms each "
+          f"(insertion, then an ejection chain), {truck_scheduler.metrics.METRICS.counters.get('scheduler.ejections', 0)} pickups displaced")
+
+    # without repair: rebuild the whole week first-fit, the truck out of service
+    bench_fleet.use_fleet(trucks[1:])
+    truck_scheduler.SCHEDULE_WRITER.rows.clear()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for house_id, truck, load in requests:
+            truck_scheduler.schedule_pickup(house_id, truck, optimise=False, load=load)
+    print(f"rebuilding the week first-fit without {trucks[0].truck_id}: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import contextlib
+import io
+import random
+import sys
+import time
+
+import server
+import wire_protocol
+from inproc_broker import InProcessBroker
+from report_aggregator import ReportAggregator
+
+
+# Truck-Queue traffic and schedule rows caused by repeated reports: one truck request per report
+# (old behaviour) vs the server's windowed, deduplicating ReportAggregator.
+# Every house reports `reports` times; its bins fill up between reports and are emptied at random,
+# so most reports of a full bin repeat a request that is still open.
+# Usage: python bench_report_aggregation.py [houses] [reports per house]
+
+# fill level of a bin right after it was emptied
+RESIDUAL = 5
+
+
+def make_reports(houses, reports):
+    random.seed(11)
+    levels = {house_id: [random.randint(0, 70) for _ in range(3)] for house_id in range(1, houses + 1)}
+    messages = []
+    for _ in range(reports):
+        for house_id, house_levels in levels.items():
+            for i in range(3):
+                house_levels[i] = RESIDUAL if random.random() < 0.05 else min(house_levels[i] + random.randint(0, 15), 100)
+            messages.append(wire_protocol.encode_garbage_report(len(messages) + 1, house_id, house_levels))
+    return messages
+
+
+def run(messages, aggregate):
+    broker = InProcessBroker()
+    broker.declare('Garbage-Info-Queue')
+    for message in messages:
+        broker.put('Garbage-Info-Queue', message)
+    connection = broker.BlockingConnection()
+    channel = connection.channel()
+    server.PUBLISHER = server.TruckRequestPublisher(connection)
+    server.AGGREGATOR = ReportAggregator(server.THRESHOLD) if aggregate else None
+    channel.basic_consume(queue='Garbage-Info-Queue', on_message_callback=server.rabbitmq_callback)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        while broker.message_count('Garbage-Info-Queue') or channel.unacked:
+            connection.process_data_events()
+            if aggregate:
+                server.close_aggregation_window()
+            else:
+                server.PUBLISHER.flush()
+    elapsed = time.perf_counter() - start
+    requests = [wire_protocol.decode_truck_request(entry[1]) for entry in iter(lambda: broker.get('Truck-Queue'), None)]
+    server.PUBLISHER = server.AGGREGATOR = None
+    return elapsed, len(requests), sum(len(request.trucks_needed) for request in requests), len(
+        {request.request_id for request in requests})
+
+
+def main():
+    houses = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    reports = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    messages = make_reports(houses, reports)
+    print(f"{houses} houses x {reports} reports = {len(messages)} garbage reports")
+    print(f"{'':<24}{'time':>10}{'reports/s':>12}{'truck requests':>16}{'schedule rows':>15}{'unique ids':>12}")
+    results = {}
+    for label, aggregate in (("per report", False), ("windowed + dedup", True)):
+        elapsed, requests, rows, unique = run(messages, aggregate)
+        results[label] = rows
+        print(f"{label:<24}{elapsed * 1000:8.0f}ms{len(messages) / elapsed:12.0f}{requests:16d}{rows:15d}{unique:12d}")
+    print(f"schedule rows cut by {results['per report'] / results['windowed + dedup']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
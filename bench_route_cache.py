@@ -0,0 +1,69 @@
+import random
+import sys
+import time
+import tracemalloc
+
+from house_index import manhattan_path
+import route_cache
+
+
+# Cost of the routes the UI animates, per dispatched truck: the old cell-by-cell path (a tuple per
+# grid cell, rebuilt every simulated week) against route_cache.manhattan_polyline (corner points
+# only) and a RouteCache hit, for routes of growing numbers of stops on a GRID x GRID map.
+# Prints the build time, the memory held by one route and the points the animator walks through.
+# Usage: python bench_route_cache.py [max stops]
+
+GRID = 200
+BASE = (GRID // 2, GRID // 2)
+REPEATS = 20
+
+
+def cell_path(stops):
+    # WasteCollectionUI.dispatch_truck / get_path before the route cache
+    current, path = BASE, [BASE]
+    for location in stops + [BASE]:
+        path += [tuple(step) for step in manhattan_path(current, location).tolist()]
+        current = location
+    return path
+
+
+def polyline(stops):
+    return route_cache.manhattan_polyline([BASE] + stops + [BASE])
+
+
+def measure(build, stops):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        route = build(stops)
+    elapsed = (time.perf_counter() - start) / REPEATS
+    tracemalloc.start()
+    route = build(stops)
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return elapsed, held, route
+
+
+def main():
+    max_stops = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rng = random.Random(3)
+    cache = route_cache.RouteCache()
+    print(f"{GRID}x{GRID} grid, mean of {REPEATS} builds")
+    print(f"{'stops':>6}{'cells us':>10}{'cells KB':>10}{'points':>8}{'polyline us':>13}{'polyline KB':>13}"
+          f"{'points':>8}{'cache hit us':>14}")
+    stops_count = 10
+    while stops_count <= max_stops:
+        stops = [(rng.randrange(GRID), rng.randrange(GRID)) for _ in range(stops_count)]
+        cells_time, cells_held, cells = measure(cell_path, stops)
+        line_time, line_held, line = measure(polyline, stops)
+        cache.put(("Monday", "Garbage"), line, cache.version)
+        start = time.perf_counter()
+        for _ in range(REPEATS):
+            cache.get(("Monday", "Garbage"))
+        hit_time = (time.perf_counter() - start) / REPEATS
+        print(f"{stops_count:6d}{cells_time * 1e6:10.0f}{cells_held / 1024:10.1f}{len(cells):8d}"
+              f"{line_time * 1e6:13.0f}{line_held / 1024:13.1f}{len(line.points):8d}{hit_time * 1e6:14.2f}")
+        stops_count *= 10
+
+
+if __name__ == "__main__":
+    main()
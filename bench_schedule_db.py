@@ -0,0 +1,104 @@
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import db
+
+
+# Benchmark of the schedule table: the old comma-joined layout (commit per insert, full scans)
+# against the normalised, indexed WAL layout written through db.ScheduleWriter.
+# Usage: python bench_schedule_db.py [rows]
+
+LEGACY_SCHEMA = """
+CREATE TABLE schedule (
+    request_id INTEGER PRIMARY KEY,
+    house_id INTEGER,
+    truck_type TEXT,
+    day_visiting TEXT
+)
+"""
+
+
+def legacy_rows(rows, houses):
+    random.seed(5)
+    for request_id in range(1, rows + 1):
+        trucks = random.sample(db.TRUCK_TYPES, random.randint(1, 3))
+        days = [random.choice(db.DAYS) for _ in trucks]
+        yield request_id, random.randint(1, houses), ", ".join(trucks), ", ".join(days)
+
+
+def timed(label, function):
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<52} {elapsed * 1000:10.1f} ms")
+    return elapsed, result
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    houses = max(rows // 10, 10)
+    directory = tempfile.mkdtemp()
+
+    # old layout: rollback journal, one commit per insert (timed on a sample and extrapolated)
+    legacy = sqlite3.connect(os.path.join(directory, "legacy.db"))
+    legacy.execute(LEGACY_SCHEMA)
+    data = list(legacy_rows(rows, houses))
+    sample = min(2000, rows)
+    elapsed, _ = timed(f"legacy insert + commit per row ({sample} rows)",
+                       lambda: [(legacy.execute("INSERT INTO schedule VALUES (?, ?, ?, ?)", row), legacy.commit())
+                                for row in data[:sample]])
+    print(f"{'':<52} {sample / elapsed:10.0f} rows/s")
+    legacy.executemany("INSERT INTO schedule VALUES (?, ?, ?, ?)", data[sample:])
+    legacy.commit()
+
+    def legacy_day_truck(day, truck):
+        houses_found = []
+        for _, house_id, trucks, days in legacy.execute("SELECT * FROM schedule"):
+            for t, d in zip(trucks.split(", "), days.split(", ")):
+                if t == truck and d == day:
+                    houses_found.append(house_id)
+        return houses_found
+
+    _, legacy_tuesday = timed("legacy: Organic houses on Tuesday (full scan + split)",
+                              lambda: legacy_day_truck("Tuesday", "Organic"))
+    _, legacy_house = timed("legacy: rows of house 42 (full scan)",
+                            lambda: legacy.execute("SELECT * FROM schedule WHERE house_id = 42").fetchall())
+    legacy.close()
+
+    # migration of the legacy file to the normalised layout
+    migrated = db.connect(os.path.join(directory, "legacy.db"))
+    _, written = timed(f"migrate {rows} legacy rows", lambda: db.migrate_schedule(migrated))
+    print(f"{'':<52} {written:10d} normalised rows")
+
+    # normalised layout through the batching writer
+    connection = db.connect(os.path.join(directory, "normalised.db"))
+    db.use_wal(connection)
+    db.create_schedule_table(connection)
+    writer = db.ScheduleWriter(connection)
+
+    def write_all():
+        for request_id, house_id, trucks, days in data:
+            for truck, day in zip(trucks.split(", "), days.split(", ")):
+                writer.add(request_id, house_id, truck, day)
+        writer.flush()
+
+    elapsed, _ = timed(f"ScheduleWriter insert ({written} rows, WAL)", write_all)
+    print(f"{'':<52} {writer.written / elapsed:10.0f} rows/s")
+
+    tuesday, organic = db.DAYS.index("Tuesday"), db.TRUCK_TYPES.index("Organic")
+    _, new_tuesday = timed("normalised: Organic houses on Tuesday (index)", lambda: [row[0] for row in connection.execute(
+        "SELECT house_id FROM schedule WHERE day = ? AND truck_type = ? ORDER BY id", (tuesday, organic))])
+    _, new_house = timed("normalised: rows of house 42 (index)", lambda: connection.execute(
+        "SELECT request_id, truck_type, day FROM schedule WHERE house_id = 42").fetchall())
+    assert sorted(new_tuesday) == sorted(legacy_tuesday)
+    assert len(new_house) == sum(len(row[2].split(", ")) for row in legacy_house)
+    connection.close()
+    migrated.close()
+
+
+if __name__ == "__main__":
+    main()
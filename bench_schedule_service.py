@@ -0,0 +1,104 @@
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import urllib.request
+
+import db
+import map_import
+import schedule_service
+
+
+# Benchmark of schedule reads for dashboards: the old way (own connection, SELECT * FROM schedule,
+# filter in Python) against schedule_service.ScheduleQueries (indexed queries, response cache,
+# batches), and how much of the cache survives the scheduler's writes.
+# Usage: python bench_schedule_service.py [rows]
+
+QUERIES = 100
+WRITE_BATCH = 500
+MOVED_ROWS = 25
+
+
+def timed(label, function, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:<52} {elapsed * 1000:10.2f} ms")
+    return elapsed, result
+
+
+def full_scan(path, keep):
+    connection = sqlite3.connect(path)
+    rows = [row for row in connection.execute("SELECT * FROM schedule") if keep(row)]
+    connection.close()
+    return rows
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    houses = max(rows // 10, 10)
+    side = int(houses ** 0.5) * 2
+    random.seed(8)
+    path = os.path.join(tempfile.mkdtemp(), "schedule.db")
+    connection = db.connect(path)
+    db.create_tables(connection.cursor())
+    connection.commit()
+    map_import.import_houses(connection, ((house_id, random.randrange(side), random.randrange(side))
+                                          for house_id in range(houses + 1)), replace=True)
+    with connection:
+        connection.executemany("INSERT INTO schedule (request_id, house_id, truck_type, day) VALUES (?, ?, ?, ?)",
+                               ((request_id, random.randint(1, houses), random.randrange(3), random.randrange(7))
+                                for request_id in range(1, rows + 1)))
+    print(f"{rows} schedule rows, {houses} houses")
+
+    tuesday, organic = db.DAYS.index("Tuesday"), db.TRUCK_TYPES.index("Organic")
+    timed("full scan: Organic houses on Tuesday", lambda: full_scan(path, lambda row: row[4] == tuesday and row[3] == organic))
+    timed("full scan: pickups of house 42", lambda: full_scan(path, lambda row: row[2] == 42))
+
+    queries = schedule_service.ScheduleQueries(path)
+    timed("service: Organic houses on Tuesday (index)", lambda: queries.day_truck("Tuesday", "Organic"))
+    timed("service: same query again (cached)", lambda: queries.day_truck("Tuesday", "Organic"), repeat=1000)
+    timed("service: pickups of house 42 (index)", lambda: queries.house(42))
+    timed("service: pickups in a 5% x 5% box (map cache + index)", lambda: queries.box(0, 0, side // 20, side // 20))
+
+    house_ids = random.sample(range(1, houses + 1), QUERIES)
+    queries.responses.clear()
+    timed(f"service: {QUERIES} house queries one by one", lambda: [queries.house(house_id) for house_id in house_ids])
+    queries.responses.clear()
+    timed(f"service: {QUERIES} house queries in one batch",
+          lambda: queries.batch([{"query": "house", "house_id": house_id} for house_id in house_ids]))
+
+    # the scheduler appends a batch of rows: only the answers those rows touch are dropped
+    for house_id in range(1, min(houses, schedule_service.CACHE_SIZE // 2) + 1):
+        queries.house(house_id)
+    cached = len(queries.responses)
+    writer = db.ScheduleWriter(connection)
+    for request_id in range(rows + 1, rows + 1 + WRITE_BATCH):
+        writer.add(request_id, random.randint(1, houses), random.choice(db.TRUCK_TYPES), random.choice(db.DAYS))
+    writer.flush()
+    timed(f"service: refresh after {WRITE_BATCH} new rows", lambda: queries.house(1))
+    print(f"{'':<52} {len(queries.responses):10d} of {cached} answers kept")
+
+    # the repair pass moves pickups to other days in place: the answers of their houses and truck types go
+    cached = len(queries.responses)
+    with connection:
+        connection.executemany("UPDATE schedule SET day = ? WHERE id = ?",
+                               ((random.randrange(7), random.randint(1, rows)) for _ in range(MOVED_ROWS)))
+    timed(f"service: refresh after {MOVED_ROWS} rows moved", lambda: queries.house(1))
+    print(f"{'':<52} {len(queries.responses):10d} of {cached} answers kept")
+
+    server = schedule_service.start_http(queries, port=0)
+    port = server.server_address[1]
+    timed("HTTP: GET /house (cached)", lambda: json.loads(
+        urllib.request.urlopen(f"http://127.0.0.1:{port}/house?house_id=42").read()), repeat=200)
+    server.shutdown()
+    queries.close()
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import os
+import random
+import sys
+import tempfile
+import time
+
+# the scheduler loads from a scratch database / snapshot built by this benchmark
+directory = tempfile.mkdtemp()
+os.environ["WASTE_DB_PATH"] = os.path.join(directory, "startup.db")
+os.environ["WASTE_SNAPSHOT_PATH"] = os.path.join(directory, "startup.snap")
+
+import db
+import truck_scheduler
+
+
+# Scheduler start-up time: cold (full SELECT of map + schedule) vs warm (memory-mapped snapshot
+# + replay of the schedule rows written after it).
+# Usage: python bench_scheduler_startup.py [houses] [schedule rows] [rows written after the snapshot]
+
+
+def reset_state():
+    truck_scheduler.HOUSE_GRID.clear()
+    truck_scheduler.HOUSE_INDEX = None
+    truck_scheduler.ROUTES.clear()
+    for trucks in truck_scheduler.WEEKLY_SCHEDULE.values():
+        for houses in trucks.values():
+            houses.clear()
+
+
+def schedule_rows(count, houses, first_request):
+    for request_id in range(first_request, first_request + count):
+        yield request_id, random.randint(1, houses), random.randrange(3), random.randrange(7)
+
+
+def main():
+    houses = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+    tail = int(sys.argv[3]) if len(sys.argv) > 3 else rows // 100
+    random.seed(9)
+
+    connection = db.connect()
+    db.create_tables(connection.cursor())
+    connection.execute("DELETE FROM map")
+    connection.executemany("INSERT INTO map (house_id, x_value, y_value) VALUES (?, ?, ?)",
+                           ((house_id, random.randrange(2000), random.randrange(2000)) for house_id in range(houses + 1)))
+    connection.executemany("INSERT INTO schedule (request_id, house_id, truck_type, day) VALUES (?, ?, ?, ?)",
+                           schedule_rows(rows - tail, houses, 1))
+    connection.commit()
+
+    assert truck_scheduler.load_state() == "cold"
+    expected = {key: list(route) for key, route in
+                ((key, truck_scheduler.WEEKLY_SCHEDULE[key[0]][key[1]]) for key in truck_scheduler.ROUTES)}
+
+    start = time.perf_counter()
+    truck_scheduler.save_state()
+    save = time.perf_counter() - start
+    snapshot_size = os.path.getsize(os.environ["WASTE_SNAPSHOT_PATH"])
+
+    # rows written after the snapshot, replayed on the warm start
+    connection.executemany("INSERT INTO schedule (request_id, house_id, truck_type, day) VALUES (?, ?, ?, ?)",
+                           schedule_rows(tail, houses, rows - tail + 1))
+    connection.commit()
+
+    reset_state()
+    start = time.perf_counter()
+    mode = truck_scheduler.load_state()
+    warm = time.perf_counter() - start
+    assert mode == "warm"
+
+    warm_routes = {day: {truck: list(houses) for truck, houses in trucks.items()}
+                   for day, trucks in truck_scheduler.WEEKLY_SCHEDULE.items()}
+    for (day, truck), route in expected.items():
+        assert warm_routes[day][truck][:len(route)] == route
+
+    # same rows, without a snapshot
+    reset_state()
+    os.remove(os.environ["WASTE_SNAPSHOT_PATH"])
+    start = time.perf_counter()
+    truck_scheduler.load_state()
+    cold_with_tail = time.perf_counter() - start
+    assert warm_routes == truck_scheduler.WEEKLY_SCHEDULE
+
+    print(f"houses: {houses}, schedule rows: {rows} ({tail} written after the snapshot)")
+    print(f"cold start (snapshot missing):  {cold_with_tail * 1000:10.1f} ms")
+    print(f"snapshot save:                  {save * 1000:10.1f} ms  ({snapshot_size / 1e6:.1f} MB)")
+    print(f"warm start (snapshot + replay): {warm * 1000:10.1f} ms  ({cold_with_tail / warm:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
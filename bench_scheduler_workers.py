@@ -0,0 +1,145 @@
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+# every process of the load test (parent and spawned workers) uses the same scratch database
+os.environ.setdefault("WASTE_DB_PATH", os.path.join(tempfile.mkdtemp(), "load_test.db"))
+
+import db
+import map_import
+import truck_scheduler
+import scheduler_workers
+import wire_protocol
+
+
+# Load test for scheduler_workers: the same stream of truck requests is scheduled by 1, 2, 4 ...
+# worker processes. Multiprocessing queues stand in for the cell queues of the topic exchange
+# (one inbox per worker, messages routed with the same hash ring) and for the capacity hints,
+# this process routes like the dispatcher; the SchedulerWorker logic and the SQLite commits are
+# the real ones.
+# Prints the wall-clock throughput and, since workers normally run on separate cores, the
+# throughput bound by the busiest worker (messages / its CPU time), and the cell hops per message.
+# Usage: python bench_scheduler_workers.py [requests] [max workers]
+
+HOUSES = 5000
+GRID_SIDE = 400
+MAX_DISTANCE = 4000
+
+
+def house_grid():
+    random.seed(11)
+    grid = {0: (GRID_SIDE // 2, GRID_SIDE // 2)}
+    for house_id in range(1, HOUSES + 1):
+        grid[house_id] = (random.randrange(GRID_SIDE), random.randrange(GRID_SIDE))
+    return grid
+
+
+def worker_process(worker, workers, inboxes, done, hints):
+    sys.stdout = open(os.devnull, "w")  # the scheduler prints every request it can't place
+    truck_scheduler.get_all_house_coordinates()
+    truck_scheduler.MAX_DISTANCE = MAX_DISTANCE
+    ring = scheduler_workers.HashRing(workers)
+    state = scheduler_workers.SchedulerWorker(scheduler_workers.partition(worker, workers), db.connect())
+    inbox = inboxes[worker]
+    handled = 0
+    busy = 0.0
+    while True:
+        item = inbox.get()
+        if item is None:
+            break
+        key, body = item
+        start = time.process_time()
+        if key.startswith("capacity."):
+            state.mark_full(key, body)  # capacity hint, may be the last item of a batch
+        else:
+            forward = state.handle(key, body)
+            for hint in state.announcements:
+                hints.put(hint)
+                for other, other_inbox in enumerate(inboxes):
+                    if other != worker:
+                        other_inbox.put(hint)
+            state.announcements.clear()
+            if forward is None:
+                handled += 1
+            else:
+                inboxes[ring.owner(forward[0])].put(forward)
+        if handled >= scheduler_workers.COMMIT_BATCH_SIZE or (inbox.empty() and handled):
+            state.commit()  # acks would go out here
+            done.put(handled)
+            handled = 0
+        busy += time.process_time() - start
+    state.commit()
+    done.put((busy, state.forwarded))
+
+
+def run(workers, requests):
+    connection = db.connect()
+    db.create_tables(connection.cursor())
+    connection.commit()
+    map_import.import_houses(connection, ((house_id, x, y) for house_id, (x, y) in house_grid().items()), replace=True)
+
+    context = multiprocessing.get_context("spawn")
+    inboxes = [context.Queue() for _ in range(workers)]
+    done = context.Queue()
+    hints = context.Queue()
+    processes = [context.Process(target=worker_process, args=(worker, workers, inboxes, done, hints))
+                 for worker in range(workers)]
+    for process in processes:
+        process.start()
+
+    random.seed(3)
+    bodies = []
+    for request_id in range(1, requests + 1):
+        house_id = random.randint(1, HOUSES)
+        trucks = random.sample(scheduler_workers.TRUCK_TYPES, random.randint(1, 3))
+        bodies.append(wire_protocol.encode_truck_request(request_id, house_id, trucks))
+
+    # the workers start by loading the map, don't count process start-up
+    time.sleep(2)
+    ring = scheduler_workers.HashRing(workers)
+    full_cells = scheduler_workers.CapacityHints()
+    messages = 0
+    start = time.perf_counter()
+    for body in bodies:
+        while not hints.empty():
+            full_cells.announced(*hints.get())
+        for key, message in scheduler_workers.split_request(body, full_cells):
+            inboxes[ring.owner(key)].put((key, message))
+            messages += 1
+    stored = 0
+    while stored < messages:
+        stored += done.get()
+    elapsed = time.perf_counter() - start
+
+    for inbox in inboxes:
+        inbox.put(None)
+    busy, forwarded = zip(*[done.get() for _ in processes])
+    for process in processes:
+        process.join()
+
+    rows = connection.execute("SELECT COUNT(*) FROM schedule").fetchone()[0]
+    connection.close()
+    assert rows == messages, f"expected {messages} schedule rows, got {rows}"
+    return messages / elapsed, messages / max(busy), sum(forwarded) / messages
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 6000
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else min(multiprocessing.cpu_count(), 8)
+    print(f"{requests} requests, {HOUSES} houses, route limit {MAX_DISTANCE}, {os.cpu_count()} CPUs")
+    print(f"{'workers':>7}{'wall msg/s':>12}{'':>8}{'busiest-worker bound':>22}{'':>8}{'hops/msg':>10}")
+    workers = 1
+    baseline = None
+    while workers <= max_workers:
+        throughput, bound, hops = run(workers, requests)
+        baseline = baseline or (throughput, bound)
+        print(f"{workers:7d}{throughput:12.0f}{throughput / baseline[0]:7.1f}x{bound:22.0f}{bound / baseline[1]:7.1f}x"
+              f"{hops:10.2f}")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import contextlib
+import io
+import sys
+import time
+
+import server
+import transport
+import wire_protocol
+from inproc_broker import InProcessBroker
+
+
+# Benchmark for server.publish_truck_info_to_queue: connection-per-message (old behaviour)
+# vs the long-lived batched TruckRequestPublisher. Runs against the in-process broker
+# stand-in with a simulated handshake / round-trip cost so no RabbitMQ is needed.
+# Usage: python bench_server_publish.py [messages] [connect_latency_ms] [round_trip_ms]
+
+# Every report needs all three trucks, so each one produces a truck request
+REPORT = wire_protocol.encode_garbage_report(request_id=1, house_id=5, garbage_info=[95, 95, 95])
+
+
+def fill_garbage_queue(broker, messages):
+    broker.declare('Garbage-Info-Queue')
+    for _ in range(messages):
+        broker.put('Garbage-Info-Queue', REPORT)
+
+
+def run_per_message_connection(broker, messages):
+    """
+    Old path: no PUBLISHER, so every truck request opens its own connection.
+    """
+    fill_garbage_queue(broker, messages)
+    server.PUBLISHER = None
+    connection = broker.BlockingConnection()
+    channel = connection.channel()
+    channel.basic_consume(queue='Garbage-Info-Queue', on_message_callback=server.rabbitmq_callback, auto_ack=True)
+    start = time.perf_counter()
+    connection.process_data_events()
+    return time.perf_counter() - start
+
+
+def run_persistent_publisher(broker, messages):
+    """
+    New path: the listener's channel setup with a long-lived publisher, one transaction per batch.
+    """
+    fill_garbage_queue(broker, messages)
+    start = time.perf_counter()
+    connection, channel = server.setup_rabbitmq()
+    server.PUBLISHER = server.TruckRequestPublisher(connection)
+    channel.basic_qos(prefetch_count=server.PUBLISH_BATCH_SIZE * 2)
+    channel.basic_consume(queue='Garbage-Info-Queue', on_message_callback=server.rabbitmq_callback)
+    while broker.message_count('Garbage-Info-Queue') or server.PUBLISHER.pending:
+        connection.process_data_events(time_limit=server.PUBLISH_FLUSH_INTERVAL)
+    server.PUBLISHER.close()
+    elapsed = time.perf_counter() - start
+    server.PUBLISHER = None
+    assert not channel.unacked, "every garbage report should be acked after its flush"
+    return elapsed
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    connect_latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.002
+    round_trip = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.0001
+
+    results = {}
+    for name, run in (("per-message connection", run_per_message_connection),
+                      ("persistent publisher", run_persistent_publisher)):
+        broker = InProcessBroker(connect_latency=connect_latency, round_trip_latency=round_trip)
+        transport.use("inproc", broker)
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed = run(broker, messages)
+        delivered = broker.message_count('Truck-Queue')
+        assert delivered == messages, f"{name}: expected {messages} truck requests, got {delivered}"
+        results[name] = messages / elapsed
+        print(f"{name:>24}: {messages / elapsed:10.0f} msg/s  "
+              f"({broker.connections_opened} connections opened, {elapsed:.3f}s)")
+
+    print(f"{'speedup':>24}: {results['persistent publisher'] / results['per-message connection']:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
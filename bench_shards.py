@@ -0,0 +1,155 @@
+import math
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+# the parent process only routes; every shard process gets its own database (set before it starts)
+SCRATCH = tempfile.mkdtemp()
+os.environ.setdefault("WASTE_DB_PATH", os.path.join(SCRATCH, "coordinator.db"))
+
+import sharding
+import shard_scheduler
+import truck_scheduler
+import wire_protocol
+
+
+# Load test for the sharded scheduler: 1, 2, 4 ... districts (tiles), one shard process each,
+# every district with the same houses and request stream, so the ideal is throughput growing
+# linearly with the number of shards. Multiprocessing queues stand in for the tile queues and
+# Handoff-Queue; the coordinator (this process), ShardScheduler and the per-shard SQLite files
+# are the real ones. The route limit leaves a district's week some room, so handoffs only
+# happen for the few pickups first-fit can't place at home.
+# Prints the wall-clock throughput and, since shards normally run on separate cores or nodes,
+# the throughput bound by the busiest shard (requests / its CPU time).
+# Usage: python bench_shards.py [requests per shard] [max shards]
+
+TILE_SIZE = 200
+HOUSES_PER_SHARD = 2000
+TILES_PER_ROW = 4
+
+
+# route limit for a district: a tour through its share of the houses (Manhattan TSP ~ 0.95 sqrt(n A))
+# split over 7 days, with room for first-fit (about twice the optimal tour) and the drive from the depot
+def route_limit(requests_per_shard):
+    houses = min(requests_per_shard * 2 / 3, HOUSES_PER_SHARD)  # 2 of 3 truck types per request on average
+    return int(2 * 0.95 * math.sqrt(houses * TILE_SIZE * TILE_SIZE) / 7 + TILE_SIZE)
+
+
+def make_tile(index):
+    return index % TILES_PER_ROW, index // TILES_PER_ROW
+
+
+def district(tile):
+    rng = random.Random(11)  # same layout in every tile
+    first = (tile[1] * TILES_PER_ROW + tile[0]) * HOUSES_PER_SHARD + 1
+    return [(first + n, tile[0] * TILE_SIZE + rng.randrange(TILE_SIZE), tile[1] * TILE_SIZE + rng.randrange(TILE_SIZE))
+            for n in range(HOUSES_PER_SHARD)]
+
+
+def shard_process(tile, max_distance, inbox, results):
+    sys.stdout = open(os.devnull, "w")  # the scheduler prints every probe
+    truck_scheduler.MAX_DISTANCE = max_distance
+    truck_scheduler.load_state()
+    scheduler = shard_scheduler.ShardScheduler(tile)
+    results.put(("ready", tile, 0))
+    busy = 0.0
+    finished = 0
+    while True:
+        body = inbox.get()
+        if body is None:
+            break
+        start = time.process_time()
+        handoff = scheduler.handle(body)
+        busy += time.process_time() - start
+        if handoff is not None:
+            results.put(("handoff", handoff, 0))
+        else:
+            finished += 1
+        if finished and (finished >= 100 or inbox.empty()):
+            results.put(("done", finished, 0))
+            finished = 0
+    start = time.process_time()
+    truck_scheduler.SCHEDULE_WRITER.flush()
+    busy += time.process_time() - start
+    results.put(("busy", tile, busy))
+
+
+def run(shards, requests_per_shard):
+    tiles = [make_tile(index) for index in range(shards)]
+    shard_dir = tempfile.mkdtemp(dir=SCRATCH)
+    house_grid = {}
+    for tile in tiles:
+        houses = district(tile)
+        sharding.create_shard(sharding.shard_path(tile, shard_dir), tile, TILE_SIZE, houses)
+        house_grid.update((house_id, (x, y)) for house_id, x, y in houses)
+    coordinator = sharding.HandoffCoordinator(tiles, TILE_SIZE, house_grid)
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    inboxes = {}
+    processes = []
+    for tile in tiles:
+        os.environ["WASTE_DB_PATH"] = sharding.shard_path(tile, shard_dir)
+        os.environ["WASTE_SNAPSHOT_PATH"] = sharding.shard_path(tile, shard_dir) + ".snap"
+        inboxes[sharding.routing_key(tile)] = context.Queue()
+        processes.append(context.Process(target=shard_process,
+                                         args=(tile, route_limit(requests_per_shard),
+                                               inboxes[sharding.routing_key(tile)], results)))
+        processes[-1].start()
+    for _ in tiles:
+        results.get()  # ready
+
+    rng = random.Random(3)
+    messages = []
+    request_id = 0
+    for tile in tiles:
+        houses = district(tile)
+        for _ in range(requests_per_shard):
+            request_id += 1
+            house_id = rng.choice(houses)[0]
+            trucks = rng.sample(wire_protocol.WASTE_TYPES, rng.randint(1, 3))
+            messages.append(coordinator.dispatch(wire_protocol.encode_truck_request(request_id, house_id, trucks)))
+    rng.shuffle(messages)
+
+    start = time.perf_counter()
+    for key, body in messages:
+        inboxes[key].put(body)
+    finished = 0
+    while finished < len(messages):
+        kind, value, _ = results.get()
+        if kind == "done":
+            finished += value
+        else:
+            key, body = coordinator.handoff(value)
+            inboxes[key].put(body)
+    elapsed = time.perf_counter() - start
+
+    for inbox in inboxes.values():
+        inbox.put(None)
+    busy = [results.get()[2] for _ in tiles]
+    for process in processes:
+        process.join()
+    return len(messages) / elapsed, len(messages) / max(busy), coordinator.handoffs
+
+
+def main():
+    requests_per_shard = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    max_shards = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    print(f"{requests_per_shard} requests and {HOUSES_PER_SHARD} houses per shard, route limit "
+          f"{route_limit(requests_per_shard)}, {os.cpu_count()} CPUs")
+    print(f"{'shards':>6}{'wall req/s':>12}{'':>8}{'busiest-shard bound':>21}{'':>8}{'handoffs':>10}")
+    shards = 1
+    baseline = None
+    while shards <= max_shards:
+        throughput, bound, handoffs = run(shards, requests_per_shard)
+        baseline = baseline or (throughput, bound)
+        print(f"{shards:6d}{throughput:12.0f}{throughput / baseline[0]:7.1f}x{bound:21.0f}{bound / baseline[1]:7.1f}x"
+              f"{handoffs:10d}")
+        shards *= 2
+
+
+if __name__ == "__main__":
+    main()
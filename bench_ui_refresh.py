@@ -0,0 +1,91 @@
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import db
+
+
+# Cost of one UI schedule refresh as the schedule table grows, with the scheduler adding
+# ROWS_PER_REFRESH rows and moving MOVES_PER_REFRESH rows to another day in place between refreshes
+# (6000 new rows and 3000 moves a minute at the UI's 500 ms interval):
+# the old way (read the whole table and rebuild the house -> type -> day dict) against
+# db.ScheduleFeed (only the new rows and the rows changed since the last poll, applied to the dict).
+# The Tk side isn't timed, it redraws at most 7 x 3 entries per refresh either way.
+# Usage: python bench_ui_refresh.py [max rows]
+
+ROWS_PER_REFRESH = 50
+MOVES_PER_REFRESH = 25
+REFRESHES = 20
+
+
+def full_reload(path):
+    connection = sqlite3.connect(path)
+    schedule = {}
+    for house_id, truck_type, day in connection.execute(
+            "SELECT house_id, truck_type, day FROM schedule WHERE day IS NOT NULL"):
+        schedule.setdefault(house_id, {})[db.TRUCK_TYPES[truck_type]] = db.DAYS[day]
+    connection.close()
+    return schedule
+
+
+def incremental(feed, schedule):
+    rows, restarted = feed.poll()
+    if restarted:
+        schedule.clear()  # rows is the whole schedule again
+    for _, house_id, truck_type, day, _ in rows:
+        schedule.setdefault(house_id, {})[db.TRUCK_TYPES[truck_type]] = db.DAYS[day]
+    return schedule
+
+
+def move_rows(connection, count, rows):
+    connection.executemany("UPDATE schedule SET day = ? WHERE id = ?",
+                           [(random.randrange(7), random.randint(1, rows)) for _ in range(count)])
+    connection.commit()
+
+
+def add_rows(writer, count, first_request):
+    for request_id in range(first_request, first_request + count):
+        writer.add(request_id, random.randint(1, 100000), random.randrange(3), random.randrange(7))
+    writer.flush()
+
+
+def main():
+    max_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    random.seed(5)
+    path = os.path.join(tempfile.mkdtemp(), "ui.db")
+    connection = db.connect(path)
+    db.use_wal(connection)
+    db.create_schedule_table(connection)
+    connection.commit()
+    writer = db.ScheduleWriter(connection, batch_size=None, interval_ms=None)
+    feed = db.ScheduleFeed(path)
+    schedule = incremental(feed, {})
+
+    print(f"{ROWS_PER_REFRESH} new rows and {MOVES_PER_REFRESH} moved rows per refresh, mean of {REFRESHES} refreshes")
+    print(f"{'rows':>10}{'full reload ms':>16}{'feed ms':>10}")
+    rows = 0
+    size = 10000
+    while size <= max_rows:
+        add_rows(writer, size - rows, rows + 1)
+        rows = size
+        incremental(feed, schedule)
+        full = fed = 0.0
+        for _ in range(REFRESHES):
+            add_rows(writer, ROWS_PER_REFRESH, rows + 1)
+            rows += ROWS_PER_REFRESH
+            move_rows(connection, MOVES_PER_REFRESH, rows)
+            start = time.perf_counter()
+            incremental(feed, schedule)
+            fed += time.perf_counter() - start
+            start = time.perf_counter()
+            full_reload(path)
+            full += time.perf_counter() - start
+        print(f"{size:10d}{full / REFRESHES * 1000:16.1f}{fed / REFRESHES * 1000:10.3f}")
+        size *= 10
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import contextlib
+import io
+import math
+import random
+import sys
+import time
+
+import db
+import truck_scheduler
+import week_planner
+from house_index import HouseIndex
+
+
+# Greedy first-fit (truck_scheduler.schedule_truck_route, one request at a time) vs the batch
+# week planner (week_planner.plan_week, every request at once) on random cities.
+# Houses are spread over a square with the base in the middle, every house asks for one random
+# truck type, and the route limit is set so the week has roughly enough room for every request.
+# Usage: python bench_week_planner.py [houses ...]
+
+
+def make_city(houses, seed=4):
+    random.seed(seed)
+    side = int(math.sqrt(houses) * 3) + 10
+    house_grid = {0: (side // 2, side // 2)}
+    for house_id in range(1, houses + 1):
+        house_grid[house_id] = (random.randrange(side), random.randrange(side))
+    requests = [(house_id, random.choice(db.TRUCK_TYPES)) for house_id in range(1, houses + 1)]
+    # one truck's week ~ a tour through its share of the houses (Manhattan TSP ~ 0.95 sqrt(n A)),
+    # split over 7 days, plus the drive out to the area and back every day
+    per_truck = houses / len(db.TRUCK_TYPES)
+    max_distance = int(1.15 * 0.95 * math.sqrt(per_truck * side * side) / 7 + side)
+    return house_grid, requests, max_distance
+
+
+def use_city(house_grid, max_distance):
+    truck_scheduler.HOUSE_GRID.clear()
+    truck_scheduler.HOUSE_GRID.update(house_grid)
+    truck_scheduler.HOUSE_INDEX = HouseIndex.from_grid(house_grid)
+    truck_scheduler.MAX_DISTANCE = max_distance
+    truck_scheduler.ROUTES.clear()
+    for trucks in truck_scheduler.WEEKLY_SCHEDULE.values():
+        for houses in trucks.values():
+            houses.clear()
+
+
+def summary(schedule, scheduled, requests, elapsed):
+    distance = sum(truck_scheduler.truck_route_distance_if_house_added(route)
+                   for trucks in schedule.values() for route in trucks.values())
+    truck_days = sum(1 for trucks in schedule.values() for route in trucks.values() if route)
+    return distance, truck_days, scheduled, len(requests) - scheduled, elapsed
+
+
+def run_greedy(requests):
+    start = time.perf_counter()
+    scheduled = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for house_id, truck in requests:
+            scheduled += truck_scheduler.schedule_truck_route(house_id, truck, optimise=False) != 0
+    return summary(truck_scheduler.WEEKLY_SCHEDULE, scheduled, requests, time.perf_counter() - start)
+
+
+def run_planner(requests, time_budget):
+    start = time.perf_counter()
+    report = week_planner.plan_week(requests, truck_scheduler.distance_between_houses, truck_scheduler.MAX_DISTANCE,
+                                    db.DAYS, db.TRUCK_TYPES, house_index=truck_scheduler.HOUSE_INDEX,
+                                    time_budget=time_budget)
+    return summary(report["schedule"], len(requests) - len(report["unscheduled"]), requests,
+                   time.perf_counter() - start)
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or [100, 10000, 100000]
+    print(f"{'houses':>8} {'mode':<18}{'distance':>12}{'truck-days':>12}{'scheduled':>11}{'left out':>10}{'time':>10}")
+    for houses in sizes:
+        house_grid, requests, max_distance = make_city(houses)
+        use_city(house_grid, max_distance)
+        results = [("greedy first-fit", run_greedy(requests))]
+        use_city(house_grid, max_distance)
+        results.append(("savings planner", run_planner(requests, week_planner.PLAN_TIME_BUDGET)))
+        for label, (distance, truck_days, scheduled, left_out, elapsed) in results:
+            print(f"{houses:>8} {label:<18}{distance:12d}{truck_days:12d}{scheduled:11d}{left_out:10d}{elapsed:9.2f}s")
+        print(f"{'':>8} (route limit {max_distance})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import json
+import re
+import sys
+import time
+
+import wire_protocol
+
+
+# Encode/decode cost per message: the old JSON report + "Request ID: ..." string parsed with
+# re.match/split, against the struct-packed wire_protocol messages.
+# Usage: python bench_wire_protocol.py [messages]
+
+TRUCK_PATTERN = re.compile(r"Request ID:\s*(\d+),\s*House ID:\s*(\d+),\s*Truck Needed:\s*(.*)")
+
+
+def legacy_truck_request(request_id, house_id, trucks_needed):
+    return f"Request ID: {request_id}, House ID: {house_id}, Truck Needed: {', '.join(trucks_needed)}".encode()
+
+
+def legacy_parse_truck_request(body):
+    match = re.match(TRUCK_PATTERN, body.decode())
+    if not match:
+        raise ValueError("Invalid message format")
+    return int(match.group(1)), int(match.group(2)), [truck.strip() for truck in match.group(3).split(",")]
+
+
+def legacy_report(request_id, house_id, garbage_info, location):
+    return json.dumps({"Request ID": request_id, "house_id": house_id, "garbage_info": garbage_info,
+                       "location": location, "day_and_time": "2025-03-20 10:00 AM"}).encode()
+
+
+def legacy_parse_report(body):
+    message = json.loads(body.decode())
+    return message["house_id"], message["garbage_info"]
+
+
+def per_message(function, messages):
+    start = time.perf_counter()
+    for _ in range(messages):
+        function()
+    return (time.perf_counter() - start) / messages * 1e9
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    trucks = ["Garbage", "Organic"]
+    location = {"x": 2, "y": 8}
+
+    rows = [
+        ("truck request encode",
+         lambda: legacy_truck_request(1234, 42, trucks),
+         lambda: wire_protocol.encode_truck_request(1234, 42, trucks)),
+        ("truck request decode",
+         (lambda body=legacy_truck_request(1234, 42, trucks): legacy_parse_truck_request(body)),
+         (lambda body=wire_protocol.encode_truck_request(1234, 42, trucks): wire_protocol.decode_truck_request(body))),
+        ("garbage report encode",
+         lambda: legacy_report(1234, 42, [85, 40, 90], location),
+         lambda: wire_protocol.encode_garbage_report(1234, 42, [85, 40, 90], location, 1742464800.0)),
+        ("garbage report decode",
+         (lambda body=legacy_report(1234, 42, [85, 40, 90], location): legacy_parse_report(body)),
+         (lambda body=wire_protocol.encode_garbage_report(1234, 42, [85, 40, 90], location, 1742464800.0):
+          wire_protocol.decode_garbage_report(body))),
+    ]
+    print(f"{'':>22}  {'string/json':>12}  {'wire_protocol':>13}")
+    for name, legacy, packed in rows:
+        legacy_ns, packed_ns = per_message(legacy, messages), per_message(packed, messages)
+        print(f"{name:>22}  {legacy_ns:9.0f} ns  {packed_ns:10.0f} ns   ({legacy_ns / packed_ns:.1f}x)")
+
+    print(f"{'message size':>22}  {len(legacy_truck_request(1234, 42, trucks)):9d} B   "
+          f"{wire_protocol.TRUCK_REQUEST_FORMAT.size:10d} B   (truck request)")
+    print(f"{'':>22}  {len(legacy_report(1234, 42, [85, 40, 90], location)):9d} B   "
+          f"{wire_protocol.GARBAGE_REPORT_FORMAT.size:10d} B   (garbage report)")
+
+
+if __name__ == "__main__":
+    main()
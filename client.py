@@ -1,16 +1,21 @@
-import pika
-import sqlite3
 import random
 import sys
-import json
+import time
+import coordinate_cache
+import metrics
+import transport
+import wire_protocol
 
 #max size of the neighbourhodd for houses to be collected from
 GRID_SIZE = (10, 10)
 
+#house coordinates, loaded from the map table on the first lookup and kept up to date (see coordinate_cache.py)
+COORDINATES = None
+
 
 #setting up mqerver
 def setup_rabbitmq():
-    connection = pika.BlockingConnection(pika.ConnectionParameters('localhost'))
+    connection = transport.connect()
     channel = connection.channel()
 
     #setup connection to Garbage Info Queue
@@ -20,21 +25,31 @@ def setup_rabbitmq():
 
 
 #publish house waste info to queue
-def publish_house_info_to_queue(house_id):
-    connection, channel = setup_rabbitmq()
-
-    garbage_data = {
-        "Request ID": random.randint(1000, 9999),  #randon req id is made
-        "house_id": house_id,
-        "garbage_info": generate_waste_percentages(),
-        "location": get_house_coordinates(house_id),
-        "day_and_time": "2025-03-20 10:00 AM"  #random timestamp
-    }
-
-    channel.basic_publish(exchange='', routing_key='Garbage-Info-Queue', body=json.dumps(garbage_data))
-    print(f"Garbage info has been sent → {garbage_data}")
-
-    connection.close()
+#channel, garbage_info and location can be passed in to reuse an open connection and known
+#values (sensor_simulator.py does this), otherwise they are opened / generated / looked up here
+def publish_house_info_to_queue(house_id, channel=None, garbage_info=None, location=None):
+    connection = None
+    if channel is None:
+        connection, channel = setup_rabbitmq()
+
+    garbage_data = wire_protocol.GarbageReport(
+        request_id=random.randint(1000, 9999),  #randon req id is made
+        house_id=house_id,
+        garbage_info=garbage_info if garbage_info is not None else generate_waste_percentages(),
+        location=location if location is not None else get_house_coordinates(house_id),
+        reported_at=time.time(),
+        trace=metrics.new_trace()  #trace id + publish time, for the end-to-end latency (see metrics.py)
+    )
+
+    #packed with the shared wire format (see wire_protocol.py)
+    channel.basic_publish(exchange='', routing_key='Garbage-Info-Queue',
+                          body=wire_protocol.encode_garbage_report(*garbage_data))
+    metrics.METRICS.count("client.reports_published")
+
+    if connection is not None:
+        print(f"Garbage info has been sent → {garbage_data}")
+        connection.close()
+    return garbage_data
 
 
 #randomly generate garbage percentages (values always increasing up to 100)
@@ -49,23 +64,28 @@ def generate_waste_percentages():
 
     return percentages
 
-#get house coordinates from the db from map table
-def get_house_coordinates(house_id): #https://www.askpython.com/python/examples/python-sql-data-to-json
-    #https://docs.python.org/3/library/sqlite3.html
-    conn = sqlite3.connect("my_database.db")  #setup/connect to db
-    cursor = conn.cursor()
+#house coordinates cache of this process, opened on first use
+def coordinates():
+    global COORDINATES
+    if COORDINATES is None:
+        COORDINATES = coordinate_cache.CoordinateCache()
+    return COORDINATES
 
-    cursor.execute("SELECT x_value, y_value FROM map WHERE house_id = ?", (house_id,))
-    result = cursor.fetchone()
 
-    conn.close()
-
-    if result:
-        return {"x": result[0], "y": result[1]}
+#get house coordinates of the map table (from the in-memory copy, no query per report)
+def get_house_coordinates(house_id):
+    location = coordinates().location(house_id)
+    if location:
+        return {"x": location[0], "y": location[1]}
     else:
         return {"x": -1, "y": -1}  #invalid location in case we can't find the house
 
 
+#get the coordinates of every house (for callers that send many reports)
+def get_all_house_coordinates():
+    return {house_id: {"x": x, "y": y} for house_id, (x, y) in coordinates().houses().items()}
+
+
 #main to call
 def run(house_id):
     publish_house_info_to_queue(house_id)
@@ -0,0 +1,132 @@
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+import db
+
+
+# In-memory copy of the map table (house_id -> x, y) shared by the lookups of one process: the
+# client looks up the house of every report it sends, the server checks the house of every report
+# it receives, neither opens a connection or runs a query per message.
+# The copy is kept in NumPy arrays (indexed by house id when ids are dense, sorted ids + binary
+# search otherwise), about 24 bytes a house, so a 500k-house city takes ~12 MB.
+# It follows the database through db.create_map_tracking: map_version.changes moves on every
+# change to the map, the copy is reloaded when it did.
+
+# seconds between two checks for map changes (a lookup of an unknown house checks right away)
+CHECK_INTERVAL = 1.0
+
+# house ids up to this many times the number of houses are stored densely (indexed by id)
+DENSE_FACTOR = 4
+
+
+class CoordinateCache:
+    """
+    Read-mostly cache of the map of one database (opened read-only).
+    location(house_id) returns (x, y), or None for a house not on the map.
+    The map is checked for changes at most every check_interval seconds and on every miss, a check
+    with nothing committed since the last one costs a single PRAGMA data_version.
+    invalidate() reloads the copy right away (for maps without change tracking).
+    """
+    def __init__(self, path=None, check_interval=CHECK_INTERVAL):
+        self.connection = sqlite3.connect(f"file:{path or db.DB_PATH}?mode=ro", uri=True, check_same_thread=False)
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.data_version = None
+        self.changes = -1  # never a map_version value, the first check loads the map
+        self.checked_at = 0
+        self.reloads = 0
+        self.table = None
+        self.size = 0
+        self.check()
+
+    def load(self):
+        rows = self.connection.execute("SELECT house_id, x_value, y_value FROM map ORDER BY house_id")
+        houses = np.fromiter(rows, dtype=[("id", np.int64), ("x", np.int64), ("y", np.int64)])
+        ids = houses["id"]
+        if len(ids) == 0 or (ids[0] >= 0 and ids[-1] < DENSE_FACTOR * len(ids) + 1024):
+            size = int(ids[-1]) + 1 if len(ids) else 0
+            xs = np.zeros(size, dtype=np.int64)
+            ys = np.zeros(size, dtype=np.int64)
+            known = np.zeros(size, dtype=bool)
+            xs[ids], ys[ids], known[ids] = houses["x"], houses["y"], True
+            self.table = (None, xs, ys, known)
+        else:
+            self.table = (ids, houses["x"].copy(), houses["y"].copy(), None)
+        self.size = len(ids)
+        self.reloads += 1
+
+    def check(self):
+        # reloads the map when it changed since the last load, returns True when it did
+        with self.lock:
+            self.checked_at = time.monotonic()
+            data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self.data_version:
+                return False
+            self.data_version = data_version
+            try:
+                changes = self.connection.execute("SELECT changes FROM map_version").fetchone()[0]
+            except sqlite3.OperationalError:
+                changes = None  # not migrated yet (python db.py --migrate), only invalidate() reloads
+            if changes == self.changes:
+                return False
+            self.changes = changes
+            self.load()
+            return True
+
+    def invalidate(self):
+        with self.lock:
+            self.data_version = None
+            self.changes = -1
+        self.check()
+
+    # (x, y) of house_id in one loaded copy of the map, or None
+    @staticmethod
+    def find(table, house_id):
+        ids, xs, ys, known = table
+        if ids is None:
+            if 0 <= house_id < len(known) and known[house_id]:
+                return int(xs[house_id]), int(ys[house_id])
+            return None
+        i = int(np.searchsorted(ids, house_id))
+        if i < len(ids) and ids[i] == house_id:
+            return int(xs[i]), int(ys[i])
+        return None
+
+    def location(self, house_id):
+        if time.monotonic() - self.checked_at >= self.check_interval:
+            self.check()
+        location = self.find(self.table, house_id)
+        if location is None and self.check():
+            location = self.find(self.table, house_id)
+        return location
+
+    def __contains__(self, house_id):
+        return self.location(house_id) is not None
+
+    def __len__(self):
+        return self.size
+
+    # {house_id: (x, y)} of every house on the map
+    def houses(self):
+        self.check()
+        ids, xs, ys, known = self.table
+        if ids is None:
+            ids = np.flatnonzero(known)
+            xs, ys = xs[ids], ys[ids]
+        return dict(zip(ids.tolist(), zip(xs.tolist(), ys.tolist())))
+
+    # ids (NumPy array, ascending) of the houses with x0 <= x <= x1 and y0 <= y <= y1
+    def houses_in_box(self, x0, y0, x1, y1):
+        if time.monotonic() - self.checked_at >= self.check_interval:
+            self.check()
+        ids, xs, ys, known = self.table
+        inside = (xs >= x0) & (xs <= x1) & (ys >= y0) & (ys <= y1)
+        if ids is None:
+            return np.flatnonzero(inside & known)
+        return ids[inside]
+
+    def close(self):
+        self.connection.close()
@@ -1,79 +1,360 @@
+import os
+import re
 import sqlite3
+import sys
+import time
+
+# Path of the database, can be overridden with the WASTE_DB_PATH environment variable
+DB_PATH = os.environ.get("WASTE_DB_PATH", "my_database.db")
+
+# Sample neighbourhood put in the map by create_tables
+COORDINATES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "coordinates.txt")
+
+# Integer values stored in schedule.truck_type and schedule.day (index in these lists)
+TRUCK_TYPES = ["Garbage", "Recycling", "Organic"]
+DAYS = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+
+# The batching writer commits after this many rows, or when the oldest buffered row is this old
+WRITE_BATCH_SIZE = 500
+WRITE_BATCH_INTERVAL_MS = 50
+
+
+# Opens a connection to the database (waits for other writers instead of failing right away,
+# several scheduler workers can share the file)
+# Opening doesn't change the file: readers (UI, fleet, coordinate cache) leave its journal mode alone
+def connect(path=None):
+    connection = sqlite3.connect(path or DB_PATH, timeout=30)
+    if connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+        connection.execute("PRAGMA synchronous=NORMAL")  # WAL is still crash-safe, fsync only at checkpoints
+    return connection
+
+
+# switches the file to WAL (kept in the file), so the UI and other readers keep reading while the
+# scheduler writes; done by the writers' start-up (create_tables, migrate_schedule)
+def use_wal(connection):
+    if connection.execute("PRAGMA journal_mode=WAL").fetchone()[0] == "wal":
+        connection.execute("PRAGMA synchronous=NORMAL")
+
+
+# creates the normalised schedule table and its indexes: one row per (request, house, truck type, day)
+# day is NULL when the request could not be scheduled that week
+# truck is the id of the truck in the fleet (see fleet.py), NULL = the truck named after the type;
+# load is the fill % of the bin picked up, NULL = unknown
+# (request_id, truck_type) is unique: a request delivered twice doesn't get a second row
+# updated_seq is set by the change tracking triggers when the row is changed in place, NULL until then
+def create_schedule_table(cursor, name="schedule"):
+    recreated = bool(table_columns(cursor, f"{name}_version"))
+    cursor.execute(f"""
+    CREATE TABLE {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        request_id INTEGER NOT NULL,
+        house_id INTEGER NOT NULL,
+        truck_type INTEGER NOT NULL,
+        day INTEGER,
+        truck TEXT,
+        load INTEGER,
+        updated_seq INTEGER
+    )
+    """)
+    cursor.execute(f"CREATE INDEX {name}_day_truck ON {name} (day, truck_type)")
+    cursor.execute(f"CREATE INDEX {name}_house ON {name} (house_id)")
+    cursor.execute(f"CREATE UNIQUE INDEX {name}_request ON {name} (request_id, truck_type)")
+    create_change_tracking(cursor, name)
+    if recreated:
+        # {name}_version outlives a dropped table and the new row ids start over: the dropped rows
+        # count as deleted, so readers (ScheduleFeed, scheduler snapshots) start over too
+        cursor.execute(f"UPDATE {name}_version SET changes = changes + 1, deleted = deleted + 1")
+
+
+# readers following the schedule (ScheduleFeed, schedule_service) pick up new rows by id; a row
+# changed in place (a pickup moved to another day by the route optimiser, ejected or displaced) bumps
+# {name}_version.changes through these triggers and is stamped with the new value in updated_seq, so
+# readers fetch the rows with an updated_seq above the last one they saw. Deleted rows (a re-planned
+# week, a cleared table) can't be fetched: they also bump {name}_version.deleted, readers start over.
+def create_change_tracking(cursor, name="schedule"):
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {name}_version (changes INTEGER NOT NULL, "
+                   f"deleted INTEGER NOT NULL DEFAULT 0)")
+    if "deleted" not in table_columns(cursor, f"{name}_version"):
+        cursor.execute(f"ALTER TABLE {name}_version ADD COLUMN deleted INTEGER NOT NULL DEFAULT 0")
+    cursor.execute(f"INSERT INTO {name}_version SELECT 0, 0 WHERE NOT EXISTS (SELECT 1 FROM {name}_version)")
+    if "updated_seq" not in table_columns(cursor, name):
+        cursor.execute(f"ALTER TABLE {name} ADD COLUMN updated_seq INTEGER")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {name}_updated_seq ON {name} (updated_seq) "
+                   f"WHERE updated_seq IS NOT NULL")
+    # (re)created: older databases have the triggers that only counted the changes
+    cursor.execute(f"DROP TRIGGER IF EXISTS {name}_updated")
+    cursor.execute(f"""
+    CREATE TRIGGER {name}_updated AFTER UPDATE OF request_id, house_id, truck_type, day, truck, load ON {name}
+    BEGIN
+        UPDATE {name}_version SET changes = changes + 1;
+        UPDATE {name} SET updated_seq = (SELECT changes FROM {name}_version) WHERE id = NEW.id;
+    END
+    """)
+    cursor.execute(f"DROP TRIGGER IF EXISTS {name}_deleted")
+    cursor.execute(f"""
+    CREATE TRIGGER {name}_deleted AFTER DELETE ON {name}
+    BEGIN UPDATE {name}_version SET changes = changes + 1, deleted = deleted + 1; END
+    """)
+
+
+def table_columns(cursor, table):
+    return [row[1] for row in cursor.execute(f"PRAGMA table_info({table})").fetchall()]
+
+
+# (Re)creates the tables and fills the map, only done when running python db.py
+def create_tables(cursor):
+    use_wal(cursor)
+    cursor.execute("DROP TABLE IF EXISTS schedule;")
+    cursor.execute("DROP TABLE IF EXISTS map;")
+    cursor.execute("DROP TABLE IF EXISTS unavailable;")
+
+    # Create a table
+    # truck_type is the index in TRUCK_TYPES: Garbage, Recycling, Organic
+    # day is the index in DAYS (Sunday to Saturday) assuming we are only take about 1 week
+    create_schedule_table(cursor)
+
+    # Create a table
+    create_map_table(cursor)
+    create_unavailable_table(cursor)
+
+
+    # Insert data into schedule
+    #truck_type and day are stored as integers, see TRUCK_TYPES and DAYS
+    #cursor.execute("INSERT INTO schedule (request_id, house_id, truck_type, day) VALUES (?, ?, ?, ?)",
+        #           (1, 101, TRUCK_TYPES.index("Garbage"), DAYS.index("Monday")))
+
+    # Insert data into map
+    #house id --> 0 means home base of trucks
+    create_map_tracking(cursor)
+    cursor.executemany("INSERT INTO map (house_id, x_value, y_value) VALUES (?, ?, ?)", read_coordinates())
+
+
+# map of the neighbourhood: grid coordinates of every house, house 0 is the trucks' base
+def create_map_table(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS map (
+        house_id INTEGER PRIMARY KEY,
+        x_value INTEGER,
+        y_value INTEGER
+    )
+    """)
+
+
+# trucks out of service: nothing is scheduled on a (day, truck id) in this table
+# (day is the index in DAYS, see truck_scheduler.set_availability)
+def create_unavailable_table(cursor):
+    cursor.execute("CREATE TABLE IF NOT EXISTS unavailable (day INTEGER NOT NULL, truck TEXT NOT NULL, "
+                   "PRIMARY KEY (day, truck))")
+
+
+# readers caching the map (coordinate_cache.CoordinateCache) reload it when map_version.changes
+# moves; these triggers bump it on every house inserted, moved or removed
+# (map_import drops them for the length of a bulk import and bumps the version once instead)
+MAP_EVENTS = ("INSERT", "UPDATE", "DELETE")
+
+
+def create_map_tracking(cursor):
+    cursor.execute("CREATE TABLE IF NOT EXISTS map_version (changes INTEGER NOT NULL)")
+    cursor.execute("INSERT INTO map_version SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM map_version)")
+    for event in MAP_EVENTS:
+        cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS map_{event.lower()} AFTER {event} ON map
+        BEGIN UPDATE map_version SET changes = changes + 1; END
+        """)
+
+
+# changes counter of a change tracking table (schedule_version, map_version), None if it doesn't exist
+def table_changes(connection, table):
+    try:
+        return connection.execute(f"SELECT changes FROM {table}").fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+
+
+# (house_id, x, y) of the houses in a coordinates.txt file ("home base : (5,5)" is house 0,
+# then "house 1: (1,1)", ...)
+def read_coordinates(path=COORDINATES_PATH):
+    with open(path) as coordinates_file:
+        for line in coordinates_file:
+            match = re.match(r"\s*(?:house\s+(\d+)|home base)\s*:\s*\((-?\d+),\s*(-?\d+)\)", line)
+            if match:
+                yield int(match.group(1) or 0), int(match.group(2)), int(match.group(3))
+
+
+# converts a schedule table in the old layout (comma-joined truck_type / day_visiting strings,
+# one row per request) to the normalised layout, returns the number of rows written
+# (and switches the file to WAL, see use_wal)
+# normalised tables from before the fleet model get the truck / load columns (left NULL),
+# and older ones the change tracking triggers and the unique request key (keeping the last row
+# of a request and truck type stored more than once)
+def migrate_schedule(connection):
+    use_wal(connection)
+    columns = [row[1] for row in connection.execute("PRAGMA table_info(schedule)")]
+    if columns and "day_visiting" not in columns:
+        with connection:
+            for column, column_type in (("truck", "TEXT"), ("load", "INTEGER")):
+                if column not in columns:
+                    connection.execute(f"ALTER TABLE schedule ADD COLUMN {column} {column_type}")
+            create_change_tracking(connection)
+            if not connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'schedule_request'").fetchone():
+                connection.execute("DELETE FROM schedule WHERE id NOT IN "
+                                   "(SELECT MAX(id) FROM schedule GROUP BY request_id, truck_type)")
+                connection.execute("CREATE UNIQUE INDEX schedule_request ON schedule (request_id, truck_type)")
+    if "day_visiting" not in columns:
+        return 0  # already normalised (or no schedule table yet)
+
+    connection.execute("BEGIN")  # one transaction (DDL included), rolled back if anything fails
+    with connection:
+        connection.execute("ALTER TABLE schedule RENAME TO schedule_legacy")
+        create_schedule_table(connection)
+        rows = []
+        for request_id, house_id, truck_types, days in connection.execute(
+                "SELECT request_id, house_id, truck_type, day_visiting FROM schedule_legacy ORDER BY rowid"):
+            truck_list = (truck_types or "").strip('[]').split(', ')
+            day_list = (days or "").strip('[]').split(', ')
+            for truck, day in zip(truck_list, day_list):
+                if truck in TRUCK_TYPES:
+                    rows.append((request_id, house_id, TRUCK_TYPES.index(truck), DAYS.index(day) if day in DAYS else None))
+        before = connection.total_changes
+        connection.executemany("INSERT OR IGNORE INTO schedule (request_id, house_id, truck_type, day) "
+                               "VALUES (?, ?, ?, ?)", rows)
+        written = connection.total_changes - before  # a request stored twice is written once
+        connection.execute("DROP TABLE schedule_legacy")
+    return written
+
+
+class ScheduleWriter:
+    """
+    Buffers schedule rows and writes them with one executemany + commit per batch.
+    A batch is flushed when it reaches batch_size rows, or by flush_if_due() once the oldest
+    buffered row is older than interval_ms (callers with an event loop call it from a timer).
+    With batch_size / interval_ms set to None, rows are only written by explicit flush() calls.
+    Truck types and days can be given as names or as their integer values; truck / load are the
+    truck id and bin load of the pickup (see fleet.py), None if not known.
+    Rows of a (request, truck type) already in the table are skipped (a redelivered request),
+    written counts the rows actually inserted and duplicates the ones skipped.
+    on_commit, if given, is called with the number of rows after each committed batch.
+    """
+    def __init__(self, connection, batch_size=WRITE_BATCH_SIZE, interval_ms=WRITE_BATCH_INTERVAL_MS, on_commit=None):
+        self.connection = connection
+        self.on_commit = on_commit
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000 if interval_ms is not None else None
+        self.rows = []
+        self.oldest = None
+        self.written = 0
+        self.duplicates = 0
+
+    def add(self, request_id, house_id, truck_type, day, truck=None, load=None):
+        if isinstance(truck_type, str):
+            truck_type = TRUCK_TYPES.index(truck_type)
+        if isinstance(day, str):
+            day = DAYS.index(day) if day in DAYS else None  # "N/A" -> NULL
+        if not self.rows:
+            self.oldest = time.monotonic()
+        self.rows.append((request_id, house_id, truck_type, day, truck, load))
+        if self.batch_size is not None and len(self.rows) >= self.batch_size:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+    def flush_if_due(self):
+        if self.rows and self.interval is not None and time.monotonic() - self.oldest >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return 0
+        before = self.connection.total_changes
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO schedule (request_id, house_id, truck_type, day, truck, load) "
+                "VALUES (?, ?, ?, ?, ?, ?)", self.rows)
+        count = self.connection.total_changes - before
+        self.written += count
+        self.duplicates += len(self.rows) - count
+        self.rows = []
+        self.oldest = None
+        if self.on_commit is not None:
+            self.on_commit(count)
+        return count
+
+
+# truck types (integer values) of a request already in the schedule table
+def scheduled_truck_types(connection, request_id):
+    return {row[0] for row in connection.execute("SELECT truck_type FROM schedule WHERE request_id = ?", (request_id,))}
+
+
+class ScheduleFeed:
+    """
+    Follows the schedule table of one database (read-only) for the UI.
+    poll() returns (rows, restarted), rows in id order:
+    - the (id, house_id, truck_type, day, truck) rows with a day added since the last poll, by id
+      (the high-water mark last_id)
+    - the rows already returned that were changed in place since, by updated_seq (high-water mark
+      last_seq); their day is None when the pickup was unscheduled
+    When rows were deleted meanwhile (schedule_version.deleted moved), restarted is True and rows
+    is the whole schedule again.
+    A poll with nothing committed since the last one costs a single PRAGMA data_version.
+    """
+    def __init__(self, path=None):
+        self.connection = sqlite3.connect(f"file:{path or DB_PATH}?mode=ro", uri=True, check_same_thread=False)
+        self.restart()
+
+    def restart(self):
+        self.last_id = 0
+        self.last_seq = None
+        self.deleted = None
+        self.data_version = None
+
+    def poll(self):
+        data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self.data_version:
+            return [], False
+        self.data_version = data_version
+        try:
+            # read before the rows: a change made in between is fetched (again) by the next poll
+            changes, deleted = self.connection.execute("SELECT changes, deleted FROM schedule_version").fetchone()
+        except sqlite3.OperationalError:
+            changes, deleted = 0, 0  # not migrated yet (python db.py --migrate), only new rows are followed
+        restarted = deleted != self.deleted
+        if restarted:
+            self.deleted = deleted
+            self.last_id = 0
+            updated = []
+        else:
+            updated = self.connection.execute(
+                "SELECT id, house_id, truck_type, day, truck FROM schedule INDEXED BY schedule_updated_seq "
+                "WHERE updated_seq > ? AND id <= ? ORDER BY id", (self.last_seq, self.last_id)).fetchall() if changes != self.last_seq else []
+        self.last_seq = changes
+        rows = self.connection.execute(
+            "SELECT id, house_id, truck_type, day, truck FROM schedule WHERE id > ? AND day IS NOT NULL ORDER BY id",
+            (self.last_id,)).fetchall()
+        if rows:
+            self.last_id = rows[-1][0]
+        return updated + rows, restarted
+
+    def close(self):
+        self.connection.close()
+
 
 # Connect to a database (or create one if it doesn't exist)
-conn = sqlite3.connect("my_database.db")
+conn = connect()
 
 # Create a cursor object
 cursor = conn.cursor()
 
-cursor.execute("DROP TABLE IF EXISTS schedule;")
-cursor.execute("DROP TABLE IF EXISTS map;")
-
-# Create a table
-# truck_type can be only the following:
-#  Garbage, Recycling, Organic
-# day can be any day of the week assuming we are only take about 1 week
-#possible values are Sunday, Monday, Tuesday, Wednesday, Thursday, Friday, Saturday
-cursor.execute("""
-CREATE TABLE schedule (
-    request_id INTEGER PRIMARY KEY,
-    house_id INTEGER,
-    truck_type TEXT,
-    day_visiting TEXT
-)
-""")
-
-# Create a table
-cursor.execute("""
-CREATE TABLE map (
-    house_id INTEGER PRIMARY KEY,
-    x_value INTEGER,
-    y_value INTEGER
-)
-""")
-
-
-# Insert data into schedule
-#acceptable values for truck_type is
-#Garbage , Recycling and Organic
-#cursor.execute("INSERT INTO schedule (request_id, house_id,truck_type,day_visiting) VALUES (?, ?,?,?)",
-    #           (1, 101,"Waste", "Monday"))
-
-# Insert data into map
-#house id --> 0 means home base of trucks
-cursor.execute("INSERT INTO map (house_id, x_value, y_value) VALUES (?, ?, ?)",
-               (0, 5, 5),
-               )
-cursor.execute("INSERT INTO map (house_id, x_value, y_value) VALUES (?, ?, ?)",
-               (1, 1, 1),
-               )
-cursor.execute("INSERT INTO map (house_id, x_value, y_value) VALUES (?, ?, ?)",
-               (2, 2, 3),
-               )
-cursor.execute("INSERT INTO map (house_id, x_value, y_value) VALUES (?, ?, ?)",
-               (3, 3, 4),
-               )
-cursor.execute("INSERT INTO map (house_id, x_value, y_value) VALUES (?, ?, ?)",
-               (4, 5, 6),
-               )
-cursor.execute("INSERT INTO map (house_id, x_value, y_value) VALUES (?, ?, ?)",
-               (5, 2, 8),
-               )
-cursor.execute("INSERT INTO map (house_id, x_value, y_value) VALUES (?, ?, ?)",
-               (6, 9, 1),
-               )
-cursor.execute("INSERT INTO map (house_id, x_value, y_value) VALUES (?, ?, ?)",
-               (7, 1, 7),
-               )
-cursor.execute("INSERT INTO map (house_id, x_value, y_value) VALUES (?, ?, ?)",
-               (8, 7, 3),
-               )
-cursor.execute("INSERT INTO map (house_id, x_value, y_value) VALUES (?, ?, ?)",
-               (9, 8, 8),
-               )
-cursor.execute("INSERT INTO map (house_id, x_value, y_value) VALUES (?, ?, ?)",
-               (10, 4, 6),
-               )
-# Commit and close
-conn.commit()
-#conn.close()
\ No newline at end of file
+# python db.py            -> (re)creates the tables
+# python db.py --migrate  -> converts an existing schedule table to the normalised layout
+#                            and adds the map change tracking and the unavailable table
+if __name__ == "__main__":
+    if "--migrate" in sys.argv:
+        print(f"Migrated {migrate_schedule(conn)} schedule rows.")
+        create_map_table(cursor)
+        create_map_tracking(cursor)
+        create_unavailable_table(cursor)
+    else:
+        create_tables(cursor)
+    # Commit and close
+    conn.commit()
+    conn.close()
@@ -0,0 +1,173 @@
+import time
+
+import numpy as np
+
+import report_aggregator
+import wire_protocol
+
+
+# Fill-level forecasting for pre-scheduling pickups (used by server.py).
+# - ReadingHistory keeps the last HISTORY_LENGTH readings of every house in ring buffers
+#   (one row per house that reported, numbered by report_aggregator.HouseRows like FillTable)
+# - fit_fill_rates() fits level = rate * t + level_now by least squares for every (house, waste
+#   type) at once, only over the readings since the bin was last emptied
+# - forecast() returns the bins expected to cross the threshold within the horizon, with the
+#   day of the week they get there, so they can be booked before they are full
+
+# readings kept per house
+HISTORY_LENGTH = 16
+
+# a bin needs this many readings since its last pickup to be forecast
+MIN_READINGS = 3
+
+# bins expected to cross the threshold within this many seconds are pre-scheduled
+FORECAST_HORIZON = 3 * 24 * 3600
+
+WASTE_COUNT = len(wire_protocol.WASTE_TYPES)
+
+
+class ReadingHistory:
+    """
+    Last `length` (time, levels) readings of every house, in NumPy ring buffers indexed by the
+    house's row in `rows` (rows[:len(rows)] are in use).
+    """
+    def __init__(self, capacity=1024, length=HISTORY_LENGTH):
+        self.rows = report_aggregator.HouseRows()
+        self.length = length
+        self.times = np.zeros((capacity, length), dtype=np.float64)
+        self.levels = np.zeros((capacity, WASTE_COUNT, length), dtype=np.uint8)
+        self.counts = np.zeros(capacity, dtype=np.int64)
+
+    def _grow(self, row):
+        capacity = max(len(self.counts), 1)
+        while capacity <= row:
+            capacity *= 2
+        extra = capacity - len(self.counts)
+        self.times = np.concatenate([self.times, np.zeros((extra, self.length))])
+        self.levels = np.concatenate([self.levels, np.zeros((extra, WASTE_COUNT, self.length), dtype=np.uint8)])
+        self.counts = np.concatenate([self.counts, np.zeros(extra, dtype=np.int64)])
+
+    def record(self, house_id, garbage_info, now):
+        row = self.rows.row(house_id)
+        if row >= len(self.counts):
+            self._grow(row)
+        slot = self.counts[row] % self.length
+        self.times[row, slot] = now
+        self.levels[row, :, slot] = garbage_info
+        self.counts[row] += 1
+
+    def record_many(self, house_ids, levels, now):
+        """
+        One reading for each of house_ids (array), levels is an (n, 3) array.
+        """
+        rows = np.fromiter((self.rows.row(house_id) for house_id in house_ids.tolist()), dtype=np.int64,
+                           count=len(house_ids))
+        if len(rows) and rows.max() >= len(self.counts):
+            self._grow(int(rows.max()))
+        slots = self.counts[rows] % self.length
+        self.times[rows, slots] = now
+        self.levels[rows, :, slots] = levels
+        self.counts[rows] += 1
+
+    def copy(self):
+        """
+        Copy of the rows in use, for a refit that runs while readings keep being recorded
+        """
+        houses = len(self.rows)
+        history = ReadingHistory(0, self.length)
+        history.rows = self.rows.copy()
+        history.times = self.times[:houses].copy()
+        history.levels = self.levels[:houses].copy()
+        history.counts = self.counts[:houses].copy()
+        return history
+
+    def house_ids(self):
+        """
+        House id of every row in use (NumPy array)
+        """
+        return np.frombuffer(self.rows.house_ids, dtype=np.int64) if len(self.rows) else np.zeros(0, dtype=np.int64)
+
+    def ordered(self):
+        """
+        (times (houses, length), levels (houses, 3, length), valid (houses, length)), oldest reading first,
+        one row per row in use.
+        """
+        houses = len(self.rows)
+        counts = self.counts[:houses]
+        steps = np.arange(self.length)
+        start = np.where(counts > self.length, counts % self.length, 0)
+        order = (start[:, None] + steps) % self.length
+        times = np.take_along_axis(self.times[:houses], order, axis=1)
+        levels = np.take_along_axis(self.levels[:houses], order[:, None, :], axis=2)
+        valid = steps < np.minimum(counts, self.length)[:, None]
+        return times, levels, valid
+
+
+def fit_fill_rates(times, levels, valid, now):
+    """
+    Least-squares line per (house, waste type) through the readings since the bin was last emptied.
+    Returns (rate in % per hour, fitted level at `now`), both (houses, 3), NaN where there are
+    fewer than MIN_READINGS readings or no spread in time.
+    """
+    hours = ((times - now) / 3600).astype(np.float32)[:, None, :]
+    y = levels.astype(np.float32)
+    steps = np.arange(times.shape[1])
+
+    # readings before the last big drop (a pickup) belong to the previous fill cycle
+    drops = (y[..., 1:] - y[..., :-1] <= -report_aggregator.PICKUP_DROP) & valid[:, None, 1:]
+    cycle_start = np.where(drops, steps[1:], 0).max(axis=-1)
+    weights = (valid[:, None, :] & (steps >= cycle_start[..., None])).astype(np.float32)
+
+    n = weights.sum(axis=-1)
+    weighted_hours = weights * hours
+    sum_t = weighted_hours.sum(axis=-1)
+    sum_y = (weights * y).sum(axis=-1)
+    sum_tt = (weighted_hours * hours).sum(axis=-1)
+    sum_ty = (weighted_hours * y).sum(axis=-1)
+    denominator = n * sum_tt - sum_t * sum_t
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = (n * sum_ty - sum_t * sum_y) / denominator
+        level_now = (sum_y - rate * sum_t) / n
+    unusable = (n < MIN_READINGS) | (denominator <= 1e-6)
+    rate[unusable] = np.nan
+    level_now[unusable] = np.nan
+    return rate, level_now
+
+
+def threshold_times(history, threshold, now=None):
+    """
+    Unix time every (house, waste type) is expected to cross the threshold (inf if it isn't filling
+    or can't be forecast), and the last reported levels, both (houses, 3) in the history's row order.
+    """
+    now = now or time.time()
+    times, levels, valid = history.ordered()
+    rate, level_now = fit_fill_rates(times, levels, valid, now)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossing = now + (threshold - level_now) / rate * 3600
+    crossing[~(rate > 0)] = np.inf
+    last = np.minimum(history.counts[:len(history.rows)], history.length) - 1
+    latest = np.take_along_axis(levels, np.maximum(last, 0)[:, None, None], axis=2)[..., 0]
+    return crossing, latest
+
+
+def day_of_week(timestamp):
+    """
+    Index in db.DAYS (Sunday = 0) of a unix time, in local time
+    """
+    return (time.localtime(timestamp).tm_wday + 1) % 7
+
+
+def forecast(history, threshold, now=None, horizon=FORECAST_HORIZON):
+    """
+    Bins still under the threshold that are expected to cross it within `horizon` seconds,
+    as a list of (house id, truck flags, first day, crossing time), one entry per house.
+    """
+    now = now or time.time()
+    crossing, latest = threshold_times(history, threshold, now)
+    due = (latest <= threshold) & (crossing <= now + horizon)
+    flags = (due * np.array([wire_protocol.TRUCK_FLAGS[truck] for truck in wire_protocol.WASTE_TYPES])).sum(axis=1)
+    first_crossing = np.where(due, crossing, np.inf).min(axis=1)
+    return [(house_id, house_flags, day_of_week(max(crossing_time, now)), crossing_time)
+            for house_id, house_flags, crossing_time in zip(history.house_ids()[flags > 0].tolist(),
+                                                            flags[flags > 0].tolist(),
+                                                            first_crossing[flags > 0].tolist())]
@@ -0,0 +1,92 @@
+import bisect
+import json
+import math
+import os
+
+import db
+
+
+# Fleet model for the truck scheduler: any number of trucks per waste type, each with its own
+# home depot (a house id in the map, 0 is the original base), route length limit and load capacity.
+# A route length limit of None means the scheduler's MAX_DISTANCE.
+# Loads are in % of a bin: a request for a bin reported 85% full adds 85 to the truck's load.
+#
+# The fleet is read from the JSON file in WASTE_FLEET, a list of trucks:
+#   [{"id": "Garbage", "type": "Garbage", "depot": 0, "max_distance": 30, "max_load": 2000}, ...]
+# ("max_load": null or missing = no load limit). Without WASTE_FLEET there is one truck per type,
+# named after the type, based at house 0, with no load limit: the original one-truck-per-type model.
+
+# load of a pickup whose fill level isn't known (rows written before loads were recorded)
+FULL_BIN_LOAD = 100
+
+
+class Truck:
+    def __init__(self, truck_id, truck_type, depot=0, max_distance=None, max_load=None):
+        if truck_type not in db.TRUCK_TYPES:
+            raise ValueError(f"Unknown truck type: {truck_type}")
+        self.truck_id = truck_id
+        self.truck_type = truck_type
+        self.depot = depot
+        self.max_distance = max_distance
+        self.max_load = math.inf if max_load is None else max_load
+
+    def __repr__(self):
+        return f"Truck({self.truck_id!r}, {self.truck_type!r}, depot={self.depot}, " \
+               f"max_distance={self.max_distance}, max_load={self.max_load})"
+
+
+# n trucks per type with the same depot / limits; the first one of each type is named after the type
+# (so schedule rows without a truck id belong to it), the others "<type>-2", "<type>-3", ...
+def make_fleet(trucks_per_type=1, max_distance=None, max_load=None, depot=0):
+    return [Truck(truck_type if number == 1 else f"{truck_type}-{number}", truck_type, depot, max_distance, max_load)
+            for truck_type in db.TRUCK_TYPES for number in range(1, trucks_per_type + 1)]
+
+
+# the fleet from the WASTE_FLEET file, or the default one truck per type
+# raises ValueError for a fleet the scheduler can't use: not a list of trucks, a truck without id / type
+# or of an unknown type, a truck id used twice, or a truck type without any truck
+def load_fleet(path=None):
+    path = path or os.environ.get("WASTE_FLEET")
+    if not path:
+        return make_fleet()
+    with open(path) as fleet_file:
+        try:
+            trucks = [Truck(truck["id"], truck["type"], truck.get("depot", 0), truck.get("max_distance"),
+                            truck.get("max_load")) for truck in json.load(fleet_file)]
+        except KeyError as error:
+            raise ValueError(f"Truck without {error.args[0]!r} in the fleet {path}") from None
+        except (TypeError, AttributeError):
+            raise ValueError(f"The fleet {path} isn't a list of trucks") from None
+    if len({truck.truck_id for truck in trucks}) != len(trucks):
+        raise ValueError("Truck ids in the fleet must be unique")
+    missing = [truck_type for truck_type in db.TRUCK_TYPES if all(truck.truck_type != truck_type for truck in trucks)]
+    if missing:
+        raise ValueError(f"The fleet {path} has no {', '.join(missing)} truck, every truck type needs one")
+    return trucks
+
+
+class CapacityIndex:
+    """
+    The trucks of one type on one day, sorted by remaining load capacity.
+    fitting(load) lists the trucks that can still take `load`, tightest fit first (found by bisection);
+    update() moves a truck after a pickup was added or removed. Both are O(log n) searches
+    (plus a memmove of the sorted list on update).
+    """
+    def __init__(self, trucks):
+        self.keys = sorted((truck.max_load, order, truck.truck_id) for order, truck in enumerate(trucks))
+        self.key_of = {key[2]: key for key in self.keys}
+
+    def remaining(self, truck_id):
+        return self.key_of[truck_id][0]
+
+    def fitting(self, load):
+        start = bisect.bisect_left(self.keys, (load,))
+        for index in range(start, len(self.keys)):
+            yield self.keys[index][2]
+
+    def update(self, truck_id, load_change):
+        key = self.key_of[truck_id]
+        del self.keys[bisect.bisect_left(self.keys, key)]
+        key = (key[0] - load_change, key[1], truck_id)
+        bisect.insort(self.keys, key)
+        self.key_of[truck_id] = key
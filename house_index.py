@@ -0,0 +1,207 @@
+import numpy as np
+
+
+# Array-backed representation of HOUSE_GRID.
+# Coordinates are kept as contiguous int arrays (one row per house) so Manhattan distances
+# can be computed in batches (one-to-many, many-to-many) instead of one dict lookup per pair.
+# Houses are also bucketed into a uniform grid (sorted by cell) for nearest-k and
+# within-radius queries.
+
+# house ids up to this many times the number of houses are looked up in a dense table (indexed by id),
+# sparser ids (e.g. 64-bit ids from map_import.py) by binary search
+DENSE_FACTOR = 4
+
+
+class HouseIndex:
+    """
+    Index over house coordinates.
+    - house_ids / xs / ys: contiguous arrays, row i describes one house
+    - rows_of(ids): vectorised house id -> row lookup (dense id table, or sorted ids when sparse)
+    - distances_from / distance_matrix: batched Manhattan distances
+    - nearest / within_radius: spatial queries backed by a bucket grid
+    """
+    def __init__(self, house_ids, xs, ys, cell_size=None):
+        self.house_ids = np.ascontiguousarray(house_ids, dtype=np.int64)
+        self.xs = np.ascontiguousarray(xs, dtype=np.int32)
+        self.ys = np.ascontiguousarray(ys, dtype=np.int32)
+        if len(self.house_ids) and self.house_ids.min() < 0:
+            raise ValueError("House IDs must be non-negative.")
+
+        # dense lookup table house id -> row (-1 for unknown ids), None when the ids are sparse
+        size = int(self.house_ids.max()) + 1 if len(self.house_ids) else 0
+        if size < DENSE_FACTOR * len(self.house_ids) + 1024:
+            self.row_table = np.full(size, -1, dtype=np.int64)
+            self.row_table[self.house_ids] = np.arange(len(self.house_ids))
+        else:
+            self.row_table = None
+            self.id_order = np.argsort(self.house_ids, kind="stable")
+            self.sorted_ids = self.house_ids[self.id_order]
+
+        self._build_grid(cell_size)
+
+    # builds the index from a {house_id: (x, y)} dict such as HOUSE_GRID
+    @classmethod
+    def from_grid(cls, house_grid, cell_size=None):
+        ids = np.fromiter(house_grid.keys(), dtype=np.int64, count=len(house_grid))
+        coords = np.array(list(house_grid.values()), dtype=np.int32).reshape(-1, 2)
+        return cls(ids, coords[:, 0], coords[:, 1], cell_size)
+
+    # builds the index from (house_id, x_value, y_value) rows of the map table
+    @classmethod
+    def from_rows(cls, rows, cell_size=None):
+        data = np.array(rows, dtype=np.int64).reshape(-1, 3)
+        return cls(data[:, 0], data[:, 1], data[:, 2], cell_size)
+
+    def __len__(self):
+        return len(self.house_ids)
+
+    def __contains__(self, house_id):
+        if self.row_table is None:
+            position = int(np.searchsorted(self.sorted_ids, house_id))
+            return position < len(self.sorted_ids) and self.sorted_ids[position] == house_id
+        return 0 <= house_id < len(self.row_table) and self.row_table[house_id] >= 0
+
+    def rows_of(self, house_ids):
+        house_ids = np.asarray(house_ids, dtype=np.int64)
+        if self.row_table is None:
+            positions = np.minimum(np.searchsorted(self.sorted_ids, house_ids), len(self.sorted_ids) - 1)
+            if house_ids.size and (self.sorted_ids[positions] != house_ids).any():
+                raise ValueError("Invalid house ID(s).")
+            return self.id_order[positions]
+        if house_ids.size and (house_ids.min() < 0 or house_ids.max() >= len(self.row_table)):
+            raise ValueError("Invalid house ID(s).")
+        rows = self.row_table[house_ids]
+        if rows.size and rows.min() < 0:
+            raise ValueError("Invalid house ID(s).")
+        return rows
+
+    def coordinates(self, house_id):
+        row = self.rows_of([house_id])[0]
+        return int(self.xs[row]), int(self.ys[row])
+
+    # Manhattan distance from one house to many houses
+    def distances_from(self, house_id, house_ids):
+        row = self.rows_of([house_id])[0]
+        rows = self.rows_of(house_ids)
+        return np.abs(self.xs[rows] - self.xs[row]) + np.abs(self.ys[rows] - self.ys[row])
+
+    # Manhattan distance matrix between two lists of houses (second list defaults to the first)
+    def distance_matrix(self, house_ids_a, house_ids_b=None):
+        rows_a = self.rows_of(house_ids_a)
+        rows_b = rows_a if house_ids_b is None else self.rows_of(house_ids_b)
+        return (np.abs(self.xs[rows_a][:, None] - self.xs[rows_b][None, :])
+                + np.abs(self.ys[rows_a][:, None] - self.ys[rows_b][None, :]))
+
+    # distance added by inserting house_id at every position 0..len(route) of the closed
+    # tour base -> route -> base (same result as route_optimizer.insertion_delta per position)
+    def insertion_deltas(self, route, house_id, base):
+        stops = self.rows_of([base] + list(route) + [base])
+        row = self.rows_of([house_id])[0]
+        xs, ys = self.xs[stops], self.ys[stops]
+        to_house = np.abs(xs - self.xs[row]) + np.abs(ys - self.ys[row])
+        edges = np.abs(np.diff(xs)) + np.abs(np.diff(ys))
+        return to_house[:-1] + to_house[1:] - edges
+
+    # ejection moves of house_id on the closed tour base -> route -> base: for every stop e,
+    # changes[e] is the tour length change of taking route[e] out and inserting house_id at its
+    # cheapest place, positions[e] that place in the route without route[e]
+    def ejection_deltas(self, route, house_id, base):
+        stops = self.rows_of([base] + list(route) + [base])
+        row = self.rows_of([house_id])[0]
+        xs, ys = self.xs[stops].astype(np.int64), self.ys[stops].astype(np.int64)
+        to_house = np.abs(xs - int(self.xs[row])) + np.abs(ys - int(self.ys[row]))
+        edges = np.abs(np.diff(xs)) + np.abs(np.diff(ys))
+        shortcuts = np.abs(xs[2:] - xs[:-2]) + np.abs(ys[2:] - ys[:-2])  # stop e skipped
+        insertions = to_house[:-1] + to_house[1:] - edges
+        removals = edges[:-1] + edges[1:] - shortcuts
+        bridges = to_house[:-2] + to_house[2:] - shortcuts  # inserted where stop e was
+        # the cheapest insertion not on one of stop e's two edges (e and e + 1) is one of the 3 cheapest
+        stops_taken = np.arange(len(route))
+        others = np.full(len(route), np.iinfo(np.int64).max)
+        other_positions = np.zeros(len(route), dtype=np.int64)
+        for position in np.argsort(insertions, kind="stable")[:3][::-1]:
+            free = (stops_taken != position) & (stops_taken + 1 != position)
+            others = np.where(free, insertions[position], others)
+            other_positions = np.where(free, position - (position > stops_taken), other_positions)
+        bridged = bridges <= others
+        return np.where(bridged, bridges, others) - removals, np.where(bridged, stops_taken, other_positions)
+
+    def _build_grid(self, cell_size):
+        if cell_size is None:
+            # aim for a handful of houses per cell
+            if len(self.house_ids):
+                span = max(int(self.xs.max() - self.xs.min()), int(self.ys.max() - self.ys.min()), 1)
+                cell_size = max(1, int(span / max(np.sqrt(len(self.house_ids) / 4), 1)))
+            else:
+                cell_size = 1
+        self.cell_size = cell_size
+        self.min_x = int(self.xs.min()) if len(self.xs) else 0
+        self.min_y = int(self.ys.min()) if len(self.ys) else 0
+        cx = (self.xs - self.min_x) // cell_size
+        cy = (self.ys - self.min_y) // cell_size
+        self.grid_cols = int(cy.max()) + 1 if len(cy) else 1
+        self.grid_rows = int(cx.max()) + 1 if len(cx) else 1
+        keys = cx.astype(np.int64) * self.grid_cols + cy
+        self.cell_order = np.argsort(keys, kind="stable")
+        self.cell_keys = keys[self.cell_order]
+
+    # rows of every house in the cells overlapping the box [x0, x1] x [y0, y1]
+    def _rows_in_box(self, x0, y0, x1, y1):
+        cx0 = max((x0 - self.min_x) // self.cell_size, 0)
+        cx1 = min((x1 - self.min_x) // self.cell_size, self.grid_rows - 1)
+        cy0 = max((y0 - self.min_y) // self.cell_size, 0)
+        cy1 = min((y1 - self.min_y) // self.cell_size, self.grid_cols - 1)
+        if cx0 > cx1 or cy0 > cy1:
+            return np.empty(0, dtype=np.int64)
+        # each grid column is one contiguous key range, so one searchsorted pair per column
+        columns = np.arange(cx0, cx1 + 1, dtype=np.int64) * self.grid_cols
+        starts = np.searchsorted(self.cell_keys, columns + cy0, side="left")
+        ends = np.searchsorted(self.cell_keys, columns + cy1, side="right")
+        if not len(starts):
+            return np.empty(0, dtype=np.int64)
+        return self.cell_order[np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)])]
+
+    # house ids within Manhattan distance radius of the point (x, y)
+    def within_radius(self, x, y, radius):
+        rows = self._rows_in_box(x - radius, y - radius, x + radius, y + radius)
+        distances = np.abs(self.xs[rows] - x) + np.abs(self.ys[rows] - y)
+        return self.house_ids[rows[distances <= radius]]
+
+    # the k closest house ids to the point (x, y), closest first
+    def nearest(self, x, y, k, exclude=None):
+        if not len(self.house_ids):
+            return np.empty(0, dtype=np.int64)
+        wanted = k + (1 if exclude is not None else 0)
+        radius = self.cell_size
+        max_radius = (int(self.xs.max() - self.xs.min()) + int(self.ys.max() - self.ys.min())
+                      + abs(x - self.min_x) + abs(y - self.min_y))
+        while True:
+            rows = self._rows_in_box(x - radius, y - radius, x + radius, y + radius)
+            distances = np.abs(self.xs[rows] - x) + np.abs(self.ys[rows] - y)
+            inside = distances <= radius
+            # everything outside the radius is further away than everything inside it
+            if inside.sum() >= wanted or radius >= max_radius:
+                rows, distances = rows[inside], distances[inside]
+                order = np.argsort(distances, kind="stable")
+                ids = self.house_ids[rows[order]]
+                if exclude is not None:
+                    ids = ids[ids != exclude]
+                return ids[:k]
+            radius *= 2
+
+
+# cell by cell path between two grid points, moving along x first and then along y
+# (the end point is included, the start point is not)
+def manhattan_path(start, end):
+    sx, sy = start
+    ex, ey = end
+    step_x = 1 if ex >= sx else -1
+    step_y = 1 if ey >= sy else -1
+    xs = np.arange(sx + step_x, ex + step_x, step_x)
+    ys = np.arange(sy + step_y, ey + step_y, step_y)
+    path = np.empty((len(xs) + len(ys), 2), dtype=np.int32)
+    path[:len(xs), 0] = xs
+    path[:len(xs), 1] = sy
+    path[len(xs):, 0] = ex
+    path[len(xs):, 1] = ys
+    return path
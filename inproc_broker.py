@@ -0,0 +1,294 @@
+import collections
+import threading
+import time
+
+
+# In-process stand-in for the RabbitMQ broker.
+# It exposes the small part of the pika BlockingConnection / BlockingChannel API that
+# the pipeline stages use, so server.py / truck_scheduler.py logic can be driven in one
+# process (benchmarks, local runs) without docker. Network cost can be simulated with
+# connect_latency (TCP + AMQP handshake) and round_trip_latency (one synchronous
+# broker round trip, e.g. queue_declare, a publisher confirm or a transaction commit).
+# Besides the default exchange it has topic exchanges (exchange_declare / queue_bind, with the
+# "*" and "#" wildcards) for scheduler_workers.py and shard_scheduler.py.
+
+
+class Method:
+    """
+    Delivery information handed to consumer callbacks (mirrors pika's Basic.Deliver).
+    """
+    def __init__(self, delivery_tag, routing_key, exchange='', redelivered=False):
+        self.delivery_tag = delivery_tag
+        self.routing_key = routing_key
+        self.exchange = exchange
+        self.redelivered = redelivered
+
+
+def topic_matches(binding_key, routing_key):
+    """
+    True if routing_key matches binding_key, "*" standing for one word and "#" for any number.
+    """
+    def match(pattern, words):
+        if not pattern:
+            return not words
+        if pattern[0] == "#":
+            return any(match(pattern[1:], words[i:]) for i in range(len(words) + 1))
+        return bool(words) and pattern[0] in ("*", words[0]) and match(pattern[1:], words[1:])
+    return match(binding_key.split("."), routing_key.split("."))
+
+
+class InProcessBroker:
+    """
+    Holds the queues and exchange bindings shared by every connection opened against it.
+    Messages are stored as (queue, body, properties, redelivered, exchange, routing_key) tuples.
+    """
+    def __init__(self, connect_latency=0.0, round_trip_latency=0.0):
+        self.connect_latency = connect_latency
+        self.round_trip_latency = round_trip_latency
+        self.queues = {}
+        self.bindings = {}  # exchange -> [(binding key, queue)]
+        self.lock = threading.Condition()
+        self.connections_opened = 0
+        self.published = 0
+
+    def declare(self, queue):
+        with self.lock:
+            self.queues.setdefault(queue, collections.deque())
+
+    def bind(self, queue, exchange, binding_key):
+        with self.lock:
+            self.bindings.setdefault(exchange, []).append((binding_key, queue))
+
+    # queues a message published to exchange with routing_key goes to
+    def route(self, exchange, routing_key):
+        if not exchange:
+            return [routing_key]
+        with self.lock:
+            return list(dict.fromkeys(queue for binding_key, queue in self.bindings.get(exchange, ())
+                                      if topic_matches(binding_key, routing_key)))
+
+    def put(self, queue, body, properties=None, redelivered=False, front=False, exchange='', routing_key=None):
+        with self.lock:
+            if queue not in self.queues:
+                return False  # unroutable, same as the default exchange with no queue
+            entry = (queue, body, properties, redelivered, exchange, queue if routing_key is None else routing_key)
+            if front:
+                self.queues[queue].appendleft(entry)
+            else:
+                self.queues[queue].append(entry)
+            self.published += 1
+            self.lock.notify_all()
+            return True
+
+    def get(self, queue):
+        with self.lock:
+            messages = self.queues.get(queue)
+            if messages:
+                return messages.popleft()
+            return None
+
+    def purge(self, queue):
+        with self.lock:
+            count = len(self.queues.get(queue, ()))
+            self.queues[queue] = collections.deque()
+            return count
+
+    def message_count(self, queue):
+        with self.lock:
+            return len(self.queues.get(queue, ()))
+
+    # Same signature as pika.BlockingConnection so it can be swapped in
+    def BlockingConnection(self, parameters=None):
+        return BlockingConnection(self, parameters)
+
+
+class BlockingConnection:
+    """
+    Connection to an InProcessBroker. Also runs the timers registered with call_later.
+    """
+    def __init__(self, broker, parameters=None):
+        self.broker = broker
+        self.parameters = parameters
+        self.channels = []
+        self.timers = []
+        self.is_open = True
+        broker.connections_opened += 1
+        if broker.connect_latency:
+            time.sleep(broker.connect_latency)
+
+    def channel(self):
+        channel = BlockingChannel(self)
+        self.channels.append(channel)
+        return channel
+
+    def call_later(self, delay, callback):
+        timer = [time.monotonic() + delay, callback]
+        self.timers.append(timer)
+        return timer
+
+    def remove_timeout(self, timer):
+        if timer in self.timers:
+            self.timers.remove(timer)
+
+    def _run_due_timers(self):
+        now = time.monotonic()
+        due = [timer for timer in self.timers if timer[0] <= now]
+        for timer in due:
+            self.timers.remove(timer)
+            timer[1]()
+        return len(due)
+
+    def process_data_events(self, time_limit=0):
+        """
+        Delivers every message currently waiting for this connection's consumers and
+        runs due timers. Waits up to time_limit seconds for work when idle.
+        """
+        deadline = time.monotonic() + (time_limit or 0)
+        while True:
+            handled = self._run_due_timers()
+            for channel in list(self.channels):
+                handled += channel._deliver_ready()
+            if handled or time.monotonic() >= deadline:
+                return handled
+            with self.broker.lock:
+                self.broker.lock.wait(min(0.005, max(deadline - time.monotonic(), 0)))
+
+    def close(self):
+        self.is_open = False
+        for channel in self.channels:
+            channel.is_open = False
+
+
+class BlockingChannel:
+    """
+    Channel on an in-process connection: declares queues, publishes (optionally with
+    publisher confirms, or in transactions) and consumes with auto or manual acks.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.broker = connection.broker
+        self.is_open = True
+        self.confirming = False
+        self.transaction = None  # messages published since the last tx_commit, after tx_select()
+        self.prefetch_count = 0
+        self.consumers = {}
+        self.unacked = collections.OrderedDict()
+        self.next_delivery_tag = 1
+        self.consuming = False
+
+    def _round_trip(self):
+        if self.broker.round_trip_latency:
+            time.sleep(self.broker.round_trip_latency)
+
+    def queue_declare(self, queue, durable=False, arguments=None, **kwargs):
+        self._round_trip()
+        self.broker.declare(queue)
+
+    def exchange_declare(self, exchange, exchange_type='direct', durable=False, **kwargs):
+        self._round_trip()
+        with self.broker.lock:
+            self.broker.bindings.setdefault(exchange, [])
+
+    def queue_bind(self, queue, exchange, routing_key=None, **kwargs):
+        self._round_trip()
+        self.broker.bind(queue, exchange, queue if routing_key is None else routing_key)
+
+    def queue_purge(self, queue):
+        self._round_trip()
+        return self.broker.purge(queue)
+
+    def basic_qos(self, prefetch_count=0, **kwargs):
+        self.prefetch_count = prefetch_count
+
+    def confirm_delivery(self):
+        self._round_trip()
+        self.confirming = True
+
+    # transactions: messages published after tx_select() reach their queues at tx_commit(),
+    # in one round trip for the whole batch
+    def tx_select(self):
+        self._round_trip()
+        self.transaction = []
+
+    def tx_commit(self):
+        self._round_trip()
+        messages, self.transaction = self.transaction, []
+        for message in messages:
+            self._route(*message)
+
+    def tx_rollback(self):
+        self._round_trip()
+        self.transaction = []
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        if isinstance(body, str):
+            body = body.encode()
+        if self.transaction is not None:
+            self.transaction.append((exchange, routing_key, body, properties))
+            return
+        routed = self._route(exchange, routing_key, body, properties)
+        if self.confirming:
+            # with confirms on, a blocking publish waits for the broker's ack
+            self._round_trip()
+            if mandatory and not routed:
+                raise RuntimeError(f"Message to '{routing_key}' was returned as unroutable")
+
+    def _route(self, exchange, routing_key, body, properties):
+        routed = False
+        for queue in self.broker.route(exchange, routing_key):
+            routed = self.broker.put(queue, body, properties, exchange=exchange, routing_key=routing_key) or routed
+        return routed
+
+    def basic_consume(self, queue, on_message_callback, auto_ack=False, **kwargs):
+        self.consumers[queue] = (on_message_callback, auto_ack)
+        return queue
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        if multiple:
+            for tag in [tag for tag in self.unacked if tag <= delivery_tag]:
+                del self.unacked[tag]
+        else:
+            self.unacked.pop(delivery_tag, None)
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        if multiple:
+            tags = [tag for tag in self.unacked if tag <= delivery_tag]
+        else:
+            tags = [delivery_tag] if delivery_tag in self.unacked else []
+        for tag in reversed(tags):
+            queue, body, properties, exchange, routing_key = self.unacked.pop(tag)
+            if requeue:
+                self.broker.put(queue, body, properties, redelivered=True, front=True,
+                                exchange=exchange, routing_key=routing_key)
+
+    def basic_reject(self, delivery_tag=0, requeue=True):
+        self.basic_nack(delivery_tag, multiple=False, requeue=requeue)
+
+    def _deliver_ready(self):
+        delivered = 0
+        for queue, (callback, auto_ack) in list(self.consumers.items()):
+            while self.is_open and queue in self.consumers:
+                if not auto_ack and self.prefetch_count and len(self.unacked) >= self.prefetch_count:
+                    break
+                entry = self.broker.get(queue)
+                if entry is None:
+                    break
+                _, body, properties, redelivered, exchange, routing_key = entry
+                tag = self.next_delivery_tag
+                self.next_delivery_tag += 1
+                if not auto_ack:
+                    self.unacked[tag] = (queue, body, properties, exchange, routing_key)
+                callback(self, Method(tag, routing_key, exchange, redelivered), properties, body)
+                delivered += 1
+        return delivered
+
+    def start_consuming(self):
+        self.consuming = True
+        while self.consuming and self.is_open:
+            self.connection.process_data_events(time_limit=0.05)
+
+    def stop_consuming(self):
+        self.consuming = False
+
+    def close(self):
+        self.is_open = False
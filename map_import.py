@@ -0,0 +1,124 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import time
+
+import db
+
+
+# Bulk loader for the map table, for cities with hundreds of thousands of houses.
+# House lists are read as a stream of (house_id, x, y) from:
+# - CSV: a house_id (or id), x (or x_value) and y (or y_value) column, or those three columns in
+#   that order without a header
+# - GeoJSON: a FeatureCollection of Point features, the house id in properties.house_id or the
+#   feature id, the point's coordinates being grid coordinates (rounded to the nearest cell)
+# - the coordinates.txt format (see db.read_coordinates)
+# and written with executemany in one transaction, so readers see the old map or the new one.
+# The row triggers of the map change tracking are dropped for the length of the import and the
+# version is bumped once (a per-row trigger would double the import time).
+#
+# Usage: python map_import.py houses.csv [--replace] [--db my_database.db]
+
+# rows handed to one executemany call (bounds the memory of a streamed import)
+CHUNK_SIZE = 50000
+
+CSV_COLUMNS = {"house_id": ("house_id", "id"), "x": ("x", "x_value"), "y": ("y", "y_value")}
+
+
+# grid cell of a coordinate, "12" or "12.4"
+def grid_value(value):
+    try:
+        return int(value)
+    except ValueError:
+        return int(round(float(value)))
+
+
+def read_csv(path):
+    with open(path, newline="") as csv_file:
+        rows = csv.reader(csv_file)
+        header = next(rows, None)
+        if header is None:
+            return
+        names = [name.strip().lower() for name in header]
+        first_line = 2
+        try:
+            columns = [next(names.index(name) for name in aliases if name in names)
+                       for aliases in CSV_COLUMNS.values()]
+        except StopIteration:
+            # no header, the first row is a house
+            columns = [0, 1, 2]
+            rows = itertools.chain([header], rows)
+            first_line = 1
+        house_column, x_column, y_column = columns
+        for line, row in enumerate(rows, start=first_line):
+            if not row:
+                continue
+            try:
+                yield int(row[house_column]), grid_value(row[x_column]), grid_value(row[y_column])
+            except (IndexError, ValueError):
+                raise ValueError(f"{path}: line {line}: expected house_id, x, y, got {row}") from None
+
+
+def read_geojson(path):
+    with open(path) as geojson_file:
+        collection = json.load(geojson_file)
+    for number, feature in enumerate(collection.get("features", [])):
+        geometry = feature.get("geometry") or {}
+        properties = feature.get("properties") or {}
+        house_id = properties.get("house_id", feature.get("id"))
+        if geometry.get("type") != "Point" or house_id is None:
+            raise ValueError(f"{path}: feature {number}: expected a Point with a house_id, got {feature}")
+        x, y = geometry["coordinates"][:2]
+        yield int(house_id), grid_value(x), grid_value(y)
+
+
+# (house_id, x, y) of the houses in a file, by extension
+def read_houses(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return read_csv(path)
+    if extension in (".geojson", ".json"):
+        return read_geojson(path)
+    if extension == ".txt":
+        return db.read_coordinates(path)
+    raise ValueError(f"Unknown house list format '{extension}', expected .csv, .geojson or .txt")
+
+
+# writes (house_id, x, y) houses to the map table in one transaction, returns the number written
+# houses already on the map are moved; replace: houses not in the list are removed (the trucks'
+# base, house 0, is kept unless the list has one)
+def import_houses(connection, houses, replace=False):
+    houses = iter(houses)
+    written = 0
+    connection.execute("BEGIN")
+    with connection:
+        for event in db.MAP_EVENTS:
+            connection.execute(f"DROP TRIGGER IF EXISTS map_{event.lower()}")
+        db.create_map_table(connection)
+        if replace:
+            connection.execute("DELETE FROM map WHERE house_id != 0")
+        while True:
+            chunk = list(itertools.islice(houses, CHUNK_SIZE))
+            if not chunk:
+                break
+            connection.executemany("INSERT OR REPLACE INTO map (house_id, x_value, y_value) VALUES (?, ?, ?)", chunk)
+            written += len(chunk)
+        db.create_map_tracking(connection)
+        connection.execute("UPDATE map_version SET changes = changes + 1")
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load a house list (CSV, GeoJSON or coordinates.txt) into the map table.")
+    parser.add_argument("path")
+    parser.add_argument("--replace", action="store_true", help="remove the houses that are not in the list")
+    parser.add_argument("--db", default=None, help="database path (default: WASTE_DB_PATH or my_database.db)")
+    arguments = parser.parse_args()
+
+    connection = db.connect(arguments.db) if arguments.db else db.conn
+    started = time.perf_counter()
+    count = import_houses(connection, read_houses(arguments.path), replace=arguments.replace)
+    print(f"[Map Import] {count} houses from {arguments.path} in {time.perf_counter() - started:.2f}s")
+    connection.close()
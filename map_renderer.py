@@ -0,0 +1,238 @@
+import math
+import tkinter as tk
+
+import numpy as np
+
+
+# Zoomable, pannable map for WasteCollectionUI.
+# The view is a scale (pixels per grid cell) and the grid coordinates of the canvas' top-left
+# corner. Only what is inside the view is drawn, with canvas items taken from pools and reused
+# from one redraw to the next (moved, re-labelled, hidden when left over), so the number of
+# canvas items follows the view and not the size of the map. Level of detail by scale:
+# - scale >= LABEL_SCALE: houses with their "House <id>" labels (the original look at 50 px)
+# - scale >= HOUSE_SCALE and at most MAX_HOUSE_ITEMS houses in view: houses without labels
+# - otherwise: a density heatmap of the houses in view, drawn as a single image
+# Grid lines are drawn from GRID_SCALE up. Mouse wheel zooms around the pointer, dragging pans.
+
+LABEL_SCALE = 30
+HOUSE_SCALE = 4
+GRID_SCALE = 8
+MAX_HOUSE_ITEMS = 4000
+HEAT_PIXELS = 4  # a heatmap cell is HEAT_PIXELS x HEAT_PIXELS screen pixels
+MIN_SCALE = 0.01
+MAX_SCALE = 200
+ZOOM_STEP = 1.25
+
+# tag of the truck icons, kept above the map
+TRUCK_TAG = "truck"
+LABEL_TAG = "house_label"
+
+
+class ItemPool:
+    """
+    Canvas items of one kind reused between redraws: take() the items a redraw needs, in order,
+    then finish() hides the ones it didn't use. Items are only created when a redraw needs more
+    than any redraw before it.
+    """
+    def __init__(self, canvas, create):
+        self.canvas = canvas
+        self.create = create
+        self.items = []
+        self.used = 0
+        self.shown = 0
+
+    def take(self):
+        if self.used == len(self.items):
+            self.items.append(self.create(self.canvas))
+        elif self.used >= self.shown:
+            self.canvas.itemconfigure(self.items[self.used], state="normal")
+        self.used += 1
+        return self.items[self.used - 1]
+
+    def finish(self):
+        for item in self.items[self.used:self.shown]:
+            self.canvas.itemconfigure(item, state="hidden")
+        self.shown = self.used
+        self.used = 0
+
+
+class MapRenderer:
+    """
+    Draws the houses ({house id: (x, y)}), the grid and the base on canvas (width x height pixels).
+    Houses are kept in NumPy arrays sorted by x, so the houses in view are a binary search for the
+    view's columns and a mask on their rows.
+    to_screen() gives the pixel position of a grid position for what's drawn on top (the trucks),
+    on_redraw, if set, is called after every redraw so it can follow the view.
+    """
+    def __init__(self, canvas, width, height, houses, base):
+        self.canvas = canvas
+        self.width = width
+        self.height = height
+        self.base = base
+        self.xs = self.ys = self.ids = np.empty(0, dtype=np.int64)
+        self.add_houses(houses, redraw=False)
+        self.fit()
+
+        self.lines = ItemPool(canvas, lambda c: c.create_line(0, 0, 0, 0, fill="gray"))
+        self.house_items = ItemPool(canvas, lambda c: c.create_rectangle(0, 0, 0, 0, fill="grey"))
+        self.labels = ItemPool(canvas, lambda c: c.create_text(0, 0, fill="white", font=("Arial", 9, "bold"),
+                                                               tags=(LABEL_TAG,)))
+        self.label_text = {}  # label item -> house id it shows
+        self.heat_item = canvas.create_image(0, 0, anchor=tk.NW, state="hidden")
+        self.heat_image = None
+        self.base_item = canvas.create_rectangle(0, 0, 0, 0, fill="black")
+        self.base_label = canvas.create_text(0, 0, text="Base", fill="white", font=("Arial", 10, "bold"))
+        self.redraw_pending = False
+        self.drag_from = None
+        self.drawn = 0  # houses drawn as items by the last redraw (0 when it was a heatmap)
+        self.on_redraw = None
+
+    # adds houses (or moves known ones), redraws unless told not to
+    def add_houses(self, houses, redraw=True):
+        if houses:
+            ids = np.fromiter(houses.keys(), dtype=np.int64, count=len(houses))
+            locations = np.array(list(houses.values()), dtype=np.int64).reshape(-1, 2)
+            keep = ~np.isin(self.ids, ids)
+            xs = np.concatenate([self.xs[keep], locations[:, 0]])
+            ys = np.concatenate([self.ys[keep], locations[:, 1]])
+            ids = np.concatenate([self.ids[keep], ids])
+            order = np.argsort(xs, kind="stable")
+            self.xs, self.ys, self.ids = xs[order], ys[order], ids[order]
+        if redraw:
+            self.request_redraw()
+
+    # scale and position showing the whole map (and the base)
+    def fit(self):
+        max_x = max(int(self.xs.max()) if len(self.xs) else 0, self.base[0]) + 1
+        max_y = max(int(self.ys.max()) if len(self.ys) else 0, self.base[1]) + 1
+        min_x = min(int(self.xs.min()) if len(self.xs) else 0, 0)
+        min_y = min(int(self.ys.min()) if len(self.ys) else 0, 0)
+        self.scale = min(self.width / (max_x - min_x), self.height / (max_y - min_y))
+        self.left, self.top = min_x, min_y
+
+    def to_screen(self, x, y):
+        return (x - self.left) * self.scale, (y - self.top) * self.scale
+
+    def to_grid(self, screen_x, screen_y):
+        return self.left + screen_x / self.scale, self.top + screen_y / self.scale
+
+    # zooms by factor keeping the grid position under (screen_x, screen_y) in place
+    def zoom(self, factor, screen_x, screen_y):
+        x, y = self.to_grid(screen_x, screen_y)
+        self.scale = min(max(self.scale * factor, MIN_SCALE), MAX_SCALE)
+        self.left, self.top = x - screen_x / self.scale, y - screen_y / self.scale
+        self.request_redraw()
+
+    def pan(self, dx, dy):
+        self.left -= dx / self.scale
+        self.top -= dy / self.scale
+        self.request_redraw()
+
+    def bind_controls(self):
+        self.canvas.bind("<MouseWheel>", lambda event: self.zoom(ZOOM_STEP if event.delta > 0 else 1 / ZOOM_STEP,
+                                                                 event.x, event.y))
+        self.canvas.bind("<Button-4>", lambda event: self.zoom(ZOOM_STEP, event.x, event.y))
+        self.canvas.bind("<Button-5>", lambda event: self.zoom(1 / ZOOM_STEP, event.x, event.y))
+        self.canvas.bind("<ButtonPress-1>", self.start_drag)
+        self.canvas.bind("<B1-Motion>", self.drag)
+
+    def start_drag(self, event):
+        self.drag_from = (event.x, event.y)
+
+    def drag(self, event):
+        if self.drag_from is not None:
+            self.pan(event.x - self.drag_from[0], event.y - self.drag_from[1])
+            self.drag_from = (event.x, event.y)
+
+    # zoom / pan events come in bursts, they share one redraw when Tk is idle
+    def request_redraw(self):
+        if not self.redraw_pending:
+            self.redraw_pending = True
+            self.canvas.after_idle(self.redraw)
+
+    # grid cells (x0, y0, x1, y1) in view, bounds included
+    def view_cells(self):
+        x0, y0 = self.to_grid(0, 0)
+        x1, y1 = self.to_grid(self.width, self.height)
+        return math.floor(x0), math.floor(y0), math.ceil(x1), math.ceil(y1)
+
+    # x, y and ids of the houses in view
+    def visible_houses(self):
+        x0, y0, x1, y1 = self.view_cells()
+        lo, hi = np.searchsorted(self.xs, [x0, x1 + 1])
+        ys = self.ys[lo:hi]
+        inside = (ys >= y0) & (ys <= y1)
+        return self.xs[lo:hi][inside], ys[inside], self.ids[lo:hi][inside]
+
+    def redraw(self):
+        self.redraw_pending = False
+        xs, ys, ids = self.visible_houses()
+        if self.scale >= HOUSE_SCALE and len(xs) <= MAX_HOUSE_ITEMS:
+            self.canvas.itemconfigure(self.heat_item, state="hidden")
+            self.draw_houses(xs, ys, ids)
+        else:
+            self.show_heatmap(self.heatmap_ppm(xs, ys))
+            self.drawn = 0
+        self.draw_grid()
+        self.draw_base()
+        for pool in (self.lines, self.house_items, self.labels):
+            pool.finish()
+        # items created by this redraw are on top: put labels over houses, then the base and trucks
+        for tag in (LABEL_TAG, self.base_item, self.base_label, TRUCK_TAG):
+            self.canvas.tag_raise(tag)
+        if self.on_redraw is not None:
+            self.on_redraw()
+
+    def draw_houses(self, xs, ys, ids):
+        scale = self.scale
+        labelled = scale >= LABEL_SCALE
+        for x, y, house_id in zip(((xs - self.left) * scale).tolist(), ((ys - self.top) * scale).tolist(),
+                                  ids.tolist()):
+            self.canvas.coords(self.house_items.take(), x, y, x + scale, y + scale)
+            if labelled:
+                label = self.labels.take()
+                self.canvas.coords(label, x + scale / 2, y + scale * 0.4)
+                if self.label_text.get(label) != house_id:
+                    self.canvas.itemconfigure(label, text=f"House {house_id}")
+                    self.label_text[label] = house_id
+        self.drawn = len(xs)
+
+    def draw_grid(self):
+        if self.scale < GRID_SCALE:
+            return
+        x0, y0, x1, y1 = self.view_cells()
+        for x in range(x0, x1 + 1):
+            screen_x = self.to_screen(x, 0)[0]
+            self.canvas.coords(self.lines.take(), screen_x, 0, screen_x, self.height)
+        for y in range(y0, y1 + 1):
+            screen_y = self.to_screen(0, y)[1]
+            self.canvas.coords(self.lines.take(), 0, screen_y, self.width, screen_y)
+
+    def draw_base(self):
+        x, y = self.to_screen(*self.base)
+        size = max(self.scale, 6)  # still visible zoomed out
+        self.canvas.coords(self.base_item, x, y, x + size, y + size)
+        self.canvas.coords(self.base_label, x + size / 2, y + size / 2)
+        self.canvas.itemconfigure(self.base_label, state="normal" if self.scale >= LABEL_SCALE else "hidden")
+
+    # PPM image of the view: the houses counted per HEAT_PIXELS x HEAT_PIXELS block, white (none)
+    # to dark grey (most) on a log scale
+    def heatmap_ppm(self, xs, ys):
+        columns = -(-self.width // HEAT_PIXELS)
+        rows = -(-self.height // HEAT_PIXELS)
+        bx = ((xs + 0.5 - self.left) * (self.scale / HEAT_PIXELS)).astype(np.int64)
+        by = ((ys + 0.5 - self.top) * (self.scale / HEAT_PIXELS)).astype(np.int64)
+        inside = (bx >= 0) & (bx < columns) & (by >= 0) & (by < rows)
+        counts = np.bincount(by[inside] * columns + bx[inside], minlength=rows * columns).reshape(rows, columns)
+        shade = np.full(counts.shape, 255, dtype=np.uint8)
+        if counts.any():
+            level = np.log1p(counts) / np.log1p(counts.max())
+            shade = (255 - level * 205).astype(np.uint8)
+        pixels = np.repeat(np.repeat(shade, HEAT_PIXELS, axis=0), HEAT_PIXELS, axis=1)[:self.height, :self.width]
+        rgb = np.repeat(pixels[:, :, None], 3, axis=2)
+        return b"P6 %d %d 255\n" % (self.width, self.height) + rgb.tobytes()
+
+    def show_heatmap(self, ppm):
+        self.heat_image = tk.PhotoImage(data=ppm, format="PPM")
+        self.canvas.itemconfigure(self.heat_item, image=self.heat_image, state="normal")
+        self.canvas.tag_lower(self.heat_item)
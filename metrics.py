@@ -0,0 +1,202 @@
+import http.server
+import itertools
+import json
+import math
+import os
+import threading
+import time
+
+
+# Lightweight instrumentation shared by the pipeline stages.
+# - trace ids: monotonic per process (process id in the high bits so ids from different
+#   clients don't collide), carried with the wire_protocol messages together with a list of
+#   time.time_ns() stamps, one per stage the message went through
+# - histograms: per-stage latencies in log2 buckets (microseconds), so observing a value is a
+#   bit_length() and two additions; benchmarks can have a stage's values kept as they are
+#   (Metrics.keep_samples), for exact percentiles
+# - counters: messages per stage, turned into messages/s by the dump / endpoint
+# Collection is always on; exposing it is opt-in through environment variables:
+#   WASTE_METRICS_PORT=9100  -> JSON on http://127.0.0.1:9100/metrics
+#   WASTE_METRICS_DUMP=10    -> print a JSON line every 10 seconds
+
+# stage stamps, in the order they are appended to a trace
+CLIENT_PUBLISH = 0
+SERVER_RECEIVE = 1
+TRUCK_PUBLISH = 2
+SCHEDULER_RECEIVE = 3
+
+HISTOGRAM_BUCKETS = 40  # 2**39 us is ~6 days, plenty
+
+_trace_counter = itertools.count(1)
+_trace_prefix = (os.getpid() & 0xFFFFF) << 40
+
+
+def new_trace(stamp_ns=None):
+    """
+    Starts a trace: (trace id, [first stamp])
+    """
+    return next(_trace_counter) | _trace_prefix, [stamp_ns or time.time_ns()]
+
+
+def stamp(trace, stamp_ns=None):
+    """
+    Appends this stage's time to a trace (no-op for untraced messages), returns the stamp.
+    """
+    stamp_ns = stamp_ns or time.time_ns()
+    if trace is not None:
+        trace[1].append(stamp_ns)
+    return stamp_ns
+
+
+class Histogram:
+    """
+    Latency histogram with log2 buckets in microseconds.
+    With keep_samples every value is kept too, and quantile() is exact instead of a bucket bound.
+    """
+    def __init__(self, keep_samples=False):
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.samples = [] if keep_samples else None
+
+    def observe(self, microseconds):
+        microseconds = max(int(microseconds), 0)
+        if self.samples is not None:
+            self.samples.append(microseconds)
+        self.buckets[min(microseconds.bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += microseconds
+        if microseconds > self.max:
+            self.max = microseconds
+
+    # upper bound of the bucket holding the given quantile (0..1), the exact value (nearest rank)
+    # when the samples are kept
+    def quantile(self, q):
+        if not self.count:
+            return 0
+        if self.samples is not None:
+            ordered = sorted(self.samples)
+            return ordered[min(max(math.ceil(q * len(ordered)) - 1, 0), len(ordered) - 1)]
+        wanted = q * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= wanted:
+                return min((1 << bucket) - 1 if bucket else 0, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_us": self.total / self.count if self.count else 0,
+            "p50_us": self.quantile(0.5),
+            "p90_us": self.quantile(0.9),
+            "p99_us": self.quantile(0.99),
+            "max_us": self.max,
+        }
+
+
+class Metrics:
+    """
+    Registry of counters and latency histograms for one process.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.exact = set()  # histograms keeping their samples
+        self.started = time.monotonic()
+        self.last_counters = {}
+        self.last_time = self.started
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    # keeps every value of the histogram from now on (exact percentiles, memory grows with the values)
+    def keep_samples(self, name):
+        with self.lock:
+            self.exact.add(name)
+            histogram = self.histograms.get(name)
+            if histogram is not None and histogram.samples is None:
+                self.histograms[name] = Histogram(keep_samples=True)
+
+    def observe(self, name, seconds):
+        self.observe_us(name, seconds * 1e6)
+
+    def observe_us(self, name, microseconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(name in self.exact)
+            histogram.observe(microseconds)
+
+    # latency between two stamps of a trace (untraced messages are skipped)
+    def observe_trace(self, name, trace, start_stage, end_stamp_ns=None):
+        if trace is not None and len(trace[1]) > start_stage:
+            end_stamp_ns = end_stamp_ns or trace[1][-1]
+            self.observe_us(name, (end_stamp_ns - trace[1][start_stage]) / 1000)
+
+    def snapshot(self):
+        """
+        Counters, messages/s since the previous snapshot and histogram summaries.
+        """
+        with self.lock:
+            now = time.monotonic()
+            elapsed = max(now - self.last_time, 1e-9)
+            rates = {name: (value - self.last_counters.get(name, 0)) / elapsed for name, value in self.counters.items()}
+            self.last_counters = dict(self.counters)
+            self.last_time = now
+            return {
+                "uptime_s": now - self.started,
+                "counters": dict(self.counters),
+                "rates_per_s": rates,
+                "latency": {name: histogram.summary() for name, histogram in self.histograms.items()},
+            }
+
+
+# metrics of this process
+METRICS = Metrics()
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = json.dumps(METRICS.snapshot()).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # no line per scrape
+
+
+def start_http(port, host="127.0.0.1"):
+    metrics_server = http.server.ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=metrics_server.serve_forever, daemon=True).start()
+    return metrics_server
+
+
+def start_dump(interval, stage):
+    def dump():
+        while True:
+            time.sleep(interval)
+            print(f"[Metrics {stage}] {json.dumps(METRICS.snapshot())}")
+
+    thread = threading.Thread(target=dump, daemon=True)
+    thread.start()
+    return thread
+
+
+# starts the endpoint / periodic dump configured in the environment (see top of file)
+def start_from_env(stage):
+    if os.environ.get("WASTE_METRICS_PORT"):
+        start_http(int(os.environ["WASTE_METRICS_PORT"]))
+        print(f"[Metrics {stage}] Serving on http://127.0.0.1:{os.environ['WASTE_METRICS_PORT']}/metrics")
+    if os.environ.get("WASTE_METRICS_DUMP"):
+        start_dump(float(os.environ["WASTE_METRICS_DUMP"]), stage)
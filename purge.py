@@ -1,6 +1,6 @@
-import pika
+import transport
 
-connection = pika.BlockingConnection(pika.ConnectionParameters('localhost'))
+connection = transport.connect()
 channel = connection.channel()
 
 # Purge the queue
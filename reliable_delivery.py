@@ -0,0 +1,80 @@
+import pika
+
+import metrics
+import wire_protocol
+
+
+# Retries and dead-lettering for the RabbitMQ consumers (server, truck scheduler, shards, workers).
+# Consumers ack manually, once a message's work is done (its rows committed, its truck requests
+# confirmed), so a crash before that gets the message redelivered instead of losing it.
+# A message whose handling raises is published again at the back of the queue it came from,
+# with the number of attempts in its x-attempts header (classic queues don't count deliveries).
+# After MAX_ATTEMPTS attempts, or straight away when it can't be decoded (retrying won't fix a
+# wire_protocol.MessageFormatError), it goes to Dead-Letter-Queue instead, with the routing key
+# it came from and the error in its headers. The original is acked either way.
+# A redelivered message may be the one that crashed the consumer before it was acked, so it
+# counts as an attempt as well: it is sent to the back of the queue (or dead-lettered) before
+# being handled again, which stops a poison message from crash-looping a consumer.
+
+DEAD_LETTER_QUEUE = 'Dead-Letter-Queue'
+MAX_ATTEMPTS = 5
+ATTEMPTS_HEADER = 'x-attempts'
+
+
+def attempts_of(properties):
+    headers = getattr(properties, "headers", None) or {}
+    return headers.get(ATTEMPTS_HEADER, 0)
+
+
+class DeliveryGuard:
+    """
+    Runs a consumer's handler on each message and retries or dead-letters the ones it fails on.
+    channel publishes the retries and dead letters; it should have publisher confirms on, so
+    they are on the broker before the caller acks the original.
+    handle() returns what handler(body) returned, or None when the message was retried or
+    dead-lettered instead.
+    """
+    def __init__(self, channel, name, max_attempts=MAX_ATTEMPTS):
+        self.channel = channel
+        self.name = name
+        self.max_attempts = max_attempts
+        self.retried = 0
+        self.dead_lettered = 0
+        channel.queue_declare(queue=DEAD_LETTER_QUEUE, durable=True)
+
+    def handle(self, method, properties, body, handler):
+        attempts = attempts_of(properties) + 1
+        if method.redelivered:
+            self.retry(method, properties, body, attempts, "redelivered, the consumer may have crashed on it")
+            return None
+        try:
+            return handler(body)
+        except wire_protocol.MessageFormatError as error:
+            self.dead_letter(method, properties, body, attempts, error)
+        except Exception as error:
+            print(f"[{self.name}] Message from {method.routing_key} failed (attempt {attempts}): {error!r}")
+            self.retry(method, properties, body, attempts, error)
+        return None
+
+    def retry(self, method, properties, body, attempts, error):
+        if attempts >= self.max_attempts:
+            self.dead_letter(method, properties, body, attempts, error)
+            return
+        self.channel.basic_publish(exchange=method.exchange, routing_key=method.routing_key, body=body,
+                                   properties=self._properties(properties, {ATTEMPTS_HEADER: attempts}))
+        self.retried += 1
+        metrics.METRICS.count("delivery.retried")
+
+    def dead_letter(self, method, properties, body, attempts, error):
+        print(f"[{self.name}] Dead-lettered message from {method.routing_key} after {attempts} attempt(s): {error}")
+        self.channel.basic_publish(exchange='', routing_key=DEAD_LETTER_QUEUE, body=body,
+                                   properties=self._properties(properties, {
+                                       ATTEMPTS_HEADER: attempts, "x-routing-key": method.routing_key,
+                                       "x-exchange": method.exchange, "x-error": str(error)}))
+        self.dead_lettered += 1
+        metrics.METRICS.count("delivery.dead_lettered")
+
+    @staticmethod
+    def _properties(properties, headers):
+        return pika.BasicProperties(delivery_mode=2,
+                                    headers={**(getattr(properties, "headers", None) or {}), **headers})
@@ -0,0 +1,71 @@
+import collections
+import heapq
+import itertools
+import time
+
+
+# Pickups waiting for a place in the week: requests no route could take ("N/A" in the schedule
+# table) and pickups displaced from a truck / day taken out of service (see
+# truck_scheduler.set_availability). The repair pass takes them fullest bin / longest wait first.
+#
+# A pickup's priority is its load (fill %) plus AGE_WEIGHT per second it has waited:
+# load + AGE_WEIGHT * (now - queued_at). Every pickup ages at the same rate, so ordering by
+# load - AGE_WEIGHT * queued_at gives the same order at any time and the heap never needs re-keying.
+
+# fill % a waiting pickup gains per second (10% an hour)
+AGE_WEIGHT = 10 / 3600
+
+# request_id + truck_type identify the pickup (its schedule row), load is in % of a bin
+Pickup = collections.namedtuple("Pickup", "request_id truck_type house_id load queued_at")
+
+
+# time-invariant priority of a pickup, higher goes first
+def priority(load, queued_at):
+    return load - AGE_WEIGHT * queued_at
+
+
+class PendingQueue:
+    """
+    Max-priority queue of Pickups, one per (request_id, truck_type).
+    push() of a pickup already queued replaces it; remove() drops one. Both leave the old heap
+    entry in place, marked dead, and pop() skips dead entries.
+    """
+    def __init__(self):
+        self.heap = []
+        self.entries = {}  # (request_id, truck_type) -> heap entry [-priority, order, pickup, alive]
+        self.order = itertools.count()
+
+    def push(self, request_id, truck_type, house_id, load, queued_at=None):
+        pickup = Pickup(request_id, truck_type, house_id, load, time.time() if queued_at is None else queued_at)
+        self.remove(request_id, truck_type)
+        entry = [-priority(pickup.load, pickup.queued_at), next(self.order), pickup, True]
+        self.entries[(request_id, truck_type)] = entry
+        heapq.heappush(self.heap, entry)
+        if len(self.heap) > 2 * len(self.entries) + 64:
+            self.heap = list(self.entries.values())  # mostly dead entries, rebuild
+            heapq.heapify(self.heap)
+        return pickup
+
+    def remove(self, request_id, truck_type):
+        entry = self.entries.pop((request_id, truck_type), None)
+        if entry is not None:
+            entry[3] = False
+
+    # highest priority pickup, taken out of the queue (None when empty)
+    def pop(self):
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            if entry[3]:
+                del self.entries[(entry[2].request_id, entry[2].truck_type)]
+                return entry[2]
+        return None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    # waiting pickups, highest priority first
+    def pickups(self):
+        return [entry[2] for entry in sorted(self.entries.values())]
@@ -0,0 +1,190 @@
+import array
+import time
+
+import wire_protocol
+
+
+# Stateful aggregation of garbage reports for server.py.
+# - FillTable keeps the latest levels of every house in flat arrays, one row per house that reported
+#   (HouseRows numbers the houses densely, a large or sparse house id from map_import costs one row)
+# - a truck type stays "open" for a house from its truck request until the house reports that bin
+#   emptied (its level drops by PICKUP_DROP or more), so repeated reports of a full bin don't book
+#   it again, and bins pre-scheduled from a forecast (see fill_forecast.py) aren't booked a second
+#   time when they do cross the threshold
+# - new truck requests are collected per window and published together, one request per house
+#   with all the trucks that house needs
+
+# seconds a window stays open before its truck requests are published
+AGGREGATION_WINDOW = 1.0
+
+# a window is also closed after this many reports (their acks wait for it, see server.py)
+AGGREGATION_MAX_REPORTS = 1000
+
+# an open request is sent again if the bin still reports full this long after it (missed pickup)
+OPEN_REQUEST_TTL = 7 * 24 * 3600
+
+# a level drop of at least this many % between two reports means the bin was emptied
+PICKUP_DROP = 20
+
+WASTE_COUNT = len(wire_protocol.WASTE_TYPES)
+
+
+class HouseRows:
+    """
+    Dense row numbers of house ids, given out in the order the houses are first seen.
+    row() numbers a new house, find() returns None for one never seen; house_ids[row] is the row's house.
+    """
+    def __init__(self):
+        self.rows = {}
+        self.house_ids = array.array("q")
+
+    def row(self, house_id):
+        row = self.rows.get(house_id)
+        if row is None:
+            row = self.rows[house_id] = len(self.house_ids)
+            self.house_ids.append(house_id)
+        return row
+
+    def find(self, house_id):
+        return self.rows.get(house_id)
+
+    def copy(self):
+        rows = HouseRows()
+        rows.rows = dict(self.rows)
+        rows.house_ids = array.array("q", self.house_ids)
+        return rows
+
+    def __len__(self):
+        return len(self.house_ids)
+
+
+class FillTable:
+    """
+    Latest report of every house: 3 fill levels (bytes), report time, and the truck flags
+    (wire_protocol.TRUCK_FLAGS) of its open truck requests with the time they were opened.
+    The arrays are indexed by the house's row in `rows` and grow by doubling.
+    """
+    def __init__(self, capacity=1024):
+        self.rows = HouseRows()
+        self.capacity = 0
+        self.levels = array.array("B")
+        self.reported_at = array.array("d")
+        self.open_flags = array.array("B")
+        self.opened_at = array.array("d")
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        extra = capacity - self.capacity
+        self.levels.frombytes(bytes(extra * WASTE_COUNT))
+        self.reported_at.frombytes(bytes(extra * self.reported_at.itemsize))
+        self.open_flags.frombytes(bytes(extra))
+        self.opened_at.frombytes(bytes(extra * self.opened_at.itemsize))
+        self.capacity = capacity
+
+    # returns the house's row
+    def record(self, house_id, garbage_info, now):
+        row = self.rows.row(house_id)
+        if row >= self.capacity:
+            self._grow(max(self.capacity * 2, 1))
+        start = row * WASTE_COUNT
+        self.levels[start:start + WASTE_COUNT] = array.array("B", garbage_info)
+        self.reported_at[row] = now
+        return row
+
+    def latest(self, house_id):
+        """
+        Latest levels of a house (None if it never reported)
+        """
+        row = self.rows.find(house_id)
+        if row is None or not self.reported_at[row]:
+            return None
+        start = row * WASTE_COUNT
+        return self.levels[start:start + WASTE_COUNT].tolist()
+
+    def reported(self, house_id):
+        """
+        Time of the house's latest report (None if it never reported)
+        """
+        row = self.rows.find(house_id)
+        return None if row is None else self.reported_at[row]
+
+
+class ReportAggregator:
+    """
+    Turns garbage reports into deduplicated, per-window truck requests.
+    add() records a report, add_forecast() a pre-scheduled pickup; close_window() returns the
+    window's truck requests as (house id, trucks needed, trace, first day) and starts a new window.
+    """
+    def __init__(self, threshold, window=AGGREGATION_WINDOW, max_reports=AGGREGATION_MAX_REPORTS,
+                 open_request_ttl=OPEN_REQUEST_TTL):
+        self.threshold = threshold
+        self.window = window
+        self.max_reports = max_reports
+        self.open_request_ttl = open_request_ttl
+        self.table = FillTable()
+        self.pending = {}  # house id -> [truck flags, trace of the first report, first day]
+        self.window_reports = 0
+        self.pending_ack = None  # (consumer channel, highest delivery tag) acked once the window is published
+        self.reports = 0
+        self.duplicates = 0
+
+    def add(self, house_id, garbage_info, trace=None, now=None):
+        now = now or time.time()
+        table = self.table
+        previous = table.latest(house_id)
+        row = table.record(house_id, garbage_info, now)
+        needed = 0
+        emptied = 0
+        for i, level in enumerate(garbage_info):
+            if level > self.threshold:
+                needed |= 1 << i
+            if previous is not None and previous[i] - level >= PICKUP_DROP:
+                emptied |= 1 << i
+
+        open_flags = table.open_flags[row] & ~emptied
+        if open_flags and now - table.opened_at[row] > self.open_request_ttl:
+            open_flags = 0
+        new = needed & ~open_flags
+        if needed and not new:
+            self.duplicates += 1
+        table.open_flags[row] = open_flags
+        self._open(house_id, row, new, trace, 0, now)
+        self.window_reports += 1
+        self.reports += 1
+        return new
+
+    def add_forecast(self, house_id, flags, first_day, now=None):
+        """
+        Books the bins in flags (expected to be full from first_day on) unless they already are.
+        """
+        if self.table.latest(house_id) is None:
+            return 0
+        row = self.table.rows.find(house_id)
+        new = flags & ~self.table.open_flags[row]
+        self._open(house_id, row, new, None, first_day, now or time.time())
+        return new
+
+    def _open(self, house_id, row, flags, trace, first_day, now):
+        if not flags:
+            return
+        self.table.open_flags[row] |= flags
+        self.table.opened_at[row] = now
+        request = self.pending.get(house_id)
+        if request is None:
+            self.pending[house_id] = [flags, trace, first_day]
+        else:
+            request[0] |= flags
+            # the day that comes first from today (day indices wrap round the week)
+            today = (time.localtime(now).tm_wday + 1) % 7  # Sunday = 0, as fill_forecast.day_of_week
+            if (first_day - today) % 7 < (request[2] - today) % 7:
+                request[2] = first_day
+
+    def is_full(self):
+        return self.window_reports >= self.max_reports
+
+    def close_window(self):
+        requests = [(house_id, wire_protocol.flags_to_trucks(flags), trace, first_day)
+                    for house_id, (flags, trace, first_day) in self.pending.items()]
+        self.pending = {}
+        self.window_reports = 0
+        return requests
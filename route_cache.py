@@ -0,0 +1,86 @@
+import collections
+import threading
+
+import numpy as np
+
+
+# Truck routes for WasteCollectionUI's animation, as polylines through their corner points
+# instead of one point per grid cell, cached per (day, truck id) until the schedule changes
+# one of that route's stops.
+# Trucks drive x first, then y (as house_index.manhattan_path), so a leg from a to b turns
+# once, at (b.x, a.y).
+
+ROUTE_CACHE_SIZE = 1024
+
+# points: (k, 2) int32 corner points, lengths: (k,) int32 distance driven at each of them
+Polyline = collections.namedtuple("Polyline", "points lengths")
+
+
+def manhattan_polyline(waypoints):
+    """
+    Polyline driving through waypoints ((x, y) list: base, stops, base) in order. Legs of
+    zero length and corners going straight on are left out, so every segment has a length.
+    """
+    waypoints = np.asarray(waypoints, dtype=np.int32).reshape(-1, 2)
+    points = np.empty((2 * len(waypoints) - 1, 2), dtype=np.int32)
+    points[0] = waypoints[0]
+    points[1::2, 0] = waypoints[1:, 0]  # turn of each leg
+    points[1::2, 1] = waypoints[:-1, 1]
+    points[2::2] = waypoints[1:]
+    points = points[np.r_[True, np.any(np.diff(points, axis=0) != 0, axis=1)]]
+    if len(points) > 2:
+        direction = np.sign(np.diff(points, axis=0))
+        points = points[np.r_[True, np.any(direction[1:] != direction[:-1], axis=1), True]]
+    lengths = np.zeros(len(points), dtype=np.int32)
+    np.cumsum(np.abs(np.diff(points, axis=0)).sum(axis=1), out=lengths[1:])
+    return Polyline(points, lengths)
+
+
+class RouteCache:
+    """
+    LRU cache of routes by (day, truck id), holding at most max_routes of them. The UI thread
+    invalidates a route when the schedule changes its stops, the route worker get()s and put()s.
+    A route built from stops read before an invalidation of its key is not stored: the worker
+    takes version before reading the stops and passes it to put().
+    """
+    def __init__(self, max_routes=ROUTE_CACHE_SIZE):
+        self.max_routes = max_routes
+        self.routes = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.version = 0
+        self.changed_at = {}  # key -> version of its last invalidation
+        self.cleared_at = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            route = self.routes.get(key)
+            if route is None:
+                self.misses += 1
+            else:
+                self.routes.move_to_end(key)
+                self.hits += 1
+            return route
+
+    def put(self, key, route, version):
+        with self.lock:
+            if max(self.changed_at.get(key, -1), self.cleared_at) > version:
+                return
+            self.routes[key] = route
+            self.routes.move_to_end(key)
+            while len(self.routes) > self.max_routes:
+                self.routes.popitem(last=False)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.version += 1
+            self.changed_at[key] = self.version
+            self.routes.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.version += 1
+            self.cleared_at = self.version
+            self.changed_at = {}
+            self.routes.clear()
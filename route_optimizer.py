@@ -0,0 +1,205 @@
+import time
+
+
+# Route improvement engine for the per-day, per-truck house lists in WEEKLY_SCHEDULE.
+# Routes are closed tours: base -> houses in order -> back to base, Manhattan distance.
+# Improvers are pluggable:
+# - ROUTE_IMPROVERS work on a single route:   improver(houses, distance, base, deadline) -> bool
+# - WEEK_IMPROVERS work on one truck's week: improver(day_routes, distance, base, max_distance, deadline) -> list of moves
+# Every improver edits the lists in place (so other references to them stay valid) and
+# returns whether / what it changed. Moves are (house_id, from_day, to_day) tuples.
+
+# house id of the trucks' home base
+BASE_HOUSE = 0
+
+
+# length of the closed tour base -> houses -> base
+def tour_length(houses, distance, base=BASE_HOUSE):
+    if not houses:
+        return 0
+    length = distance(base, houses[0]) + distance(houses[-1], base)
+    for i in range(1, len(houses)):
+        length += distance(houses[i - 1], houses[i])
+    return length
+
+
+# distance added by inserting house at index position of a closed tour
+def insertion_delta(houses, house, position, distance, base=BASE_HOUSE):
+    previous_house = houses[position - 1] if position > 0 else base
+    next_house = houses[position] if position < len(houses) else base
+    return distance(previous_house, house) + distance(house, next_house) - distance(previous_house, next_house)
+
+
+# distance saved by removing the house at index position of a closed tour
+def removal_saving(houses, position, distance, base=BASE_HOUSE):
+    previous_house = houses[position - 1] if position > 0 else base
+    next_house = houses[position + 1] if position + 1 < len(houses) else base
+    house = houses[position]
+    return distance(previous_house, house) + distance(house, next_house) - distance(previous_house, next_house)
+
+
+# cheapest insertion position in a closed tour, returns (delta, position)
+def cheapest_insertion(houses, house, distance, base=BASE_HOUSE):
+    best_delta, best_position = None, len(houses)
+    for position in range(len(houses) + 1):
+        delta = insertion_delta(houses, house, position, distance, base)
+        if best_delta is None or delta < best_delta:
+            best_delta, best_position = delta, position
+    return best_delta, best_position
+
+
+# 2-opt: reverse the segment between two edges when that shortens the tour
+def two_opt(houses, distance, base=BASE_HOUSE, deadline=None):
+    tour = [base] + houses + [base]
+    improved = False
+    found = True
+    while found:
+        found = False
+        for i in range(1, len(tour) - 2):
+            if deadline is not None and time.monotonic() > deadline:
+                break
+            a, b = tour[i - 1], tour[i]
+            for j in range(i + 1, len(tour) - 1):
+                c, d = tour[j], tour[j + 1]
+                if distance(a, c) + distance(b, d) < distance(a, b) + distance(c, d):
+                    tour[i:j + 1] = reversed(tour[i:j + 1])
+                    b = tour[i]
+                    found = improved = True
+    if improved:
+        houses[:] = tour[1:-1]
+    return improved
+
+
+# Or-opt: move a chain of 1 to 3 consecutive houses (possibly reversed) elsewhere in the tour
+def or_opt(houses, distance, base=BASE_HOUSE, deadline=None):
+    improved = False
+    found = True
+    while found:
+        found = False
+        for size in (1, 2, 3):
+            for start in range(len(houses) - size + 1):
+                if deadline is not None and time.monotonic() > deadline:
+                    return improved
+                segment = houses[start:start + size]
+                previous_house = houses[start - 1] if start > 0 else base
+                next_house = houses[start + size] if start + size < len(houses) else base
+                saving = (distance(previous_house, segment[0]) + distance(segment[-1], next_house)
+                          - distance(previous_house, next_house))
+                rest = houses[:start] + houses[start + size:]
+                best = None
+                for position in range(len(rest) + 1):
+                    if position == start:
+                        continue  # same place
+                    p = rest[position - 1] if position > 0 else base
+                    n = rest[position] if position < len(rest) else base
+                    for chain in (segment, segment[::-1]):
+                        cost = distance(p, chain[0]) + distance(chain[-1], n) - distance(p, n)
+                        if cost < saving and (best is None or cost < best[0]):
+                            best = (cost, position, chain)
+                if best is not None:
+                    _, position, chain = best
+                    houses[:] = rest[:position] + chain + rest[position:]
+                    found = improved = True
+                    break
+            if found:
+                break
+    return improved
+
+
+# relocate: move single houses to another day's route when that lowers the total week
+# distance and the other day stays under max_distance
+def relocate_between_days(day_routes, distance, base=BASE_HOUSE, max_distance=None, deadline=None):
+    moves = []
+    lengths = {day: tour_length(houses, distance, base) for day, houses in day_routes.items()}
+    found = True
+    while found:
+        found = False
+        for from_day, houses in day_routes.items():
+            position = 0
+            while position < len(houses):
+                if deadline is not None and time.monotonic() > deadline:
+                    return moves
+                house = houses[position]
+                saving = removal_saving(houses, position, distance, base)
+                best = None
+                for to_day, other in day_routes.items():
+                    if to_day == from_day:
+                        continue
+                    delta, insert_at = cheapest_insertion(other, house, distance, base)
+                    if max_distance is not None and lengths[to_day] + delta >= max_distance:
+                        continue
+                    if delta < saving and (best is None or delta < best[0]):
+                        best = (delta, to_day, insert_at)
+                if best is None:
+                    position += 1
+                    continue
+                delta, to_day, insert_at = best
+                houses.pop(position)
+                day_routes[to_day].insert(insert_at, house)
+                lengths[from_day] -= saving
+                lengths[to_day] += delta
+                moves.append((house, from_day, to_day))
+                found = True
+    return moves
+
+
+ROUTE_IMPROVERS = [two_opt, or_opt]
+WEEK_IMPROVERS = [relocate_between_days]
+
+
+def register_route_improver(improver):
+    ROUTE_IMPROVERS.append(improver)
+    return improver
+
+
+def register_week_improver(improver):
+    WEEK_IMPROVERS.append(improver)
+    return improver
+
+
+# re-optimises every route in a WEEKLY_SCHEDULE-shaped dict (day -> truck type -> houses)
+# within time_budget seconds and reports how much route distance it freed
+def optimise_schedule(schedule, distance, max_distance=None, time_budget=0.5, base=BASE_HOUSE,
+                      route_improvers=None, week_improvers=None):
+    """
+    Returns a report dict:
+    - distance_before / distance_after: total closed-tour distance of every route
+    - capacity_freed: distance given back to the fleet (distance_before - distance_after)
+    - routes_improved: number of (day, truck) routes changed by the route improvers
+    - moves: (truck type, house id, from day, to day) for every house moved to another day
+    - elapsed: seconds spent
+    """
+    start = time.monotonic()
+    deadline = start + time_budget
+    route_improvers = ROUTE_IMPROVERS if route_improvers is None else route_improvers
+    week_improvers = WEEK_IMPROVERS if week_improvers is None else week_improvers
+
+    def total_distance():
+        return sum(tour_length(houses, distance, base) for trucks in schedule.values() for houses in trucks.values())
+
+    distance_before = total_distance()
+    routes_improved = 0
+    for trucks in schedule.values():
+        for houses in trucks.values():
+            changed = False
+            for improver in route_improvers:
+                changed = improver(houses, distance, base, deadline) or changed
+            routes_improved += changed
+
+    moves = []
+    truck_types = {truck for trucks in schedule.values() for truck in trucks}
+    for truck in truck_types:
+        day_routes = {day: trucks[truck] for day, trucks in schedule.items() if truck in trucks}
+        for improver in week_improvers:
+            for house, from_day, to_day in improver(day_routes, distance, base, max_distance, deadline):
+                moves.append((truck, house, from_day, to_day))
+
+    distance_after = total_distance()
+    return {
+        "distance_before": distance_before,
+        "distance_after": distance_after,
+        "capacity_freed": distance_before - distance_after,
+        "routes_improved": routes_improved,
+        "moves": moves,
+        "elapsed": time.monotonic() - start,
+    }
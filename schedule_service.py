@@ -0,0 +1,278 @@
+import argparse
+import collections
+import http.server
+import json
+import sqlite3
+import threading
+import urllib.parse
+
+import coordinate_cache
+import db
+import metrics
+
+
+# Read service for the schedule, so dashboards don't open the database and scan the whole
+# schedule table themselves (and don't load the scheduler's database while it writes):
+# - pickups of a day and truck type (schedule_day_truck index), of a house (schedule_house index)
+#   and of the houses in a box of the map (coordinate_cache.CoordinateCache, then schedule_house)
+# - a batch of queries answered from one snapshot of the database
+# - responses are cached; the cache follows the schedule like db.ScheduleFeed: new rows drop the
+#   responses of their day / truck type and house, rows changed in place (updated_seq) those of
+#   their house and of every day of their truck type (the day they left isn't known), both drop
+#   the box responses; deleted rows (schedule_version.deleted) drop everything, a changed map
+#   (map_version) the box responses
+#
+# Usage: python schedule_service.py [--port 9200] [--db my_database.db]
+#   GET  /day?day=Tuesday&truck_type=Organic
+#   GET  /house?house_id=42
+#   GET  /box?x0=0&y0=0&x1=50&y1=50[&day=Tuesday]
+#   POST /batch  [{"query": "house", "house_id": 42}, {"query": "day", "day": 2, "truck_type": 0}, ...]
+#   GET  /stats
+# Days and truck types are given by name or index in db.DAYS / db.TRUCK_TYPES, answers use names.
+
+PORT = 9200
+
+# responses kept per kind of query (least recently used dropped first)
+CACHE_SIZE = 10000
+
+
+# index of a day / truck type given by name or index
+def index_of(value, names, kind):
+    if isinstance(value, str) and value.isdigit():
+        value = int(value)
+    if isinstance(value, int) and 0 <= value < len(names):
+        return value
+    if value in names:
+        return names.index(value)
+    raise ValueError(f"Unknown {kind}: {value}")
+
+
+class ScheduleQueries:
+    """
+    Indexed, cached queries on the schedule of one database (opened read-only).
+    Every query first checks the database for commits (a single PRAGMA data_version when there
+    are none), so answers are never older than the last commit. Answers are shared between
+    callers and must not be modified.
+    """
+    def __init__(self, path=None, cache_size=CACHE_SIZE):
+        self.connection = sqlite3.connect(f"file:{path or db.DB_PATH}?mode=ro", uri=True, check_same_thread=False)
+        self.coordinates = coordinate_cache.CoordinateCache(path)
+        self.cache_size = cache_size
+        self.lock = threading.RLock()
+        self.responses = collections.OrderedDict()  # ("day", day, truck_type) / ("house", house_id) -> answer
+        self.box_responses = collections.OrderedDict()  # ("box", x0, y0, x1, y1, day) -> answer
+        self.data_version = None
+        self.changes = None
+        self.deleted = None
+        self.map_changes = None
+        self.last_id = 0
+
+    def version(self, table):
+        try:
+            return self.connection.execute(f"SELECT changes FROM {table}").fetchone()[0]
+        except sqlite3.OperationalError:
+            return None  # not migrated yet (python db.py --migrate)
+
+    # drops the cached answers that commits since the last call may have changed
+    def refresh(self):
+        data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self.data_version:
+            return
+        self.data_version = data_version
+        try:
+            # read before the rows: a change made in between is handled (again) by the next refresh
+            changes, deleted = self.connection.execute("SELECT changes, deleted FROM schedule_version").fetchone()
+        except sqlite3.OperationalError:
+            changes, deleted = 0, 0  # not migrated yet (python db.py --migrate), only new rows are followed
+        map_changes = self.version("map_version")
+        if map_changes != self.map_changes:
+            self.map_changes = map_changes
+            self.coordinates.check()  # box answers are rebuilt from the new map
+            self.box_responses.clear()
+        if deleted != self.deleted:
+            self.changes, self.deleted = changes, deleted
+            self.responses.clear()
+            self.box_responses.clear()
+            self.last_id = self.connection.execute("SELECT COALESCE(MAX(id), 0) FROM schedule").fetchone()[0]
+            return
+        updated = []
+        if changes != self.changes:
+            updated = self.connection.execute(
+                "SELECT house_id, truck_type FROM schedule INDEXED BY schedule_updated_seq WHERE updated_seq > ?",
+                (self.changes,)).fetchall()
+            self.changes = changes
+        rows = self.connection.execute("SELECT id, house_id, truck_type, day FROM schedule WHERE id > ? ORDER BY id",
+                                       (self.last_id,)).fetchall()
+        if not updated and not rows:
+            return
+        if rows:
+            self.last_id = rows[-1][0]
+        for house_id, truck_type in updated:
+            self.responses.pop(("house", house_id), None)
+            for day in range(len(db.DAYS)):
+                self.responses.pop(("day", day, truck_type), None)
+        for _, house_id, truck_type, day in rows:
+            self.responses.pop(("house", house_id), None)
+            if day is not None:
+                self.responses.pop(("day", day, truck_type), None)
+        self.box_responses.clear()
+
+    def cached(self, responses, key, answer):
+        with self.lock:
+            self.refresh()
+            if key in responses:
+                responses.move_to_end(key)
+                metrics.METRICS.count("schedule_service.cache_hits")
+                return responses[key]
+            metrics.METRICS.count("schedule_service.cache_misses")
+            responses[key] = result = answer()
+            if len(responses) > self.cache_size:
+                responses.popitem(last=False)
+            return result
+
+    # houses the truck type visits that day, and the id of the truck visiting each one
+    # (None: the truck named after the type)
+    def day_truck(self, day, truck_type):
+        day, truck_type = index_of(day, db.DAYS, "day"), index_of(truck_type, db.TRUCK_TYPES, "truck type")
+
+        def answer():
+            rows = self.connection.execute(
+                "SELECT house_id, truck FROM schedule WHERE day = ? AND truck_type = ? ORDER BY id",
+                (day, truck_type)).fetchall()
+            return {"day": db.DAYS[day], "truck_type": db.TRUCK_TYPES[truck_type],
+                    "houses": [row[0] for row in rows], "trucks": [row[1] for row in rows]}
+
+        return self.cached(self.responses, ("day", day, truck_type), answer)
+
+    # pickups of one house (day None: the request couldn't be scheduled that week)
+    def house(self, house_id):
+        house_id = int(house_id)
+
+        def answer():
+            return [{"request_id": request_id, "truck_type": db.TRUCK_TYPES[truck_type],
+                     "day": None if day is None else db.DAYS[day], "truck": truck, "load": load}
+                    for request_id, truck_type, day, truck, load in self.connection.execute(
+                        "SELECT request_id, truck_type, day, truck, load FROM schedule WHERE house_id = ? ORDER BY id",
+                        (house_id,))]
+
+        return self.cached(self.responses, ("house", house_id), answer)
+
+    # scheduled pickups of the houses with x0 <= x <= x1 and y0 <= y <= y1 (of one day, or all week)
+    def box(self, x0, y0, x1, y1, day=None):
+        x0, y0, x1, y1 = int(x0), int(y0), int(x1), int(y1)
+        day = None if day is None else index_of(day, db.DAYS, "day")
+
+        def answer():
+            houses = self.coordinates.houses_in_box(x0, y0, x1, y1)
+            query = ("SELECT house_id, truck_type, day, truck FROM schedule "
+                     "WHERE house_id IN (SELECT value FROM json_each(?)) AND day IS NOT NULL")
+            parameters = [json.dumps(houses.tolist())]
+            if day is not None:
+                query += " AND day = ?"
+                parameters.append(day)
+            pickups = []
+            for house_id, truck_type, pickup_day, truck in self.connection.execute(query + " ORDER BY id", parameters):
+                location = self.coordinates.location(house_id)
+                if location is None:
+                    continue  # removed from the map since the houses were picked
+                pickups.append({"house_id": house_id, "x": location[0], "y": location[1],
+                                "truck_type": db.TRUCK_TYPES[truck_type],
+                                "day": db.DAYS[pickup_day], "truck": truck})
+            return pickups
+
+        return self.cached(self.box_responses, ("box", x0, y0, x1, y1, day), answer)
+
+    # answer of one query: name "day", "house" or "box" and its parameters
+    def query(self, name, parameters):
+        parameters = dict(parameters)
+        parameters.pop("query", None)
+        if name == "day":
+            return self.day_truck(parameters["day"], parameters["truck_type"])
+        if name == "house":
+            return self.house(parameters["house_id"])
+        if name == "box":
+            return self.box(**parameters)
+        raise ValueError(f"Unknown query '{name}', expected day, house or box")
+
+    # answers of a list of queries ({"query": name, ...parameters}), all from one snapshot of the
+    # database; a query that fails gets {"error": ...} instead of failing the batch
+    def batch(self, queries):
+        answers = []
+        with self.lock:
+            self.connection.execute("BEGIN")
+            try:
+                for query in queries:
+                    try:
+                        answers.append(self.query(query.get("query"), query))
+                    except (KeyError, TypeError, ValueError) as error:
+                        answers.append({"error": f"{type(error).__name__}: {error}"})
+            finally:
+                self.connection.execute("COMMIT")
+        return answers
+
+    def stats(self):
+        counters = metrics.METRICS.counters
+        return {"cached_responses": len(self.responses) + len(self.box_responses),
+                "cache_hits": counters.get("schedule_service.cache_hits", 0),
+                "cache_misses": counters.get("schedule_service.cache_misses", 0)}
+
+    def close(self):
+        self.coordinates.close()
+        self.connection.close()
+
+
+class ScheduleHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        name = url.path.strip("/")
+        if name == "stats":
+            self.respond(self.server.queries.stats)
+        else:
+            self.respond(lambda: self.server.queries.query(name, urllib.parse.parse_qsl(url.query)))
+
+    def do_POST(self):
+        if self.path.strip("/") != "batch":
+            self.send_error(404)
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.respond(lambda: self.server.queries.batch(json.loads(body)))
+
+    def respond(self, answer):
+        try:
+            body = json.dumps(answer()).encode()
+        except (KeyError, TypeError, ValueError) as error:
+            self.send_error(400, f"{type(error).__name__}: {error}")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # no line per request
+
+
+def start_http(queries, port=PORT, host="127.0.0.1"):
+    schedule_server = http.server.ThreadingHTTPServer((host, port), ScheduleHandler)
+    schedule_server.queries = queries
+    threading.Thread(target=schedule_server.serve_forever, daemon=True).start()
+    return schedule_server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve schedule queries over HTTP (JSON).")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--db", default=None, help="database path (default: WASTE_DB_PATH or my_database.db)")
+    arguments = parser.parse_args()
+
+    queries = ScheduleQueries(arguments.db)
+    schedule_server = http.server.ThreadingHTTPServer((arguments.host, arguments.port), ScheduleHandler)
+    schedule_server.queries = queries
+    print(f"[Schedule Service] Serving on http://{arguments.host}:{arguments.port}")
+    try:
+        schedule_server.serve_forever()
+    except KeyboardInterrupt:
+        print("[Schedule Service] Stopped")
+        queries.close()
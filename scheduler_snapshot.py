@@ -0,0 +1,141 @@
+import mmap
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+
+
+# Binary snapshot of the truck scheduler's in-memory state (HOUSE_GRID + WEEKLY_SCHEDULE),
+# so a restart can skip the full SELECTs of the map and schedule tables.
+# Layout (little-endian):
+#   header: magic "WCSS" | version H | pad 2x | last schedule row id q | last request id q |
+#           house count I | route count I | created at d | truck ids crc32 I |
+#           schedule_version.changes q | map_version.changes q (-1: no such table)
+#   houses: house ids int64[n] | xs int32[n] | ys int32[n]
+#   routes: (day index, truck index, house count) int32[routes * 3] | route distances int64[routes] |
+#           route loads int64[routes] | house ids int64[sum of house counts]
+# Trucks are stored by index in the fleet's truck ids; a snapshot of another fleet (different
+# crc32 of the ids) isn't loaded.
+# The snapshot is tagged with the id of the last schedule row it contains; on boot only
+# rows written after it have to be replayed. Rows changed in place and houses moved don't show in
+# the row id, so it also keeps the change counters of the schedule and map tables (see
+# db.create_change_tracking / db.create_map_tracking), the caller compares them with the database's. Files are written to a temp file and renamed,
+# so a crash never leaves a half-written snapshot behind.
+
+MAGIC = b"WCSS"
+VERSION = 3
+HEADER = struct.Struct("<4sH2xqqIIdIqq")
+
+
+def _fleet_checksum(truck_ids):
+    return zlib.crc32("\n".join(truck_ids).encode())
+
+
+class Snapshot:
+    """
+    Loaded snapshot. The arrays are read-only views on the memory-mapped file.
+    - routes: {(day, truck): array of house ids}
+    - route_distances: {(day, truck): cached route length}
+    - route_loads: {(day, truck): load of the route's pickups}
+    - schedule_changes / map_changes: the tables' change counters when it was written (None: no table)
+    """
+    def __init__(self, last_row_id, last_request_id, created_at, house_ids, xs, ys, routes, route_distances,
+                 route_loads, schedule_changes=None, map_changes=None):
+        self.last_row_id = last_row_id
+        self.last_request_id = last_request_id
+        self.schedule_changes = schedule_changes
+        self.map_changes = map_changes
+        self.created_at = created_at
+        self.house_ids = house_ids
+        self.xs = xs
+        self.ys = ys
+        self.routes = routes
+        self.route_distances = route_distances
+        self.route_loads = route_loads
+
+    def house_grid(self):
+        return dict(zip(self.house_ids.tolist(), zip(self.xs.tolist(), self.ys.tolist())))
+
+
+# route_distances / route_loads: {(day, truck): length / load} of the routes, so they don't need
+# recomputing on load; truck_ids: the fleet's truck ids (the keys of weekly_schedule's days)
+# schedule_changes / map_changes: schedule_version.changes / map_version.changes the state matches
+def save_snapshot(path, house_grid, weekly_schedule, route_distances, route_loads, days, truck_ids, last_row_id,
+                  last_request_id=0, schedule_changes=None, map_changes=None):
+    house_ids = np.fromiter(house_grid.keys(), dtype=np.int64, count=len(house_grid))
+    coordinates = np.array(list(house_grid.values()), dtype=np.int32).reshape(-1, 2)
+    route_table = []
+    distances = []
+    loads = []
+    route_houses = []
+    for day, trucks in weekly_schedule.items():
+        for truck, houses in trucks.items():
+            route_table.append((days.index(day), truck_ids.index(truck), len(houses)))
+            distances.append(route_distances[(day, truck)])
+            loads.append(route_loads[(day, truck)])
+            route_houses.extend(houses)
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as snapshot_file:
+        snapshot_file.write(HEADER.pack(MAGIC, VERSION, last_row_id, last_request_id,
+                                        len(house_ids), len(route_table), time.time(), _fleet_checksum(truck_ids),
+                                        -1 if schedule_changes is None else schedule_changes,
+                                        -1 if map_changes is None else map_changes))
+        snapshot_file.write(house_ids.tobytes())
+        snapshot_file.write(np.ascontiguousarray(coordinates[:, 0]).tobytes())
+        snapshot_file.write(np.ascontiguousarray(coordinates[:, 1]).tobytes())
+        snapshot_file.write(np.array(route_table, dtype=np.int32).reshape(-1, 3).tobytes())
+        snapshot_file.write(np.array(distances, dtype=np.int64).tobytes())
+        snapshot_file.write(np.array(loads, dtype=np.int64).tobytes())
+        snapshot_file.write(np.array(route_houses, dtype=np.int64).tobytes())
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    os.replace(temp_path, path)
+
+
+# returns a Snapshot, or None when there is no (valid) snapshot at path
+def load_snapshot(path, days, truck_ids):
+    try:
+        with open(path, "rb") as snapshot_file:
+            mapped = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):  # ValueError: empty file
+        return None
+    if len(mapped) < HEADER.size:
+        return None
+    (magic, version, last_row_id, last_request_id, house_count, route_count, created_at, fleet,
+     schedule_changes, map_changes) = HEADER.unpack_from(mapped)
+    if magic != MAGIC or version != VERSION or fleet != _fleet_checksum(truck_ids):
+        return None
+
+    offset = HEADER.size
+    try:
+        house_ids = np.frombuffer(mapped, dtype=np.int64, count=house_count, offset=offset)
+        offset += house_ids.nbytes
+        xs = np.frombuffer(mapped, dtype=np.int32, count=house_count, offset=offset)
+        offset += xs.nbytes
+        ys = np.frombuffer(mapped, dtype=np.int32, count=house_count, offset=offset)
+        offset += ys.nbytes
+        route_table = np.frombuffer(mapped, dtype=np.int32, count=route_count * 3, offset=offset).reshape(-1, 3)
+        offset += route_table.nbytes
+        distances = np.frombuffer(mapped, dtype=np.int64, count=route_count, offset=offset)
+        offset += distances.nbytes
+        loads = np.frombuffer(mapped, dtype=np.int64, count=route_count, offset=offset)
+        offset += loads.nbytes
+        route_houses = np.frombuffer(mapped, dtype=np.int64, count=int(route_table[:, 2].sum()), offset=offset)
+    except ValueError:
+        return None  # truncated file
+
+    routes = {}
+    route_distances = {}
+    route_loads = {}
+    start = 0
+    for (day_index, truck_index, count), distance, load in zip(route_table.tolist(), distances.tolist(), loads.tolist()):
+        key = (days[day_index], truck_ids[truck_index])
+        routes[key] = route_houses[start:start + count]
+        route_distances[key] = distance
+        route_loads[key] = load
+        start += count
+    return Snapshot(last_row_id, last_request_id, created_at, house_ids, xs, ys, routes, route_distances, route_loads,
+                    None if schedule_changes < 0 else schedule_changes, None if map_changes < 0 else map_changes)
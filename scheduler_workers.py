@@ -0,0 +1,345 @@
+import bisect
+import multiprocessing
+import sys
+import time
+import zlib
+
+import pika
+
+import db
+import fleet
+import reliable_delivery
+import transport
+import truck_scheduler
+import wire_protocol
+
+
+# Multi-worker mode for the truck scheduler.
+# The (day, truck type) space is split between N worker processes with a consistent-hash ring:
+# every cell has its own durable queue "Truck-Queue.<truck>.<day>" bound to the topic exchange
+# Truck-Exchange with routing key "schedule.<truck>.<day>", and each worker consumes the
+# queues of the cells it owns. A dispatcher splits the requests on Truck-Queue into one message
+# per truck type and sends them to the cell of their first day. A worker that can't fit the house
+# in its day forwards the message to the next day's key, so a request walks the week like
+# schedule_truck_route does, with each day's probe running on the worker that owns it.
+# Full cells are skipped: a worker announces its cell as full when none of the cell's trucks in
+# service has room left (FULL_MARGIN of its distance limit and a full bin of load), checked after
+# every request it handles (routing key "capacity.<truck>.<day>" on the same exchange, body FULL
+# or OPEN, every process has a Truck-Capacity.<name> queue bound to "capacity.#"). The dispatcher
+# and the workers send requests straight to the next day whose cell isn't full. Once the early days
+# of the week are full a request takes one hop, not one per full day.
+# A hint lasts FULL_FOR seconds, the cell is probed again after that (repairs and re-optimisations
+# free distance, trucks come back into service) and announced full again if it still is; a cell
+# found with room again is announced OPEN at once.
+# A cell covers every truck of its type in the fleet (truck_scheduler.FLEET) on that day.
+# Acks are manual and only sent after the schedule rows are committed to SQLite.
+# Every worker writes its own rows (one per request and truck type) to the shared WAL database.
+#
+# Usage: python scheduler_workers.py <number of workers>
+
+EXCHANGE = 'Truck-Exchange'
+DAYS = list(truck_scheduler.WEEKLY_SCHEDULE)
+TRUCK_TYPES = db.TRUCK_TYPES
+
+# unacked messages a worker can hold, enough to fill a commit batch on every queue it consumes
+PREFETCH_COUNT = 200
+
+# commit (then ack) after this many messages, or after COMMIT_INTERVAL seconds
+COMMIT_BATCH_SIZE = 100
+COMMIT_INTERVAL = 0.05
+
+# points per worker on the hash ring, spreads the 21 cells more evenly
+VIRTUAL_NODES = 64
+
+# a truck has room while its route has FULL_MARGIN of its distance limit left
+# (and a full bin of load, fleet.FULL_BIN_LOAD); a cell without a truck with room is full
+FULL_MARGIN = 0.05
+
+# seconds a full cell is skipped by the routing before it is probed again
+FULL_FOR = 60
+
+# bodies of the capacity announcements (an empty body is FULL)
+FULL = b"full"
+OPEN = b"open"
+
+
+def routing_key(truck, day):
+    return f"schedule.{truck}.{day}"
+
+
+def cell_queue(truck, day):
+    return f"Truck-Queue.{truck}.{day}"
+
+
+def capacity_key(truck, day):
+    return f"capacity.{truck}.{day}"
+
+
+def capacity_queue(name):
+    return f"Truck-Capacity.{name}"
+
+
+# (day, truck) of a capacity hint's routing key
+def full_cell(key):
+    _, truck, day = key.split(".")
+    return day, truck
+
+
+# True when none of the truck type's trucks in service on that day has room left (see FULL_MARGIN)
+def cell_full(day, truck):
+    for truck_id, fleet_truck in truck_scheduler.FLEET.items():
+        if fleet_truck.truck_type != truck or (day, truck_id) in truck_scheduler.UNAVAILABLE:
+            continue
+        route = truck_scheduler.get_route(day, truck_id)
+        if (route.length < truck_scheduler.max_distance_of(truck_id) * (1 - FULL_MARGIN)
+                and route.load + fleet.FULL_BIN_LOAD <= fleet_truck.max_load):
+            return False
+    return True
+
+
+class CapacityHints:
+    """
+    The (day, truck) cells announced as full, `cell in hints` while the routing skips them.
+    A hint expires FULL_FOR seconds after it was given (the cell is probed again), an OPEN
+    announcement removes it at once.
+    """
+    def __init__(self, full_for=FULL_FOR):
+        self.full_for = full_for
+        self.until = {}
+
+    def __contains__(self, cell):
+        until = self.until.get(cell)
+        if until is None:
+            return False
+        if time.monotonic() < until:
+            return True
+        del self.until[cell]
+        return False
+
+    def mark_full(self, cell):
+        self.until[cell] = time.monotonic() + self.full_for
+
+    def mark_open(self, cell):
+        self.until.pop(cell, None)
+
+    # a capacity announcement (routing key and body) from a worker
+    def announced(self, key, body):
+        if body == OPEN:
+            self.mark_open(full_cell(key))
+        else:
+            self.mark_full(full_cell(key))
+
+
+# index of the first day from start whose cell isn't full, going round the week from first_day
+# (both indexes in DAYS); when every cell left is full, the last day of the round, which writes
+# the request's unscheduled row
+def next_open_day(truck, start, first_day, full_cells):
+    week = [(first_day + offset) % len(DAYS) for offset in range(len(DAYS))]
+    left = week[week.index(start):]
+    for day in left:
+        if (DAYS[day], truck) not in full_cells:
+            return day
+    return left[-1]
+
+
+class HashRing:
+    """
+    Consistent-hash ring mapping routing keys to worker numbers.
+    Adding a worker only moves the cells that land on its points.
+    """
+    def __init__(self, workers, virtual_nodes=VIRTUAL_NODES):
+        points = sorted((zlib.crc32(f"worker-{worker}-{node}".encode()), worker)
+                        for worker in range(workers) for node in range(virtual_nodes))
+        self.hashes = [point for point, _ in points]
+        self.workers = [worker for _, worker in points]
+
+    def owner(self, key):
+        position = bisect.bisect(self.hashes, zlib.crc32(key.encode())) % len(self.hashes)
+        return self.workers[position]
+
+
+# (day, truck) cells owned by one worker
+def partition(worker, workers):
+    ring = HashRing(workers)
+    return [(day, truck) for day in DAYS for truck in TRUCK_TYPES if ring.owner(routing_key(truck, day)) == worker]
+
+
+class SchedulerWorker:
+    """
+    Scheduling logic of one worker, independent of the broker.
+    handle() probes the cell named by the routing key and returns the (routing key, body) the
+    message has to be forwarded to, or None once the truck has been stored. Rows are buffered
+    in a db.ScheduleWriter and only committed by commit(), callers ack the messages after that.
+    full_cells holds the cells known to be full (CapacityHints: its own and the ones announced by
+    mark_full()); the (capacity key, FULL / OPEN) announcements of its own cells that filled up or
+    have room again wait in announcements for the caller.
+    """
+    def __init__(self, cells, conn):
+        self.cells = set(cells)
+        # the worker decides when to commit (it acks right after), so no size/time flushes of its own
+        self.writer = db.ScheduleWriter(conn, batch_size=None, interval_ms=None)
+        self.full_cells = CapacityHints()
+        self.announcements = []
+        self.forwarded = 0
+
+    def handle(self, key, body):
+        _, truck, day = key.split(".")
+        if (day, truck) not in self.cells:
+            raise ValueError(f"Worker does not own {day} {truck}")
+        request = wire_protocol.decode_truck_request(body)
+        request_id, house_id = request.request_id, request.house_id
+        truck_scheduler.refresh_map()  # houses imported / moved since the last message
+
+        load = truck_scheduler.request_load(request.loads, truck)
+        truck_id = truck_scheduler.place_on_day(house_id, truck, day, load)
+        self._check_capacity(day, truck)
+        if truck_id is not None:
+            self._save(request_id, house_id, truck, day, truck_id, load)
+            return None
+
+        next_day = (DAYS.index(day) + 1) % len(DAYS)
+        if next_day != request.first_day:  # once round the week
+            self.forwarded += 1
+            return routing_key(truck, DAYS[next_open_day(truck, next_day, request.first_day, self.full_cells)]), body
+        print("Could not find day to schedule truck, reached max cap for weekly schedule...")
+        self._save(request_id, house_id, truck, "N/A", None, load)
+        return None
+
+    # a capacity hint from another worker (body FULL or OPEN)
+    def mark_full(self, key, body=FULL):
+        self.full_cells.announced(key, body)
+
+    # announces the cell full when none of its trucks has room left (again once its hint expired),
+    # open when a cell taken as full has room again
+    def _check_capacity(self, day, truck):
+        full = cell_full(day, truck)
+        if full and (day, truck) not in self.full_cells:
+            self.full_cells.mark_full((day, truck))
+            self.announcements.append((capacity_key(truck, day), FULL))
+        elif not full and (day, truck) in self.full_cells:
+            self.full_cells.mark_open((day, truck))
+            self.announcements.append((capacity_key(truck, day), OPEN))
+
+    def _save(self, request_id, house_id, truck, day, truck_id, load):
+        self.writer.add(request_id, house_id, truck, day, truck_id, load)
+
+    def commit(self):
+        self.writer.flush()
+
+
+# splits a Truck-Queue request into one message per truck type, each sent to the first day from
+# its first_day whose cell isn't in full_cells
+def split_request(body, full_cells=()):
+    request = wire_protocol.decode_truck_request(body)
+    return [(routing_key(truck, DAYS[next_open_day(truck, request.first_day, request.first_day, full_cells)]),
+             wire_protocol.encode_truck_request(request.request_id, request.house_id, [truck], request.trace,
+                                                request.first_day, request.loads))
+            for truck in request.trucks_needed]
+
+
+# name: the process's capacity hint queue (Truck-Capacity.<name>)
+def setup_rabbitmq(name):
+    connection = transport.connect()
+    channel = connection.channel()
+    channel.exchange_declare(exchange=EXCHANGE, exchange_type='topic', durable=True)
+    channel.queue_declare(queue='Truck-Queue', durable=True)
+    for day in DAYS:
+        for truck in TRUCK_TYPES:
+            channel.queue_declare(queue=cell_queue(truck, day), durable=True)
+            channel.queue_bind(queue=cell_queue(truck, day), exchange=EXCHANGE, routing_key=routing_key(truck, day))
+    channel.queue_declare(queue=capacity_queue(name), durable=True)
+    channel.queue_bind(queue=capacity_queue(name), exchange=EXCHANGE, routing_key="capacity.#")
+    return connection, channel
+
+
+# forwards the requests on Truck-Queue to the first day's cell with room of each truck type
+def run_dispatcher():
+    connection, channel = setup_rabbitmq("dispatcher")
+    publish_channel = connection.channel()
+    publish_channel.confirm_delivery()
+    guard = reliable_delivery.DeliveryGuard(publish_channel, "Truck Dispatcher")
+    full_cells = CapacityHints()
+
+    def on_capacity(ch, method, properties, body):
+        full_cells.announced(method.routing_key, body)
+
+    def on_request(ch, method, properties, body):
+        messages = guard.handle(method, properties, body, lambda body: split_request(body, full_cells)) or []
+        for key, message in messages:
+            publish_channel.basic_publish(exchange=EXCHANGE, routing_key=key, body=message,
+                                          properties=pika.BasicProperties(delivery_mode=2))
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+
+    channel.basic_qos(prefetch_count=PREFETCH_COUNT)
+    channel.basic_consume(queue=capacity_queue("dispatcher"), on_message_callback=on_capacity, auto_ack=True)
+    channel.basic_consume(queue='Truck-Queue', on_message_callback=on_request)
+    print("[Truck Dispatcher] Splitting Truck-Queue requests between scheduler workers...")
+    channel.start_consuming()
+
+
+def run_worker(worker, workers):
+    cells = partition(worker, workers)
+    db.migrate_schedule(truck_scheduler.conn)
+    truck_scheduler.get_all_house_coordinates()
+    truck_scheduler.get_current_schedule()
+    state = SchedulerWorker(cells, truck_scheduler.conn)
+
+    connection, channel = setup_rabbitmq(f"worker-{worker}")
+    publish_channel = connection.channel()
+    publish_channel.confirm_delivery()
+    guard = reliable_delivery.DeliveryGuard(publish_channel, f"Truck Scheduler {worker}")
+    pending = {"count": 0, "tag": None}
+
+    # commit the rows, then ack everything handled so far in one go
+    def flush():
+        if pending["tag"] is not None:
+            state.commit()
+            channel.basic_ack(delivery_tag=pending["tag"], multiple=True)
+            pending["count"], pending["tag"] = 0, None
+
+    def on_timer():
+        flush()
+        connection.call_later(COMMIT_INTERVAL, on_timer)
+
+    def on_message(ch, method, properties, body):
+        forward = guard.handle(method, properties, body, lambda body: state.handle(method.routing_key, body))
+        if forward is not None:
+            publish_channel.basic_publish(exchange=EXCHANGE, routing_key=forward[0], body=forward[1],
+                                          properties=pika.BasicProperties(delivery_mode=2))
+        for key, announcement in state.announcements:
+            publish_channel.basic_publish(exchange=EXCHANGE, routing_key=key, body=announcement)
+        state.announcements.clear()
+        pending["count"] += 1
+        pending["tag"] = method.delivery_tag
+        if pending["count"] >= COMMIT_BATCH_SIZE:
+            flush()
+
+    channel.basic_qos(prefetch_count=PREFETCH_COUNT)
+    channel.basic_consume(queue=capacity_queue(f"worker-{worker}"), auto_ack=True,
+                          on_message_callback=lambda ch, method, properties, body: state.mark_full(method.routing_key,
+                                                                                                    body))
+    for day, truck in cells:
+        channel.basic_consume(queue=cell_queue(truck, day), on_message_callback=on_message)
+    connection.call_later(COMMIT_INTERVAL, on_timer)
+    print(f"[Truck Scheduler {worker}] Owns {', '.join(f'{day} {truck}' for day, truck in cells) or 'no cells'}")
+    channel.start_consuming()
+
+
+# starts the dispatcher and the workers as separate processes
+def main(workers):
+    context = multiprocessing.get_context("spawn")  # each process opens its own SQLite / RabbitMQ connections
+    processes = [context.Process(target=run_dispatcher, daemon=True)]
+    processes += [context.Process(target=run_worker, args=(worker, workers), daemon=True) for worker in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        while all(process.is_alive() for process in processes):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("[Truck Scheduler] Stopping workers...")
+    for process in processes:
+        process.terminate()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else multiprocessing.cpu_count())
@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+
+
+# Points db.py and truck_scheduler.py at a scratch database and snapshot for the unit tests.
+# Imported before db by the tests that need it (db opens the database at import time):
+#   import scratch_db
+#   import db
+# USABLE is False when db was already imported with another database, the tests are then skipped.
+
+DIRECTORY = tempfile.mkdtemp(prefix="waste-tests-")
+DB_PATH = os.path.join(DIRECTORY, "tests.db")
+if "db" not in sys.modules:
+    os.environ["WASTE_DB_PATH"] = DB_PATH
+    os.environ["WASTE_SNAPSHOT_PATH"] = os.path.join(DIRECTORY, "tests.snap")
+    os.environ.pop("WASTE_FLEET", None)
+
+import db
+
+USABLE = db.DB_PATH == DB_PATH
+SKIP_REASON = "db was imported with another database before this test"
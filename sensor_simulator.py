@@ -0,0 +1,190 @@
+import argparse
+import asyncio
+import concurrent.futures
+import heapq
+import random
+import time
+
+import client
+import server
+
+
+# Load generator for the pipeline: simulates thousands of house sensors from one process.
+# - all reports go through client.publish_house_info_to_queue on one shared connection/channel
+# - house coordinates are loaded once (client.get_all_house_coordinates) and kept in memory
+# - reports are timed by asyncio: every house reports every report_interval seconds (with jitter),
+#   so the total rate is houses / report_interval messages/s
+# - the publishes (blocking pika calls) and the connection's heartbeats run on one publisher thread,
+#   a batch of due reports at a time, so a slow broker write never holds up the timing loop
+# - in "rising" mode fill levels grow over simulated time at a per-house rate and drop back after
+#   a pickup, in "random" mode every report is a fresh client.generate_waste_percentages() draw
+#
+# Usage: python sensor_simulator.py --houses 5000 --interval 10 --speed 3600 --duration 60
+
+# average fill rate (% per simulated hour) of the Garbage, Recycling and Organic bins
+FILL_RATES = [1.0, 0.6, 1.3]
+
+# once a bin reports above server.THRESHOLD, a truck empties it this many simulated hours later
+PICKUP_DELAY_HOURS = (12, 72)
+
+# fill level left in a bin right after a pickup
+RESIDUAL_LEVEL = 5
+
+# seconds between progress lines
+STATS_INTERVAL = 5
+
+
+class FillModel:
+    """
+    Fill levels of one house's three bins. Each bin fills at its own rate (house-to-house variation
+    around FILL_RATES) and is emptied some time after it first reports above the threshold.
+    Levels are only updated when read, so simulating a house costs nothing between reports.
+    """
+    def __init__(self, rng, sim_time):
+        self.rng = rng
+        self.rates = [rate * rng.lognormvariate(0, 0.35) for rate in FILL_RATES]
+        self.levels = [rng.uniform(0, 60) for _ in FILL_RATES]
+        self.pickups = [None for _ in FILL_RATES]  # simulated time of the next pickup of each bin
+        self.updated = sim_time
+
+    def read(self, sim_time):
+        for i, rate in enumerate(self.rates):
+            pickup = self.pickups[i]
+            if pickup is not None and pickup <= sim_time:
+                self.levels[i] = RESIDUAL_LEVEL + rate * (sim_time - pickup) / 3600
+                self.pickups[i] = None
+            else:
+                self.levels[i] += rate * (sim_time - self.updated) / 3600
+            self.levels[i] = min(self.levels[i], 100)
+            if self.levels[i] > server.THRESHOLD and self.pickups[i] is None:
+                self.pickups[i] = sim_time + self.rng.uniform(*PICKUP_DELAY_HOURS) * 3600
+        self.updated = sim_time
+        return [int(level) for level in self.levels]
+
+
+class SensorSimulator:
+    """
+    Sends garbage reports for many houses on one channel.
+    - locations: {house_id: {"x": .., "y": ..}} coordinate cache
+    - report_interval: mean real seconds between two reports of the same house
+    - speed: simulated seconds per real second (fill levels rise with simulated time)
+    - mode: "rising" (FillModel) or "random" (client.generate_waste_percentages)
+    """
+    def __init__(self, channel, locations, report_interval=10.0, speed=3600.0, mode="rising", seed=None):
+        self.channel = channel
+        self.locations = locations
+        self.report_interval = report_interval
+        self.speed = speed
+        self.mode = mode
+        self.rng = random.Random(seed)
+        self.sim_start = time.time()
+        self.real_start = time.monotonic()
+        self.models = {house_id: FillModel(self.rng, self.sim_start) for house_id in locations}
+        self.sent = 0
+        # the only thread using the channel (pika channels aren't thread-safe)
+        self.publisher = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="sensor-publisher")
+
+    def sim_time(self):
+        return self.sim_start + (time.monotonic() - self.real_start) * self.speed
+
+    def report(self, house_id):
+        if self.mode == "random":
+            garbage_info = client.generate_waste_percentages()
+        else:
+            garbage_info = self.models[house_id].read(self.sim_time())
+        client.publish_house_info_to_queue(house_id, channel=self.channel, garbage_info=garbage_info,
+                                           location=self.locations[house_id])
+        self.sent += 1
+
+    def report_all(self, house_ids):
+        for house_id in house_ids:
+            self.report(house_id)
+
+    # runs a channel / connection call on the publisher thread
+    async def on_publisher(self, call, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.publisher, call, *args)
+
+    async def run(self, duration=None, max_messages=None):
+        """
+        Reports until duration seconds have passed or max_messages were sent (forever if both are None).
+        """
+        start = time.monotonic()
+        # first reports spread over one interval so houses don't all report at once
+        due = [(start + self.rng.uniform(0, self.report_interval), house_id) for house_id in self.locations]
+        heapq.heapify(due)
+        scheduled = 0
+        in_flight = None  # the batch being published; the next one waits for it (backpressure)
+        while due:
+            next_time, house_id = due[0]
+            now = time.monotonic()
+            if duration is not None and next_time - start >= duration:
+                break
+            if next_time > now:
+                await asyncio.sleep(next_time - now)
+                continue
+            # everything that is due goes out in one batch on the publisher thread
+            batch = []
+            while due and due[0][0] <= now and (max_messages is None or scheduled < max_messages):
+                _, house_id = heapq.heappop(due)
+                batch.append(house_id)
+                scheduled += 1
+                heapq.heappush(due, (now + self.report_interval * self.rng.uniform(0.5, 1.5), house_id))
+            if in_flight is not None:
+                await in_flight
+            in_flight = asyncio.ensure_future(self.on_publisher(self.report_all, batch))
+            if max_messages is not None and scheduled >= max_messages:
+                break
+        if in_flight is not None:
+            await in_flight
+
+
+# keeps the shared pika connection serviced (heartbeats) from the publisher thread while the simulator runs
+async def service_connection(simulator, connection, interval=1.0):
+    while connection.is_open:
+        await simulator.on_publisher(connection.process_data_events, 0)
+        await asyncio.sleep(interval)
+
+
+async def print_stats(simulator):
+    last_sent, last_time = 0, time.monotonic()
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        now = time.monotonic()
+        print(f"[Simulator] sent {simulator.sent} reports ({(simulator.sent - last_sent) / (now - last_time):.0f} msg/s)")
+        last_sent, last_time = simulator.sent, now
+
+
+async def main(arguments):
+    locations = client.get_all_house_coordinates()
+    locations.pop(0, None)  # house 0 is the trucks' base
+    # more houses than in the map: the extra ones report an unknown location
+    for house_id in range(1, arguments.houses + 1):
+        locations.setdefault(house_id, {"x": -1, "y": -1})
+    locations = {house_id: locations[house_id] for house_id in range(1, arguments.houses + 1)}
+
+    connection, channel = client.setup_rabbitmq()
+    simulator = SensorSimulator(channel, locations, arguments.interval, arguments.speed, arguments.mode, arguments.seed)
+    tasks = [asyncio.create_task(service_connection(simulator, connection)), asyncio.create_task(print_stats(simulator))]
+    print(f"[Simulator] {len(locations)} houses, ~{len(locations) / arguments.interval:.0f} reports/s")
+    try:
+        await simulator.run(duration=arguments.duration)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await simulator.on_publisher(connection.close)
+        simulator.publisher.shutdown()
+    print(f"[Simulator] Done, sent {simulator.sent} reports")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate many house sensors sending garbage reports.")
+    parser.add_argument("--houses", type=int, default=1000, help="number of houses (ids 1..N)")
+    parser.add_argument("--interval", type=float, default=10.0, help="mean seconds between reports of one house")
+    parser.add_argument("--speed", type=float, default=3600.0, help="simulated seconds per real second")
+    parser.add_argument("--mode", choices=["rising", "random"], default="rising")
+    parser.add_argument("--duration", type=float, default=None, help="seconds to run (default: forever)")
+    parser.add_argument("--seed", type=int, default=None)
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        print("[Simulator] Stopped")
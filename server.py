@@ -1,9 +1,54 @@
+import collections
+import concurrent.futures
+import itertools
+import time
 import pika
-import json
+import coordinate_cache
+import fill_forecast
+import metrics
+import reliable_delivery
+import report_aggregator
+import transport
+import wire_protocol
 
 # Threshold for requesting a truck
 THRESHOLD = 80
 
+# Number of truck requests buffered before the publisher flushes them to the Truck-Queue
+PUBLISH_BATCH_SIZE = 100
+
+# Max time (in seconds) a truck request can wait in the buffer before being flushed
+PUBLISH_FLUSH_INTERVAL = 0.05
+
+# Long-lived publisher used by the listener (None when functions are called standalone)
+PUBLISHER = None
+
+# Aggregation / deduplication of reports used by the listener (see report_aggregator.py)
+AGGREGATOR = None
+
+# Retries / dead-letters the reports the listener fails on (see reliable_delivery.py)
+DELIVERY_GUARD = None
+
+# Houses on the map used by the listener to reject reports of unknown houses (see coordinate_cache.py)
+COORDINATES = None
+
+# Reading history used to forecast fill levels and pre-schedule pickups (see fill_forecast.py)
+HISTORY = None
+
+# Seconds between two forecasts of the whole city
+FORECAST_INTERVAL = 600
+
+# The listener's refits run on this thread (~270 ms at 100k houses, too long for the connection's
+# thread: deliveries and heartbeats would wait), on a copy of HISTORY
+FORECASTER = None
+
+# Seconds between two checks of a refit in progress, its bookings are made on the connection's thread
+FORECAST_POLL_INTERVAL = 0.1
+
+# Truck request ids: microseconds since the epoch at start-up, then +1 per request,
+# so ids stay unique across restarts
+REQUEST_IDS = itertools.count(time.time_ns() // 1000)
+
 # Function to set up the RabbitMQ connection and declare necessary queues
 def setup_rabbitmq():
     """
@@ -11,7 +56,7 @@ def setup_rabbitmq():
     - 'Garbage-Info-Queue': Receives garbage data from clients.
     - 'Truck-Queue': Sends truck requests to the truck scheduler.
     """
-    connection = pika.BlockingConnection(pika.ConnectionParameters(host='localhost'))
+    connection = transport.connect()
     channel = connection.channel()
     channel.queue_declare(queue='Garbage-Info-Queue', durable=True)  # Ensures messages persist if RabbitMQ restarts
     channel.queue_declare(queue='Truck-Queue', durable=True)
@@ -22,14 +67,59 @@ def setup_rabbitmq():
 def rabbitmq_callback(ch, method, properties, body):
     """
     Callback function triggered when a message is received from the Garbage-Info-Queue.
-    Parses the received message, checks waste levels, and sends a truck request if needed.
+    Decodes the received report and hands it to process_garbage_report().
+    With the listener's DELIVERY_GUARD, reports that fail are retried and malformed ones go to the
+    Dead-Letter-Queue; without it malformed reports are logged and dropped. Nothing raises inside the consumer.
+    """
+    metrics.METRICS.count("server.reports_received")
+    if DELIVERY_GUARD is not None:
+        DELIVERY_GUARD.handle(method, properties, body, handle_garbage_report)
+    else:
+        try:
+            handle_garbage_report(body)
+        except wire_protocol.MessageFormatError as error:
+            print(f"[Server] Dropped malformed garbage report: {error}")
+            metrics.METRICS.count("server.reports_dropped")
+
+    # The garbage report is only acked once its truck request has been committed to the broker
+    # (with the aggregator: once the window it was aggregated into has been published)
+    if AGGREGATOR is not None:
+        AGGREGATOR.pending_ack = (ch, method.delivery_tag)
+        if AGGREGATOR.is_full():
+            close_aggregation_window()
+    elif PUBLISHER is not None:
+        PUBLISHER.ack_after_flush(ch, method.delivery_tag)
+
+
+# Decodes one garbage report and processes it
+def handle_garbage_report(body):
+    report = wire_protocol.decode_garbage_report(body)
+    metrics.stamp(report.trace)
+    metrics.METRICS.observe_trace("client_publish->server_receive", report.trace, metrics.CLIENT_PUBLISH)
+    # a house that isn't on the map can't be scheduled, however often the report is retried
+    if COORDINATES is not None and report.house_id not in COORDINATES:
+        raise wire_protocol.MessageFormatError(f"House {report.house_id} is not on the map")
+    process_garbage_report(report.house_id, report.garbage_info, report.trace)
+
+
+# Checks waste levels of one house and sends a truck request if needed
+def process_garbage_report(house_id, garbage_data, trace=None):
     """
-    message = json.loads(body.decode())
-    house_id = message['house_id']  # ID of the house reporting waste data
-    garbage_data = message['garbage_info']  # List containing waste percentages for each type
+    - house_id: ID of the house reporting waste data
+    - garbage_data: list containing waste percentages for each type
+    - trace: the report's trace (see metrics.py), passed on to the truck request
+    With the listener's AGGREGATOR the report only updates the aggregation window; its truck
+    request (if any) goes out when the window is closed.
+    """
+    if AGGREGATOR is not None:
+        if not AGGREGATOR.add(house_id, garbage_data, trace) and max(garbage_data) > THRESHOLD:
+            metrics.METRICS.count("server.duplicates_suppressed")
+        if HISTORY is not None:
+            HISTORY.record(house_id, garbage_data, AGGREGATOR.table.reported(house_id))
+        return
 
     trucks_needed = []
-    waste_types = ['Garbage', 'Recycling', 'Organic']  # Three types of waste collected
+    waste_types = wire_protocol.WASTE_TYPES  # Three types of waste collected
 
     # Check if waste levels exceed the threshold, and determine required trucks
     for i, waste in enumerate(garbage_data):
@@ -39,39 +129,246 @@ def rabbitmq_callback(ch, method, properties, body):
     # If trucks are needed, send a truck request to the Truck Queue
     if trucks_needed:
         print(f"[Server] Processed house {house_id}: Needed trucks {trucks_needed}")
-        publish_truck_info_to_queue(house_id, trucks_needed)
+        publish_truck_info_to_queue(house_id, trucks_needed, trace, loads=garbage_data)
 
     #print(f"[Server] Processed house {house_id}: Needed trucks {trucks_needed}")
 
 
+class TruckRequestPublisher:
+    """
+    Long-lived publisher for the Truck-Queue.
+    - Opens a second channel on the consumer's connection instead of a new connection per message.
+    - Buffers truck requests and flushes them when batch_size is reached or flush_interval has passed.
+    - Publishes each batch as one AMQP transaction of persistent messages: the whole batch costs a
+      single tx_commit round trip (a confirm channel waits for every message), and the consumed
+      garbage reports are only acked once every truck request buffered before them is committed.
+    """
+    def __init__(self, connection, batch_size=PUBLISH_BATCH_SIZE, flush_interval=PUBLISH_FLUSH_INTERVAL):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.channel = None
+        self._open_channel()
+        self.pending = collections.deque()
+        self.pending_ack = None  # (consumer channel, highest delivery tag) waiting on the next flush
+        self.published = 0
+        self.timer = None
+        self._schedule_flush()
+
+    def publish(self, message):
+        self.pending.append(message)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def ack_after_flush(self, consumer_channel, delivery_tag):
+        self.pending_ack = (consumer_channel, delivery_tag)
+        if not self.pending:
+            self._ack_consumed()
+
+    def _open_channel(self):
+        self.channel = self.connection.channel()
+        self.channel.queue_declare(queue='Truck-Queue', durable=True)
+        self.channel.tx_select()
+
+    def flush(self):
+        # Messages stay in the buffer until committed, so a failed commit / connection error is retried on the next flush
+        if self.pending:
+            batch = len(self.pending)
+            try:
+                for body in self.pending:
+                    self.channel.basic_publish(exchange='', routing_key='Truck-Queue', body=body,
+                                               properties=pika.BasicProperties(delivery_mode=2))
+                self.channel.tx_commit()
+            except Exception:
+                self._discard_transaction()
+                raise
+            self.pending.clear()
+            self.published += batch
+            metrics.METRICS.count("server.truck_requests_confirmed", batch)
+        self._ack_consumed()
+
+    # Drops what a failed flush published in the open transaction, so the next flush doesn't commit it twice:
+    # rolls back on the same channel, or opens a new transactional channel if that one is gone
+    def _discard_transaction(self):
+        if self.channel.is_open:
+            try:
+                self.channel.tx_rollback()
+                return
+            except Exception as error:
+                print(f"[Server] Rollback of the Truck-Queue batch failed, reopening the channel: {error}")
+                try:
+                    self.channel.close()
+                except Exception:
+                    pass
+        if self.connection.is_open:
+            self._open_channel()
+
+    def _ack_consumed(self):
+        if self.pending_ack is not None:
+            consumer_channel, delivery_tag = self.pending_ack
+            consumer_channel.basic_ack(delivery_tag=delivery_tag, multiple=True)
+            self.pending_ack = None
+
+    def _on_timer(self):
+        self.timer = None
+        self.flush()
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self.timer is None and self.connection.is_open:
+            self.timer = self.connection.call_later(self.flush_interval, self._on_timer)
+
+    def close(self):
+        if self.timer is not None:
+            self.connection.remove_timeout(self.timer)
+            self.timer = None
+        self.flush()
+
+
+# Publishes the truck requests of the current aggregation window in one batch,
+# then acks every report received up to now
+# The loads sent are the latest reported levels, at least THRESHOLD (forecast pickups are
+# booked for when the bin is expected to be that full)
+def close_aggregation_window():
+    requests = AGGREGATOR.close_window()
+    for house_id, trucks_needed, trace, first_day in requests:
+        loads = [max(level, THRESHOLD) for level in AGGREGATOR.table.latest(house_id)]
+        publish_truck_info_to_queue(house_id, trucks_needed, trace, first_day, loads)
+    if requests:
+        print(f"[Server] Published {len(requests)} truck requests "
+              f"({AGGREGATOR.reports} reports, {AGGREGATOR.duplicates} duplicates suppressed so far)")
+    if AGGREGATOR.pending_ack is not None:
+        PUBLISHER.ack_after_flush(*AGGREGATOR.pending_ack)
+        AGGREGATOR.pending_ack = None
+    PUBLISHER.flush()
+
+
+# Closes the aggregation window every AGGREGATOR.window seconds from the connection's timer
+def close_aggregation_window_periodically(connection):
+    close_aggregation_window()
+    connection.call_later(AGGREGATOR.window, lambda: close_aggregation_window_periodically(connection))
+
+
+# Refits the fill forecast of every house, returns (forecast, seconds it took)
+def refit_forecast(history):
+    start = time.perf_counter()
+    return fill_forecast.forecast(history, THRESHOLD), time.perf_counter() - start
+
+
+# Books the bins of a forecast expected to be full soon; they go out with the next aggregation window
+def book_forecast(forecast, seconds):
+    booked = 0
+    for house_id, flags, first_day, _ in forecast:
+        if AGGREGATOR.add_forecast(house_id, flags, first_day):
+            booked += 1
+    metrics.METRICS.observe("server.forecast", seconds)
+    metrics.METRICS.count("server.forecast_requests", booked)
+    if booked:
+        print(f"[Server] Forecast: pre-scheduled pickups for {booked} houses")
+
+
+# Refits and books in one go, on the caller's thread
+def forecast_pickups():
+    book_forecast(*refit_forecast(HISTORY))
+
+
+# Every FORECAST_INTERVAL seconds from the connection's timer: refits a copy of HISTORY on FORECASTER
+# and books the result from the timer once it is done
+def forecast_pickups_periodically(connection):
+    refit = FORECASTER.submit(refit_forecast, HISTORY.copy())
+
+    def book_when_done():
+        if AGGREGATOR is None:
+            return  # the listener was stopped
+        if not refit.done():
+            connection.call_later(FORECAST_POLL_INTERVAL, book_when_done)
+            return
+        book_forecast(*refit.result())
+        connection.call_later(FORECAST_INTERVAL, lambda: forecast_pickups_periodically(connection))
+
+    connection.call_later(FORECAST_POLL_INTERVAL, book_when_done)
+
+
 # Function to publish truck request messages to the Truck Queue
-def publish_truck_info_to_queue(house_id, trucks_needed):
+def publish_truck_info_to_queue(house_id, trucks_needed, trace=None, first_day=0, loads=None):
     """
     Publishes truck request messages to the Truck Queue when waste exceeds the threshold.
+    Goes through the listener's long-lived PUBLISHER; when called standalone (no listener running)
+    it falls back to a one-off connection.
+    first_day: first day of the week the pickup may be scheduled on (0 = Sunday ... 6 = Saturday).
+    loads: fill % of each bin, the load the pickup adds to the truck (None if unknown).
     """
+    request_id = next(REQUEST_IDS)
+    metrics.stamp(trace)
+    metrics.METRICS.observe_trace("server_receive->truck_publish", trace, metrics.SERVER_RECEIVE)
+    metrics.METRICS.count("server.truck_requests")
+    message = wire_protocol.encode_truck_request(request_id, house_id, trucks_needed, trace, first_day, loads)
+    if PUBLISHER is not None:
+        PUBLISHER.publish(message)
+        return
+
     connection, channel = setup_rabbitmq()
-    request_id = house_id  # Using house_id as a temporary request ID for simplicity
-    message = f"Request ID: {request_id}, House ID: {house_id}, Truck Needed: {', '.join(trucks_needed)}"
     channel.basic_publish(exchange='', routing_key='Truck-Queue', body=message)
     print(f"[Server] Published truck request for House {house_id}: {trucks_needed}\n")
     connection.close()
 
 
+# Function to set up the listener on the Garbage Info Queue
+def start_rabbitmq_listener():
+    """
+    Sets up the listener's publisher, aggregator, delivery guard and map cache and registers rabbitmq_callback()
+    on the Garbage Info Queue. Returns (connection, channel); reports are handled while the caller
+    runs the connection (channel.start_consuming() or connection.process_data_events()).
+    """
+
+    global PUBLISHER, AGGREGATOR, HISTORY, DELIVERY_GUARD, COORDINATES, FORECASTER
+
+    connection, channel = setup_rabbitmq()
+    metrics.start_from_env("Server")
+    COORDINATES = coordinate_cache.CoordinateCache()
+    PUBLISHER = TruckRequestPublisher(connection)
+    # retries / dead letters are rare, they get a confirm channel of their own (PUBLISHER's is transactional)
+    guard_channel = connection.channel()
+    guard_channel.confirm_delivery()
+    DELIVERY_GUARD = reliable_delivery.DeliveryGuard(guard_channel, "Server")
+    AGGREGATOR = report_aggregator.ReportAggregator(THRESHOLD)
+    HISTORY = fill_forecast.ReadingHistory()
+    FORECASTER = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="forecast")
+    # Reports are acked per window, so a full window has to fit in the unacked reports in flight
+    channel.basic_qos(prefetch_count=AGGREGATOR.max_reports * 2)
+    channel.basic_consume(queue='Garbage-Info-Queue', on_message_callback=rabbitmq_callback)
+    close_aggregation_window_periodically(connection)
+    connection.call_later(FORECAST_INTERVAL, lambda: forecast_pickups_periodically(connection))
+    return connection, channel
+
+
+# Publishes the open aggregation window and the buffered truck requests, then closes the connection
+def stop_rabbitmq_listener(connection):
+    global PUBLISHER, AGGREGATOR, HISTORY, DELIVERY_GUARD, COORDINATES, FORECASTER
+    close_aggregation_window()
+    AGGREGATOR = HISTORY = DELIVERY_GUARD = None
+    FORECASTER.shutdown(wait=False)
+    FORECASTER = None
+    COORDINATES.close()
+    COORDINATES = None
+    PUBLISHER.close()
+    PUBLISHER = None
+    connection.close()
+
+
 # Function to start listening for messages from the Garbage Info Queue
 def run_rabbitmq_listener():
     """
     Listens for incoming messages from the Garbage Info Queue.
     When a message is received, it is processed by rabbitmq_callback().
     """
-
-    connection, channel = setup_rabbitmq()
-    channel.basic_consume(queue='Garbage-Info-Queue', on_message_callback=rabbitmq_callback, auto_ack=True)
+    connection, channel = start_rabbitmq_listener()
     print("[Server] Listening for waste data from clients...")
     try:
         channel.start_consuming()  # Continuously listens for new messages
     except KeyboardInterrupt:
         print("[Server] Stopping RabbitMQ listener...")
-        connection.close()
+        stop_rabbitmq_listener(connection)
 
 
 # Main entry point for running the server
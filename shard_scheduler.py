@@ -0,0 +1,204 @@
+import os
+import subprocess
+import sys
+
+import sharding
+
+# a shard process works on its tile's database and snapshot: point db / truck_scheduler at them
+# before they are imported (they open the database at import time)
+if __name__ == "__main__" and "--shard" in sys.argv:
+    _tile = tuple(int(value) for value in sys.argv[sys.argv.index("--shard") + 1:][:2])
+    os.environ["WASTE_DB_PATH"] = sharding.shard_path(_tile)
+    os.environ["WASTE_SNAPSHOT_PATH"] = sharding.shard_path(_tile) + ".snap"
+
+import pika
+
+import coordinate_cache
+import db
+import metrics
+import reliable_delivery
+import transport
+import truck_scheduler
+import wire_protocol
+
+
+# Processes of the sharded scheduler (see sharding.py):
+# - one scheduler per tile, running truck_scheduler on the tile's database and consuming its tile queue
+# - the coordinator, splitting Truck-Queue between the tiles and handing off what a shard couldn't fit
+# Usage:
+#   python shard_scheduler.py --split [tile size]  -> cuts the map table into shard files (shards/)
+#   python shard_scheduler.py                      -> coordinator + one scheduler process per shard
+#   python shard_scheduler.py --coordinator        -> only the coordinator
+#   python shard_scheduler.py --shard <x> <y>      -> only the scheduler of tile (x, y), e.g. on another node
+
+
+class ShardScheduler:
+    """
+    Scheduling side of one shard, broker-independent. handle() schedules the pickups of a shard
+    request that fit in this shard's week (rows go through truck_scheduler's writer) and returns
+    the shard request to hand off for the ones that didn't, or None.
+    A shard that isn't the last one to try hands off without re-optimising its week first.
+    A retried request (see reliable_delivery.py) skips the truck types already in the schedule table.
+    The tile's map is reloaded first when it changed (truck_scheduler.refresh_map).
+    """
+    def __init__(self, tile):
+        self.tile = tile
+        self.handled = 0
+        self.handed_off = 0
+        self.foreign_houses = 0
+
+    def handle(self, body, retried=False):
+        shard_request = wire_protocol.decode_shard_request(body)
+        request = shard_request.request
+        house_id = request.house_id
+        done = set()
+        if retried:
+            truck_scheduler.SCHEDULE_WRITER.flush()
+            done = db.scheduled_truck_types(truck_scheduler.conn, request.request_id)
+        received_at = metrics.stamp(request.trace)
+        metrics.METRICS.observe_trace("truck_publish->scheduler_receive", request.trace, metrics.TRUCK_PUBLISH)
+        metrics.METRICS.count("scheduler.requests")
+        truck_scheduler.refresh_map()
+        if house_id not in truck_scheduler.HOUSE_GRID:
+            self.add_house(house_id, shard_request.x, shard_request.y)
+
+        trucks, days, truck_ids, loads, left_over = [], [], [], [], []
+        for truck in request.trucks_needed:
+            if db.TRUCK_TYPES.index(truck) in done:
+                continue
+            load = truck_scheduler.request_load(request.loads, truck)
+            day, truck_id = truck_scheduler.schedule_pickup(house_id, truck, optimise=shard_request.last,
+                                                            first_day=request.first_day, load=load)
+            if day == 0 and not shard_request.last:
+                left_over.append(truck)
+                continue
+            if day == 0:
+                truck_scheduler.PENDING.push(request.request_id, truck, house_id, load)  # placed by a later repair pass
+            trucks.append(truck)
+            days.append(day or "N/A")
+            truck_ids.append(truck_id)
+            loads.append(load)
+        metrics.METRICS.observe_us("scheduler_receive->scheduled", (metrics.stamp(request.trace) - received_at) / 1000)
+        self.handled += 1
+
+        if trucks:
+            if request.trace is not None and not left_over:
+                truck_scheduler.TRACES_AWAITING_COMMIT.append(request.trace)
+            truck_scheduler.publish_truck_info_to_queue(request.request_id, house_id, trucks, days, truck_ids, loads)
+        if not left_over:
+            return None
+        self.handed_off += 1
+        handoff = wire_protocol.encode_truck_request(request.request_id, house_id, left_over, request.trace,
+                                                     request.first_day, request.loads)
+        return wire_protocol.encode_shard_request(handoff, shard_request.x, shard_request.y, shard_request.hop)
+
+    # a house from another tile (or imported since the split), handed off to this shard: kept in this shard's map too
+    def add_house(self, house_id, x, y):
+        truck_scheduler.add_house(house_id, x, y)
+        self.foreign_houses += 1
+
+
+def setup_rabbitmq(tiles):
+    connection = transport.connect()
+    channel = connection.channel()
+    channel.exchange_declare(exchange=sharding.EXCHANGE, exchange_type='topic', durable=True)
+    channel.queue_declare(queue='Truck-Queue', durable=True)
+    channel.queue_declare(queue=sharding.HANDOFF_QUEUE, durable=True)
+    for tile in tiles:
+        channel.queue_declare(queue=sharding.tile_queue(tile), durable=True)
+        channel.queue_bind(queue=sharding.tile_queue(tile), exchange=sharding.EXCHANGE,
+                           routing_key=sharding.routing_key(tile))
+    return connection, channel
+
+
+def run_shard(tile):
+    db.migrate_schedule(truck_scheduler.conn)
+    start_mode = truck_scheduler.load_state()
+    scheduler = ShardScheduler(tile)
+    connection, channel = setup_rabbitmq([tile])
+    metrics.start_from_env(f"Shard {tile[0]},{tile[1]}")
+    publish_channel = connection.channel()
+    publish_channel.confirm_delivery()
+    guard = reliable_delivery.DeliveryGuard(publish_channel, f"Shard {tile[0]},{tile[1]}")
+
+    # acked once the request's rows are committed (and its handoff confirmed)
+    def on_message(ch, method, properties, body):
+        retried = reliable_delivery.attempts_of(properties) > 0
+        handoff = guard.handle(method, properties, body, lambda body: scheduler.handle(body, retried))
+        if handoff is not None:
+            publish_channel.basic_publish(exchange='', routing_key=sharding.HANDOFF_QUEUE, body=handoff,
+                                          properties=pika.BasicProperties(delivery_mode=2))
+        truck_scheduler.REQUESTS_SINCE_SNAPSHOT += 1
+        truck_scheduler.maybe_save_state()
+        truck_scheduler.ack_when_committed(ch, method.delivery_tag)
+
+    channel.basic_qos(prefetch_count=truck_scheduler.PREFETCH_COUNT)
+    channel.basic_consume(queue=sharding.tile_queue(tile), on_message_callback=on_message)
+    truck_scheduler.flush_schedule_writer_periodically(connection)
+    print(f"[Shard {tile[0]},{tile[1]}] {start_mode} start, {len(truck_scheduler.HOUSE_GRID)} houses, "
+          f"listening on {sharding.tile_queue(tile)}")
+    channel.start_consuming()
+
+
+def run_coordinator():
+    tiles = list(sharding.shard_paths())
+    if not tiles:
+        print("[Shard Coordinator] No shards, run python shard_scheduler.py --split first")
+        return
+    view = sharding.FederatedView()
+    # houses imported into the main map after the split (map_import.py) are found in it
+    coordinates = coordinate_cache.CoordinateCache() if os.path.exists(db.DB_PATH) else None
+    coordinator = sharding.HandoffCoordinator(tiles, view.tile_size, view.houses(), coordinates=coordinates)
+    connection, channel = setup_rabbitmq(tiles)
+    publish_channel = connection.channel()
+    publish_channel.confirm_delivery()
+    guard = reliable_delivery.DeliveryGuard(publish_channel, "Shard Coordinator")
+
+    # requests (and handoffs) are acked once forwarded to their shard and confirmed,
+    # the ones that can't be routed go to the Dead-Letter-Queue
+    def forward(route, ch, method):
+        if route is not None:
+            publish_channel.basic_publish(exchange=sharding.EXCHANGE, routing_key=route[0], body=route[1],
+                                          properties=pika.BasicProperties(delivery_mode=2))
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+
+    def on_request(ch, method, properties, body):
+        forward(guard.handle(method, properties, body, coordinator.dispatch), ch, method)
+
+    def on_handoff(ch, method, properties, body):
+        forward(guard.handle(method, properties, body, coordinator.handoff), ch, method)
+
+    channel.basic_consume(queue='Truck-Queue', on_message_callback=on_request)
+    channel.basic_consume(queue=sharding.HANDOFF_QUEUE, on_message_callback=on_handoff)
+    print(f"[Shard Coordinator] Routing Truck-Queue to {len(tiles)} shards (tile size {view.tile_size})")
+    channel.start_consuming()
+
+
+# starts one scheduler process per shard, then runs the coordinator in this process
+def main():
+    processes = [subprocess.Popen([sys.executable, __file__, "--shard", str(tile[0]), str(tile[1])])
+                 for tile in sharding.shard_paths()]
+    try:
+        run_coordinator()
+    except KeyboardInterrupt:
+        print("[Shard Coordinator] Stopping shards...")
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == "__main__":
+    if "--split" in sys.argv:
+        arguments = sys.argv[sys.argv.index("--split") + 1:]
+        tile_size = int(arguments[0]) if arguments else sharding.TILE_SIZE
+        split = sharding.split_map(db.conn, tile_size=tile_size)
+        print(f"Split {sum(split.values())} houses into {len(split)} shards in {sharding.SHARD_DIR}/ "
+              f"(tile size {tile_size})")
+    elif "--coordinator" in sys.argv:
+        run_coordinator()
+    elif "--shard" in sys.argv:
+        run_shard(_tile)
+    else:
+        main()
@@ -0,0 +1,213 @@
+import glob
+import os
+import re
+import sqlite3
+
+import db
+import wire_protocol
+
+
+# Geographic sharding of the map and the schedule.
+# The map is cut into square tiles of TILE_SIZE x TILE_SIZE grid units. Every tile with houses
+# is a shard: its own SQLite file (shards/tile_<x>_<y>.db with the usual map and schedule
+# tables, plus a one-row shard table) and its own scheduler process (shard_scheduler.py)
+# consuming the queue bound to the tile's routing key "tile.<x>.<y>" on Tile-Exchange.
+# House 0 of every shard is its depot, in the middle of the tile.
+#
+# The HandoffCoordinator sends each truck request to the shard of the house's tile. Pickups
+# that shard can't fit in its week come back on Handoff-Queue and are handed off to the next
+# closest shard (by depot), up to MAX_HANDOFFS times; the shard that takes a house from
+# another tile copies it into its own map. The last shard tried stores what is still left
+# as unscheduled.
+#
+# FederatedView reads (and follows) every shard file, read-only, for WasteCollectionUI.
+
+SHARD_DIR = os.environ.get("WASTE_SHARD_DIR", "shards")
+
+# default tile: the 10 x 10 neighbourhood the single scheduler (and its MAX_DISTANCE) was made for
+TILE_SIZE = 10
+
+EXCHANGE = 'Tile-Exchange'
+HANDOFF_QUEUE = 'Handoff-Queue'
+
+# shards a request can be handed off to after its home shard
+MAX_HANDOFFS = 3
+
+DEPOT_HOUSE = 0
+
+
+def tile_of(x, y, tile_size=TILE_SIZE):
+    return x // tile_size, y // tile_size
+
+
+def tile_depot(tile, tile_size=TILE_SIZE):
+    return tile[0] * tile_size + tile_size // 2, tile[1] * tile_size + tile_size // 2
+
+
+def routing_key(tile):
+    return f"tile.{tile[0]}.{tile[1]}"
+
+
+def tile_queue(tile):
+    return f"Truck-Queue.tile.{tile[0]}.{tile[1]}"
+
+
+def shard_path(tile, shard_dir=SHARD_DIR):
+    return os.path.join(shard_dir, f"tile_{tile[0]}_{tile[1]}.db")
+
+
+# {tile: path} of the shard files in shard_dir
+def shard_paths(shard_dir=SHARD_DIR):
+    paths = {}
+    for path in glob.glob(os.path.join(shard_dir, "tile_*_*.db")):
+        match = re.fullmatch(r"tile_(-?\d+)_(-?\d+)\.db", os.path.basename(path))
+        if match:
+            paths[(int(match.group(1)), int(match.group(2)))] = path
+    return dict(sorted(paths.items()))
+
+
+# tile size the shards in shard_dir were split with (None if there are no shards)
+def shard_tile_size(shard_dir=SHARD_DIR):
+    for path in shard_paths(shard_dir).values():
+        connection = sqlite3.connect(path)
+        try:
+            return connection.execute("SELECT tile_size FROM shard").fetchone()[0]
+        finally:
+            connection.close()
+    return None
+
+
+# creates one shard file with the houses of its tile (rows of (house_id, x, y)) and its depot
+def create_shard(path, tile, tile_size, houses):
+    connection = db.connect(path)
+    cursor = connection.cursor()
+    db.create_tables(cursor)
+    cursor.execute("DELETE FROM map")  # create_tables fills in the sample neighbourhood
+    cursor.execute("INSERT INTO map (house_id, x_value, y_value) VALUES (?, ?, ?)",
+                   (DEPOT_HOUSE, *tile_depot(tile, tile_size)))
+    cursor.executemany("INSERT INTO map (house_id, x_value, y_value) VALUES (?, ?, ?)", houses)
+    cursor.execute("DROP TABLE IF EXISTS shard")
+    cursor.execute("CREATE TABLE shard (tile_x INTEGER, tile_y INTEGER, tile_size INTEGER)")
+    cursor.execute("INSERT INTO shard VALUES (?, ?, ?)", (tile[0], tile[1], tile_size))
+    connection.commit()
+    connection.close()
+
+
+# splits the map table of connection into one shard file per tile with houses, returns {tile: houses}
+# (house 0, the single-district base, is replaced by one depot per shard)
+def split_map(connection, shard_dir=SHARD_DIR, tile_size=TILE_SIZE):
+    houses_by_tile = {}
+    for house_id, x, y in connection.execute("SELECT house_id, x_value, y_value FROM map WHERE house_id != ?",
+                                             (DEPOT_HOUSE,)):
+        houses_by_tile.setdefault(tile_of(x, y, tile_size), []).append((house_id, x, y))
+    os.makedirs(shard_dir, exist_ok=True)
+    for path in shard_paths(shard_dir).values():
+        for stale in (path, f"{path}-wal", f"{path}-shm", f"{path}.snap"):
+            if os.path.exists(stale):
+                os.remove(stale)
+    for tile, houses in houses_by_tile.items():
+        create_shard(shard_path(tile, shard_dir), tile, tile_size, houses)
+    return {tile: len(houses) for tile, houses in houses_by_tile.items()}
+
+
+class HandoffCoordinator:
+    """
+    Routes truck requests between shards (broker-independent, see shard_scheduler.py for the process).
+    - dispatch(body): a Truck-Queue request -> (routing key, shard request) for the house's home shard
+    - handoff(body): pickups a shard couldn't fit -> (routing key, shard request) for the next shard
+    The shards tried for a house are its home tile's shard, then the others by distance from the
+    house's tile to their depots; the last one is told so (ShardRequest.last) and keeps what's left.
+    Houses missing from house_grid (imported since it was read) are looked up in coordinates, a
+    coordinate_cache.CoordinateCache of the main map that follows its changes, when there is one.
+    """
+    def __init__(self, tiles, tile_size, house_grid, max_handoffs=MAX_HANDOFFS, coordinates=None):
+        self.tiles = list(tiles)
+        self.tile_size = tile_size
+        self.house_grid = house_grid
+        self.coordinates = coordinates
+        self.max_handoffs = max_handoffs
+        self.order = {}  # tile of a house -> shards to try
+        self.dispatched = 0
+        self.handoffs = 0
+
+    def candidates(self, x, y):
+        tile = tile_of(x, y, self.tile_size)
+        order = self.order.get(tile)
+        if order is None:
+            cx, cy = tile_depot(tile, self.tile_size)
+
+            def distance(shard):
+                x_depot, y_depot = tile_depot(shard, self.tile_size)
+                return abs(x_depot - cx) + abs(y_depot - cy)
+
+            order = sorted(self.tiles, key=lambda shard: (shard != tile, distance(shard), shard))[:self.max_handoffs + 1]
+            self.order[tile] = order
+        return order
+
+    def location(self, house_id):
+        location = self.house_grid.get(house_id)
+        if location is None and self.coordinates is not None:
+            location = self.coordinates.location(house_id)
+        return location
+
+    def dispatch(self, body):
+        request = wire_protocol.decode_truck_request(body)
+        location = self.location(request.house_id)
+        if location is None:
+            raise wire_protocol.MessageFormatError(f"House {request.house_id} is not on the map")
+        self.dispatched += 1
+        return self._send(body, *location, hop=0)
+
+    def handoff(self, body):
+        shard_request = wire_protocol.decode_shard_request(body)
+        self.handoffs += 1
+        return self._send(shard_request.body, shard_request.x, shard_request.y, shard_request.hop + 1)
+
+    def _send(self, truck_request_body, x, y, hop):
+        order = self.candidates(x, y)
+        hop = min(hop, len(order) - 1)
+        return routing_key(order[hop]), wire_protocol.encode_shard_request(truck_request_body, x, y, hop,
+                                                                           hop == len(order) - 1)
+
+
+class FederatedView:
+    """
+    Read-only view over the map and schedule of every shard, for WasteCollectionUI.
+    Each shard file is opened read-only on its own (SQLite can only ATTACH a handful of databases)
+    and the rows are merged here. Houses copied into another shard by a handoff are only listed
+    once, from the shard of their own tile.
+    """
+    def __init__(self, shard_dir=SHARD_DIR):
+        self.paths = shard_paths(shard_dir)
+        self.tile_size = shard_tile_size(shard_dir)
+
+    def _query(self, sql, parameters=()):
+        for tile, path in self.paths.items():
+            connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                yield tile, connection.execute(sql, parameters).fetchall()
+            finally:
+                connection.close()
+
+    # {house id: (x, y)} of every house, without the depots
+    def houses(self):
+        houses = {}
+        for tile, rows in self._query("SELECT house_id, x_value, y_value FROM map WHERE house_id != ?", (DEPOT_HOUSE,)):
+            for house_id, x, y in rows:
+                if tile_of(x, y, self.tile_size) == tile or house_id not in houses:
+                    houses[house_id] = (x, y)
+        return houses
+
+    # {tile: (x, y)} of the shards' depots
+    def depots(self):
+        return {tile: tuple(rows[0]) for tile, rows in
+                self._query("SELECT x_value, y_value FROM map WHERE house_id = ?", (DEPOT_HOUSE,)) if rows}
+
+    # (house_id, truck_type, day) of the scheduled pickups of every shard, as in the schedule table
+    def schedule_rows(self):
+        return [row for _, rows in self._query("SELECT house_id, truck_type, day FROM schedule WHERE day IS NOT NULL")
+                for row in rows]
+
+    # a db.ScheduleFeed per shard, to follow the schedule of every shard as it changes
+    def feeds(self):
+        return [db.ScheduleFeed(path) for path in self.paths.values()]
@@ -1,5 +1,5 @@
-import pika
-import json
+import transport
+import wire_protocol
 
 
 # Function to set up RabbitMQ connection
@@ -7,7 +7,7 @@ def setup_rabbitmq():
     """
     Establishes a connection to RabbitMQ and declares the required queue.
     """
-    connection = pika.BlockingConnection(pika.ConnectionParameters(host='localhost'))
+    connection = transport.connect()
     channel = connection.channel()
     channel.queue_declare(queue='Garbage-Info-Queue', durable=True)  # Ensure messages persist if RabbitMQ restarts
     return connection, channel
@@ -26,11 +26,11 @@ def send_test_message():
         "garbage_info": [85, 40, 90]  # Garbage: 85%, Recycling: 40%, Organic: 90%
     }
 
-    # Convert the message to JSON format and publish it
+    # Pack the message with the shared wire format and publish it
     channel.basic_publish(
         exchange='',
         routing_key='Garbage-Info-Queue',
-        body=json.dumps(test_message)
+        body=wire_protocol.encode_garbage_report(request_id=1, **test_message)
     )
 
     print(f"[Test Client] Sent test message: {test_message}")
@@ -0,0 +1,260 @@
+import os
+import sqlite3
+import unittest
+
+import scratch_db  # a scratch database, imported before db
+import db
+
+
+# Unit tests of db.py: ScheduleWriter, migrate_schedule, the change tracking triggers and the
+# journal mode at start-up, each on a database file of its own.
+# Usage: python -m unittest test_db
+
+GARBAGE, RECYCLING, ORGANIC = (db.TRUCK_TYPES.index(truck) for truck in ("Garbage", "Recycling", "Organic"))
+MONDAY, TUESDAY = db.DAYS.index("Monday"), db.DAYS.index("Tuesday")
+
+# schedule table of the original layout: one row per request, truck types and days comma-joined
+LEGACY_SCHEDULE = """
+CREATE TABLE schedule (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    request_id INTEGER,
+    house_id INTEGER,
+    truck_type TEXT,
+    day_visiting TEXT
+)
+"""
+
+# normalised schedule table from before the fleet model and the change tracking
+NORMALISED_SCHEDULE = """
+CREATE TABLE schedule (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    request_id INTEGER NOT NULL,
+    house_id INTEGER NOT NULL,
+    truck_type INTEGER NOT NULL,
+    day INTEGER
+)
+"""
+
+
+class DatabaseTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(scratch_db.DIRECTORY, f"{self.id().rsplit('.', 1)[-1]}.db")
+        self.connection = db.connect(self.path)
+
+    def tearDown(self):
+        self.connection.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def create_tables(self):
+        db.create_tables(self.connection.cursor())
+        self.connection.commit()
+
+    def rows(self):
+        return self.connection.execute("SELECT request_id, house_id, truck_type, day, truck, load FROM schedule "
+                                       "ORDER BY id").fetchall()
+
+    def version(self):
+        return self.connection.execute("SELECT changes, deleted FROM schedule_version").fetchone()
+
+
+class ScheduleWriterTest(DatabaseTest):
+    def setUp(self):
+        super().setUp()
+        self.create_tables()
+        self.commits = []
+        self.writer = db.ScheduleWriter(self.connection, batch_size=3, interval_ms=None, on_commit=self.commits.append)
+
+    def test_batch_is_written_when_full(self):
+        self.writer.add(1, 10, "Garbage", "Monday")
+        self.writer.add(1, 10, "Recycling", "Tuesday", "Recycling-2", 70)
+        self.assertEqual(self.rows(), [])
+        self.writer.add(2, 11, ORGANIC, MONDAY)
+        self.assertEqual(self.rows(), [(1, 10, GARBAGE, MONDAY, None, None), (1, 10, RECYCLING, TUESDAY, "Recycling-2", 70),
+                                       (2, 11, ORGANIC, MONDAY, None, None)])
+        self.assertEqual(self.commits, [3])
+        self.assertEqual(self.writer.rows, [])
+
+    def test_unscheduled_pickup(self):
+        self.writer.add(1, 10, "Garbage", "N/A")
+        self.writer.flush()
+        self.assertEqual(self.rows(), [(1, 10, GARBAGE, None, None, None)])
+
+    def test_redelivered_request_is_skipped(self):
+        self.writer.add(1, 10, "Garbage", "Monday")
+        self.writer.flush()
+        self.writer.add(1, 10, "Garbage", "Tuesday")  # same request and truck type
+        self.writer.add(1, 10, "Organic", "Tuesday")
+        self.assertEqual(self.writer.flush(), 1)
+        self.assertEqual(self.rows(), [(1, 10, GARBAGE, MONDAY, None, None), (1, 10, ORGANIC, TUESDAY, None, None)])
+        self.assertEqual((self.writer.written, self.writer.duplicates), (2, 1))
+        self.assertEqual(db.scheduled_truck_types(self.connection, 1), {GARBAGE, ORGANIC})
+
+    def test_flush_without_rows(self):
+        self.assertEqual(self.writer.flush(), 0)
+        self.assertEqual(self.commits, [])
+
+    def test_flush_if_due(self):
+        self.writer.add(1, 10, "Garbage", "Monday")
+        self.writer.flush_if_due()  # no interval: only explicit flushes
+        self.assertEqual(self.rows(), [])
+        self.writer.interval = 0
+        self.writer.flush_if_due()
+        self.assertEqual(len(self.rows()), 1)
+
+    def test_rows_are_visible_to_other_connections(self):
+        reader = sqlite3.connect(self.path)
+        self.writer.add(1, 10, "Garbage", "Monday")
+        self.assertEqual(reader.execute("SELECT COUNT(*) FROM schedule").fetchone(), (0,))
+        self.writer.flush()
+        self.assertEqual(reader.execute("SELECT COUNT(*) FROM schedule").fetchone(), (1,))
+        reader.close()
+
+
+class ChangeTrackingTest(DatabaseTest):
+    def setUp(self):
+        super().setUp()
+        self.create_tables()
+        with self.connection:
+            self.connection.executemany("INSERT INTO schedule (request_id, house_id, truck_type, day) VALUES (?, ?, ?, ?)",
+                                        [(1, 10, GARBAGE, MONDAY), (2, 11, GARBAGE, MONDAY)])
+
+    def updated_seq(self, request_id):
+        return self.connection.execute("SELECT updated_seq FROM schedule WHERE request_id = ?", (request_id,)).fetchone()[0]
+
+    def test_new_rows_are_not_changes(self):
+        self.assertEqual(self.version(), (0, 0))
+        self.assertIsNone(self.updated_seq(1))
+
+    def test_update_in_place(self):
+        with self.connection:
+            self.connection.execute("UPDATE schedule SET day = ? WHERE request_id = 2", (TUESDAY,))
+        self.assertEqual(self.version(), (1, 0))
+        self.assertEqual(self.updated_seq(2), 1)
+        with self.connection:
+            self.connection.execute("UPDATE schedule SET truck = 'Garbage-2', load = 40")
+        self.assertEqual(self.version(), (3, 0))
+        self.assertEqual({self.updated_seq(1), self.updated_seq(2)}, {2, 3})
+
+    def test_stamp_alone_is_not_a_change(self):
+        with self.connection:
+            self.connection.execute("UPDATE schedule SET updated_seq = NULL")
+        self.assertEqual(self.version(), (0, 0))
+
+    def test_deleted_rows(self):
+        with self.connection:
+            self.connection.execute("DELETE FROM schedule WHERE request_id = 1")
+        self.assertEqual(self.version(), (1, 1))
+        with self.connection:
+            self.connection.execute("DELETE FROM schedule")
+        self.assertEqual(self.version(), (2, 2))
+
+    def test_recreated_table(self):
+        self.create_tables()
+        self.assertEqual(self.version(), (1, 1))  # the rows dropped with the table count as deleted
+        self.assertEqual(self.rows(), [])
+
+    def test_map_version(self):
+        changes = db.table_changes(self.connection, "map_version")
+        with self.connection:
+            self.connection.execute("INSERT INTO map (house_id, x_value, y_value) VALUES (1000, 1, 1)")
+            self.connection.execute("UPDATE map SET x_value = 2 WHERE house_id = 1000")
+            self.connection.execute("DELETE FROM map WHERE house_id = 1000")
+        self.assertEqual(db.table_changes(self.connection, "map_version"), changes + 3)
+        self.assertIsNone(db.table_changes(self.connection, "no_such_version"))
+
+
+class MigrateScheduleTest(DatabaseTest):
+    def test_legacy_layout(self):
+        with self.connection:
+            self.connection.execute(LEGACY_SCHEDULE)
+            self.connection.executemany("INSERT INTO schedule (request_id, house_id, truck_type, day_visiting) "
+                                        "VALUES (?, ?, ?, ?)",
+                                        [(1, 10, "[Garbage, Organic]", "[Monday, N/A]"),
+                                         (2, 11, "Recycling", "Tuesday"),
+                                         (2, 11, "Recycling", "Monday"),  # delivered twice, the first row is kept
+                                         (3, 12, "Compost", "Monday"),  # not a truck type
+                                         (4, 13, None, None)])
+        self.assertEqual(db.migrate_schedule(self.connection), 3)
+        self.assertEqual(self.rows(), [(1, 10, GARBAGE, MONDAY, None, None), (1, 10, ORGANIC, None, None, None),
+                                       (2, 11, RECYCLING, TUESDAY, None, None)])
+        self.assertEqual(self.version(), (0, 0))
+        tables = {row[0] for row in self.connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertNotIn("schedule_legacy", tables)
+        self.assertEqual(db.migrate_schedule(self.connection), 0)  # already normalised
+
+    def test_normalised_layout_without_tracking(self):
+        with self.connection:
+            self.connection.execute(NORMALISED_SCHEDULE)
+            self.connection.executemany("INSERT INTO schedule (request_id, house_id, truck_type, day) VALUES (?, ?, ?, ?)",
+                                        [(1, 10, GARBAGE, MONDAY), (1, 10, GARBAGE, TUESDAY), (2, 11, GARBAGE, MONDAY)])
+        self.assertEqual(db.migrate_schedule(self.connection), 0)
+        # the last row of a request stored twice is kept, the columns added later are NULL
+        self.assertEqual(self.rows(), [(1, 10, GARBAGE, TUESDAY, None, None), (2, 11, GARBAGE, MONDAY, None, None)])
+        self.assertEqual(self.version(), (1, 1))  # the row deleted restarts the readers
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.connection.execute("INSERT INTO schedule (request_id, house_id, truck_type, day) VALUES (2, 11, 0, 2)")
+        with self.connection:
+            self.connection.execute("UPDATE schedule SET day = NULL WHERE request_id = 2")
+        self.assertEqual(self.version(), (2, 1))
+        self.assertEqual(db.migrate_schedule(self.connection), 0)
+        self.assertEqual(len(self.rows()), 2)
+
+    def test_failed_migration_is_rolled_back(self):
+        with self.connection:
+            self.connection.execute(LEGACY_SCHEDULE)
+            self.connection.execute("INSERT INTO schedule (request_id, house_id, truck_type, day_visiting) "
+                                    "VALUES (1, 10, 'Garbage', X'4D6F6E646179')")  # a blob, not text
+        with self.assertRaises(TypeError):
+            db.migrate_schedule(self.connection)
+        columns = db.table_columns(self.connection.cursor(), "schedule")
+        self.assertIn("day_visiting", columns)
+        self.assertEqual(self.connection.execute("SELECT COUNT(*) FROM schedule").fetchone(), (1,))
+
+    def test_no_schedule_table(self):
+        self.assertEqual(db.migrate_schedule(self.connection), 0)
+
+
+class JournalModeTest(DatabaseTest):
+    def journal_mode(self, connection=None):
+        return (connection or self.connection).execute("PRAGMA journal_mode").fetchone()[0]
+
+    def test_connect_leaves_the_journal_mode_alone(self):
+        self.assertEqual(self.journal_mode(), "delete")
+        reader = db.connect(self.path)
+        self.assertEqual(self.journal_mode(reader), "delete")
+        reader.close()
+
+    def test_writers_start_up_switches_to_wal(self):
+        self.create_tables()
+        self.assertEqual(self.journal_mode(), "wal")
+        reader = db.connect(self.path)
+        self.assertEqual(self.journal_mode(reader), "wal")  # kept in the file
+        self.assertEqual(reader.execute("PRAGMA synchronous").fetchone()[0], 1)  # NORMAL
+        reader.close()
+
+    def test_migration_switches_to_wal(self):
+        db.migrate_schedule(self.connection)
+        self.assertEqual(self.journal_mode(), "wal")
+
+    def test_read_only_reader_during_a_write(self):
+        self.create_tables()
+        reader = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        self.connection.execute("BEGIN")
+        self.connection.execute("INSERT INTO schedule (request_id, house_id, truck_type, day) VALUES (1, 10, 0, 1)")
+        self.assertEqual(reader.execute("SELECT COUNT(*) FROM schedule").fetchone(), (0,))
+        self.connection.commit()
+        self.assertEqual(reader.execute("SELECT COUNT(*) FROM schedule").fetchone(), (1,))
+        reader.close()
+
+
+class ReadCoordinatesTest(unittest.TestCase):
+    def test_sample_map(self):
+        houses = list(db.read_coordinates())
+        self.assertEqual(houses[0][0], 0)  # the home base
+        self.assertEqual(len({house_id for house_id, _, _ in houses}), len(houses))
+
+
+if __name__ == "__main__":
+    unittest.main()
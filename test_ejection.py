@@ -0,0 +1,164 @@
+import time
+import unittest
+
+import scratch_db  # a scratch database, imported before db
+import db
+import map_import
+import repair_queue
+import truck_scheduler
+
+
+# Unit tests of the real-time rescheduling of truck_scheduler: ejection chains (place_by_ejection)
+# and repair passes, on a hand-made map with the default fleet (one truck per type).
+# Usage: python -m unittest test_ejection
+#
+# Every route is a closed tour from the base (house 0) and the route limit is 11, so a day's route
+# takes one of these houses (a tour through two of them is longer):
+#   house 1 (5, 0): tour 10   house 2 (0, 4): tour 8   house 3 (0, -4): tour 8
+
+HOUSES = [(0, 0, 0), (1, 5, 0), (2, 0, 4), (3, 0, -4)]
+MAX_DISTANCE = 11
+HOUR = 3600
+
+
+@unittest.skipUnless(scratch_db.USABLE, scratch_db.SKIP_REASON)
+class EjectionTest(unittest.TestCase):
+    def setUp(self):
+        db.create_tables(db.cursor)
+        db.conn.commit()
+        map_import.import_houses(db.conn, HOUSES, replace=True)
+        truck_scheduler.get_all_house_coordinates()
+        truck_scheduler.MAX_DISTANCE = MAX_DISTANCE
+        for trucks in truck_scheduler.WEEKLY_SCHEDULE.values():
+            for houses in trucks.values():
+                houses.clear()
+        truck_scheduler.ROUTES.clear()
+        truck_scheduler.CAPACITY.clear()
+        truck_scheduler.UNAVAILABLE.clear()
+        truck_scheduler.QUEUED_AT.clear()
+        truck_scheduler.PENDING = repair_queue.PendingQueue()
+        truck_scheduler.SCHEDULE_WRITER.rows.clear()
+        self.request_id = 0
+
+    def tearDown(self):
+        db.conn.rollback()  # row changes place_by_ejection left for its caller to commit
+
+    # only these days of the Garbage truck take pickups
+    def open_days(self, *days):
+        truck_scheduler.UNAVAILABLE.update((day, "Garbage") for day in db.DAYS if day not in days)
+
+    # schedules a Garbage pickup like a request does, returns its request id and day
+    def schedule(self, house_id, load):
+        self.request_id += 1
+        day, truck_id = truck_scheduler.schedule_pickup(house_id, "Garbage", optimise=False, load=load)
+        truck_scheduler.publish_truck_info_to_queue(self.request_id, house_id, ["Garbage"], [day or "N/A"],
+                                                    [truck_id], [load])
+        truck_scheduler.SCHEDULE_WRITER.flush()
+        return self.request_id, day
+
+    def day_of(self, request_id):
+        day = db.conn.execute("SELECT day FROM schedule WHERE request_id = ?", (request_id,)).fetchone()[0]
+        return None if day is None else db.DAYS[day]
+
+    def route(self, day):
+        return truck_scheduler.WEEKLY_SCHEDULE[day]["Garbage"]
+
+    def test_full_bin_takes_the_place_of_an_emptier_one(self):
+        self.open_days("Monday")
+        request_id, day = self.schedule(1, 20)
+        self.assertEqual(day, "Monday")
+        self.assertEqual(truck_scheduler.schedule_pickup(2, "Garbage", optimise=False, load=100), (0, None))
+
+        now = time.time()
+        self.assertEqual(truck_scheduler.place_by_ejection(2, "Garbage", 100, now), ("Monday", "Garbage"))
+        self.assertEqual(self.route("Monday"), [2])
+        self.assertEqual(truck_scheduler.get_route("Monday", "Garbage").length, 8)
+        self.assertEqual(truck_scheduler.get_route("Monday", "Garbage").load, 100)
+        self.assertIsNone(self.day_of(request_id))
+        pickup = truck_scheduler.PENDING.pop()
+        self.assertEqual((pickup.request_id, pickup.house_id, pickup.load), (request_id, 1, 20))
+        self.assertGreaterEqual(pickup.queued_at, now)
+
+    def test_no_ejection_for_a_similar_bin(self):
+        self.open_days("Monday")
+        self.schedule(1, 80)
+        self.assertEqual(truck_scheduler.place_by_ejection(2, "Garbage", 85, time.time()), (0, None))
+        self.assertEqual(self.route("Monday"), [1])
+        self.assertEqual(len(truck_scheduler.PENDING), 0)
+
+    def test_displaced_pickup_keeps_its_age(self):
+        self.open_days("Monday")
+        request_id, _ = self.schedule(1, 20)
+        queued_at = time.time() - HOUR  # waited an hour before a repair pass placed it
+        truck_scheduler.QUEUED_AT[(request_id, "Garbage")] = queued_at
+        self.assertEqual(truck_scheduler.place_by_ejection(2, "Garbage", 100, time.time()), ("Monday", "Garbage"))
+        self.assertEqual(truck_scheduler.PENDING.pop().queued_at, queued_at)
+
+    def test_long_wait_protects_a_pickup(self):
+        # 20% after 12 hours of waiting is worth more than a full bin that just arrived
+        self.open_days("Monday")
+        request_id, _ = self.schedule(1, 20)
+        truck_scheduler.QUEUED_AT[(request_id, "Garbage")] = time.time() - 12 * HOUR
+        self.assertEqual(truck_scheduler.place_by_ejection(2, "Garbage", 100, time.time()), (0, None))
+        self.assertEqual(self.route("Monday"), [1])
+
+    def test_ejection_chain(self):
+        # the full bin displaces house 1 on Monday, house 1 displaces house 3 on Tuesday,
+        # house 3 fits nowhere and waits
+        self.open_days("Monday", "Tuesday")
+        first, _ = self.schedule(1, 60)
+        second, day = self.schedule(3, 20)
+        self.assertEqual(day, "Tuesday")
+        self.assertEqual(truck_scheduler.place_by_ejection(2, "Garbage", 100, time.time()), ("Monday", "Garbage"))
+        self.assertEqual(self.route("Monday"), [2])
+        self.assertEqual(self.route("Tuesday"), [1])
+        self.assertEqual((self.day_of(first), self.day_of(second)), ("Tuesday", None))
+        self.assertEqual([(pickup.request_id, pickup.house_id) for pickup in truck_scheduler.PENDING.pickups()],
+                         [(second, 3)])
+
+    def test_chain_depth(self):
+        self.open_days("Monday", "Tuesday")
+        first, _ = self.schedule(1, 60)
+        second, _ = self.schedule(3, 20)
+        self.assertEqual(truck_scheduler.place_by_ejection(2, "Garbage", 100, time.time(), depth=1),
+                         ("Monday", "Garbage"))
+        self.assertEqual(self.route("Tuesday"), [3])
+        self.assertEqual((self.day_of(first), self.day_of(second)), (None, "Tuesday"))
+        self.assertEqual([pickup.request_id for pickup in truck_scheduler.PENDING.pickups()], [first])
+
+    def test_caller_commits(self):
+        self.open_days("Monday")
+        self.schedule(1, 20)
+        truck_scheduler.place_by_ejection(2, "Garbage", 100, time.time())
+        self.assertTrue(db.conn.in_transaction)
+
+    def test_repair_places_waiting_pickups_and_commits_once(self):
+        self.open_days("Monday", "Tuesday")
+        self.schedule(1, 20)
+        _, day = self.schedule(3, 20)
+        self.schedule(2, 100)
+        self.assertEqual(day, "Tuesday")
+        waiting = self.request_id
+        self.assertIsNone(self.day_of(waiting))
+        truck_scheduler.PENDING.push(waiting, "Garbage", 2, 100, time.time())
+
+        report = truck_scheduler.repair()
+        self.assertEqual((report["placed"], report["pending"]), (1, 1))
+        self.assertFalse(db.conn.in_transaction)
+        self.assertIsNotNone(self.day_of(waiting))
+        self.assertIn((waiting, "Garbage"), truck_scheduler.QUEUED_AT)
+        self.assertEqual(truck_scheduler.PENDING.pop().house_id, 1)  # the emptier bin on Monday
+
+    def test_unavailable_truck_is_repaired(self):
+        self.open_days("Monday", "Tuesday")
+        request_id, day = self.schedule(1, 20)
+        self.assertEqual(day, "Monday")
+        report = truck_scheduler.set_availability("Garbage", "Monday")
+        self.assertEqual((report["displaced"], report["placed"], report["pending"]), (1, 1, 0))
+        self.assertEqual(self.day_of(request_id), "Tuesday")
+        self.assertEqual(self.route("Monday"), [])
+        self.assertFalse(db.conn.in_transaction)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import json
+import math
+import os
+import random
+import tempfile
+import unittest
+
+import fleet
+
+
+# Unit tests of fleet.py: the fleet file (load_fleet) and CapacityIndex.
+# Usage: python -m unittest test_fleet
+
+
+def trucks(*max_loads):
+    return [fleet.Truck(f"Garbage-{number}", "Garbage", max_load=max_load) for number, max_load in enumerate(max_loads, 1)]
+
+
+class LoadFleetTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "fleet.json")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def load(self, trucks):
+        with open(self.path, "w") as fleet_file:
+            json.dump(trucks, fleet_file)
+        return fleet.load_fleet(self.path)
+
+    def one_per_type(self, **extra):
+        return [dict({"id": truck_type, "type": truck_type}, **extra) for truck_type in ("Garbage", "Recycling", "Organic")]
+
+    def test_default_fleet(self):
+        environment = os.environ.pop("WASTE_FLEET", None)
+        try:
+            trucks = fleet.load_fleet()
+        finally:
+            if environment is not None:
+                os.environ["WASTE_FLEET"] = environment
+        self.assertEqual([truck.truck_id for truck in trucks], ["Garbage", "Recycling", "Organic"])
+        self.assertTrue(all(truck.depot == 0 and truck.max_distance is None and truck.max_load == math.inf
+                            for truck in trucks))
+
+    def test_make_fleet(self):
+        trucks = fleet.make_fleet(2, max_distance=30, max_load=500, depot=4)
+        self.assertEqual([truck.truck_id for truck in trucks],
+                         ["Garbage", "Garbage-2", "Recycling", "Recycling-2", "Organic", "Organic-2"])
+        self.assertEqual({(truck.depot, truck.max_distance, truck.max_load) for truck in trucks}, {(4, 30, 500)})
+
+    def test_fleet_file(self):
+        trucks = self.load(self.one_per_type() + [{"id": "G2", "type": "Garbage", "depot": 7, "max_distance": 40,
+                                                   "max_load": 1500}])
+        garbage_2 = trucks[-1]
+        self.assertEqual((garbage_2.truck_id, garbage_2.truck_type, garbage_2.depot, garbage_2.max_distance,
+                          garbage_2.max_load), ("G2", "Garbage", 7, 40, 1500))
+        self.assertEqual(trucks[0].max_load, math.inf)  # no limit given
+
+    def test_unusable_fleets(self):
+        for broken in (self.one_per_type() + [{"type": "Garbage"}],  # no id
+                       self.one_per_type() + [{"id": "G2"}],  # no type
+                       self.one_per_type() + [{"id": "G2", "type": "Plastic"}],
+                       self.one_per_type() + [{"id": "Garbage", "type": "Garbage"}],  # id used twice
+                       self.one_per_type()[:2],  # no Organic truck
+                       {"id": "Garbage", "type": "Garbage"},  # not a list
+                       ["Garbage", "Recycling", "Organic"]):
+            with self.assertRaises(ValueError, msg=broken):
+                self.load(broken)
+
+
+class CapacityIndexTest(unittest.TestCase):
+    def test_tightest_fit_first(self):
+        capacity = fleet.CapacityIndex(trucks(1000, 300, None, 500))
+        self.assertEqual(list(capacity.fitting(400)), ["Garbage-4", "Garbage-1", "Garbage-3"])
+        self.assertEqual(list(capacity.fitting(500)), ["Garbage-4", "Garbage-1", "Garbage-3"])  # exact fit
+        self.assertEqual(list(capacity.fitting(5000)), ["Garbage-3"])  # no load limit
+        self.assertEqual(len(list(capacity.fitting(0))), 4)
+
+    def test_equal_room_in_fleet_order(self):
+        capacity = fleet.CapacityIndex(trucks(500, 500, 500))
+        self.assertEqual(list(capacity.fitting(100)), ["Garbage-1", "Garbage-2", "Garbage-3"])
+
+    def test_update(self):
+        capacity = fleet.CapacityIndex(trucks(1000, 500))
+        capacity.update("Garbage-1", 700)
+        self.assertEqual(capacity.remaining("Garbage-1"), 300)
+        self.assertEqual(list(capacity.fitting(400)), ["Garbage-2"])
+        capacity.update("Garbage-1", -200)  # a pickup taken off the route
+        self.assertEqual(list(capacity.fitting(400)), ["Garbage-1", "Garbage-2"])
+        capacity.update("Garbage-2", 500)
+        self.assertEqual(capacity.remaining("Garbage-2"), 0)
+        self.assertEqual(list(capacity.fitting(1)), ["Garbage-1"])
+
+    def test_overloaded_truck(self):
+        capacity = fleet.CapacityIndex(trucks(100))
+        capacity.update("Garbage-1", 150)  # routes read from the table can be over the limit
+        self.assertEqual(capacity.remaining("Garbage-1"), -50)
+        self.assertEqual(list(capacity.fitting(0)), [])
+
+    def test_matches_a_scan(self):
+        rng = random.Random(3)
+        max_loads = [rng.choice([None, 200, 500, 1000, 2000]) for _ in range(40)]
+        capacity = fleet.CapacityIndex(trucks(*max_loads))
+        remaining = {f"Garbage-{number}": math.inf if max_load is None else max_load
+                     for number, max_load in enumerate(max_loads, 1)}
+        order = list(remaining)
+        for _ in range(500):
+            truck_id = rng.choice(order)
+            change = rng.randint(-100, 150)
+            capacity.update(truck_id, change)
+            remaining[truck_id] -= change
+            load = rng.randint(0, 1200)
+            expected = sorted((room, order.index(truck_id), truck_id) for truck_id, room in remaining.items()
+                              if room >= load)
+            self.assertEqual(list(capacity.fitting(load)), [truck_id for _, _, truck_id in expected])
+        for truck_id, room in remaining.items():
+            self.assertEqual(capacity.remaining(truck_id), room)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import random
+import unittest
+
+import numpy as np
+
+import route_optimizer
+from house_index import HouseIndex
+
+
+# Unit tests of house_index.HouseIndex against plain Python on random maps (fixed seed).
+# Usage: python -m unittest test_house_index
+
+
+def random_map(count, seed=1, span=200, ids=None):
+    rng = random.Random(seed)
+    ids = ids or list(range(count))
+    return {house_id: (rng.randint(-span, span), rng.randint(-span, span)) for house_id in ids}
+
+
+def manhattan(houses, house_1, house_2):
+    (x1, y1), (x2, y2) = houses[house_1], houses[house_2]
+    return abs(x1 - x2) + abs(y1 - y2)
+
+
+class HouseIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.houses = random_map(500)
+        self.index = HouseIndex.from_grid(self.houses)
+
+    def test_within_radius(self):
+        for x, y, radius in [(0, 0, 30), (190, -190, 50), (-500, 0, 290), (1000, 1000, 5), (3, 7, 0)]:
+            expected = {house_id for house_id, (hx, hy) in self.houses.items() if abs(hx - x) + abs(hy - y) <= radius}
+            self.assertEqual(set(self.index.within_radius(x, y, radius).tolist()), expected)
+
+    def test_nearest(self):
+        for x, y, k in [(0, 0, 1), (0, 0, 10), (150, 150, 25), (-1000, 40, 5), (0, 0, 600)]:
+            distances = sorted(abs(hx - x) + abs(hy - y) for hx, hy in self.houses.values())
+            nearest = self.index.nearest(x, y, k).tolist()
+            self.assertEqual(len(nearest), min(k, len(self.houses)))
+            self.assertEqual([abs(self.houses[h][0] - x) + abs(self.houses[h][1] - y) for h in nearest],
+                             distances[:k])
+
+    def test_nearest_excludes_the_house_itself(self):
+        x, y = self.houses[7]
+        nearest = self.index.nearest(x, y, 5, exclude=7).tolist()
+        self.assertEqual(len(nearest), 5)
+        self.assertNotIn(7, nearest)
+
+    def test_distances(self):
+        ids = list(range(0, 500, 7))
+        self.assertEqual(self.index.distances_from(3, ids).tolist(), [manhattan(self.houses, 3, h) for h in ids])
+        matrix = self.index.distance_matrix(ids[:5], ids[-4:])
+        self.assertEqual(matrix.tolist(), [[manhattan(self.houses, a, b) for b in ids[-4:]] for a in ids[:5]])
+
+    def test_insertion_deltas(self):
+        distance = lambda a, b: manhattan(self.houses, a, b)
+        for route in ([], [5], [5, 9, 40, 2, 300]):
+            deltas = self.index.insertion_deltas(route, 11, 0).tolist()
+            self.assertEqual(deltas, [route_optimizer.insertion_delta(route, 11, position, distance)
+                                      for position in range(len(route) + 1)])
+
+    def test_ejection_deltas(self):
+        distance = lambda a, b: manhattan(self.houses, a, b)
+        route = [5, 9, 40, 2, 300, 17]
+        changes, positions = self.index.ejection_deltas(route, 11, 0)
+        length = route_optimizer.tour_length(route, distance)
+        for e in range(len(route)):
+            rest = route[:e] + route[e + 1:]
+            best = min(route_optimizer.tour_length(rest[:p] + [11] + rest[p:], distance) for p in range(len(rest) + 1))
+            self.assertEqual(changes[e], best - length)
+            p = positions[e]
+            self.assertEqual(route_optimizer.tour_length(rest[:p] + [11] + rest[p:], distance), best)
+
+    def test_unknown_houses(self):
+        self.assertNotIn(500, self.index)
+        self.assertNotIn(-1, self.index)
+        for house_ids in ([500], [-1], [3, 10 ** 12]):
+            with self.assertRaises(ValueError):
+                self.index.rows_of(house_ids)
+
+    def test_sparse_ids(self):
+        # 64-bit ids (map_import.py) don't get a table indexed by id
+        ids = [0] + [10 ** 12 + 7 * i for i in range(1, 300)]
+        houses = random_map(len(ids), seed=2, ids=ids)
+        index = HouseIndex.from_grid(houses)
+        self.assertIsNone(index.row_table)
+        self.assertIn(10 ** 12 + 7, index)
+        self.assertNotIn(10 ** 12 + 8, index)
+        self.assertNotIn(10 ** 13, index)
+        for house_id in ids[::13]:
+            self.assertEqual(index.coordinates(house_id), houses[house_id])
+        rows = index.rows_of(ids[::-1])
+        self.assertEqual(index.house_ids[rows].tolist(), ids[::-1])
+        for house_ids in ([10 ** 12 + 8], [10 ** 13], [-5]):
+            with self.assertRaises(ValueError):
+                index.rows_of(house_ids)
+        x, y = houses[ids[5]]
+        self.assertEqual(index.nearest(x, y, 1).tolist(), [ids[5]])
+
+    def test_empty_index(self):
+        index = HouseIndex.from_grid({})
+        self.assertEqual(len(index), 0)
+        self.assertNotIn(0, index)
+        self.assertEqual(index.nearest(0, 0, 3).tolist(), [])
+        self.assertEqual(index.within_radius(0, 0, 10).tolist(), [])
+
+    def test_from_rows_matches_from_grid(self):
+        rows = [(house_id, x, y) for house_id, (x, y) in self.houses.items()]
+        index = HouseIndex.from_rows(rows)
+        self.assertTrue(np.array_equal(index.distance_matrix([1, 2, 3]), self.index.distance_matrix([1, 2, 3])))
+
+
+if __name__ == "__main__":
+    unittest.main()
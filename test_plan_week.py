@@ -0,0 +1,101 @@
+import unittest
+
+import scratch_db  # a scratch database, imported before db
+import db
+import map_import
+import repair_queue
+import truck_scheduler
+
+
+# Unit tests of truck_scheduler.plan_week (batch planning of every request in the schedule table),
+# on the map of test_ejection.py with the default fleet (one truck per type).
+# Usage: python -m unittest test_plan_week
+#
+# The route limit is 11, so a day's route takes one of these houses:
+#   house 1 (5, 0): tour 10   house 2 (0, 4): tour 8   house 3 (0, -4): tour 8
+
+HOUSES = [(0, 0, 0), (1, 5, 0), (2, 0, 4), (3, 0, -4)]
+MAX_DISTANCE = 11
+
+
+@unittest.skipUnless(scratch_db.USABLE, scratch_db.SKIP_REASON)
+class PlanWeekTest(unittest.TestCase):
+    def setUp(self):
+        db.create_tables(db.cursor)
+        db.conn.execute("DELETE FROM schedule")
+        db.conn.commit()
+        map_import.import_houses(db.conn, HOUSES, replace=True)
+        truck_scheduler.get_all_house_coordinates()
+        truck_scheduler.MAX_DISTANCE = MAX_DISTANCE
+        truck_scheduler.UNAVAILABLE.clear()
+        truck_scheduler.PENDING = repair_queue.PendingQueue()
+        self.garbage = truck_scheduler.FLEET["Garbage"]
+        self.limits = (self.garbage.max_distance, self.garbage.max_load)
+
+    def tearDown(self):
+        self.garbage.max_distance, self.garbage.max_load = self.limits
+
+    def add_requests(self, *requests):
+        db.conn.executemany("INSERT INTO schedule (request_id, house_id, truck_type, load) VALUES (?, ?, ?, ?)",
+                            [(request_id, house_id, db.TRUCK_TYPES.index("Garbage"), load)
+                             for request_id, house_id, load in requests])
+        db.conn.commit()
+
+    def rows(self):
+        rows = db.conn.execute("SELECT request_id, house_id, day, truck FROM schedule ORDER BY request_id").fetchall()
+        return {request_id: (house_id, None if day is None else db.DAYS[day], truck)
+                for request_id, house_id, day, truck in rows}
+
+    def route(self, day):
+        return truck_scheduler.WEEKLY_SCHEDULE[day]["Garbage"]
+
+    def test_request_for_a_house_off_the_map_is_kept(self):
+        self.add_requests((1, 1, 80), (2, 99, 90))
+        report = truck_scheduler.plan_week()
+        rows = self.rows()
+        self.assertEqual(set(rows), {1, 2})
+        self.assertIsNotNone(rows[1][1])
+        self.assertEqual(rows[2], (99, None, None))
+        self.assertIn((2, "Garbage"), truck_scheduler.PENDING)
+        self.assertNotIn((1, "Garbage"), truck_scheduler.PENDING)
+        self.assertEqual(report["unscheduled"], [])
+
+    def test_house_asked_for_twice(self):
+        # a route carries 100: the two bins of 60 are picked up on two days
+        self.garbage.max_load = 100
+        self.add_requests((1, 1, 60), (2, 1, 60))
+        truck_scheduler.plan_week()
+        rows = self.rows()
+        self.assertIsNotNone(rows[1][1])
+        self.assertIsNotNone(rows[2][1])
+        self.assertNotEqual(rows[1][1], rows[2][1])
+        for day in (rows[1][1], rows[2][1]):
+            self.assertEqual(self.route(day), [1])
+            self.assertEqual(truck_scheduler.get_route(day, "Garbage").load, 60)
+
+    def test_unavailable_days_get_no_pickups(self):
+        truck_scheduler.UNAVAILABLE.update((day, "Garbage") for day in db.DAYS if day not in ("Monday", "Tuesday"))
+        truck_scheduler.WEEKLY_SCHEDULE["Sunday"]["Garbage"][:] = [2]  # planned before the truck went out of service
+        self.add_requests((1, 1, 80), (2, 2, 90), (3, 3, 85))
+        report = truck_scheduler.plan_week()
+        days = [day for _, day, _ in self.rows().values()]
+        self.assertEqual(sorted(day for day in days if day is not None), ["Monday", "Tuesday"])
+        self.assertEqual(days.count(None), 1)
+        self.assertEqual(len(report["unscheduled"]), 1)
+        self.assertEqual(len(truck_scheduler.PENDING), 1)
+        for day in db.DAYS:
+            if day not in ("Monday", "Tuesday"):
+                self.assertEqual(self.route(day), [])
+
+    def test_truck_limits(self):
+        # the truck's own limit (9) leaves out house 1, whose tour is 10
+        self.garbage.max_distance = 9
+        self.add_requests((1, 1, 80), (2, 2, 90))
+        truck_scheduler.plan_week()
+        rows = self.rows()
+        self.assertIsNone(rows[1][1])
+        self.assertIsNotNone(rows[2][1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+
+import inproc_broker
+import reliable_delivery
+import wire_protocol
+
+
+# Unit tests of reliable_delivery.DeliveryGuard on the in-process broker (inproc_broker.py).
+# Usage: python -m unittest test_reliable_delivery
+
+QUEUE = "Test-Queue"
+
+
+class DeliveryGuardTest(unittest.TestCase):
+    def setUp(self):
+        self.broker = inproc_broker.InProcessBroker()
+        self.connection = self.broker.BlockingConnection()
+        self.channel = self.connection.channel()
+        self.channel.queue_declare(queue=QUEUE, durable=True)
+        publish_channel = self.connection.channel()
+        publish_channel.confirm_delivery()
+        self.guard = reliable_delivery.DeliveryGuard(publish_channel, "Test", max_attempts=3)
+        self.calls = []
+        self.results = []
+
+    # consumes QUEUE like the pipeline stages do (guard, then ack) until it is empty
+    def consume(self, handler):
+        def on_message(ch, method, properties, body):
+            self.results.append(self.guard.handle(method, properties, body, handler))
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+
+        self.channel.basic_consume(queue=QUEUE, on_message_callback=on_message)
+        while self.connection.process_data_events():
+            pass
+
+    def publish(self, body):
+        self.channel.basic_publish(exchange='', routing_key=QUEUE, body=body)
+
+    def dead_letters(self):
+        letters = []
+        while True:
+            entry = self.broker.get(reliable_delivery.DEAD_LETTER_QUEUE)
+            if entry is None:
+                return letters
+            letters.append(entry)
+
+    def test_handled_message(self):
+        self.publish(b"ok")
+        self.consume(lambda body: self.calls.append(body) or body.upper())
+        self.assertEqual(self.calls, [b"ok"])
+        self.assertEqual(self.results, [b"OK"])
+        self.assertEqual((self.guard.retried, self.guard.dead_lettered), (0, 0))
+        self.assertEqual(self.dead_letters(), [])
+
+    def test_failing_message_is_retried_then_dead_lettered(self):
+        def handler(body):
+            self.calls.append(body)
+            raise RuntimeError("database is locked")
+
+        self.publish(b"poison")
+        self.consume(handler)
+        self.assertEqual(self.calls, [b"poison"] * 3)
+        self.assertEqual(self.results, [None] * 3)
+        self.assertEqual((self.guard.retried, self.guard.dead_lettered), (2, 1))
+        self.assertEqual(self.broker.message_count(QUEUE), 0)
+        [(_, body, properties, _, _, _)] = self.dead_letters()
+        self.assertEqual(body, b"poison")
+        self.assertEqual(properties.headers[reliable_delivery.ATTEMPTS_HEADER], 3)
+        self.assertEqual(properties.headers["x-routing-key"], QUEUE)
+        self.assertIn("database is locked", properties.headers["x-error"])
+
+    def test_retry_succeeds(self):
+        def handler(body):
+            self.calls.append(body)
+            if len(self.calls) == 1:
+                raise RuntimeError("temporary")
+            return "done"
+
+        self.publish(b"flaky")
+        self.consume(handler)
+        self.assertEqual(self.calls, [b"flaky", b"flaky"])
+        self.assertEqual(self.results, [None, "done"])
+        self.assertEqual((self.guard.retried, self.guard.dead_lettered), (1, 0))
+
+    def test_malformed_message_is_dead_lettered_without_retry(self):
+        self.publish(b"\x09\x02garbage")
+        self.consume(lambda body: self.calls.append(body) or wire_protocol.decode_truck_request(body))
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual((self.guard.retried, self.guard.dead_lettered), (0, 1))
+        [(_, body, properties, _, _, _)] = self.dead_letters()
+        self.assertEqual(body, b"\x09\x02garbage")
+        self.assertEqual(properties.headers[reliable_delivery.ATTEMPTS_HEADER], 1)
+        self.assertIn("version", properties.headers["x-error"])
+
+    def test_redelivered_message_goes_to_the_back_of_the_queue(self):
+        # a redelivery may be the message that crashed the consumer: it isn't handled right away
+        self.publish(b"first")
+        self.channel.basic_consume(queue=QUEUE, on_message_callback=lambda *arguments: None)
+        self.connection.process_data_events()
+        self.channel.basic_nack(delivery_tag=1)  # the consumer died before acking
+        self.publish(b"second")
+        self.consume(lambda body: self.calls.append(body))
+        self.assertEqual(self.calls, [b"second", b"first"])
+        self.assertEqual(self.guard.retried, 1)
+
+    def test_attempts_of(self):
+        self.assertEqual(reliable_delivery.attempts_of(None), 0)
+        self.assertEqual(reliable_delivery.attempts_of(
+            reliable_delivery.DeliveryGuard._properties(None, {reliable_delivery.ATTEMPTS_HEADER: 2})), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
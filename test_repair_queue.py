@@ -0,0 +1,80 @@
+import unittest
+
+import repair_queue
+
+
+# Unit tests of repair_queue.PendingQueue. Usage: python -m unittest test_repair_queue
+
+HOUR = 3600
+
+
+class PendingQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.queue = repair_queue.PendingQueue()
+
+    def test_fullest_bin_first(self):
+        self.queue.push(1, "Garbage", 10, 40, queued_at=0)
+        self.queue.push(2, "Garbage", 20, 90, queued_at=0)
+        self.queue.push(3, "Organic", 30, 60, queued_at=0)
+        self.assertEqual([self.queue.pop().request_id for _ in range(3)], [2, 3, 1])
+        self.assertIsNone(self.queue.pop())
+
+    def test_waiting_adds_priority(self):
+        # an hour of waiting is worth 10% of fill
+        self.queue.push(1, "Garbage", 10, 50, queued_at=0)
+        self.queue.push(2, "Garbage", 20, 55, queued_at=HOUR)
+        self.assertEqual(self.queue.pop().request_id, 1)
+        self.assertGreater(repair_queue.priority(50, 0), repair_queue.priority(55, HOUR))
+        self.assertLess(repair_queue.priority(50, 0), repair_queue.priority(65, HOUR))
+
+    def test_equal_priority_in_push_order(self):
+        for request_id in range(1, 6):
+            self.queue.push(request_id, "Garbage", request_id, 70, queued_at=0)
+        self.assertEqual([pickup.request_id for pickup in self.queue.pickups()], [1, 2, 3, 4, 5])
+
+    def test_push_replaces_the_same_pickup(self):
+        self.queue.push(1, "Garbage", 10, 20, queued_at=0)
+        self.queue.push(2, "Garbage", 20, 50, queued_at=0)
+        self.queue.push(1, "Garbage", 10, 80, queued_at=0)
+        self.assertEqual(len(self.queue), 2)
+        first = self.queue.pop()
+        self.assertEqual((first.request_id, first.load), (1, 80))
+        self.assertEqual(self.queue.pop().request_id, 2)
+        self.assertIsNone(self.queue.pop())
+
+    def test_truck_types_are_separate_pickups(self):
+        self.queue.push(1, "Garbage", 10, 20, queued_at=0)
+        self.queue.push(1, "Recycling", 10, 30, queued_at=0)
+        self.assertEqual(len(self.queue), 2)
+        self.assertIn((1, "Garbage"), self.queue)
+        self.assertIn((1, "Recycling"), self.queue)
+
+    def test_remove(self):
+        self.queue.push(1, "Garbage", 10, 90, queued_at=0)
+        self.queue.push(2, "Garbage", 20, 50, queued_at=0)
+        self.queue.remove(1, "Garbage")
+        self.queue.remove(3, "Garbage")  # not queued
+        self.assertNotIn((1, "Garbage"), self.queue)
+        self.assertEqual(len(self.queue), 1)
+        self.assertEqual(self.queue.pop().request_id, 2)
+        self.assertEqual(len(self.queue), 0)
+
+    def test_pickup_fields(self):
+        pushed = self.queue.push(7, "Organic", 42, 65, queued_at=123.5)
+        self.assertEqual(pushed, repair_queue.Pickup(7, "Organic", 42, 65, 123.5))
+        self.assertEqual(self.queue.pop(), pushed)
+
+    def test_push_stamps_the_time(self):
+        pickup = self.queue.push(1, "Garbage", 10, 50)
+        self.assertGreater(pickup.queued_at, 0)
+
+    def test_dead_entries_are_dropped(self):
+        for load in range(1000):
+            self.queue.push(1, "Garbage", 10, load % 100, queued_at=0)
+        self.assertEqual(len(self.queue), 1)
+        self.assertLess(len(self.queue.heap), 100)
+        self.assertEqual(self.queue.pop().load, 999 % 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import unittest
+
+import scratch_db  # a scratch database, imported before db
+import db
+
+
+# Unit tests of db.ScheduleFeed (the UI following the schedule table) on a database of its own,
+# written through another connection like the scheduler does.
+# Usage: python -m unittest test_schedule_feed
+
+GARBAGE, RECYCLING = db.TRUCK_TYPES.index("Garbage"), db.TRUCK_TYPES.index("Recycling")
+MONDAY, TUESDAY = db.DAYS.index("Monday"), db.DAYS.index("Tuesday")
+
+
+class ScheduleFeedTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(scratch_db.DIRECTORY, "feed.db")
+        self.connection = db.connect(self.path)
+        db.create_tables(self.connection.cursor())
+        self.connection.commit()
+        self.feed = db.ScheduleFeed(self.path)
+
+    def tearDown(self):
+        self.feed.close()
+        self.connection.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def write(self, sql, parameters=()):
+        with self.connection:
+            self.connection.execute(sql, parameters)
+
+    def add(self, request_id, house_id, truck_type=GARBAGE, day=MONDAY):
+        self.write("INSERT INTO schedule (request_id, house_id, truck_type, day) VALUES (?, ?, ?, ?)",
+                   (request_id, house_id, truck_type, day))
+
+    def test_new_rows(self):
+        self.assertEqual(self.feed.poll(), ([], True))  # the first poll starts from scratch
+        self.add(1, 10)
+        self.add(2, 11, RECYCLING, TUESDAY)
+        self.assertEqual(self.feed.poll(), ([(1, 10, GARBAGE, MONDAY, None), (2, 11, RECYCLING, TUESDAY, None)], False))
+        self.assertEqual(self.feed.poll(), ([], False))
+        self.add(3, 12)
+        self.assertEqual(self.feed.poll(), ([(3, 12, GARBAGE, MONDAY, None)], False))
+
+    def test_unscheduled_row_is_left_out(self):
+        self.add(1, 10, day=None)
+        self.assertEqual(self.feed.poll(), ([], True))
+
+    def test_row_changed_in_place(self):
+        self.add(1, 10)
+        self.add(2, 11)
+        self.feed.poll()
+        self.write("UPDATE schedule SET day = ?, truck = 'Garbage-2' WHERE request_id = 2", (TUESDAY,))
+        self.assertEqual(self.feed.poll(), ([(2, 11, GARBAGE, TUESDAY, "Garbage-2")], False))
+        self.assertEqual(self.feed.poll(), ([], False))
+
+    def test_row_unscheduled_in_place(self):
+        self.add(1, 10)
+        self.feed.poll()
+        self.write("UPDATE schedule SET day = NULL WHERE request_id = 1")
+        self.assertEqual(self.feed.poll(), ([(1, 10, GARBAGE, None, None)], False))
+
+    def test_row_scheduled_later_is_new(self):
+        # a row added without a day (e.g. by plan_week) and given one later is fetched once
+        self.add(1, 10, day=None)
+        self.add(2, 11)
+        self.feed.poll()
+        self.write("UPDATE schedule SET day = ? WHERE request_id = 1", (MONDAY,))
+        self.assertEqual(self.feed.poll(), ([(1, 10, GARBAGE, MONDAY, None)], False))
+        self.assertEqual(self.feed.poll(), ([], False))
+
+    def test_deleted_rows_restart_the_feed(self):
+        self.add(1, 10)
+        self.add(2, 11)
+        self.feed.poll()
+        self.write("DELETE FROM schedule WHERE request_id = 1")
+        rows, restarted = self.feed.poll()
+        self.assertTrue(restarted)
+        self.assertEqual(rows, [(2, 11, GARBAGE, MONDAY, None)])
+        self.assertEqual(self.feed.poll(), ([], False))
+
+    def test_changes_in_one_commit_with_new_rows(self):
+        self.add(1, 10)
+        self.feed.poll()
+        with self.connection:
+            self.connection.execute("UPDATE schedule SET day = ? WHERE request_id = 1", (TUESDAY,))
+            self.connection.execute("INSERT INTO schedule (request_id, house_id, truck_type, day) VALUES (2, 11, 0, 1)")
+        self.assertEqual(self.feed.poll(), ([(1, 10, GARBAGE, TUESDAY, None), (2, 11, GARBAGE, MONDAY, None)], False))
+
+    def test_database_in_wal_mode(self):
+        self.assertEqual(self.connection.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.add(1, 10)
+        self.connection.execute("BEGIN")  # a write in progress doesn't block the feed
+        self.connection.execute("UPDATE schedule SET day = ? WHERE request_id = 1", (TUESDAY,))
+        self.assertEqual(self.feed.poll(), ([(1, 10, GARBAGE, MONDAY, None)], True))
+        self.connection.commit()
+        self.assertEqual(self.feed.poll(), ([(1, 10, GARBAGE, TUESDAY, None)], False))
+
+
+if __name__ == "__main__":
+    unittest.main()
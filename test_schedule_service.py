@@ -0,0 +1,141 @@
+import os
+import unittest
+
+import scratch_db  # a scratch database, imported before db
+import db
+import map_import
+import schedule_service
+
+
+# Unit tests of schedule_service.ScheduleQueries: the answers, and the cached answers dropped by
+# new rows, rows changed in place, deleted rows and map changes (written through another connection).
+# Usage: python -m unittest test_schedule_service
+
+HOUSES = [(0, 0, 0), (1, 5, 0), (2, 0, 4), (3, 20, 20)]
+GARBAGE, ORGANIC = db.TRUCK_TYPES.index("Garbage"), db.TRUCK_TYPES.index("Organic")
+MONDAY, TUESDAY = db.DAYS.index("Monday"), db.DAYS.index("Tuesday")
+
+
+class ScheduleQueriesTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(scratch_db.DIRECTORY, "service.db")
+        self.connection = db.connect(self.path)
+        db.create_tables(self.connection.cursor())
+        self.connection.commit()
+        map_import.import_houses(self.connection, HOUSES, replace=True)
+        self.add(1, 1, GARBAGE, MONDAY)
+        self.add(2, 2, GARBAGE, TUESDAY)
+        self.queries = schedule_service.ScheduleQueries(self.path)
+
+    def tearDown(self):
+        self.queries.close()
+        self.connection.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def write(self, sql, parameters=()):
+        with self.connection:
+            self.connection.execute(sql, parameters)
+
+    def add(self, request_id, house_id, truck_type, day):
+        self.write("INSERT INTO schedule (request_id, house_id, truck_type, day) VALUES (?, ?, ?, ?)",
+                   (request_id, house_id, truck_type, day))
+
+    def test_answers(self):
+        self.assertEqual(self.queries.day_truck("Monday", "Garbage"),
+                         {"day": "Monday", "truck_type": "Garbage", "houses": [1], "trucks": [None]})
+        self.assertEqual(self.queries.day_truck(str(TUESDAY), GARBAGE)["houses"], [2])
+        self.assertEqual(self.queries.house(1), [{"request_id": 1, "truck_type": "Garbage", "day": "Monday",
+                                                  "truck": None, "load": None}])
+        self.assertEqual(self.queries.box(0, 0, 10, 10, day="Tuesday"),
+                         [{"house_id": 2, "x": 0, "y": 4, "truck_type": "Garbage", "day": "Tuesday", "truck": None}])
+        self.assertEqual(self.queries.box(10, 10, 30, 30), [])
+        with self.assertRaises(ValueError):
+            self.queries.day_truck("Someday", "Garbage")
+
+    def test_answers_are_cached(self):
+        answer = self.queries.day_truck("Monday", "Garbage")
+        self.assertIs(self.queries.day_truck("Monday", "Garbage"), answer)
+        self.assertIs(self.queries.house(1), self.queries.house(1))
+
+    def test_new_row(self):
+        monday, tuesday, house_1 = (self.queries.day_truck("Monday", "Garbage"),
+                                    self.queries.day_truck("Tuesday", "Garbage"), self.queries.house(1))
+        box = self.queries.box(0, 0, 10, 10)
+        self.add(3, 1, ORGANIC, MONDAY)
+        self.add(4, 3, GARBAGE, MONDAY)
+        self.assertEqual(self.queries.day_truck("Monday", "Garbage")["houses"], [1, 3])
+        self.assertIs(self.queries.day_truck("Tuesday", "Garbage"), tuesday)  # untouched
+        self.assertEqual([pickup["truck_type"] for pickup in self.queries.house(1)], ["Garbage", "Organic"])
+        self.assertEqual(len(self.queries.box(0, 0, 10, 10)), 3)
+        self.assertIsNot(self.queries.box(0, 0, 10, 10), box)
+        self.assertIsNot(monday, self.queries.day_truck("Monday", "Garbage"))
+        self.assertIsNot(house_1, self.queries.house(1))
+
+    def test_row_moved_in_place(self):
+        self.queries.day_truck("Monday", "Garbage")
+        self.queries.day_truck("Tuesday", "Garbage")
+        self.queries.house(1)
+        organic = self.queries.day_truck("Monday", "Organic")
+        self.write("UPDATE schedule SET day = ?, truck = 'Garbage-2' WHERE request_id = 1", (TUESDAY,))
+        self.assertEqual(self.queries.day_truck("Monday", "Garbage")["houses"], [])
+        self.assertEqual(self.queries.day_truck("Tuesday", "Garbage"),
+                         {"day": "Tuesday", "truck_type": "Garbage", "houses": [1, 2], "trucks": ["Garbage-2", None]})
+        self.assertEqual(self.queries.house(1)[0]["day"], "Tuesday")
+        self.assertIs(self.queries.day_truck("Monday", "Organic"), organic)  # another truck type
+
+    def test_row_unscheduled_in_place(self):
+        self.queries.house(2)
+        self.queries.box(0, 0, 10, 10)
+        self.write("UPDATE schedule SET day = NULL WHERE request_id = 2")
+        self.assertIsNone(self.queries.house(2)[0]["day"])
+        self.assertEqual([pickup["house_id"] for pickup in self.queries.box(0, 0, 10, 10)], [1])
+        self.assertEqual(self.queries.day_truck("Tuesday", "Garbage")["houses"], [])
+
+    def test_deleted_rows(self):
+        self.queries.day_truck("Monday", "Garbage")
+        self.queries.house(2)
+        self.write("DELETE FROM schedule WHERE request_id = 1")
+        self.assertEqual(self.queries.day_truck("Monday", "Garbage")["houses"], [])
+        self.assertEqual(len(self.queries.house(2)), 1)
+        self.add(5, 1, GARBAGE, MONDAY)  # followed again after the restart
+        self.assertEqual(self.queries.day_truck("Monday", "Garbage")["houses"], [1])
+
+    def test_schedule_recreated(self):
+        self.queries.day_truck("Monday", "Garbage")
+        self.write("DROP TABLE schedule")
+        db.create_schedule_table(self.connection.cursor())
+        self.connection.commit()
+        self.add(1, 2, GARBAGE, MONDAY)
+        self.assertEqual(self.queries.day_truck("Monday", "Garbage")["houses"], [2])
+
+    def test_house_moved(self):
+        self.assertEqual(len(self.queries.box(0, 0, 10, 10)), 2)
+        house_1 = self.queries.house(1)
+        self.write("UPDATE map SET x_value = 50 WHERE house_id = 1")
+        self.assertEqual([pickup["house_id"] for pickup in self.queries.box(0, 0, 10, 10)], [2])
+        self.assertEqual(self.queries.box(40, -10, 60, 10)[0]["x"], 50)
+        self.assertIs(self.queries.house(1), house_1)  # doesn't depend on the map
+
+    def test_batch(self):
+        answers = self.queries.batch([{"query": "house", "house_id": 1}, {"query": "day", "day": "Monday"},
+                                      {"query": "box", "x0": 0, "y0": 0, "x1": 10, "y1": 10, "day": MONDAY},
+                                      {"query": "route"}])
+        self.assertEqual(answers[0][0]["day"], "Monday")
+        self.assertIn("KeyError", answers[1]["error"])
+        self.assertEqual([pickup["house_id"] for pickup in answers[2]], [1])
+        self.assertIn("Unknown query", answers[3]["error"])
+
+    def test_least_recently_used_dropped_first(self):
+        self.queries.cache_size = 2
+        first = self.queries.house(1)
+        self.queries.house(2)
+        self.queries.house(1)
+        self.queries.house(3)  # drops house 2
+        self.assertEqual(list(self.queries.responses), [("house", 1), ("house", 3)])
+        self.assertIs(self.queries.house(1), first)
+
+
+if __name__ == "__main__":
+    unittest.main()
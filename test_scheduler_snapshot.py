@@ -0,0 +1,156 @@
+import os
+import unittest
+
+import scratch_db  # a scratch database, imported before db
+import db
+import map_import
+import scheduler_snapshot
+import truck_scheduler
+
+
+# Unit tests of scheduler_snapshot.py and of truck_scheduler.load_state deciding between a warm
+# start (snapshot + the rows written after it) and a cold one (full reload) when the snapshot is stale.
+# Usage: python -m unittest test_scheduler_snapshot
+
+HOUSES = [(0, 0, 0), (1, 5, 0), (2, 0, 4), (3, 0, -4)]
+DAYS = ["Monday", "Tuesday"]
+TRUCK_IDS = ["Garbage", "Garbage-2"]
+
+
+class SnapshotFileTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(scratch_db.DIRECTORY, "file.snap")
+        self.schedule = {"Monday": {"Garbage": [1, 2], "Garbage-2": []}, "Tuesday": {"Garbage": [], "Garbage-2": [3]}}
+        self.distances = {("Monday", "Garbage"): 18, ("Monday", "Garbage-2"): 0, ("Tuesday", "Garbage"): 0,
+                          ("Tuesday", "Garbage-2"): 8}
+        self.loads = {key: 100 * len(self.schedule[key[0]][key[1]]) for key in self.distances}
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def save(self, **kwargs):
+        scheduler_snapshot.save_snapshot(self.path, {house_id: (x, y) for house_id, x, y in HOUSES}, self.schedule,
+                                         self.distances, self.loads, DAYS, TRUCK_IDS, last_row_id=7, **kwargs)
+
+    def test_round_trip(self):
+        self.save(last_request_id=12, schedule_changes=3, map_changes=0)
+        snapshot = scheduler_snapshot.load_snapshot(self.path, DAYS, TRUCK_IDS)
+        self.assertEqual((snapshot.last_row_id, snapshot.last_request_id), (7, 12))
+        self.assertEqual((snapshot.schedule_changes, snapshot.map_changes), (3, 0))
+        self.assertEqual(snapshot.house_grid(), {house_id: (x, y) for house_id, x, y in HOUSES})
+        self.assertEqual({key: route.tolist() for key, route in snapshot.routes.items()},
+                         {("Monday", "Garbage"): [1, 2], ("Monday", "Garbage-2"): [], ("Tuesday", "Garbage"): [],
+                          ("Tuesday", "Garbage-2"): [3]})
+        self.assertEqual(snapshot.route_distances, self.distances)
+        self.assertEqual(snapshot.route_loads, self.loads)
+
+    def test_without_change_tracking(self):
+        self.save()
+        snapshot = scheduler_snapshot.load_snapshot(self.path, DAYS, TRUCK_IDS)
+        self.assertEqual((snapshot.schedule_changes, snapshot.map_changes), (None, None))
+
+    def test_unusable_files(self):
+        self.assertIsNone(scheduler_snapshot.load_snapshot(self.path, DAYS, TRUCK_IDS))  # missing
+        open(self.path, "wb").close()
+        self.assertIsNone(scheduler_snapshot.load_snapshot(self.path, DAYS, TRUCK_IDS))  # empty
+        self.save()
+        self.assertIsNone(scheduler_snapshot.load_snapshot(self.path, DAYS, ["Garbage"]))  # another fleet
+        with open(self.path, "rb") as snapshot_file:
+            data = snapshot_file.read()
+        for broken in (data[:-8], data[:scheduler_snapshot.HEADER.size - 1], b"XXXX" + data[4:]):
+            with open(self.path, "wb") as snapshot_file:
+                snapshot_file.write(broken)
+            self.assertIsNone(scheduler_snapshot.load_snapshot(self.path, DAYS, TRUCK_IDS))
+
+    def test_no_temp_file_left(self):
+        self.save()
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+
+@unittest.skipUnless(scratch_db.USABLE, scratch_db.SKIP_REASON)
+class LoadStateTest(unittest.TestCase):
+    def setUp(self):
+        db.create_tables(db.cursor)
+        db.conn.commit()
+        map_import.import_houses(db.conn, HOUSES, replace=True)
+        truck_scheduler.UNAVAILABLE.clear()
+        self.restart()
+        self.add_rows((1, 1, "Monday"), (2, 2, "Tuesday"))
+        truck_scheduler.save_state()
+
+    def tearDown(self):
+        db.conn.rollback()
+        if os.path.exists(truck_scheduler.SNAPSHOT_PATH):
+            os.remove(truck_scheduler.SNAPSHOT_PATH)
+
+    # the in-memory state of a scheduler process that just started
+    def restart(self):
+        truck_scheduler.HOUSE_GRID.clear()
+        for trucks in truck_scheduler.WEEKLY_SCHEDULE.values():
+            for houses in trucks.values():
+                houses.clear()
+        truck_scheduler.ROUTES.clear()
+        truck_scheduler.CAPACITY.clear()
+        return truck_scheduler.load_state()
+
+    def add_rows(self, *rows):
+        for request_id, house_id, day in rows:
+            truck_scheduler.get_route(day, "Garbage").append(house_id, 100)
+            truck_scheduler.SCHEDULE_WRITER.add(request_id, house_id, "Garbage", day)
+        truck_scheduler.SCHEDULE_WRITER.flush()
+
+    def routes(self):
+        return {day: truck_scheduler.WEEKLY_SCHEDULE[day]["Garbage"] for day in ("Monday", "Tuesday")}
+
+    def test_warm_start(self):
+        self.assertEqual(self.restart(), "warm")
+        self.assertEqual(self.routes(), {"Monday": [1], "Tuesday": [2]})
+        self.assertEqual(truck_scheduler.get_route("Monday", "Garbage").length, 10)
+        self.assertEqual(truck_scheduler.HOUSE_INDEX.coordinates(2), (0, 4))
+
+    def test_rows_after_the_snapshot_are_replayed(self):
+        self.add_rows((3, 3, "Monday"))
+        self.assertEqual(self.restart(), "warm")
+        self.assertEqual(self.routes(), {"Monday": [1, 3], "Tuesday": [2]})
+
+    def test_row_changed_in_place(self):
+        with db.conn:
+            db.conn.execute("UPDATE schedule SET day = ? WHERE request_id = 2", (db.DAYS.index("Monday"),))
+        self.assertEqual(self.restart(), "cold")
+        self.assertEqual(self.routes(), {"Monday": [1, 2], "Tuesday": []})
+
+    def test_row_deleted(self):
+        with db.conn:
+            db.conn.execute("DELETE FROM schedule WHERE request_id = 1")
+        self.assertEqual(self.restart(), "cold")
+        self.assertEqual(self.routes(), {"Monday": [], "Tuesday": [2]})
+
+    def test_schedule_recreated_and_refilled(self):
+        # new row ids start over: rows 1-3 of the new table are past the snapshot's last row (2)
+        db.cursor.execute("DROP TABLE schedule")
+        db.create_schedule_table(db.cursor)
+        db.conn.commit()
+        self.add_rows((4, 3, "Monday"), (5, 3, "Tuesday"), (6, 1, "Tuesday"))
+        self.assertEqual(self.restart(), "cold")
+        self.assertEqual(self.routes(), {"Monday": [3], "Tuesday": [3, 1]})
+
+    def test_house_moved(self):
+        with db.conn:
+            db.conn.execute("UPDATE map SET x_value = 6 WHERE house_id = 1")
+        self.assertEqual(self.restart(), "cold")
+        self.assertEqual(truck_scheduler.HOUSE_GRID[1], (6, 0))
+        self.assertEqual(truck_scheduler.get_route("Monday", "Garbage").length, 12)
+
+    def test_house_added(self):
+        map_import.import_houses(db.conn, [(4, 1, 1)])
+        self.assertEqual(self.restart(), "cold")
+        self.assertIn(4, truck_scheduler.HOUSE_INDEX)
+
+    def test_other_fleet(self):
+        snapshot = scheduler_snapshot.load_snapshot(truck_scheduler.SNAPSHOT_PATH, db.DAYS, ["Garbage"])
+        self.assertIsNone(snapshot)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+
+import scratch_db  # a scratch database, imported before db
+import db
+import map_import
+import scheduler_workers
+import truck_scheduler
+import wire_protocol
+from scheduler_workers import FULL, OPEN
+
+
+# Unit tests of the capacity hints of scheduler_workers (CapacityHints, SchedulerWorker announcements)
+# on a hand-made map with the default fleet (one truck per type).
+# Usage: python -m unittest test_scheduler_workers
+#
+# The route limit is 21, so a route is full (less than FULL_MARGIN of it left) with house 1 on it:
+#   house 1 (10, 0): tour 20   house 2 (0, 4): tour 8   both: tour 28   house 99 (50, 0): out of reach
+
+HOUSES = [(0, 0, 0), (1, 10, 0), (2, 0, 4), (99, 50, 0)]
+MAX_DISTANCE = 21
+CELL = ("Monday", "Garbage")
+KEY = scheduler_workers.routing_key("Garbage", "Monday")
+CAPACITY_KEY = scheduler_workers.capacity_key("Garbage", "Monday")
+
+
+class CapacityHintsTest(unittest.TestCase):
+    def test_full_then_open(self):
+        hints = scheduler_workers.CapacityHints()
+        self.assertNotIn(CELL, hints)
+        hints.announced(CAPACITY_KEY, FULL)
+        self.assertIn(CELL, hints)
+        hints.announced(CAPACITY_KEY, OPEN)
+        self.assertNotIn(CELL, hints)
+
+    def test_empty_body_is_full(self):
+        hints = scheduler_workers.CapacityHints()
+        hints.announced(CAPACITY_KEY, b"")
+        self.assertIn(CELL, hints)
+
+    def test_hint_expires(self):
+        hints = scheduler_workers.CapacityHints(full_for=0)
+        hints.mark_full(CELL)
+        self.assertNotIn(CELL, hints)
+        self.assertEqual(hints.until, {})
+
+    def test_routing_skips_full_cells(self):
+        hints = scheduler_workers.CapacityHints()
+        for day in ("Monday", "Tuesday"):
+            hints.mark_full((day, "Garbage"))
+        days = scheduler_workers.DAYS
+        self.assertEqual(days[scheduler_workers.next_open_day("Garbage", 1, 1, hints)], "Wednesday")
+        self.assertEqual(days[scheduler_workers.next_open_day("Organic", 1, 1, hints)], "Monday")
+        hints.mark_open(("Monday", "Garbage"))
+        self.assertEqual(days[scheduler_workers.next_open_day("Garbage", 1, 1, hints)], "Monday")
+
+
+@unittest.skipUnless(scratch_db.USABLE, scratch_db.SKIP_REASON)
+class SchedulerWorkerTest(unittest.TestCase):
+    def setUp(self):
+        db.create_tables(db.cursor)
+        db.conn.commit()
+        map_import.import_houses(db.conn, HOUSES, replace=True)
+        truck_scheduler.get_all_house_coordinates()
+        truck_scheduler.MAX_DISTANCE = MAX_DISTANCE
+        for trucks in truck_scheduler.WEEKLY_SCHEDULE.values():
+            for houses in trucks.values():
+                houses.clear()
+        truck_scheduler.ROUTES.clear()
+        truck_scheduler.CAPACITY.clear()
+        truck_scheduler.UNAVAILABLE.clear()
+        self.worker = scheduler_workers.SchedulerWorker([CELL], db.conn)
+        self.request_id = 0
+
+    def tearDown(self):
+        db.conn.rollback()
+
+    def handle(self, house_id):
+        self.request_id += 1
+        return self.worker.handle(KEY, wire_protocol.encode_truck_request(self.request_id, house_id, ["Garbage"],
+                                                                          first_day=1))
+
+    def test_rejected_far_houses_dont_fill_the_cell(self):
+        for _ in range(32):
+            forward = self.handle(99)
+            self.assertEqual(forward[0], scheduler_workers.routing_key("Garbage", "Tuesday"))
+        self.assertEqual(self.worker.announcements, [])
+        self.assertNotIn(CELL, self.worker.full_cells)
+
+    def test_cell_without_room_is_announced_full(self):
+        self.assertIsNone(self.handle(2))  # tour 8, room left
+        self.assertEqual(self.worker.announcements, [])
+        self.handle(1)  # doesn't fit next to house 2
+        self.assertEqual(self.worker.announcements, [])
+
+        truck_scheduler.get_route(*CELL).houses.clear()
+        truck_scheduler.get_route(*CELL).recompute()
+        self.assertIsNone(self.handle(1))  # tour 20 of 21
+        self.assertEqual(self.worker.announcements, [(CAPACITY_KEY, FULL)])
+        self.assertIn(CELL, self.worker.full_cells)
+        self.handle(99)
+        self.assertEqual(len(self.worker.announcements), 1)  # announced once
+
+    def test_unavailable_truck_leaves_no_room(self):
+        truck_scheduler.UNAVAILABLE.add(CELL)
+        self.handle(2)
+        self.assertEqual(self.worker.announcements, [(CAPACITY_KEY, FULL)])
+
+    def test_cell_with_room_again_is_announced_open(self):
+        self.handle(1)
+        self.worker.announcements.clear()
+        truck_scheduler.get_route(*CELL).houses.clear()  # e.g. moved away by a re-optimisation
+        truck_scheduler.get_route(*CELL).recompute()
+        self.assertIsNone(self.handle(2))
+        self.assertEqual(self.worker.announcements, [(CAPACITY_KEY, OPEN)])
+        self.assertNotIn(CELL, self.worker.full_cells)
+
+    def test_full_cell_is_announced_again_after_the_hint_expired(self):
+        self.worker.full_cells.full_for = 0
+        self.handle(1)
+        self.handle(99)
+        self.assertEqual(self.worker.announcements, [(CAPACITY_KEY, FULL)] * 2)
+
+    def test_hint_from_another_worker(self):
+        self.worker.mark_full(scheduler_workers.capacity_key("Garbage", "Tuesday"))
+        forward = self.handle(99)
+        self.assertEqual(forward[0], scheduler_workers.routing_key("Garbage", "Wednesday"))
+        self.worker.mark_full(scheduler_workers.capacity_key("Garbage", "Tuesday"), OPEN)
+        self.assertEqual(self.handle(99)[0], scheduler_workers.routing_key("Garbage", "Tuesday"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+
+import inproc_broker
+import server
+
+
+# Unit tests of server.TruckRequestPublisher on the in-process broker (inproc_broker.py).
+# Usage: python -m unittest test_server_publisher
+
+QUEUE = "Truck-Queue"
+
+
+class TruckRequestPublisherTest(unittest.TestCase):
+    def setUp(self):
+        self.broker = inproc_broker.InProcessBroker()
+        self.connection = self.broker.BlockingConnection()
+        self.publisher = server.TruckRequestPublisher(self.connection, batch_size=10, flush_interval=3600)
+
+    def tearDown(self):
+        self.publisher.close()
+
+    def queued(self):
+        bodies = []
+        while True:
+            entry = self.broker.get(QUEUE)
+            if entry is None:
+                return bodies
+            bodies.append(entry[1])
+
+    def test_batch_is_committed_together(self):
+        for body in (b"a", b"b", b"c"):
+            self.publisher.publish(body)
+        self.assertEqual(self.broker.message_count(QUEUE), 0)
+        self.publisher.flush()
+        self.assertEqual(self.queued(), [b"a", b"b", b"c"])
+        self.assertEqual(self.publisher.published, 3)
+
+    def test_failed_commit_is_rolled_back(self):
+        # the batch is published, the commit fails: the next flush must not commit it twice
+        channel = self.publisher.channel
+        commit = channel.tx_commit
+
+        def failing_commit():
+            channel.tx_commit = commit
+            raise RuntimeError("connection reset")
+        channel.tx_commit = failing_commit
+        self.publisher.publish(b"a")
+        self.publisher.publish(b"b")
+        with self.assertRaises(RuntimeError):
+            self.publisher.flush()
+        self.assertEqual(self.broker.message_count(QUEUE), 0)
+        self.assertEqual(len(self.publisher.pending), 2)
+
+        self.publisher.flush()
+        self.assertEqual(self.queued(), [b"a", b"b"])
+
+    def test_failed_rollback_reopens_the_channel(self):
+        channel = self.publisher.channel
+
+        def failing(*arguments, **kwargs):
+            raise RuntimeError("channel closed by the broker")
+        channel.tx_commit = channel.tx_rollback = failing
+        self.publisher.publish(b"a")
+        with self.assertRaises(RuntimeError):
+            self.publisher.flush()
+        self.assertIsNot(self.publisher.channel, channel)
+        self.assertFalse(channel.is_open)
+
+        self.publisher.flush()
+        self.assertEqual(self.queued(), [b"a"])
+
+    def test_consumed_reports_are_acked_after_the_commit(self):
+        acks = []
+
+        class ConsumerChannel:
+            def basic_ack(self, delivery_tag, multiple=False):
+                acks.append((delivery_tag, multiple))
+        self.publisher.publish(b"a")
+        self.publisher.ack_after_flush(ConsumerChannel(), 7)
+        self.assertEqual(acks, [])
+        self.publisher.flush()
+        self.assertEqual(acks, [(7, True)])
+
+
+if __name__ == "__main__":
+    unittest.main()
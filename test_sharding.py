@@ -0,0 +1,97 @@
+import os
+import unittest
+
+import scratch_db  # a scratch database, imported before db
+import coordinate_cache
+import db
+import map_import
+import shard_scheduler
+import sharding
+import truck_scheduler
+import wire_protocol
+
+
+# Unit tests of the sharded scheduler: houses that reach the coordinator (HandoffCoordinator) or a
+# shard (ShardScheduler) after their map was read.
+# Usage: python -m unittest test_sharding
+
+HOUSES = [(0, 0, 0), (1, 2, 0), (2, 0, 3)]
+TILE_SIZE = 10
+TILES = [(0, 0), (1, 0)]
+
+
+class HandoffCoordinatorTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(scratch_db.DIRECTORY, "coordinator.db")
+        self.connection = db.connect(self.path)
+        db.create_tables(self.connection.cursor())
+        self.connection.commit()
+        map_import.import_houses(self.connection, HOUSES, replace=True)
+        self.coordinates = coordinate_cache.CoordinateCache(self.path, check_interval=3600)
+        house_grid = {house_id: (x, y) for house_id, x, y in HOUSES}
+        self.coordinator = sharding.HandoffCoordinator(TILES, TILE_SIZE, house_grid, coordinates=self.coordinates)
+
+    def tearDown(self):
+        self.coordinates.close()
+        self.connection.close()
+        os.remove(self.path)
+
+    def dispatch(self, house_id):
+        return self.coordinator.dispatch(wire_protocol.encode_truck_request(1, house_id, ["Garbage"]))
+
+    def test_house_imported_after_start(self):
+        map_import.import_houses(self.connection, [(7, 15, 0)])
+        routing_key, body = self.dispatch(7)
+        self.assertEqual(routing_key, sharding.routing_key((1, 0)))
+        shard_request = wire_protocol.decode_shard_request(body)
+        self.assertEqual((shard_request.x, shard_request.y), (15, 0))
+
+    def test_house_not_on_any_map(self):
+        with self.assertRaises(wire_protocol.MessageFormatError):
+            self.dispatch(8)
+
+    def test_without_coordinates(self):
+        self.coordinator.coordinates = None
+        map_import.import_houses(self.connection, [(7, 15, 0)])
+        with self.assertRaises(wire_protocol.MessageFormatError):
+            self.dispatch(7)
+
+
+@unittest.skipUnless(scratch_db.USABLE, scratch_db.SKIP_REASON)
+class ShardSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        db.create_tables(db.cursor)
+        db.conn.commit()
+        map_import.import_houses(db.conn, HOUSES, replace=True)
+        truck_scheduler.get_all_house_coordinates()
+        truck_scheduler.MAX_DISTANCE = 100
+        for trucks in truck_scheduler.WEEKLY_SCHEDULE.values():
+            for houses in trucks.values():
+                houses.clear()
+        truck_scheduler.ROUTES.clear()
+        truck_scheduler.CAPACITY.clear()
+        truck_scheduler.UNAVAILABLE.clear()
+        self.scheduler = shard_scheduler.ShardScheduler((0, 0))
+
+    def tearDown(self):
+        truck_scheduler.SCHEDULE_WRITER.rows.clear()
+        db.conn.rollback()
+
+    def test_handed_off_house_is_scheduled(self):
+        request = wire_protocol.encode_truck_request(1, 7, ["Garbage"], first_day=1)
+        handoff = self.scheduler.handle(wire_protocol.encode_shard_request(request, 4, 4, hop=1, last=True))
+        self.assertIsNone(handoff)
+        self.assertEqual(self.scheduler.foreign_houses, 1)
+        self.assertEqual(truck_scheduler.HOUSE_GRID[7], (4, 4))
+        self.assertIn(7, truck_scheduler.HOUSE_INDEX)
+        self.assertEqual(truck_scheduler.HOUSE_INDEX.coordinates(7), (4, 4))
+        self.assertEqual(truck_scheduler.WEEKLY_SCHEDULE["Monday"]["Garbage"], [7])
+        self.assertEqual(db.conn.execute("SELECT x_value, y_value FROM map WHERE house_id = 7").fetchone(), (4, 4))
+
+    def test_own_change_doesnt_reload_the_map(self):
+        truck_scheduler.add_house(7, 4, 4)
+        self.assertFalse(truck_scheduler.refresh_map())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+
+import route_optimizer
+import week_planner
+
+
+# Unit tests of week_planner.plan_week on a hand-made map (Manhattan distances, no HouseIndex).
+# Usage: python -m unittest test_week_planner
+
+# house 0 is the base, house 10 a second depot far to the east
+HOUSES = {0: (0, 0), 1: (2, 0), 2: (0, 3), 3: (-2, 0), 4: (0, -3), 10: (40, 0), 11: (42, 0)}
+DAYS = ["Monday", "Tuesday"]
+
+
+def distance(house_1, house_2):
+    (x1, y1), (x2, y2) = HOUSES[house_1], HOUSES[house_2]
+    return abs(x1 - x2) + abs(y1 - y2)
+
+
+def plan(requests, max_distance=20, trucks=("Garbage",), **kwargs):
+    return week_planner.plan_week(requests, distance, max_distance, DAYS, ["Garbage"], time_budget=0,
+                                  trucks={"Garbage": list(trucks)}, **kwargs)
+
+
+class PlanWeekTest(unittest.TestCase):
+    def test_every_request_is_placed(self):
+        requests = [(1, "Garbage"), (2, "Garbage"), (3, "Garbage"), (4, "Garbage")]
+        report = plan(requests)
+        self.assertEqual(report["unscheduled"], [])
+        self.assertEqual(sorted(house for trucks in report["schedule"].values() for route in trucks.values()
+                                for house in route), [1, 2, 3, 4])
+        for (house_id, _), (day, truck_id) in zip(requests, report["placements"]):
+            self.assertIn(house_id, report["schedule"][day][truck_id])
+        self.assertLess(max(route_optimizer.tour_length(route, distance)
+                            for trucks in report["schedule"].values() for route in trucks.values()), 20)
+
+    def test_unavailable_route_stays_empty(self):
+        requests = [(1, "Garbage"), (2, "Garbage"), (3, "Garbage"), (4, "Garbage")]
+        report = plan(requests, trucks=("Garbage", "Garbage-2"), unavailable={("Monday", "Garbage")})
+        self.assertEqual(report["schedule"]["Monday"]["Garbage"], [])
+        self.assertNotIn(("Monday", "Garbage"), report["placements"])
+        self.assertEqual(report["unscheduled"], [])
+
+    def test_every_route_unavailable(self):
+        report = plan([(1, "Garbage")], unavailable={(day, "Garbage") for day in DAYS})
+        self.assertEqual(report["placements"], [None])
+        self.assertEqual(report["unscheduled"], [("Garbage", 1)])
+
+    def test_truck_with_its_own_depot(self):
+        # house 11 is out of reach from the base, the second truck starts next to it
+        report = plan([(1, "Garbage"), (11, "Garbage")], trucks=("Garbage", "Garbage-2"),
+                      limits={"Garbage-2": (10, 20, float("inf"))})
+        self.assertEqual(report["unscheduled"], [])
+        self.assertEqual(report["placements"][1][1], "Garbage-2")
+        self.assertEqual(report["distance"], 2 * 2 + 2 * 2)
+
+    def test_truck_with_its_own_limits(self):
+        # the first truck carries 50 at most and drives 5 at most, the second one has no limits
+        report = plan([(1, "Garbage"), (2, "Garbage")], trucks=("Garbage", "Garbage-2"), loads=[80, 10],
+                      limits={"Garbage": (0, 5, 50)})
+        placements = dict(zip([1, 2], report["placements"]))
+        self.assertEqual(placements[1][1], "Garbage-2")  # too heavy for the first truck
+        self.assertEqual(placements[2][1], "Garbage-2")  # its tour (6) is too long for the first truck
+        self.assertEqual(report["unscheduled"], [])
+
+    def test_house_asked_for_twice(self):
+        # two bins of 60: one route can't carry both, each request gets its own stop
+        report = plan([(1, "Garbage"), (1, "Garbage")], loads=[60, 60], max_load=100)
+        self.assertEqual(report["unscheduled"], [])
+        first, second = report["placements"]
+        self.assertNotEqual(first, second)
+        self.assertEqual([report["schedule"][day][truck_id] for day, truck_id in (first, second)], [[1], [1]])
+
+    def test_repeat_that_fits_nowhere(self):
+        report = plan([(1, "Garbage"), (1, "Garbage"), (1, "Garbage")], loads=[60, 60, 60], max_load=100)
+        self.assertEqual(report["placements"][2], None)
+        self.assertEqual(report["unscheduled"], [("Garbage", 1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import unittest
+
+import wire_protocol
+from wire_protocol import MessageFormatError
+
+
+# Unit tests of the wire format: round trips of every message type and decoding of older versions.
+# Usage: python -m unittest test_wire_protocol
+
+TRACE = (0x1234567890, [1700000000000000000, 1700000000000500000])
+
+
+class GarbageReportTest(unittest.TestCase):
+    def test_round_trip(self):
+        body = wire_protocol.encode_garbage_report(7, 42, [85, 40, 90], {"x": 3, "y": -4}, 1700000000.5, TRACE)
+        report = wire_protocol.decode_garbage_report(body)
+        self.assertEqual(report, wire_protocol.GarbageReport(7, 42, [85, 40, 90], {"x": 3, "y": -4}, 1700000000.5, TRACE))
+
+    def test_fixed_size_without_trace(self):
+        body = wire_protocol.encode_garbage_report(1, 5, [0, 0, 100])
+        self.assertEqual(len(body), wire_protocol.GARBAGE_REPORT_FORMAT.size)
+        report = wire_protocol.decode_garbage_report(body)
+        self.assertEqual(report.location, {"x": -1, "y": -1})
+        self.assertIsNone(report.trace)
+
+    def test_invalid_levels(self):
+        with self.assertRaises(MessageFormatError):
+            wire_protocol.encode_garbage_report(1, 5, [101, 0, 0])
+        with self.assertRaises(MessageFormatError):
+            wire_protocol.encode_garbage_report(1, 5, [10, 20])
+
+    def test_large_house_id(self):
+        body = wire_protocol.encode_garbage_report(1, 10 ** 12, [10, 20, 30])
+        self.assertEqual(wire_protocol.decode_garbage_report(body).house_id, 10 ** 12)
+
+    def test_version_1(self):
+        # queued before house ids were widened: 32 bytes, 32-bit house id
+        body = wire_protocol.GARBAGE_REPORT_V1_FORMAT.pack(1, wire_protocol.GARBAGE_REPORT, 85, 40, 90, 42, 7, 3, -4,
+                                                           1700000000.5)
+        self.assertEqual(len(body), 32)
+        report = wire_protocol.decode_garbage_report(body)
+        self.assertEqual(report, wire_protocol.GarbageReport(7, 42, [85, 40, 90], {"x": 3, "y": -4}, 1700000000.5))
+
+    def test_wrong_type(self):
+        body = wire_protocol.encode_garbage_report(1, 5, [10, 20, 30])
+        body = bytes([body[0], wire_protocol.TRUCK_AVAILABILITY]) + body[2:]
+        with self.assertRaisesRegex(MessageFormatError, "type"):
+            wire_protocol.decode_garbage_report(body)
+
+
+class TruckRequestTest(unittest.TestCase):
+    def test_round_trip(self):
+        body = wire_protocol.encode_truck_request(2 ** 40, 42, ["Garbage", "Organic"], TRACE, 3, [80, 0, 95])
+        request = wire_protocol.decode_truck_request(body)
+        self.assertEqual(request, wire_protocol.TruckRequest(2 ** 40, 42, ["Garbage", "Organic"], TRACE, 3, [80, 0, 95]))
+
+    def test_defaults(self):
+        request = wire_protocol.decode_truck_request(wire_protocol.encode_truck_request(1, 5, ["Recycling"]))
+        self.assertEqual((request.first_day, request.loads, request.trace), (0, [0, 0, 0], None))
+
+    def test_every_truck_combination(self):
+        for trucks in wire_protocol.FLAG_TRUCKS[1:]:
+            body = wire_protocol.encode_truck_request(1, 5, list(trucks))
+            self.assertEqual(wire_protocol.decode_truck_request(body).trucks_needed, list(trucks))
+
+    def test_large_house_id(self):
+        body = wire_protocol.encode_truck_request(1, 10 ** 12, ["Garbage"], loads=[90, 0, 0])
+        self.assertEqual(wire_protocol.decode_truck_request(body).house_id, 10 ** 12)
+        with self.assertRaises(MessageFormatError):
+            wire_protocol.encode_truck_request(1, 2 ** 64, ["Garbage"])
+
+    def test_version_2(self):
+        # queued before house ids were widened: 20 bytes, 32-bit house id
+        flags = wire_protocol.trucks_to_flags(["Garbage"])
+        body = wire_protocol.TRUCK_REQUEST_V2_FORMAT.pack(2, wire_protocol.TRUCK_REQUEST, flags, 1, 42, 99, 80, 0, 0)
+        self.assertEqual(len(body), 20)
+        request = wire_protocol.decode_truck_request(body)
+        self.assertEqual(request, wire_protocol.TruckRequest(99, 42, ["Garbage"], None, 1, [80, 0, 0]))
+
+    def test_version_1(self):
+        # queued before the loads were added: 16 bytes, decoded with loads None
+        flags = wire_protocol.trucks_to_flags(["Garbage", "Recycling"])
+        body = wire_protocol.TRUCK_REQUEST_V1_FORMAT.pack(1, wire_protocol.TRUCK_REQUEST, flags, 2, 42, 99)
+        self.assertEqual(len(body), 16)
+        request = wire_protocol.decode_truck_request(body)
+        self.assertEqual(request, wire_protocol.TruckRequest(99, 42, ["Garbage", "Recycling"], None, 2, None))
+
+    def test_version_1_with_trace(self):
+        flags = wire_protocol.trucks_to_flags(["Organic"])
+        body = wire_protocol.TRUCK_REQUEST_V1_FORMAT.pack(1, wire_protocol.TRUCK_REQUEST, flags, 0, 42, 99)
+        body += wire_protocol._pack_trace(TRACE)
+        request = wire_protocol.decode_truck_request(body)
+        self.assertEqual((request.trucks_needed, request.trace, request.loads), (["Organic"], TRACE, None))
+
+    def test_unknown_version(self):
+        body = bytearray(wire_protocol.encode_truck_request(1, 5, ["Garbage"]))
+        body[0] = wire_protocol.TRUCK_REQUEST_VERSION + 1
+        with self.assertRaisesRegex(MessageFormatError, "version"):
+            wire_protocol.decode_truck_request(bytes(body))
+
+    def test_invalid_fields(self):
+        with self.assertRaises(MessageFormatError):
+            wire_protocol.encode_truck_request(1, 5, [])
+        with self.assertRaises(MessageFormatError):
+            wire_protocol.encode_truck_request(1, 5, ["Compost"])
+        with self.assertRaises(MessageFormatError):
+            wire_protocol.encode_truck_request(1, 5, ["Garbage"], first_day=7)
+        with self.assertRaises(MessageFormatError):
+            wire_protocol.encode_truck_request(1, 5, ["Garbage"], loads=[10, 120, 0])
+        with self.assertRaises(MessageFormatError):
+            wire_protocol.encode_truck_request(1, -5, ["Garbage"])
+
+    def test_malformed_bodies(self):
+        body = wire_protocol.encode_truck_request(1, 5, ["Garbage"], TRACE)
+        for malformed in (b"", b"\x02", body[:10], body[:-1], body + b"\x00"):
+            with self.assertRaises(MessageFormatError):
+                wire_protocol.decode_truck_request(malformed)
+        no_trucks = bytearray(wire_protocol.encode_truck_request(1, 5, ["Garbage"]))
+        no_trucks[2] = 0
+        with self.assertRaisesRegex(MessageFormatError, "flags"):
+            wire_protocol.decode_truck_request(bytes(no_trucks))
+
+
+class ShardRequestTest(unittest.TestCase):
+    def test_round_trip(self):
+        truck_request = wire_protocol.encode_truck_request(3, 42, ["Organic"], TRACE, 1, [0, 0, 70])
+        shard_request = wire_protocol.decode_shard_request(wire_protocol.encode_shard_request(truck_request, -10, 20, 2, True))
+        self.assertEqual((shard_request.x, shard_request.y, shard_request.hop, shard_request.last), (-10, 20, 2, True))
+        self.assertEqual(shard_request.body, truck_request)
+        self.assertEqual(shard_request.request, wire_protocol.decode_truck_request(truck_request))
+
+    def test_wrong_version(self):
+        body = bytearray(wire_protocol.encode_shard_request(wire_protocol.encode_truck_request(3, 42, ["Organic"]), 0, 0))
+        body[0] = wire_protocol.SHARD_REQUEST_VERSION + 1
+        with self.assertRaises(MessageFormatError):
+            wire_protocol.decode_shard_request(bytes(body))
+
+
+class TruckAvailabilityTest(unittest.TestCase):
+    def test_round_trip(self):
+        for truck_id, day, available in (("Garbage-2", 3, False), (None, None, True), ("Organic", None, False)):
+            body = wire_protocol.encode_truck_availability(truck_id, day, available)
+            self.assertEqual(wire_protocol.decode_truck_availability(body),
+                             wire_protocol.TruckAvailability(truck_id, day, available))
+
+    def test_invalid(self):
+        with self.assertRaises(MessageFormatError):
+            wire_protocol.encode_truck_availability("Garbage", 7)
+        body = wire_protocol.encode_truck_availability("Garbage", 1)
+        with self.assertRaises(MessageFormatError):
+            wire_protocol.decode_truck_availability(body[:-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+
+import pika
+
+import asyncio_transport
+import inproc_broker
+
+
+# Broker connections of the pipeline stages (client, server, truck scheduler, workers, shards).
+# The backend is chosen with the WASTE_TRANSPORT environment variable:
+# - "pika" (default): pika.BlockingConnection, one blocking round trip per call
+# - "asyncio": asyncio_transport.py, pika's asyncio adapter, consumers pipeline their publisher confirms
+# - "inproc": inproc_broker.py, one in-memory broker shared by every connection of the process, so the
+#   whole client -> server -> scheduler pipeline can run in one process without RabbitMQ
+# and the broker's host with WASTE_BROKER_HOST (localhost by default).
+# All three give connections with the same BlockingConnection / BlockingChannel API, stage code
+# doesn't know which one it got.
+
+TRANSPORTS = ("pika", "asyncio", "inproc")
+TRANSPORT = os.environ.get("WASTE_TRANSPORT", "pika")
+BROKER_HOST = os.environ.get("WASTE_BROKER_HOST", "localhost")
+
+# the in-process broker, created by the first "inproc" connection (or set with use())
+BROKER = None
+
+
+# switches the backend of the connections opened from now on, broker: the InProcessBroker to use
+def use(transport, broker=None):
+    global TRANSPORT, BROKER
+    if transport not in TRANSPORTS:
+        raise ValueError(f"Unknown transport '{transport}', expected one of {', '.join(TRANSPORTS)}")
+    TRANSPORT = transport
+    if broker is not None:
+        BROKER = broker
+
+
+def in_process_broker():
+    global BROKER
+    if BROKER is None:
+        BROKER = inproc_broker.InProcessBroker()
+    return BROKER
+
+
+def connect(host=None):
+    parameters = pika.ConnectionParameters(host=host or BROKER_HOST)
+    if TRANSPORT == "pika":
+        return pika.BlockingConnection(parameters)
+    if TRANSPORT == "asyncio":
+        return asyncio_transport.BlockingConnection(parameters)
+    if TRANSPORT == "inproc":
+        return in_process_broker().BlockingConnection(parameters)
+    raise ValueError(f"Unknown transport '{TRANSPORT}' in WASTE_TRANSPORT, expected one of {', '.join(TRANSPORTS)}")
@@ -1,80 +1,268 @@
 import math
+import os
+import sys
+import time
 import pika
 from db import cursor
 from db import conn
-import re
+import db
+import fleet
+import metrics
+import reliable_delivery
+import repair_queue
+import route_optimizer
+import transport
+import wire_protocol
+from house_index import HouseIndex
+import scheduler_snapshot
+import week_planner
 
 
 #global variable for the max distance a truck can travel in a day
-MAX_DISTANCE = 15
+#(routes are closed tours, so this includes the drive back to base)
+#used for the trucks in FLEET that don't set their own max_distance
+MAX_DISTANCE = 30
+
+#the trucks that go out every day by id (see fleet.py, set with WASTE_FLEET)
+#without a fleet file there is one truck per type, its id is the type name
+FLEET = {truck.truck_id: truck for truck in fleet.load_fleet()}
+
+#at most this many trucks of a type are probed on a day before moving on to the next day
+FLEET_PROBES = 16
+
+#time (in seconds) the route optimiser can spend re-optimising the week
+OPTIMISE_TIME_BUDGET = 0.5
+
+#a request that fits nowhere asks for a re-optimisation of the week (OPTIMISE_DUE), run from the
+#timer at most once every OPTIMISE_INTERVAL seconds instead of inside the request (see optimise_when_due)
+OPTIMISE_INTERVAL = 5
+OPTIMISE_DUE = False
+LAST_OPTIMISED_AT = None
 
 #stores the locations of all the houses
 HOUSE_GRID = {}
 
+#array-backed index over HOUSE_GRID for batched distances, built when the map is loaded
+HOUSE_INDEX = None
+
+#map_version.changes HOUSE_GRID was loaded at and the PRAGMA data_version of the last check (see refresh_map)
+MAP_CHANGES = None
+MAP_DATA_VERSION = None
+
+#snapshot of HOUSE_GRID / WEEKLY_SCHEDULE used for fast restarts (see scheduler_snapshot.py)
+SNAPSHOT_PATH = os.environ.get("WASTE_SNAPSHOT_PATH", "scheduler_state.snap")
+
+#a new snapshot is written after this many requests, or SNAPSHOT_INTERVAL seconds after the last one
+SNAPSHOT_EVERY = 1000
+SNAPSHOT_INTERVAL = 60
+
+#last request applied to WEEKLY_SCHEDULE and progress since the last snapshot
+LAST_REQUEST_ID = 0
+REQUESTS_SINCE_SNAPSHOT = 0
+LAST_SNAPSHOT_AT = time.monotonic()
+
+#unacked requests in flight: they are acked per committed batch of schedule rows, so a batch has to fit
+PREFETCH_COUNT = db.WRITE_BATCH_SIZE * 2
+
+#retries / dead-letters the requests the listener fails on (see reliable_delivery.py), None when standalone
+DELIVERY_GUARD = None
+
+#(day, truck id) pairs taken out of service (see set_availability), nothing is placed on them
+UNAVAILABLE = set()
+
+#pickups waiting for a place: requests no route could take and pickups displaced from an
+#unavailable truck / day, fullest bins and longest waits first (see repair_queue.py)
+PENDING = repair_queue.PendingQueue()
+
+#time each pickup that waited in PENDING (or was displaced) was first queued, by (request_id, truck type),
+#kept once it is placed: displaced again, it keeps its age instead of queueing from scratch
+QUEUED_AT = {}
+
+#time (in seconds) one repair pass of PENDING can spend
+REPAIR_TIME_BUDGET = 0.05
+
+#set when routes got shorter (re-optimised week) or a repair pass ran out of time while still
+#placing pickups, PENDING is repaired (again) at the next timer tick
+REPAIR_DUE = False
+
+#a pickup that fits nowhere may take the place of a pickup of lower priority, which is placed
+#elsewhere the same way: at most this many pickups are displaced in a row (an ejection chain)
+MAX_EJECTIONS = 3
+
+#priority (see repair_queue.py) a pickup needs over the one it displaces, so pickups of about the
+#same fill level don't keep displacing each other (10% = an hour of waiting)
+EJECTION_MARGIN = 10
+
+#cheapest ejection moves (over every route of the type) checked against the loads / priorities
+EJECTION_CANDIDATES = 32
+
+#operators mark trucks / days unavailable with messages on this queue (see wire_protocol.py)
+CONTROL_QUEUE = 'Fleet-Control-Queue'
+
+#routes at least this long use HOUSE_INDEX to price every insertion position in one batch
+VECTORISE_MIN_ROUTE = 64
+
 #stores the weekly schedule with each index including
-# 1. the truck type involved in the pickup
+# 1. the truck involved in the pickup (its id in FLEET)
 # 2. the house being picked up from
-# Create a dictionary to store the schedule by day and truck type
-WEEKLY_SCHEDULE = {
-    "Sunday": {"Garbage": [], "Recycling": [], "Organic": []},
-    "Monday": {"Garbage": [], "Recycling": [], "Organic": []},
-    "Tuesday": {"Garbage": [], "Recycling": [], "Organic": []},
-    "Wednesday": {"Garbage": [], "Recycling": [], "Organic": []},
-    "Thursday": {"Garbage": [], "Recycling": [], "Organic": []},
-    "Friday": {"Garbage": [], "Recycling": [], "Organic": []},
-    "Saturday": {"Garbage": [], "Recycling": [], "Organic": []},
-}
+# Create a dictionary to store the schedule by day and truck
+WEEKLY_SCHEDULE = {day: {truck_id: [] for truck_id in FLEET} for day in db.DAYS}
 # set up the connection to RabbitMQ and initizalizes the channels being used
 def setup_rabbitmq():
-    connection = pika.BlockingConnection(pika.ConnectionParameters(host='localhost'))
+    connection = transport.connect()
     channel = connection.channel()
     channel.queue_declare(queue='Truck-Queue', durable=True) #added true because of server
     return connection, channel
 
-# set up listening to the Truck Queue
-def run_rabbitmq_listener():
+# set up listening to the Truck Queue, returns (connection, channel) for the caller to run
+# requests are acked once their schedule rows are committed, failing ones are retried / dead-lettered
+def start_rabbitmq_listener():
+    global DELIVERY_GUARD
     connection, channel = setup_rabbitmq()
-    channel.basic_consume(queue='Truck-Queue', on_message_callback=rabbitmq_callback, auto_ack=True)
+    metrics.start_from_env("Truck Scheduler")
+    publish_channel = connection.channel()
+    publish_channel.confirm_delivery()
+    DELIVERY_GUARD = reliable_delivery.DeliveryGuard(publish_channel, "Truck Scheduler")
+    channel.basic_qos(prefetch_count=PREFETCH_COUNT)
+    channel.basic_consume(queue='Truck-Queue', on_message_callback=rabbitmq_callback)
+    channel.queue_declare(queue=CONTROL_QUEUE, durable=True)
+    channel.basic_consume(queue=CONTROL_QUEUE, on_message_callback=control_callback)
+    flush_schedule_writer_periodically(connection)
+    return connection, channel
+
+def run_rabbitmq_listener():
+    connection, channel = start_rabbitmq_listener()
     print("[Truck Scheduler] Listening for requested trucks...")
     channel.start_consuming()
 
 # callback function to process trucks from the Truck Queue
+# without the listener's DELIVERY_GUARD (standalone, auto_ack) malformed requests are just dropped
 def rabbitmq_callback(ch, method, properties, body):
-    message = body.decode()
-    print(f"📥 [Truck Scheduler] Received message from Truck-Queue: {message}")  # Debugging print
-    """Extracts request ID, house ID, and trucks needed from the message string."""
-
-    # Regular expression to capture request ID, house ID, and truck types
-    match = re.match(r"Request ID:\s*(\d+),\s*House ID:\s*(\d+),\s*Truck Needed:\s*(.*)", message)
+    if DELIVERY_GUARD is None:
+        try:
+            schedule_truck_request(body)
+        except wire_protocol.MessageFormatError as error:
+            print(f"[Truck Scheduler] Dropped malformed message from Truck-Queue: {error}")
+        return
+    retried = reliable_delivery.attempts_of(properties) > 0
+    DELIVERY_GUARD.handle(method, properties, body, lambda body: schedule_truck_request(body, retried))
+    ack_when_committed(ch, method.delivery_tag)
 
-    if not match:
-        raise ValueError("Invalid message format")
+# callback function for the Fleet-Control-Queue: a truck / day taken out of (or back into) service
+# unknown trucks can't be fixed by retrying, they are dead-lettered like malformed messages
+def control_callback(ch, method, properties, body):
+    def apply(body):
+        change = wire_protocol.decode_truck_availability(body)
+        if change.truck_id is not None and change.truck_id not in FLEET:
+            raise wire_protocol.MessageFormatError(f"Unknown truck {change.truck_id}")
+        set_availability(change.truck_id, None if change.day is None else db.DAYS[change.day], change.available)
+    DELIVERY_GUARD.handle(method, properties, body, apply)
+    ack_when_committed(ch, method.delivery_tag)
 
-    request_id = int(match.group(1))  # Extract and convert request ID
-    house_id = int(match.group(2))  # Extract and convert house ID
-    trucks_needed = [truck.strip() for truck in match.group(3).split(",")]  # Split truck list and remove spaces
+# schedules the pickups of one truck request and writes their rows
+# a retried request may already be (partly) in the schedule table: those truck types are skipped
+def schedule_truck_request(body, retried=False):
+    request = wire_protocol.decode_truck_request(body)
+    print(f"📥 [Truck Scheduler] Received message from Truck-Queue: {request}")  # Debugging print
+    request_id, house_id, trucks_needed, trace, first_day, loads = request
+    refresh_map()
+    if retried:
+        SCHEDULE_WRITER.flush()
+        done = db.scheduled_truck_types(conn, request_id)
+        trucks_needed = [truck for truck in trucks_needed if db.TRUCK_TYPES.index(truck) not in done]
+        if not trucks_needed:
+            return
+    received_at = metrics.stamp(trace)
+    metrics.METRICS.observe_trace("truck_publish->scheduler_receive", trace, metrics.TRUCK_PUBLISH)
+    metrics.METRICS.count("scheduler.requests")
     days_scheduled = list()
-    for truck in trucks_needed:
-        day = schedule_truck_route(house_id, truck)
+    trucks_scheduled = list()
+    pickup_loads = [request_load(loads, truck) for truck in trucks_needed]
+    for truck, load in zip(trucks_needed, pickup_loads):
+        day, truck_id = schedule_pickup(house_id, truck, first_day=first_day, load=load)
         if day == 0:
             print("Could not find day to schedule truck, reached max cap for weekly schedule...")
             day = "N/A"
+            PENDING.push(request_id, truck, house_id, load)  # placed by a later repair pass
         days_scheduled.append(day)
+        trucks_scheduled.append(truck_id)
+    metrics.METRICS.observe_us("scheduler_receive->scheduled", (metrics.stamp(trace) - received_at) / 1000)
+
+    if trace is not None:
+        TRACES_AWAITING_COMMIT.append(trace)
+    publish_truck_info_to_queue(request_id, house_id, trucks_needed,days_scheduled, trucks_scheduled, pickup_loads)
+
+    global LAST_REQUEST_ID, REQUESTS_SINCE_SNAPSHOT
+    LAST_REQUEST_ID = request_id
+    REQUESTS_SINCE_SNAPSHOT += 1
+    maybe_save_state()
 
-    publish_truck_info_to_queue(request_id, house_id, trucks_needed,days_scheduled)
+#load of the pickup for one truck type from a request's bin loads (0 or no loads = unknown, a full bin)
+def request_load(loads, truck_type):
+    load = loads[db.TRUCK_TYPES.index(truck_type)] if loads else 0
+    return load or fleet.FULL_BIN_LOAD
 
-#changed this up to convert to string not lists because SQLite3 can't handle lists
-def publish_truck_info_to_queue(request_id, house_id, truck_type, days_visiting):
-    # Convert lists to comma-separated strings
-    truck_type_str = ", ".join(truck_type) if isinstance(truck_type, list) else truck_type
-    days_visiting_str = ", ".join(days_visiting) if isinstance(days_visiting, list) else days_visiting
+
+#writes one schedule row per truck type through the batching writer (see db.ScheduleWriter)
+#days that could not be scheduled ("N/A") are stored as NULL
+#truck_ids / loads: the truck of the fleet each pickup went to and its load (None if not scheduled)
+def publish_truck_info_to_queue(request_id, house_id, truck_type, days_visiting, truck_ids=None, loads=None):
+    truck_list = truck_type if isinstance(truck_type, list) else [truck_type]
+    day_list = days_visiting if isinstance(days_visiting, list) else [days_visiting]
+    truck_ids = truck_ids or [None] * len(truck_list)
+    loads = loads or [None] * len(truck_list)
 
     # Insert data into schedule table
-    cursor.execute("INSERT INTO schedule (request_id, house_id, truck_type, day_visiting) VALUES (?, ?, ?, ?)",
-                   (request_id, house_id, truck_type_str, days_visiting_str))
-    conn.commit()
-    print(f"[Truck Scheduler] Inserted into schedule: Request ID {request_id}, House {house_id}, Trucks {truck_type_str}, Days {days_visiting_str}")
+    for truck, day, truck_id, load in zip(truck_list, day_list, truck_ids, loads):
+        SCHEDULE_WRITER.add(request_id, house_id, truck, day, truck_id, load)
+    print(f"[Truck Scheduler] Inserted into schedule: Request ID {request_id}, House {house_id}, Trucks {truck_list}, Days {day_list}")
+
 
+#traces of the requests whose rows are still buffered in SCHEDULE_WRITER
+TRACES_AWAITING_COMMIT = []
+
+#(channel, delivery tag) of the last request handled, acked (with every one before it) once its rows are committed
+PENDING_ACK = None
+
+
+def ack_when_committed(channel, delivery_tag):
+    global PENDING_ACK
+    PENDING_ACK = (channel, delivery_tag)
+    if not SCHEDULE_WRITER.rows:
+        ack_committed()
+
+
+def ack_committed():
+    global PENDING_ACK
+    if PENDING_ACK is not None:
+        channel, delivery_tag = PENDING_ACK
+        PENDING_ACK = None
+        channel.basic_ack(delivery_tag=delivery_tag, multiple=True)
+
+
+#records the commit latencies of the requests written by the last batch
+def on_schedule_commit(rows):
+    committed_at = time.time_ns()
+    for trace in TRACES_AWAITING_COMMIT:
+        metrics.METRICS.observe_trace("scheduled->db_commit", trace, len(trace[1]) - 1, committed_at)
+        metrics.METRICS.observe_trace("end_to_end", trace, metrics.CLIENT_PUBLISH, committed_at)
+    TRACES_AWAITING_COMMIT.clear()
+    metrics.METRICS.count("scheduler.rows_committed", rows)
+    ack_committed()
+
+
+#writes schedule rows in batches (commits every db.WRITE_BATCH_SIZE rows or db.WRITE_BATCH_INTERVAL_MS)
+SCHEDULE_WRITER = db.ScheduleWriter(conn, on_commit=on_schedule_commit)
+
+
+#flushes the schedule writer (and saves a snapshot when one is due) from the RabbitMQ connection's timer
+def flush_schedule_writer_periodically(connection):
+    SCHEDULE_WRITER.flush_if_due()
+    optimise_when_due()
+    if REPAIR_DUE and PENDING:
+        repair()
+    maybe_save_state()
+    connection.call_later(SCHEDULE_WRITER.interval, lambda: flush_schedule_writer_periodically(connection))
 
 
 #helper function to calculate the distance between 2 houses
@@ -89,72 +277,682 @@ def distance_between_houses (house_id_1,house_id_2):
 
 
 #helper function to calculate the distance a truck is covering with the input houses
-def truck_route_distance_if_house_added(houses):
-    distance = 0
-    distance += distance_between_houses(0, houses[0]) #add distance from base to house 1
-    previous_house = houses[0]
-    
-    for house in houses:
-        distance += distance_between_houses(previous_house, house)
-        previous_house = house
-    return distance
-
-#schedules a truck to pass by the house, returns the day it will pass by
-#makes use of helper function truck_route_distance
-def schedule_truck_route(house_id, truck_needed):
-    for day, trucks in WEEKLY_SCHEDULE.items():
-        for truck, houses in trucks.items():
-            if truck == truck_needed:
-                temp_houses = houses
-                temp_houses.append(house_id)
-                print(f"Distance calculated if house were appended to {day}:",truck_route_distance_if_house_added(temp_houses))
-                if truck_route_distance_if_house_added(temp_houses) < MAX_DISTANCE:
-                    return day
-    return 0
+#the route is a closed tour: base -> houses in order -> back to base
+def truck_route_distance_if_house_added(houses, base=route_optimizer.BASE_HOUSE):
+    return route_optimizer.tour_length(houses, distance_between_houses, base)
+
+# keeps track of one truck's route for one day (the house list stored in WEEKLY_SCHEDULE)
+# and caches its length, so probing a house only costs the distance delta at the
+# insertion point instead of recomputing the whole route
+# base is the truck's depot, load the sum of the loads of its pickups
+class RouteState:
+    def __init__(self, houses, length=None, base=route_optimizer.BASE_HOUSE, load=0):
+        self.houses = houses  # same list object as in WEEKLY_SCHEDULE, edited in place
+        self.base = base
+        self.load = load
+        self.length = self.recompute() if length is None else length  # length is given when restoring a snapshot
+
+    # full recompute of the route length (only needed if the list was edited from outside)
+    def recompute(self):
+        self.length = truck_route_distance_if_house_added(self.houses, self.base)
+        return self.length
+
+    # distance added by putting house_id at index position in the route, O(1)
+    def insertion_delta(self, house_id, position):
+        return route_optimizer.insertion_delta(self.houses, house_id, position, distance_between_houses, self.base)
+
+    # cheapest place to insert the house, returns (delta, position)
+    # only looks at the end of the route when cheapest is False
+    def best_insertion(self, house_id, cheapest=True):
+        if cheapest and len(self.houses) >= VECTORISE_MIN_ROUTE and HOUSE_INDEX is not None and house_id in HOUSE_INDEX:
+            deltas = HOUSE_INDEX.insertion_deltas(self.houses, house_id, self.base)
+            best_position = int(deltas.argmin())
+            return int(deltas[best_position]), best_position
+        best_position = len(self.houses)
+        best_delta = self.insertion_delta(house_id, best_position)
+        if cheapest:
+            for position in range(len(self.houses)):
+                delta = self.insertion_delta(house_id, position)
+                if delta < best_delta:
+                    best_delta, best_position = delta, position
+        return best_delta, best_position
+
+    # commits a probe, the route is only changed here
+    def insert(self, house_id, position, delta=None, load=0):
+        if delta is None:
+            delta = self.insertion_delta(house_id, position)
+        self.houses.insert(position, house_id)
+        self.length += delta
+        self.load += load
+
+    def append(self, house_id, load=0):
+        self.insert(house_id, len(self.houses), load=load)
+
+    # takes the house at index position out of the route, returns it
+    def remove(self, position, load=0):
+        self.length -= route_optimizer.removal_saving(self.houses, position, distance_between_houses, self.base)
+        self.load -= load
+        return self.houses.pop(position)
+
+
+#route state for every (day, truck id), built lazily from WEEKLY_SCHEDULE
+ROUTES = {}
+
+#fleet.CapacityIndex of the trucks of each (day, truck type), built lazily from the route loads
+CAPACITY = {}
+
+#when True houses are inserted at the cheapest spot in the route, otherwise appended
+CHEAPEST_INSERTION = True
+
+
+def get_route(day, truck):
+    route = ROUTES.get((day, truck))
+    if route is None or route.houses is not WEEKLY_SCHEDULE[day][truck]:
+        route = RouteState(WEEKLY_SCHEDULE[day][truck], base=FLEET[truck].depot)
+        ROUTES[(day, truck)] = route
+        CAPACITY.pop((day, FLEET[truck].truck_type), None)  # its load starts again from 0
+    return route
+
+
+def get_capacity(day, truck_type):
+    capacity = CAPACITY.get((day, truck_type))
+    if capacity is None:
+        trucks = [truck for truck in FLEET.values() if truck.truck_type == truck_type]
+        routes = [get_route(day, truck.truck_id) for truck in trucks]
+        capacity = fleet.CapacityIndex(trucks)
+        for truck, route in zip(trucks, routes):
+            if route.load:
+                capacity.update(truck.truck_id, route.load)
+        CAPACITY[(day, truck_type)] = capacity
+    return capacity
+
+
+#route length limit of a truck in FLEET
+def max_distance_of(truck_id):
+    max_distance = FLEET[truck_id].max_distance
+    return MAX_DISTANCE if max_distance is None else max_distance
+
+
+#puts the pickup on one of the truck type's trucks on that day, returns the truck id (None if none fits)
+#trucks with enough load capacity left are found in the day's CapacityIndex, tightest fit first,
+#and the first one whose route stays under its distance limit takes the house
+def place_on_day(house_id, truck_type, day, load=fleet.FULL_BIN_LOAD):
+    capacity = get_capacity(day, truck_type)
+    probe = 0
+    for truck_id in capacity.fitting(load):
+        if (day, truck_id) in UNAVAILABLE:
+            continue
+        if probe == FLEET_PROBES:
+            break
+        probe += 1
+        route = get_route(day, truck_id)
+        delta, position = route.best_insertion(house_id, CHEAPEST_INSERTION)
+        if route.length + delta < max_distance_of(truck_id):
+            route.insert(house_id, position, delta, load)
+            capacity.update(truck_id, load)
+            return truck_id
+    return None
+
+
+#schedules a truck to pass by the house, returns (day, truck id), (0, None) if it didn't fit
+#probes every day with RouteState, a rejected probe leaves the route untouched
+#when no day fits, the pickup takes the place of pickups with emptier bins (place_by_ejection,
+#only a few routes change); failing that a re-optimisation of the week is asked for (OPTIMISE_DUE)
+#and the caller queues the pickup in PENDING, placed by the repair pass that follows it
+#days are tried from first_day (index in WEEKLY_SCHEDULE, set for forecast pickups) round the week
+def schedule_pickup(house_id, truck_needed, optimise=True, first_day=0, load=fleet.FULL_BIN_LOAD):
+    global OPTIMISE_DUE
+    days = list(WEEKLY_SCHEDULE)
+    for day in days[first_day:] + days[:first_day]:
+        truck_id = place_on_day(house_id, truck_needed, day, load)
+        if truck_id is not None:
+            return day, truck_id
+    if optimise:
+        day, truck_id = place_by_ejection(house_id, truck_needed, load, time.time())
+        if truck_id is not None:
+            snapshot_soon()  # pickups of other requests moved
+            return day, truck_id
+        OPTIMISE_DUE = True
+    return 0, None
+
+
+#schedules a truck to pass by the house, returns the day it will pass by (0 if it didn't fit)
+def schedule_truck_route(house_id, truck_needed, optimise=True, first_day=0, load=fleet.FULL_BIN_LOAD):
+    return schedule_pickup(house_id, truck_needed, optimise, first_day, load)[0]
+
+
+#re-optimises the routes in WEEKLY_SCHEDULE (2-opt, Or-opt, relocating houses between days)
+#and saves the days of houses that were moved, returns the optimiser report (summed over the trucks)
+#each truck's week is optimised on its own, from its depot and with its distance limit;
+#houses are only moved between days for trucks without a load limit (the routes don't keep
+#the load of each house, so a move could overload a day)
+def optimise_routes(time_budget=OPTIMISE_TIME_BUDGET):
+    global REPAIR_DUE
+    start = time.monotonic()
+    report = {"distance_before": 0, "distance_after": 0, "capacity_freed": 0, "routes_improved": 0, "moves": []}
+    for truck in FLEET.values():
+        week = {day: {truck.truck_id: trucks[truck.truck_id]} for day, trucks in WEEKLY_SCHEDULE.items()
+                if (day, truck.truck_id) not in UNAVAILABLE}
+        if not week:
+            continue
+        truck_report = route_optimizer.optimise_schedule(
+            week, distance_between_houses, max_distance=max_distance_of(truck.truck_id),
+            time_budget=time_budget / len(FLEET), base=truck.depot,
+            week_improvers=None if truck.max_load == math.inf else [])
+        for key in ("distance_before", "distance_after", "capacity_freed", "routes_improved"):
+            report[key] += truck_report[key]
+        report["moves"].extend(truck_report["moves"])
+    report["elapsed"] = time.monotonic() - start
+    for route in ROUTES.values():
+        route.recompute()
+    SCHEDULE_WRITER.flush()  # moved pickups may still be waiting in the writer's batch
+    for truck, house_id, from_day, to_day in report["moves"]:
+        update_scheduled_day(house_id, truck, from_day, to_day)
+    if report["moves"]:
+        conn.commit()
+        save_state()  # replaying new rows on boot wouldn't pick up these moved (updated) rows
+    if report["capacity_freed"] > 0:
+        REPAIR_DUE = True  # waiting pickups may fit now
+    print(f"[Truck Scheduler] Route optimisation freed {report['capacity_freed']} distance "
+          f"({report['distance_before']} -> {report['distance_after']}), moved {len(report['moves'])} pickups")
+    return report
+
+
+#runs the re-optimisation asked for by requests that fit nowhere, at most every OPTIMISE_INTERVAL
+#seconds (it sets REPAIR_DUE when it frees distance); returns its report, None if it didn't run
+def optimise_when_due():
+    global OPTIMISE_DUE, LAST_OPTIMISED_AT
+    if not OPTIMISE_DUE or (LAST_OPTIMISED_AT is not None and time.monotonic() - LAST_OPTIMISED_AT < OPTIMISE_INTERVAL):
+        return None
+    OPTIMISE_DUE = False
+    LAST_OPTIMISED_AT = time.monotonic()
+    return optimise_routes()
+
+
+#moves one pickup of a house to another day in the schedule table (truck: id in FLEET)
+def update_scheduled_day(house_id, truck, from_day, to_day):
+    truck_type = FLEET[truck].truck_type
+    cursor.execute("""
+        UPDATE schedule SET day = ? WHERE id = (
+            SELECT id FROM schedule WHERE house_id = ? AND truck_type = ? AND COALESCE(truck, ?) = ? AND day = ? LIMIT 1)
+    """, (db.DAYS.index(to_day), house_id, db.TRUCK_TYPES.index(truck_type), truck_type, truck, db.DAYS.index(from_day)))
+
+
+#request id and load of the pickup of a house on a truck's route that day (its schedule row), None if it has none
+def pickup_row(house_id, truck_id, day):
+    truck_type = FLEET[truck_id].truck_type
+    cursor.execute("SELECT request_id, load FROM schedule WHERE house_id = ? AND truck_type = ? AND day = ? "
+                   "AND COALESCE(truck, ?) = ? ORDER BY id LIMIT 1",
+                   (house_id, db.TRUCK_TYPES.index(truck_type), db.DAYS.index(day), truck_type, truck_id))
+    row = cursor.fetchone()
+    return None if row is None else (row[0], fleet.FULL_BIN_LOAD if row[1] is None else row[1])
+
+
+#moves the schedule row of a pickup to a day and truck (day None: unscheduled)
+def set_pickup_day(request_id, truck_type, day, truck_id):
+    cursor.execute("UPDATE schedule SET day = ?, truck = ? WHERE request_id = ? AND truck_type = ?",
+                   (None if day is None else db.DAYS.index(day), truck_id, request_id, db.TRUCK_TYPES.index(truck_type)))
+
+
+#moved (updated) rows aren't replayed by a warm start, a snapshot is written at the next timer tick
+def snapshot_soon():
+    global REQUESTS_SINCE_SNAPSHOT
+    REQUESTS_SINCE_SNAPSHOT = max(REQUESTS_SINCE_SNAPSHOT, SNAPSHOT_EVERY)
+
+
+#places a pickup that fits on no route in the place of a pickup of lower priority (fill % and waiting
+#time, see repair_queue.py) on one of the type's available routes, the swap adding the least distance
+#the displaced pickup is placed elsewhere by insertion, or by the next link of the chain (at most
+#depth pickups displaced in a row), or waits in PENDING, keeping the time it was first queued (QUEUED_AT,
+#now if it never waited); its row is updated, the caller commits (repair: once per pass, a request: with
+#the writer's batch) and writes the row of the pickup it places; returns (day, truck id), (0, None) if no swap fits
+#chain: (day, truck id, house) placed by the chain so far, they aren't displaced again
+def place_by_ejection(house_id, truck_type, load, queued_at, depth=MAX_EJECTIONS, chain=None, deadline=None):
+    if HOUSE_INDEX is None or house_id not in HOUSE_INDEX:
+        return 0, None
+    chain = set() if chain is None else chain
+    moves = []
+    for day in WEEKLY_SCHEDULE:
+        for truck_id, truck in FLEET.items():
+            if truck.truck_type != truck_type or (day, truck_id) in UNAVAILABLE:
+                continue
+            route = get_route(day, truck_id)
+            if not route.houses:
+                continue
+            try:
+                changes, positions = HOUSE_INDEX.ejection_deltas(route.houses, house_id, route.base)
+            except ValueError:
+                continue  # a house of the route isn't in HOUSE_INDEX
+            fitting = (changes < max_distance_of(truck_id) - route.length).nonzero()[0]
+            for stop in fitting[changes[fitting].argsort(kind="stable")[:EJECTION_CANDIDATES]].tolist():
+                moves.append((int(changes[stop]), day, truck_id, stop, int(positions[stop])))
+    if not moves:
+        return 0, None
+    moves.sort(key=lambda move: move[0])
+    SCHEDULE_WRITER.flush()  # the displaced pickup's row may still be in the writer's batch
+    now = time.time()
+    for change, day, truck_id, stop, position in moves[:EJECTION_CANDIDATES]:
+        route = get_route(day, truck_id)
+        ejected_house = route.houses[stop]
+        if (day, truck_id, ejected_house) in chain:
+            continue
+        row = pickup_row(ejected_house, truck_id, day)
+        if row is None:
+            continue
+        request_id, ejected_load = row
+        ejected_queued_at = QUEUED_AT.get((request_id, truck_type), now)
+        if (repair_queue.priority(ejected_load, ejected_queued_at) + EJECTION_MARGIN
+                > repair_queue.priority(load, queued_at)):
+            continue
+        if route.load - ejected_load + load > FLEET[truck_id].max_load:
+            continue
+        route.remove(stop, ejected_load)
+        route.insert(house_id, position, load=load)
+        get_capacity(day, truck_type).update(truck_id, load - ejected_load)
+        chain.add((day, truck_id, house_id))
+        QUEUED_AT[(request_id, truck_type)] = ejected_queued_at
+        metrics.METRICS.count("scheduler.ejections")
+
+        new_day, new_truck = schedule_pickup(ejected_house, truck_type, optimise=False, load=ejected_load)
+        if new_truck is None and depth > 1 and (deadline is None or time.monotonic() < deadline):
+            new_day, new_truck = place_by_ejection(ejected_house, truck_type, ejected_load, ejected_queued_at,
+                                                   depth - 1, chain, deadline)
+        if new_truck is None:
+            set_pickup_day(request_id, truck_type, None, None)
+            PENDING.push(request_id, truck_type, ejected_house, ejected_load, ejected_queued_at)
+        else:
+            set_pickup_day(request_id, truck_type, new_day, new_truck)
+        return day, truck_id
+    return 0, None
+
+
+#takes every pickup off a truck's route for the day and into PENDING (their rows become unscheduled)
+#returns the number of pickups displaced
+def displace_route(day, truck_id):
+    truck_type = FLEET[truck_id].truck_type
+    where = "day = ? AND truck_type = ? AND COALESCE(truck, ?) = ?"
+    parameters = (db.DAYS.index(day), db.TRUCK_TYPES.index(truck_type), truck_type, truck_id)
+    cursor.execute(f"SELECT request_id, house_id, load FROM schedule WHERE {where} ORDER BY id", parameters)
+    rows = cursor.fetchall()
+    now = time.time()
+    for request_id, house_id, load in rows:
+        PENDING.push(request_id, truck_type, house_id, fleet.FULL_BIN_LOAD if load is None else load,
+                     QUEUED_AT.get((request_id, truck_type), now))
+    cursor.execute(f"UPDATE schedule SET day = NULL, truck = NULL WHERE {where}", parameters)
+    route = get_route(day, truck_id)
+    route.houses.clear()
+    route.length = 0
+    route.load = 0
+    CAPACITY.pop((day, truck_type), None)
+    return len(rows)
+
+
+#takes a truck out of service (available=False) or back into service, on one day or every day
+#(truck_id None: every truck, day None: every day); pickups of the routes taken out of service are
+#displaced into PENDING, then PENDING is repaired; returns the repair report + pickups displaced
+def set_availability(truck_id=None, day=None, available=False):
+    if truck_id is not None and truck_id not in FLEET:
+        raise ValueError(f"Unknown truck {truck_id}")
+    if day is not None and day not in WEEKLY_SCHEDULE:
+        raise ValueError(f"Unknown day {day}")
+    pairs = {(route_day, route_truck) for route_day in WEEKLY_SCHEDULE if day in (None, route_day)
+             for route_truck in FLEET if truck_id in (None, route_truck)}
+    SCHEDULE_WRITER.flush()
+    displaced = 0
+    if available:
+        UNAVAILABLE.difference_update(pairs)
+        cursor.executemany("DELETE FROM unavailable WHERE day = ? AND truck = ?",
+                           [(db.DAYS.index(route_day), route_truck) for route_day, route_truck in pairs])
+    else:
+        for route_day, route_truck in sorted(pairs - UNAVAILABLE):
+            displaced += displace_route(route_day, route_truck)
+        UNAVAILABLE.update(pairs)
+        cursor.executemany("INSERT OR IGNORE INTO unavailable (day, truck) VALUES (?, ?)",
+                           [(db.DAYS.index(route_day), route_truck) for route_day, route_truck in pairs])
+    conn.commit()
+    snapshot_soon()
+    print(f"[Truck Scheduler] {truck_id or 'Every truck'} {'available' if available else 'unavailable'} "
+          f"on {day or 'every day'}, {displaced} pickups displaced")
+    report = repair()
+    report["displaced"] = displaced
+    return report
+
+
+#places waiting pickups (PENDING, highest priority first) by insertion, or by ejection chains when
+#they fit nowhere, for at most time_budget seconds; only the routes they go to / come from change
+#a pass that runs out of time and placed pickups is continued at the next timer tick; its row changes
+#(placed and displaced pickups) are committed once, at the end of the pass
+#returns {"placed", "pending", "elapsed"}
+def repair(time_budget=REPAIR_TIME_BUDGET):
+    global REPAIR_DUE
+    start = time.monotonic()
+    deadline = start + time_budget
+    SCHEDULE_WRITER.flush()
+    refresh_map()
+    placed = 0
+    waiting = []
+    while PENDING and time.monotonic() < deadline:
+        pickup = PENDING.pop()
+        day, truck_id = 0, None
+        if pickup.house_id in HOUSE_GRID:
+            day, truck_id = schedule_pickup(pickup.house_id, pickup.truck_type, optimise=False, load=pickup.load)
+            if truck_id is None:
+                day, truck_id = place_by_ejection(pickup.house_id, pickup.truck_type, pickup.load, pickup.queued_at,
+                                                  deadline=deadline)
+        if truck_id is None:
+            waiting.append(pickup)
+        else:
+            set_pickup_day(pickup.request_id, pickup.truck_type, day, truck_id)
+            QUEUED_AT[(pickup.request_id, pickup.truck_type)] = pickup.queued_at
+            placed += 1
+    REPAIR_DUE = bool(PENDING) and placed > 0  # out of time before trying every waiting pickup
+    for pickup in waiting:
+        PENDING.push(*pickup)
+    conn.commit()
+    if placed:
+        snapshot_soon()
+    report = {"placed": placed, "pending": len(PENDING), "elapsed": time.monotonic() - start}
+    metrics.METRICS.observe("scheduler.repair", report["elapsed"])
+    print(f"[Truck Scheduler] Repair placed {placed} pickups in {report['elapsed'] * 1000:.1f} ms, "
+          f"{report['pending']} still waiting")
+    return report
+
+
+#reads the trucks out of service and the unscheduled pickups (into PENDING) at start-up
+def load_pending():
+    db.create_unavailable_table(cursor)
+    UNAVAILABLE.clear()
+    cursor.execute("SELECT day, truck FROM unavailable")
+    UNAVAILABLE.update((db.DAYS[day], truck) for day, truck in cursor.fetchall() if truck in FLEET)
+    cursor.execute("SELECT request_id, house_id, truck_type, load FROM schedule WHERE day IS NULL ORDER BY id")
+    now = time.time()
+    for request_id, house_id, truck_type, load in cursor.fetchall():
+        PENDING.push(request_id, db.TRUCK_TYPES[truck_type], house_id, fleet.FULL_BIN_LOAD if load is None else load, now)
+
+
+#sends a truck availability change to the running scheduler on the Fleet-Control-Queue
+def publish_availability(truck_id=None, day=None, available=False):
+    connection, channel = setup_rabbitmq()
+    channel.queue_declare(queue=CONTROL_QUEUE, durable=True)
+    channel.basic_publish(exchange='', routing_key=CONTROL_QUEUE,
+                          body=wire_protocol.encode_truck_availability(
+                              truck_id, None if day is None else db.DAYS.index(day), available),
+                          properties=pika.BasicProperties(delivery_mode=2))
+    connection.close()
 
 
 # reads the coordinates of the houses from the text file coordinates.txt and saves them
 # to global variable HOUSE_GRID
 def get_all_house_coordinates():
+    global MAP_CHANGES, MAP_DATA_VERSION
+    MAP_CHANGES, MAP_DATA_VERSION = db.table_changes(conn, "map_version"), None
     # Fetch all data from the map table
     cursor.execute("SELECT * FROM map")
     rows = cursor.fetchall()
     map_data = {}
     for house_id, x_value, y_value in rows:
         HOUSE_GRID[house_id] = (x_value, y_value)
+    global HOUSE_INDEX
+    HOUSE_INDEX = HouseIndex.from_rows(rows) if rows else None
+
+
+#reloads HOUSE_GRID / HOUSE_INDEX when houses were imported, moved or removed since they were loaded
+#(map_version.changes moved, e.g. after map_import.py), called before each request or repair pass;
+#with nothing committed since the last check it costs a single PRAGMA data_version
+#houses taken off the map keep their coordinates while they are on a route, and the routes through
+#a house (or from a depot) that moved get their length recomputed; returns True when it reloaded
+def refresh_map():
+    global HOUSE_INDEX, MAP_CHANGES, MAP_DATA_VERSION
+    data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+    if data_version == MAP_DATA_VERSION:
+        return False
+    MAP_DATA_VERSION = data_version
+    changes = db.table_changes(conn, "map_version")
+    if changes == MAP_CHANGES:
+        return False
+    cursor.execute("SELECT house_id, x_value, y_value FROM map")
+    grid = {house_id: (x_value, y_value) for house_id, x_value, y_value in cursor.fetchall()}
+    for trucks in WEEKLY_SCHEDULE.values():
+        for houses in trucks.values():
+            for house_id in houses:
+                if house_id not in grid and house_id in HOUSE_GRID:
+                    grid[house_id] = HOUSE_GRID[house_id]
+    moved = {house_id for house_id, location in HOUSE_GRID.items() if grid.get(house_id, location) != location}
+    HOUSE_GRID.clear()
+    HOUSE_GRID.update(grid)
+    HOUSE_INDEX = HouseIndex.from_grid(HOUSE_GRID) if HOUSE_GRID else None
+    for route in ROUTES.values():
+        if route.base in moved or not moved.isdisjoint(route.houses):
+            route.recompute()
+    MAP_CHANGES = changes
+    print(f"[Truck Scheduler] Map changed, reloaded {len(HOUSE_GRID)} house coordinates, {len(moved)} moved")
+    return True
+
+#adds a house to the map table, HOUSE_GRID and HOUSE_INDEX (e.g. a house handed off from another shard)
+def add_house(house_id, x, y):
+    global HOUSE_INDEX, MAP_CHANGES
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO map (house_id, x_value, y_value) VALUES (?, ?, ?)", (house_id, x, y))
+    HOUSE_GRID[house_id] = (x, y)
+    HOUSE_INDEX = HouseIndex.from_grid(HOUSE_GRID)
+    MAP_CHANGES = db.table_changes(conn, "map_version")  # refresh_map doesn't reload for this change
 
 #gets the current schedule and stores it in a global data structure
-def get_current_schedule():
-  # Fetch all data from the map table
-    cursor.execute("SELECT * FROM schedule")
+#only rows with an id above after_row_id are read (used to replay rows written after a snapshot)
+def get_current_schedule(after_row_id=0):
+    # Fetch the scheduled pickups (unscheduled requests have no day), in insertion order
+    cursor.execute("SELECT house_id, truck_type, day, truck, load FROM schedule WHERE day IS NOT NULL AND id > ? ORDER BY id",
+                   (after_row_id,))
     rows = cursor.fetchall()
-    # Loop through each row and organize the data
-    for row in rows:
-        request_id, house_id, truck_types, days = row
-        truck_types = truck_types.strip('[]').split(', ')
-        days = days.strip('[]').split(', ')
+    # Fill the WEEKLY_SCHEDULE dictionary
+    for house_id, truck_type, day, truck, load in rows:
+        route = get_route(db.DAYS[day], truck_of_row(db.TRUCK_TYPES[truck_type], truck))
+        route.append(house_id, fleet.FULL_BIN_LOAD if load is None else load)
+    CAPACITY.clear()
 
-        # Fill the WEEKLY_SCHEDULE dictionary
-        for day, truck_type in zip(days, truck_types):
-                WEEKLY_SCHEDULE[day][truck_type].append(house_id)
 
+#truck in FLEET for a schedule row: rows without a truck id (or with one no longer in the fleet)
+#go to the truck named after the type, or the type's first truck
+def truck_of_row(truck_type, truck):
+    if truck in FLEET and FLEET[truck].truck_type == truck_type:
+        return truck
+    if truck_type in FLEET:
+        return truck_type
+    return next(truck_id for truck_id, truck in FLEET.items() if truck.truck_type == truck_type)
 
-# main function to set up the truck_scheduler
-def main():
-    # set up RabbitMQ connection and channel
+
+#writes a snapshot of HOUSE_GRID and WEEKLY_SCHEDULE tagged with the last schedule row it includes
+#and the change counters of the schedule and map tables
+def save_state():
+    global REQUESTS_SINCE_SNAPSHOT, LAST_SNAPSHOT_AT
+    SCHEDULE_WRITER.flush()  # every row in memory has to be in the table before tagging
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM schedule")
+    last_row_id = cursor.fetchone()[0]
+    routes = {(day, truck): get_route(day, truck) for day, trucks in WEEKLY_SCHEDULE.items() for truck in trucks}
+    scheduler_snapshot.save_snapshot(SNAPSHOT_PATH, HOUSE_GRID, WEEKLY_SCHEDULE,
+                                     {key: route.length for key, route in routes.items()},
+                                     {key: route.load for key, route in routes.items()},
+                                     db.DAYS, list(FLEET), last_row_id, LAST_REQUEST_ID,
+                                     db.table_changes(conn, "schedule_version"), db.table_changes(conn, "map_version"))
+    REQUESTS_SINCE_SNAPSHOT = 0
+    LAST_SNAPSHOT_AT = time.monotonic()
+
+
+def maybe_save_state():
+    if REQUESTS_SINCE_SNAPSHOT and (REQUESTS_SINCE_SNAPSHOT >= SNAPSHOT_EVERY
+                                    or time.monotonic() - LAST_SNAPSHOT_AT >= SNAPSHOT_INTERVAL):
+        save_state()
+
+
+#loads HOUSE_GRID and WEEKLY_SCHEDULE at start-up, returns "warm" or "cold"
+#warm: memory-maps the snapshot and only replays the schedule rows written after it
+#cold: no usable snapshot (missing, the fleet changed, the map / schedule tables were recreated since, or
+#rows were changed in place / houses moved since: the tables' change counters moved), full reload
+def load_state():
+    global HOUSE_INDEX, LAST_REQUEST_ID, MAP_CHANGES, MAP_DATA_VERSION
+    snapshot = scheduler_snapshot.load_snapshot(SNAPSHOT_PATH, db.DAYS, list(FLEET))
+    if snapshot is not None:
+        cursor.execute("SELECT (SELECT COUNT(*) FROM map), (SELECT COALESCE(MAX(id), 0) FROM schedule)")
+        house_count, last_row_id = cursor.fetchone()
+        if (house_count != len(snapshot.house_ids) or last_row_id < snapshot.last_row_id
+                or db.table_changes(conn, "schedule_version") != snapshot.schedule_changes
+                or db.table_changes(conn, "map_version") != snapshot.map_changes):
+            snapshot = None
+    if snapshot is None:
+        get_all_house_coordinates()
+        get_current_schedule()
+        load_pending()
+        return "cold"
+
+    HOUSE_GRID.update(snapshot.house_grid())
+    HOUSE_INDEX = HouseIndex(snapshot.house_ids, snapshot.xs, snapshot.ys) if len(snapshot.house_ids) else None
+    MAP_CHANGES, MAP_DATA_VERSION = snapshot.map_changes, None
+    ROUTES.clear()
+    CAPACITY.clear()
+    for (day, truck), houses in snapshot.routes.items():
+        WEEKLY_SCHEDULE[day][truck][:] = houses.tolist()
+        ROUTES[(day, truck)] = RouteState(WEEKLY_SCHEDULE[day][truck], snapshot.route_distances[(day, truck)],
+                                          FLEET[truck].depot, snapshot.route_loads[(day, truck)])
+    LAST_REQUEST_ID = snapshot.last_request_id
+    get_current_schedule(after_row_id=snapshot.last_row_id)
+    load_pending()
+    return "warm"
+
+
+#batch planning mode: plans every pending request at once with week_planner (savings + local search)
+#instead of first-fit, and rewrites the whole week in the schedule table in one transaction
+#pending requests = every request already in the table (scheduled or not) + extra_requests
+#(request_id, house_id, truck type, load) from the Truck-Queue; returns the planner report
+#each truck is planned with its own depot and distance / load limits, trucks out of service (UNAVAILABLE)
+#get no pickups on those days; requests for houses no longer on the map are kept as unscheduled rows
+#and, like the pickups that didn't fit, wait in PENDING
+def plan_week(extra_requests=()):
+    global PENDING
+    SCHEDULE_WRITER.flush()
+    refresh_map()
+    cursor.execute("SELECT request_id, house_id, truck_type, load FROM schedule ORDER BY id")
+    requests = [(request_id, house_id, db.TRUCK_TYPES[truck_type], load)
+                for request_id, house_id, truck_type, load in cursor.fetchall()]
+    requests.extend(extra_requests)
+    #a pending request redelivered from the Truck-Queue may already be in the table
+    requests = list({(request[0], request[2]): request for request in requests}.values())
+    load_of = {(request_id, truck): fleet.FULL_BIN_LOAD if load is None else load for request_id, _, truck, load in requests}
+
+    report = {"schedule": {day: {} for day in WEEKLY_SCHEDULE}, "unscheduled": [], "distance": 0, "elapsed": 0}
+    placed = {}
+    for truck_type in db.TRUCK_TYPES:
+        trucks = [truck for truck in FLEET.values() if truck.truck_type == truck_type]
+        type_requests = [request for request in requests if request[2] == truck_type and request[1] in HOUSE_GRID]
+        type_report = week_planner.plan_week([(house_id, truck) for _, house_id, truck, _ in type_requests],
+                                             distance_between_houses, max_distance_of(trucks[0].truck_id),
+                                             list(WEEKLY_SCHEDULE), [truck_type], trucks[0].depot, HOUSE_INDEX,
+                                             trucks={truck_type: [truck.truck_id for truck in trucks]},
+                                             loads=[load_of[(request_id, truck)] for request_id, _, truck, _ in type_requests],
+                                             max_load=trucks[0].max_load,
+                                             limits={truck.truck_id: (truck.depot, max_distance_of(truck.truck_id), truck.max_load)
+                                                     for truck in trucks},
+                                             unavailable=UNAVAILABLE)
+        for (request_id, _, truck, _), placement in zip(type_requests, type_report["placements"]):
+            if placement is not None:
+                placed[(request_id, truck)] = placement
+        for day, routes in type_report["schedule"].items():
+            report["schedule"][day].update(routes)
+        report["unscheduled"].extend(type_report["unscheduled"])
+        report["distance"] += type_report["distance"]
+        report["elapsed"] += type_report["elapsed"]
+    QUEUED_AT.clear()
+    with conn:
+        conn.execute("DELETE FROM schedule")
+        conn.executemany("INSERT OR IGNORE INTO schedule (request_id, house_id, truck_type, day, truck, load) "
+                         "VALUES (?, ?, ?, ?, ?, ?)",
+                         [(request_id, house_id, db.TRUCK_TYPES.index(truck),
+                           *((db.DAYS.index(placed[(request_id, truck)][0]), placed[(request_id, truck)][1])
+                             if (request_id, truck) in placed else (None, None)), load)
+                          for request_id, house_id, truck, load in requests])
+
+    #the lists are replaced in place, so references to them (RouteState) stay valid
+    for day, trucks in report["schedule"].items():
+        for truck, houses in trucks.items():
+            WEEKLY_SCHEDULE[day][truck][:] = houses
+    route_loads = {}
+    for key, slot in placed.items():
+        route_loads[slot] = route_loads.get(slot, 0) + load_of[key]
+    ROUTES.clear()
+    for day, trucks in WEEKLY_SCHEDULE.items():
+        for truck in trucks:
+            get_route(day, truck).load = route_loads.get((day, truck), 0)
+    now = time.time()
+    PENDING = repair_queue.PendingQueue()
+    for request_id, house_id, truck, _ in requests:
+        if (request_id, truck) not in placed:
+            PENDING.push(request_id, truck, house_id, load_of[(request_id, truck)], now)
+    save_state()
+    print(f"[Truck Scheduler] Planned {len(requests)} requests: distance {report['distance']}, "
+          f"{len(report['unscheduled'])} pickups didn't fit, {len(PENDING)} waiting, {report['elapsed']:.2f}s")
+    return report
+
+
+#reads every request waiting in the Truck-Queue, plans the week with them and acks them once written
+#(malformed ones go to the Dead-Letter-Queue)
+def plan_pending_requests():
     connection, channel = setup_rabbitmq()
+    publish_channel = connection.channel()
+    publish_channel.confirm_delivery()
+    guard = reliable_delivery.DeliveryGuard(publish_channel, "Truck Scheduler")
+    pending = []
+    last_tag = [None]
+
+    def add_pending(body):
+        request = wire_protocol.decode_truck_request(body)
+        pending.extend((request.request_id, request.house_id, truck, request_load(request.loads, truck))
+                       for truck in request.trucks_needed)
 
+    def collect(ch, method, properties, body):
+        last_tag[0] = method.delivery_tag
+        guard.handle(method, properties, body, add_pending)
+
+    channel.basic_consume(queue='Truck-Queue', on_message_callback=collect)
+    while True:
+        received = last_tag[0]
+        connection.process_data_events(time_limit=1)
+        if last_tag[0] == received:
+            break
+    plan_week(pending)
+    if last_tag[0] is not None:
+        channel.basic_ack(delivery_tag=last_tag[0], multiple=True)
+    connection.close()
+
+
+# main function to set up the truck_scheduler
+def main():
     # set the scheduler to listen on the Truck-Queue and process incoming requests
+    # (acked after their rows are committed, see run_rabbitmq_listener)
     print("Waiting for messages in Truck-Queue...")
-
-    # subscribe to the Truck-Queue to get requests
-    channel.basic_consume(queue='Truck-Queue',
-                          on_message_callback=lambda ch, method, properties, body: rabbitmq_callback(ch, method, properties,body))
-    # start listening for messages
-    channel.start_consuming()
+    run_rabbitmq_listener()
 
 if __name__ == "__main__":
+    #python truck_scheduler.py --unavailable <truck id|all> [day] -> takes a truck (or every truck) out of service
+    #python truck_scheduler.py --available <truck id|all> [day]   -> puts it back, on that day or every day
+    #(sent to the running scheduler, which re-places the pickups of the routes taken out of service)
+    for flag in ("--unavailable", "--available"):
+        if flag in sys.argv:
+            arguments = sys.argv[sys.argv.index(flag) + 1:]
+            truck_id = None if not arguments or arguments[0] == "all" else arguments[0]
+            day = arguments[1] if len(arguments) > 1 else None
+            if truck_id not in (None, *FLEET) or day not in (None, *db.DAYS):
+                print(f"Usage: python truck_scheduler.py {flag} <{'|'.join(FLEET)}|all> [{'|'.join(db.DAYS)}]")
+                sys.exit(1)
+            publish_availability(truck_id, day, available=flag == "--available")
+            print(f"[Truck Scheduler] Sent: {truck_id or 'every truck'} {flag[2:]} on {day or 'every day'}")
+            sys.exit(0)
+    #converts a schedule table from the old comma-joined layout if needed
+    db.migrate_schedule(conn)
     #added this to debug if house coordinated loaded correctly
-    get_all_house_coordinates()
-    print(f"[Debug] Loaded house coordinates: {HOUSE_GRID}")
-    main()
\ No newline at end of file
+    start_mode = load_state()
+    print(f"[Debug] {start_mode} start, loaded {len(HOUSE_GRID)} house coordinates and "
+          f"{sum(len(houses) for trucks in WEEKLY_SCHEDULE.values() for houses in trucks.values())} scheduled pickups")
+    #python truck_scheduler.py --plan -> re-plans the week with every pending request and exits
+    if "--plan" in sys.argv:
+        plan_pending_requests()
+    else:
+        main()
\ No newline at end of file
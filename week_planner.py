@@ -0,0 +1,281 @@
+import math
+import time
+
+import numpy as np
+
+import route_optimizer
+from house_index import HouseIndex
+from route_optimizer import BASE_HOUSE
+
+
+# Batch planner for a whole week of pickups, an alternative to truck_scheduler's first-fit
+# (schedule_truck_route puts each request on the first day with room, in arrival order).
+# For each truck type, the pending houses are planned together as a capacitated vehicle routing
+# problem with one route per day (or per day and truck), a route length limit (max_distance) and
+# optionally a load limit (max_load, loads in % of a bin as in fleet.py):
+# 1. Clarke-Wright savings: start with one base -> house -> base tour per house and merge tours
+#    end to end in order of saving d(base, i) + d(base, j) - d(i, j) while they stay under the limits
+#    (with a HouseIndex only the NEIGHBOURS closest houses are paired, so big cities stay tractable)
+# 2. the tours are packed onto the days, biggest first, joining tours on one day when they fit
+# 3. houses left over are put in at their cheapest position on any day with room
+# 4. route_optimizer.optimise_schedule (2-opt, Or-opt, relocate) and another insertion pass
+#    on the distance that frees up (relocate is skipped with a load limit, it doesn't check loads)
+# Trucks may have their own depot and limits (checked per route from step 2 on), and routes out of
+# service are left empty.
+
+# candidate neighbours per house for the savings list
+NEIGHBOURS = 12
+
+# time (in seconds) the local search can spend per truck type
+PLAN_TIME_BUDGET = 2.0
+
+
+def _savings(houses, distance, base, house_index):
+    """
+    (saving, i, j) pairs, biggest saving first
+    """
+    to_base = {house: distance(base, house) for house in houses}
+    if house_index is None or len(houses) <= NEIGHBOURS + 1:
+        pairs = ((i, j) for n, i in enumerate(houses) for j in houses[n + 1:])
+    else:
+        rows = house_index.rows_of(houses)
+        subset = HouseIndex(np.asarray(houses), house_index.xs[rows], house_index.ys[rows])
+        pairs = {(min(i, j), max(i, j)) for i in houses
+                 for j in subset.nearest(*house_index.coordinates(i), NEIGHBOURS, exclude=i).tolist()}
+    savings = [(to_base[i] + to_base[j] - distance(i, j), i, j) for i, j in pairs]
+    savings.sort(key=lambda saving: -saving[0])
+    return savings
+
+
+def savings_routes(houses, distance, max_distance, base=BASE_HOUSE, house_index=None, loads=None,
+                   max_load=math.inf):
+    """
+    Clarke-Wright savings tours over houses, each shorter than max_distance and carrying at most
+    max_load (loads: {house: load}, houses missing from it carry nothing).
+    Returns (list of (length, route), houses that can't be reached within max_distance / carried at all).
+    """
+    loads = loads or {}
+    unreachable = [house for house in houses
+                   if 2 * distance(base, house) >= max_distance or loads.get(house, 0) > max_load]
+    houses = [house for house in houses
+              if 2 * distance(base, house) < max_distance and loads.get(house, 0) <= max_load]
+    routes = {house: [house] for house in houses}  # route id (its first house at creation) -> houses
+    lengths = {house: 2 * distance(base, house) for house in houses}
+    route_loads = {house: loads.get(house, 0) for house in houses}
+    route_of = {house: house for house in houses}
+
+    for saving, i, j in _savings(houses, distance, base, house_index):
+        if saving <= 0:
+            break
+        route_i, route_j = route_of[i], route_of[j]
+        if route_i == route_j:
+            continue
+        first, second = routes[route_i], routes[route_j]
+        # i and j have to be route ends to be joined by the edge i - j
+        if i not in (first[0], first[-1]) or j not in (second[0], second[-1]):
+            continue
+        length = lengths[route_i] + lengths[route_j] - saving
+        if length >= max_distance or route_loads[route_i] + route_loads[route_j] > max_load:
+            continue
+        if first[-1] != i:
+            first.reverse()
+        if second[0] != j:
+            second.reverse()
+        # the shorter route is copied into the longer one
+        if len(first) >= len(second):
+            first.extend(second)
+            kept, merged = route_i, route_j
+        else:
+            second[:0] = first
+            kept, merged = route_j, route_i
+        for house in routes[merged]:
+            route_of[house] = kept
+        lengths[kept] = length
+        route_loads[kept] += route_loads[merged]
+        del routes[merged], lengths[merged], route_loads[merged]
+    return [(lengths[route_id], route) for route_id, route in routes.items()], unreachable
+
+
+def _join_length(length_a, route_a, length_b, route_b, distance, base):
+    return length_a + length_b - distance(route_a[-1], base) - distance(base, route_b[0]) + distance(route_a[-1], route_b[0])
+
+
+def _pack_days(routes, days, distance, max_distance, base, loads=None, max_load=math.inf, limits=None):
+    """
+    Puts the tours on the days, most houses first; a tour shares a day with another one when both
+    fit in one route. Returns ({day: houses}, {day: length}, {day: load}, houses of the tours that got no day).
+    limits: {day: (base, max_distance, max_load)} of the days with limits of their own
+    """
+    loads = loads or {}
+    limits = limits or {}
+    day_routes = {day: [] for day in days}
+    lengths = {day: 0 for day in days}
+    day_loads = {day: 0 for day in days}
+    left_over = []
+    for length, route in sorted(routes, key=lambda item: (-len(item[1]), item[0])):
+        load = sum(loads.get(house, 0) for house in route)
+        for day in days:
+            day_base, day_max_distance, day_max_load = limits.get(day, (base, max_distance, max_load))
+            if day_loads[day] + load > day_max_load:
+                continue
+            # the tours were built from base, a day with another depot measures them from its own
+            day_length = length if day_base == base else route_optimizer.tour_length(route, distance, day_base)
+            if not day_routes[day]:
+                if day_length < day_max_distance:
+                    day_routes[day] = list(route)
+                    lengths[day] = day_length
+                    day_loads[day] = load
+                    break
+                continue
+            joined = _join_length(lengths[day], day_routes[day], day_length, route, distance, day_base)
+            if joined < day_max_distance:
+                day_routes[day].extend(route)
+                lengths[day] = joined
+                day_loads[day] += load
+                break
+        else:
+            left_over.extend(route)
+    return day_routes, lengths, day_loads, left_over
+
+
+def _insert_pickup(day_routes, lengths, house, load, distance, max_distance, base, house_index=None,
+                   day_loads=None, max_load=math.inf, limits=None):
+    """
+    Inserts the house where it adds the least distance over all days (within each day's limits),
+    returns the day, None if it fits on no day.
+    """
+    limits = limits or {}
+    best = None
+    for day, route in day_routes.items():
+        day_base, day_max_distance, day_max_load = limits.get(day, (base, max_distance, max_load))
+        if day_loads is not None and day_loads[day] + load > day_max_load:
+            continue
+        if house_index is not None:
+            deltas = house_index.insertion_deltas(route, house, day_base)
+            position = int(deltas.argmin())
+            delta = int(deltas[position])
+        else:
+            delta, position = route_optimizer.cheapest_insertion(route, house, distance, day_base)
+        if lengths[day] + delta < day_max_distance and (best is None or delta < best[0]):
+            best = (delta, day, position)
+    if best is None:
+        return None
+    delta, day, position = best
+    day_routes[day].insert(position, house)
+    lengths[day] += delta
+    if day_loads is not None:
+        day_loads[day] += load
+    return day
+
+
+def _insert_left_over(day_routes, lengths, houses, distance, max_distance, base, house_index=None,
+                      day_loads=None, loads=None, max_load=math.inf, limits=None):
+    """
+    Cheapest feasible insertion of every house over all days, returns the houses that didn't fit.
+    """
+    loads = loads or {}
+    return [house for house in houses
+            if _insert_pickup(day_routes, lengths, house, loads.get(house, 0), distance, max_distance, base,
+                              house_index, day_loads, max_load, limits) is None]
+
+
+def plan_truck_type(houses, distance, max_distance, days, base=BASE_HOUSE, house_index=None,
+                    time_budget=PLAN_TIME_BUDGET, loads=None, max_load=math.inf, limits=None):
+    """
+    One truck type's week. Returns ({day: ordered houses}, unscheduled houses).
+    loads: {house: load} of the pickups, checked against max_load per route
+    limits: {day: (base, max_distance, max_load)} of the days (routes) whose depot or limits differ
+    from base / max_distance / max_load; the tours are built from base within the loosest limits,
+    then each day only takes what fits its own
+    """
+    houses = list(dict.fromkeys(houses))
+    limits = limits or {}
+    savings_distance = max([max_distance] + [day_max_distance for _, day_max_distance, _ in limits.values()])
+    savings_load = max([max_load] + [day_max_load for _, _, day_max_load in limits.values()])
+    routes, unreachable = savings_routes(houses, distance, savings_distance, base, house_index, loads, savings_load)
+    day_routes, lengths, day_loads, left_over = _pack_days(routes, days, distance, max_distance, base, loads, max_load,
+                                                           limits)
+    # houses out of reach of base may still be in reach of another depot
+    left_over = _insert_left_over(day_routes, lengths, left_over + unreachable, distance, max_distance, base,
+                                  house_index, day_loads, loads, max_load, limits)
+
+    if time_budget:
+        # days sharing a depot and limits are optimised together (houses may move between them)
+        groups = {}
+        for day in days:
+            groups.setdefault(limits.get(day, (base, max_distance, max_load)), []).append(day)
+        for (group_base, group_max_distance, group_max_load), group_days in groups.items():
+            route_optimizer.optimise_schedule({day: {"truck": day_routes[day]} for day in group_days}, distance,
+                                              max_distance=group_max_distance, time_budget=time_budget / len(groups),
+                                              base=group_base,
+                                              week_improvers=None if group_max_load == math.inf else [])
+        lengths = {day: route_optimizer.tour_length(route, distance, limits.get(day, (base,))[0])
+                   for day, route in day_routes.items()}
+        left_over = _insert_left_over(day_routes, lengths, left_over, distance, max_distance, base, house_index,
+                                      day_loads, loads, max_load, limits)
+    return day_routes, left_over
+
+
+def plan_week(requests, distance, max_distance, days, truck_types, base=BASE_HOUSE, house_index=None,
+              time_budget=PLAN_TIME_BUDGET, trucks=None, loads=None, max_load=math.inf, limits=None, unavailable=()):
+    """
+    requests: (house id, truck type) pairs; a house asked for twice by the same truck type gets a
+    stop per request (the later ones are put in at their cheapest place once the week is planned)
+    trucks: {truck type: truck ids} when a type has several trucks a day (default: one truck per type,
+    named after it); each (day, truck) gets a route, with base, max_distance and max_load unless
+    limits: {truck id: (depot, max_distance, max_load)} gives the truck its own
+    unavailable: (day, truck id) routes out of service, left empty
+    loads: load of each request (in the order of requests, default: no loads)
+    Returns a report dict:
+    - schedule: WEEKLY_SCHEDULE-shaped {day: {truck: ordered houses}}
+    - placements: (day, truck id) of each request (in the order of requests), None if it didn't fit
+    - unscheduled: (truck type, house id) pairs that didn't fit in the week
+    - distance: total closed-tour distance of the week
+    - elapsed: seconds spent
+    """
+    start = time.monotonic()
+    limits = limits or {}
+    unavailable = set(unavailable)
+    loads = loads or [0] * len(requests)
+    # the first request of each house per truck type is planned, the others are repeats
+    firsts_by_truck = {truck: {} for truck in truck_types}
+    repeats_by_truck = {truck: [] for truck in truck_types}
+    for index, (house_id, truck) in enumerate(requests):
+        if house_id in firsts_by_truck[truck]:
+            repeats_by_truck[truck].append(index)
+        else:
+            firsts_by_truck[truck][house_id] = index
+
+    trucks = trucks or {truck: [truck] for truck in truck_types}
+    schedule = {day: {truck_id: [] for truck in truck_types for truck_id in trucks[truck]} for day in days}
+    placements = [None] * len(requests)
+    unscheduled = []
+    for truck, firsts in firsts_by_truck.items():
+        slots = [(day, truck_id) for day in days for truck_id in trucks[truck] if (day, truck_id) not in unavailable]
+        slot_limits = {(day, truck_id): limits[truck_id] for day, truck_id in slots if truck_id in limits}
+        truck_loads = {house_id: loads[index] for house_id, index in firsts.items()}
+        slot_routes, left_over = plan_truck_type(list(firsts), distance, max_distance, slots, base, house_index,
+                                                 time_budget, truck_loads, max_load, slot_limits)
+        for slot, route in slot_routes.items():
+            for house_id in route:
+                placements[firsts[house_id]] = slot
+        lengths = {slot: route_optimizer.tour_length(route, distance, slot_limits.get(slot, (base,))[0])
+                   for slot, route in slot_routes.items()}
+        slot_loads = {slot: sum(truck_loads[house_id] for house_id in route) for slot, route in slot_routes.items()}
+        for index in repeats_by_truck[truck]:
+            house_id = requests[index][0]
+            placements[index] = _insert_pickup(slot_routes, lengths, house_id, loads[index], distance, max_distance,
+                                               base, house_index, slot_loads, max_load, slot_limits)
+            if placements[index] is None:
+                left_over.append(house_id)
+        for (day, truck_id), route in slot_routes.items():
+            schedule[day][truck_id] = route
+        unscheduled.extend((truck, house_id) for house_id in left_over)
+    return {
+        "schedule": schedule,
+        "placements": placements,
+        "unscheduled": unscheduled,
+        "distance": sum(route_optimizer.tour_length(route, distance, limits.get(truck_id, (base,))[0])
+                        for trucks in schedule.values() for truck_id, route in trucks.items()),
+        "elapsed": time.monotonic() - start,
+    }
@@ -0,0 +1,253 @@
+import collections
+import struct
+
+
+# Binary wire format shared by client.py, test_client.py, server.py and truck_scheduler.py.
+# Every message starts with a version byte and a message type byte, followed by fixed-size
+# little-endian fields, so encoding/decoding is a single struct pack/unpack.
+# Each message type has its own version, bumped when its layout changes; decoders keep reading the
+# older versions still found in the queues after an upgrade.
+#
+# Garbage report (client -> Garbage-Info-Queue), 36 bytes:
+#   version B | type B | garbage % B | recycling % B | organic % B | pad 3x |
+#   house id Q | request id I | x i | y i | reported at d (unix time)
+#   version 1, 32 bytes, had a 32-bit house id:
+#   version B | type B | garbage % B | recycling % B | organic % B | pad 3x |
+#   house id I | request id I | x i | y i | reported at d
+# Truck request (server -> Truck-Queue), 24 bytes:
+#   version B | type B | truck flags B | first day B | house id Q | request id Q |
+#   garbage load B | recycling load B | organic load B | pad x
+#   (first day: index of the first day the pickup may be scheduled on, 0 = Sunday, the default;
+#   forecast requests use it so a bin isn't picked up before it is expected to be full.
+#   loads: fill % of each bin to collect, 0 = unknown)
+#   version 2, 20 bytes, had a 32-bit house id:
+#   version B | type B | truck flags B | first day B | house id I | request id Q |
+#   garbage load B | recycling load B | organic load B | pad x
+#   version 1, 16 bytes, had no loads (decoded with loads None):
+#   version B | type B | truck flags B | first day B | house id I | request id Q
+# Shard request (shard coordinator -> tile queue, shard -> Handoff-Queue, see sharding.py), 12 bytes
+# followed by a whole truck request (trace trailer included):
+#   version B | type B | hop B | last B | x i | y i
+#   (x, y: the house's coordinates, so a shard can take houses from outside its tile;
+#   hop: number of shards the request was handed off from; last: 1 when no shard is left to try)
+# Truck availability (operator -> Fleet-Control-Queue, see truck_scheduler.set_availability),
+# 5 bytes followed by the truck id:
+#   version B | type B | available B | day B | truck id length B | truck id (utf-8)
+#   (day: index in the week, 255 = every day; an empty truck id = every truck)
+# Garbage reports and truck requests may be followed by a trace trailer (see metrics.py),
+# carried from the report to the truck request it causes:
+#   trace id Q | stamp count B | stamps q[count] (time.time_ns() of each stage)
+
+GARBAGE_REPORT = 1
+TRUCK_REQUEST = 2
+SHARD_REQUEST = 3
+TRUCK_AVAILABILITY = 4
+
+# version written for each message type
+GARBAGE_REPORT_VERSION = 2  # 2: 64-bit house ids
+TRUCK_REQUEST_VERSION = 3  # 2: the bins' loads, 3: 64-bit house ids
+SHARD_REQUEST_VERSION = 1
+TRUCK_AVAILABILITY_VERSION = 1
+
+GARBAGE_REPORT_FORMAT = struct.Struct("<BBBBB3xQIiid")
+GARBAGE_REPORT_V1_FORMAT = struct.Struct("<BBBBB3xIIiid")
+TRUCK_REQUEST_FORMAT = struct.Struct("<BBBBQQBBBx")
+TRUCK_REQUEST_V2_FORMAT = struct.Struct("<BBBBIQBBBx")
+TRUCK_REQUEST_V1_FORMAT = struct.Struct("<BBBBIQ")
+UNKNOWN_LOADS = (0, 0, 0)
+# versions decoded: {version: format}
+GARBAGE_REPORT_FORMATS = {1: GARBAGE_REPORT_V1_FORMAT, GARBAGE_REPORT_VERSION: GARBAGE_REPORT_FORMAT}
+TRUCK_REQUEST_FORMATS = {1: TRUCK_REQUEST_V1_FORMAT, 2: TRUCK_REQUEST_V2_FORMAT,
+                         TRUCK_REQUEST_VERSION: TRUCK_REQUEST_FORMAT}
+SHARD_REQUEST_FORMAT = struct.Struct("<BBBBii")
+AVAILABILITY_FORMAT = struct.Struct("<BBBBB")
+EVERY_DAY = 255
+DAY_COUNT = 7
+TRACE_FORMAT = struct.Struct("<QB")
+MAX_TRACE_STAMPS = 255
+
+# waste types in the order used by garbage_info lists, and their truck bit flags
+WASTE_TYPES = ["Garbage", "Recycling", "Organic"]
+TRUCK_FLAGS = {truck: 1 << i for i, truck in enumerate(WASTE_TYPES)}
+ALL_TRUCK_FLAGS = sum(TRUCK_FLAGS.values())
+
+# trace is (trace id, [stamps]) or None for untraced messages
+GarbageReport = collections.namedtuple("GarbageReport", "request_id house_id garbage_info location reported_at trace",
+                                       defaults=(None,))
+TruckRequest = collections.namedtuple("TruckRequest", "request_id house_id trucks_needed trace first_day loads",
+                                      defaults=(None, 0, None))
+# request: the TruckRequest, body: its encoded bytes (forwarded as they are)
+ShardRequest = collections.namedtuple("ShardRequest", "x y hop last request body")
+# truck_id None = every truck, day (index in the week) None = every day
+TruckAvailability = collections.namedtuple("TruckAvailability", "truck_id day available")
+
+
+class MessageFormatError(ValueError):
+    """
+    Raised when a message doesn't match the wire format (wrong size, version, type or values).
+    """
+
+
+def trucks_to_flags(trucks_needed):
+    flags = 0
+    for truck in trucks_needed:
+        try:
+            flags |= TRUCK_FLAGS[truck]
+        except KeyError:
+            raise MessageFormatError(f"Unknown truck type: {truck}") from None
+    return flags
+
+
+def flags_to_trucks(flags):
+    return list(FLAG_TRUCKS[flags])
+
+
+# truck list for every flag combination, so decoding is a table lookup
+FLAG_TRUCKS = [tuple(truck for truck in WASTE_TYPES if flags & TRUCK_FLAGS[truck]) for flags in range(ALL_TRUCK_FLAGS + 1)]
+
+
+def _pack_trace(trace):
+    if trace is None:
+        return b""
+    trace_id, stamps = trace
+    stamps = stamps[-MAX_TRACE_STAMPS:]
+    try:
+        return TRACE_FORMAT.pack(trace_id, len(stamps)) + struct.pack(f"<{len(stamps)}q", *stamps)
+    except struct.error as error:
+        raise MessageFormatError(str(error)) from error
+
+
+def _unpack_trace(body, offset):
+    if len(body) < offset + TRACE_FORMAT.size:
+        raise MessageFormatError(f"Truncated trace trailer ({len(body) - offset} bytes)")
+    trace_id, count = TRACE_FORMAT.unpack_from(body, offset)
+    offset += TRACE_FORMAT.size
+    if len(body) != offset + 8 * count:
+        raise MessageFormatError(f"Trace trailer with {count} stamps doesn't match the message size {len(body)}")
+    return trace_id, list(struct.unpack_from(f"<{count}q", body, offset))
+
+
+# message_formats: {version: struct} of the versions of the message type that can be decoded
+def _unpack_checked(body, message_formats, message_type):
+    if len(body) < 2:
+        raise MessageFormatError(f"Expected at least 2 bytes, got {len(body)}")
+    message_format = message_formats.get(body[0])
+    if message_format is None:
+        raise MessageFormatError(f"Unsupported message version {body[0]}")
+    if body[1] != message_type:
+        raise MessageFormatError(f"Unexpected message type {body[1]}")
+    if len(body) < message_format.size:
+        raise MessageFormatError(f"Expected at least {message_format.size} bytes, got {len(body)}")
+    # untraced messages (the common case) skip the trailer parsing
+    return message_format.unpack_from(body), (
+        _unpack_trace(body, message_format.size) if len(body) != message_format.size else None)
+
+
+def encode_garbage_report(request_id, house_id, garbage_info, location=None, reported_at=0.0, trace=None):
+    """
+    location is {"x": .., "y": ..} (as returned by client.get_house_coordinates) or None for unknown.
+    trace is (trace id, [stamps]) as started by metrics.new_trace(), or None.
+    """
+    if len(garbage_info) != len(WASTE_TYPES) or not all(0 <= level <= 100 for level in garbage_info):
+        raise MessageFormatError(f"Invalid garbage levels: {garbage_info}")
+    x, y = (location["x"], location["y"]) if location else (-1, -1)
+    try:
+        message = GARBAGE_REPORT_FORMAT.pack(GARBAGE_REPORT_VERSION, GARBAGE_REPORT, *garbage_info, house_id,
+                                             request_id, x, y, reported_at)
+    except struct.error as error:
+        raise MessageFormatError(str(error)) from error
+    return message + _pack_trace(trace)
+
+
+def decode_garbage_report(body):
+    (_, _, garbage, recycling, organic, house_id, request_id, x, y, reported_at), trace = _unpack_checked(
+        body, GARBAGE_REPORT_FORMATS, GARBAGE_REPORT)
+    garbage_info = [garbage, recycling, organic]
+    if max(garbage_info) > 100:
+        raise MessageFormatError(f"Invalid garbage levels: {garbage_info}")
+    return GarbageReport(request_id, house_id, garbage_info, {"x": x, "y": y}, reported_at, trace)
+
+
+def encode_truck_request(request_id, house_id, trucks_needed, trace=None, first_day=0, loads=None):
+    """
+    loads: fill % of the Garbage, Recycling and Organic bins (as in garbage_info), None if unknown.
+    """
+    flags = trucks_to_flags(trucks_needed)
+    if not flags:
+        raise MessageFormatError("A truck request needs at least one truck")
+    if not 0 <= first_day < DAY_COUNT:
+        raise MessageFormatError(f"Invalid first day {first_day}")
+    try:
+        garbage_load, recycling_load, organic_load = loads or UNKNOWN_LOADS
+    except ValueError:
+        raise MessageFormatError(f"Invalid loads: {loads}") from None
+    if garbage_load > 100 or recycling_load > 100 or organic_load > 100:
+        raise MessageFormatError(f"Invalid loads: {loads}")
+    try:
+        message = TRUCK_REQUEST_FORMAT.pack(TRUCK_REQUEST_VERSION, TRUCK_REQUEST, flags, first_day, house_id, request_id,
+                                            garbage_load, recycling_load, organic_load)
+    except struct.error as error:
+        raise MessageFormatError(str(error)) from error
+    return message + _pack_trace(trace)
+
+
+def decode_truck_request(body):
+    fields, trace = _unpack_checked(body, TRUCK_REQUEST_FORMATS, TRUCK_REQUEST)
+    _, _, flags, first_day, house_id, request_id = fields[:6]
+    loads = list(fields[6:]) or None  # version 1 has no loads
+    if not flags or flags > ALL_TRUCK_FLAGS:
+        raise MessageFormatError(f"Invalid truck flags {flags:#04x}")
+    if first_day >= DAY_COUNT:
+        raise MessageFormatError(f"Invalid first day {first_day}")
+    if loads and max(loads) > 100:
+        raise MessageFormatError(f"Invalid loads: {', '.join(map(str, loads))}")
+    return TruckRequest(request_id, house_id, flags_to_trucks(flags), trace, first_day, loads)
+
+
+def encode_shard_request(truck_request_body, x, y, hop=0, last=False):
+    try:
+        header = SHARD_REQUEST_FORMAT.pack(SHARD_REQUEST_VERSION, SHARD_REQUEST, hop, last, x, y)
+    except struct.error as error:
+        raise MessageFormatError(str(error)) from error
+    return header + truck_request_body
+
+
+def decode_shard_request(body):
+    if len(body) < SHARD_REQUEST_FORMAT.size:
+        raise MessageFormatError(f"Expected at least {SHARD_REQUEST_FORMAT.size} bytes, got {len(body)}")
+    version, message_type, hop, last, x, y = SHARD_REQUEST_FORMAT.unpack_from(body)
+    if version != SHARD_REQUEST_VERSION:
+        raise MessageFormatError(f"Unsupported message version {version}")
+    if message_type != SHARD_REQUEST:
+        raise MessageFormatError(f"Unexpected message type {message_type}")
+    truck_request_body = body[SHARD_REQUEST_FORMAT.size:]
+    return ShardRequest(x, y, hop, bool(last), decode_truck_request(truck_request_body), truck_request_body)
+
+
+def encode_truck_availability(truck_id=None, day=None, available=False):
+    truck = (truck_id or "").encode()
+    if len(truck) > 255:
+        raise MessageFormatError(f"Truck id too long: {truck_id}")
+    if day is not None and not 0 <= day < DAY_COUNT:
+        raise MessageFormatError(f"Invalid day {day}")
+    return AVAILABILITY_FORMAT.pack(TRUCK_AVAILABILITY_VERSION, TRUCK_AVAILABILITY, bool(available),
+                                    EVERY_DAY if day is None else day, len(truck)) + truck
+
+
+def decode_truck_availability(body):
+    if len(body) < AVAILABILITY_FORMAT.size:
+        raise MessageFormatError(f"Expected at least {AVAILABILITY_FORMAT.size} bytes, got {len(body)}")
+    version, message_type, available, day, length = AVAILABILITY_FORMAT.unpack_from(body)
+    if version != TRUCK_AVAILABILITY_VERSION:
+        raise MessageFormatError(f"Unsupported message version {version}")
+    if message_type != TRUCK_AVAILABILITY:
+        raise MessageFormatError(f"Unexpected message type {message_type}")
+    if len(body) != AVAILABILITY_FORMAT.size + length:
+        raise MessageFormatError(f"Truck id of {length} bytes doesn't match the message size {len(body)}")
+    if day >= DAY_COUNT and day != EVERY_DAY:
+        raise MessageFormatError(f"Invalid day {day}")
+    try:
+        truck_id = bytes(body[AVAILABILITY_FORMAT.size:]).decode()
+    except UnicodeDecodeError as error:
+        raise MessageFormatError(str(error)) from error
+    return TruckAvailability(truck_id or None, None if day == EVERY_DAY else day, bool(available))